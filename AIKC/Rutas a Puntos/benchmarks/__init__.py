@@ -0,0 +1,2 @@
+# This file makes Python treat the 'benchmarks' directory as a package.
+# It holds the performance benchmarks, which are run as scripts and are not part of the application.
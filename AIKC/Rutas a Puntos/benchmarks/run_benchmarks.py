@@ -0,0 +1,415 @@
+"""
+Benchmarks of the loading, display and route stages of the application, on
+synthetic KMZ files (`synthetic_kmz`) of several sizes.
+
+    python benchmarks/run_benchmarks.py [--sizes 1000 100000 1000000] [-o resultados.json]
+    python benchmarks/run_benchmarks.py -o nuevo.json --compare resultados.json
+
+For each size the stages of `STAGES` run in order on one `KMZRouteApp`, built
+without a window: the map is a `FakeMapWidget` whose markers and paths are plain
+objects, and the pin list, routes panel, message boxes and file dialogs are
+replaced by no-op stand-ins. Each stage reports its wall time (the best of
+`--repeat` runs, each on a fresh app state) and the peak memory allocated while
+it ran, measured with `tracemalloc` in a separate pass so that tracing does not
+slow down the timings. `tracemalloc` only sees Python and NumPy allocations, not
+those of libxml2, so `max_rss_bytes` (the peak resident size of the process
+after the stage) is reported as well.
+
+The results are written as JSON, with the commit and library versions they were
+measured on, so two runs can be compared with `--compare`.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+# The application runs as a script, so its modules are imported from its directory.
+sys.path[:0] = [path for path in (APP_DIR, HERE) if path not in sys.path]
+
+import numpy as np
+from lxml import etree
+
+import ruta_por_punto
+from kmz_core.clustering import project_to_world, TILE_SIZE
+from kmz_core.instrumentation import Profiler
+from kmz_core.kml_stream import PlacemarkStream, find_kml_member, parse_kml_tree
+from kmz_core.pin_store import PinStore
+from kmz_core.route_metrics import RouteMetricsCache
+from kmz_core.zip_member import open_member
+from map_layer import MapLayer
+from synthetic_kmz import write_synthetic_kmz
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+DEFAULT_OUTPUT = "benchmark-results.json"
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "kmz-benchmarks")  # Generated files are kept here and reused
+VIEW_ZOOM = 14  # Zoom level of the fake map, which shows both clusters and individual markers at the center of the pins
+VIEW_SIZE = (1200, 800)  # Size of the fake map in pixels
+STAGES = (
+    "parse_xml",
+    "extract_placemarks_tree",
+    "stream_placemarks",  # Pins and imported lines, as a background load delivers them
+    "populate_pin_list_ui",
+    "update_ordering",
+    "create_routes_from_all",
+    "save_routes_to_kml",
+)
+
+
+class FakeMarker:
+    """Stand-in for a tkintermapview marker: keeps what `MapLayer` and the app read and write."""
+    def __init__(self, lat, lon, text=None, marker_color_circle=None, command=None):
+        self.position = (lat, lon)
+        self.text = text
+        self.marker_color_circle = marker_color_circle
+        self.command = command
+        self.big_circle = id(self)  # Canvas item of a marker that is drawn
+
+    def delete(self):
+        self.big_circle = None
+
+
+class FakePath:
+    """Stand-in for a tkintermapview path."""
+    def __init__(self, position_list, **kwargs):
+        self.position_list = position_list
+        self.options = kwargs
+
+    def delete(self):
+        self.position_list = None
+
+
+class FakeCanvas:
+    def itemconfig(self, item, **kwargs):
+        pass
+
+
+class FakeMapWidget:
+    """
+    Stand-in for `tkintermapview.TkinterMapView` with the attributes and methods
+    used by `MapLayer` and the app. `after` callbacks are never run: the stages
+    call what they need (e.g. `MapLayer.refresh`) themselves.
+    """
+    def __init__(self):
+        self.canvas = FakeCanvas()
+        self.markers = 0  # Markers created so far
+        self.paths = 0  # Paths created so far
+        self.show(0.0, 0.0, VIEW_ZOOM)
+
+    def show(self, lat, lon, zoom, width=VIEW_SIZE[0], height=VIEW_SIZE[1]):
+        """Centers the view on (lat, lon) at `zoom`, with the view size in pixels."""
+        self.zoom = zoom
+        x, y = project_to_world(lat, lon)
+        scale = 2 ** zoom
+        half_width, half_height = width / TILE_SIZE / 2, height / TILE_SIZE / 2
+        self.upper_left_tile_pos = (float(x) * scale - half_width, float(y) * scale - half_height)
+        self.lower_right_tile_pos = (float(x) * scale + half_width, float(y) * scale + half_height)
+
+    def set_marker(self, lat, lon, **kwargs):
+        self.markers += 1
+        return FakeMarker(lat, lon, **kwargs)
+
+    def set_path(self, position_list, **kwargs):
+        self.paths += 1
+        return FakePath(position_list, **kwargs)
+
+    def set_position(self, lat, lon):
+        self.show(lat, lon, self.zoom)
+
+    def set_zoom(self, zoom):
+        self.zoom = zoom
+
+    def fit_bounding_box(self, top_left, bottom_right):
+        pass
+
+    def after(self, delay_ms, callback):
+        return "after#"
+
+    def after_cancel(self, after_id):
+        pass
+
+
+class FakeVar:
+    def __init__(self, value=False):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class FakeWidget:
+    """Accepts any method call, for the pin list, source combobox and routes panel."""
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def make_app(source):
+    """Returns a `KMZRouteApp` without a window, with the fakes described in the module docstring."""
+    app = ruta_por_punto.KMZRouteApp.__new__(ruta_por_punto.KMZRouteApp)
+    app.tk = None  # tkinter.Tk forwards unknown attributes to `self.tk`
+    app.after = lambda delay_ms, callback: "after#"
+    app.after_cancel = lambda after_id: None
+    app._apply_theme = lambda: None
+    app.pins_data = PinStore()
+    app.routes_data = []
+    app.route_metrics = RouteMetricsCache()
+    app.road_router = None
+    app.dirty_marker_indices = set()
+    app.last_selected_index = None
+    app.update_ordering_id = None
+    app.extraction_error_count = 0
+    app.current_source = source
+    app.optimize_routes_var = FakeVar(False)
+    app.road_snap_var = FakeVar(False)
+    app.pin_list = app.source_combo = app.routes_panel = FakeWidget()
+    app.map_widget = FakeMapWidget()
+    app.profiler = Profiler()
+    app.map_layer = MapLayer(app.map_widget, app.pins_data, app._on_marker_click, app._marker_color,
+                             profiler=app.profiler)
+    return app
+
+
+def read_kml(path):
+    """Returns the bytes of the KML member of a KMZ file."""
+    with zipfile.ZipFile(path) as kmz:
+        return kmz.read(find_kml_member(kmz))
+
+
+def parse_kml(path):
+    """Parses the KML member of a KMZ file into a tree, as `kml_stream.parse_kml_tree` does."""
+    with zipfile.ZipFile(path) as kmz, open_member(kmz, find_kml_member(kmz)) as kml:
+        return parse_kml_tree(kml)
+
+
+def read_pins(path):
+    """
+    Reads the pins and lines of a KMZ file with the streaming parser, as the app does.
+
+    Returns:
+        (names, (N, 3) coordinates array, extraction error count, lines), `lines`
+        being `(name, (N, 3) array)` pairs (see `PlacemarkStream.lines`).
+    """
+    with zipfile.ZipFile(path) as kmz, open_member(kmz, find_kml_member(kmz)) as kml:
+        placemarks = PlacemarkStream(kml)
+        names, coords = [], []
+        for name, point in placemarks:
+            names.append(name)
+            coords.append(point)
+    return names, np.array(coords, dtype=np.float64).reshape(-1, 3), placemarks.extraction_error_count, placemarks.lines
+
+
+def stage_runs(path, output_dir):
+    """
+    Returns, for each stage of `STAGES`, a (prepare, run) pair: `prepare()`
+    builds the state the stage starts from (untimed) and returns the argument of
+    `run`, the timed part. The file is parsed once here for the stages that start
+    from loaded pins.
+    """
+    source = os.path.basename(path)
+    names, coords, error_count, _ = read_pins(path)
+
+    def loaded_app():
+        app = make_app(source)
+        app.pins_data.extend(names, coords, source)
+        app.extraction_error_count = error_count
+        # Look at the middle of the pins, like after zooming to a loaded file
+        app.map_widget.show(float(np.median(app.pins_data.lat)), float(np.median(app.pins_data.lon)), VIEW_ZOOM)
+        return app
+
+    def populate(app):
+        app._populate_pin_list_ui()
+        app.map_layer.refresh()  # Scheduled with `after` by the app
+        return app
+
+    def extract(root):
+        app = make_app(source)
+        app._extract_placemarks_from_lxml_tree(root)
+
+    def stream(kmz_path):
+        app = make_app(source)
+        stream_names, stream_coords, app.extraction_error_count, lines = read_pins(kmz_path)
+        app.pins_data.extend(stream_names, stream_coords, source)
+        app._add_imported_lines(lines)
+
+    def save_routes(app):
+        with mock.patch.object(ruta_por_punto.filedialog, "asksaveasfilename",
+                               return_value=os.path.join(output_dir, "rutas.kml")):
+            app.save_routes_to_kml()
+
+    def selected_app():
+        app = populate(loaded_app())
+        app.select_all_pins()
+        return app
+
+    def routed_app():
+        app = populate(loaded_app())
+        app.create_routes_from_all()
+        return app
+
+    return {
+        "parse_xml": (lambda: path, parse_kml),
+        "extract_placemarks_tree": (lambda: parse_kml(path), extract),
+        "stream_placemarks": (lambda: path, stream),
+        "populate_pin_list_ui": (loaded_app, populate),
+        "update_ordering": (selected_app, lambda app: app.update_ordering()),
+        "create_routes_from_all": (lambda: populate(loaded_app()), lambda app: app.create_routes_from_all()),
+        "save_routes_to_kml": (routed_app, save_routes),
+    }
+
+
+def max_rss_bytes():
+    """Peak resident set size of the process so far, or None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Bytes on macOS, kilobytes elsewhere
+
+
+@contextmanager
+def quiet_messages():
+    """Replaces the app's message boxes, which would need a window, with no-ops."""
+    with mock.patch.object(ruta_por_punto, "messagebox"):
+        yield
+
+
+def run_size(path, repeat=1, memory=True, log=None):
+    """
+    Runs every stage on one KMZ file.
+
+    Returns:
+        {stage: {"seconds": best wall time, "peak_bytes": peak traced allocation
+        or None, "max_rss_bytes": peak resident size or None}}
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir, quiet_messages():
+        runs = stage_runs(path, output_dir)
+        for stage in STAGES:
+            prepare, run = runs[stage]
+            best = None
+            for _ in range(repeat):
+                argument = prepare()
+                start = time.perf_counter()
+                run(argument)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+                del argument
+            results[stage] = {"seconds": best, "peak_bytes": None, "max_rss_bytes": max_rss_bytes()}
+            if log:
+                print(f"  {stage}: {best:.3f} s", file=log)
+
+        if memory:
+            for stage in STAGES:
+                prepare, run = runs[stage]
+                argument = prepare()
+                tracemalloc.start()  # Only while the stage runs: tracing slows down everything else
+                try:
+                    run(argument)
+                    results[stage]["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                del argument
+    return results
+
+
+def git_commit():
+    """Returns the commit of the working tree, or None outside a git checkout."""
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, data_dir=DEFAULT_DATA_DIR, repeat=1, memory=True, seed=0, log=None):
+    """
+    Generates (or reuses) a synthetic KMZ of each size in `data_dir` and runs
+    every stage on it.
+
+    Returns:
+        A JSON-serializable dictionary: "meta" (commit, versions, date) and
+        "results", the `run_size` results of each size (keyed by the size as a string).
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "lxml": ".".join(map(str, etree.LXML_VERSION)),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": {},
+    }
+    for size in sizes:
+        path = os.path.join(data_dir, f"synthetic-{size}-s{seed}.kmz")
+        if not os.path.exists(path):
+            if log:
+                print(f"Generando {path}...", file=log)
+            write_synthetic_kmz(path, size, seed)
+        if log:
+            print(f"{size} Placemarks:", file=log)
+        report["results"][str(size)] = run_size(path, repeat, memory, log)
+    return report
+
+
+def compare(report, baseline):
+    """
+    Returns the lines of a table with the time and peak memory of each stage in
+    `report` relative to `baseline` (ratios above 1 are slower or larger).
+    """
+    lines = [f"{'Tamaño':>9} {'Etapa':<24} {'Tiempo':>10} {'Base':>10} {'Razón':>7} {'Memoria':>7}"]
+    for size, stages in report["results"].items():
+        for stage, result in stages.items():
+            base = baseline.get("results", {}).get(size, {}).get(stage)
+            if base is None:
+                continue
+            time_ratio = result["seconds"] / base["seconds"] if base["seconds"] else float("nan")
+            memory_ratio = (result["peak_bytes"] / base["peak_bytes"]
+                            if result.get("peak_bytes") is not None and base.get("peak_bytes") else float("nan"))
+            lines.append(f"{size:>9} {stage:<24} {result['seconds']:>9.3f}s {base['seconds']:>9.3f}s "
+                         f"{time_ratio:>7.2f} {memory_ratio:>7.2f}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el tiempo y la memoria de las etapas de la aplicación con archivos KMZ sintéticos.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Número de Placemarks de cada archivo.")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help=f"Archivo JSON de resultados (por defecto: {DEFAULT_OUTPUT}).")
+    parser.add_argument("--compare", metavar="BASE", help="Resultados JSON de otra ejecución con los que comparar.")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Carpeta donde se generan y reutilizan los archivos KMZ.")
+    parser.add_argument("--repeat", type=int, default=1, help="Ejecuciones de cada etapa; se informa la más rápida.")
+    parser.add_argument("--no-memory", action="store_true", help="No medir la memoria (evita la segunda pasada con tracemalloc).")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los archivos generados.")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.data_dir, max(args.repeat, 1), not args.no_memory, args.seed, log=sys.stderr)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados guardados en '{args.output}'.")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(report, baseline)))
+
+
+if __name__ == "__main__":
+    main()
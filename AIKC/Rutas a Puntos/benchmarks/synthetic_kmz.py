@@ -0,0 +1,120 @@
+"""
+Synthetic KMZ files for benchmarks and tests.
+
+`write_synthetic_kmz` writes a KMZ whose `doc.kml` has the given number of
+Placemarks, grouped in nested Folders ("Zona N" > "Sector N", with
+`PLACEMARKS_PER_FOLDER` Placemarks each) like real exports. Besides plain Points
+it mixes in, at the rates of `PLACEMARK_MIX`:
+
+- "multigeometry": a MultiGeometry with a LineString and a Point (a pin and a line);
+- "unnamed": a Point without a name (a pin named `DEFAULT_PIN_NAME`);
+- "malformed": a Point with unparseable coordinates (counted as an error);
+- "linestring" and "polygon": Placemarks without a Point, whose LineString or
+  Polygon outline the loaders import as a route.
+
+The content only depends on the count and the seed, so the same arguments
+always give the same file. The returned `SyntheticKMZ` has the number of pins,
+lines and errors the loaders must report.
+
+    python benchmarks/synthetic_kmz.py 100000 datos.kmz
+"""
+import argparse
+import random
+import zipfile
+from collections import namedtuple
+
+PLACEMARKS_PER_FOLDER = 1000
+SECTORS_PER_ZONE = 10  # "Sector" folders in each "Zona" folder
+CENTER_LON, CENTER_LAT = -57.6, -25.3  # Pins are spread around this point
+SPREAD_DEGREES = 0.5  # Half the side of the square the pins are spread in
+WRITE_CHUNK = 10000  # Placemarks formatted and written at a time
+# Fraction of the Placemarks of each kind besides plain Points
+PLACEMARK_MIX = {"multigeometry": 0.02, "unnamed": 0.01, "malformed": 0.01, "linestring": 0.03, "polygon": 0.02}
+PIN_KINDS = {"point", "multigeometry", "unnamed"}  # Kinds the loaders turn into pins
+LINE_KINDS = {"multigeometry", "linestring", "polygon"}  # Kinds with one line geometry, imported as a route
+
+KML_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<kml xmlns="http://www.opengis.net/kml/2.2"><Document><name>Datos sintéticos</name>\n'
+              '<!-- Generado para pruebas de rendimiento -->\n')
+KML_FOOTER = "</Document></kml>\n"
+PLACEMARK_TEMPLATES = {
+    "point": "<Placemark><name>Pin {number}</name><Point><coordinates>{lon:.6f},{lat:.6f},{alt:.1f}</coordinates></Point></Placemark>\n",
+    "multigeometry": ("<Placemark><name>Poste {number}</name><MultiGeometry>"
+                      "<LineString><coordinates>{lon:.6f},{lat:.6f},0 {lon2:.6f},{lat2:.6f},0</coordinates></LineString>"
+                      "<Point><coordinates>{lon:.6f},{lat:.6f},{alt:.1f}</coordinates></Point></MultiGeometry></Placemark>\n"),
+    "unnamed": "<Placemark><Point><coordinates>{lon:.6f},{lat:.6f}</coordinates></Point></Placemark>\n",
+    "malformed": "<Placemark><name>Roto {number}</name><Point><coordinates>{lon:.6f};{lat:.6f}</coordinates></Point></Placemark>\n",
+    "linestring": ("<Placemark><name>Tramo {number}</name><LineString><tessellate>1</tessellate>"
+                  "<coordinates>{lon:.6f},{lat:.6f},0 {lon2:.6f},{lat2:.6f},0 {lon:.6f},{lat2:.6f},0</coordinates></LineString></Placemark>\n"),
+    "polygon": ("<Placemark><name>Zona {number}</name><Polygon><outerBoundaryIs><LinearRing><coordinates>"
+                "{lon:.6f},{lat:.6f},0 {lon2:.6f},{lat:.6f},0 {lon2:.6f},{lat2:.6f},0 {lon:.6f},{lat:.6f},0"
+                "</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark>\n"),
+}
+
+# A written synthetic file: the number of Placemarks, of pins and lines the
+# loaders must extract and of Placemarks they must count as malformed.
+SyntheticKMZ = namedtuple("SyntheticKMZ", ["path", "placemark_count", "pin_count", "malformed_count", "line_count"])
+
+
+def placemark_kinds(count, seed=0):
+    """Returns the kind (a key of `PLACEMARK_TEMPLATES`) of each of `count` Placemarks."""
+    rng = random.Random(seed)
+    kinds, weights = ["point"] + list(PLACEMARK_MIX), [1.0 - sum(PLACEMARK_MIX.values())] + list(PLACEMARK_MIX.values())
+    return rng.choices(kinds, weights, k=count)
+
+
+def _placemarks(count, seed):
+    """Yields the text of every Placemark, with the Folder tags around them."""
+    rng = random.Random(seed + 1)
+    for number, kind in enumerate(placemark_kinds(count, seed)):
+        if number % PLACEMARKS_PER_FOLDER == 0:
+            folder = number // PLACEMARKS_PER_FOLDER
+            zone, sector = divmod(folder, SECTORS_PER_ZONE)
+            if number:
+                yield "</Folder>" if sector else "</Folder></Folder>\n"
+            if sector == 0:
+                yield f"<Folder><name>Zona {zone + 1}</name>\n"
+            yield f"<Folder><name>Sector {sector + 1}</name>\n"
+        lon = CENTER_LON + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+        lat = CENTER_LAT + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+        yield PLACEMARK_TEMPLATES[kind].format(number=number + 1, lon=lon, lat=lat, alt=rng.uniform(0, 200),
+                                               lon2=lon + 0.001, lat2=lat + 0.001)
+    if count:
+        yield "</Folder></Folder>\n"
+
+
+def write_synthetic_kmz(path, count, seed=0):
+    """
+    Writes a synthetic KMZ with `count` Placemarks (see the module docstring).
+
+    Returns:
+        A `SyntheticKMZ`.
+    """
+    kinds = placemark_kinds(count, seed)
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as kmz:
+        with kmz.open("doc.kml", "w", force_zip64=True) as kml:
+            kml.write(KML_HEADER.encode("utf-8"))
+            chunk = []
+            for text in _placemarks(count, seed):
+                chunk.append(text)
+                if len(chunk) >= WRITE_CHUNK:
+                    kml.write("".join(chunk).encode("utf-8"))
+                    chunk = []
+            kml.write(("".join(chunk) + KML_FOOTER).encode("utf-8"))
+    return SyntheticKMZ(path, count, sum(kind in PIN_KINDS for kind in kinds), kinds.count("malformed"),
+                        sum(kind in LINE_KINDS for kind in kinds))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un archivo KMZ sintético para pruebas de rendimiento.")
+    parser.add_argument("count", type=int, help="Número de Placemarks.")
+    parser.add_argument("output", help="Archivo KMZ de salida.")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los datos aleatorios.")
+    args = parser.parse_args(argv)
+    result = write_synthetic_kmz(args.output, args.count, args.seed)
+    print(f"{result.path}: {result.placemark_count} Placemarks, {result.pin_count} pines, "
+          f"{result.line_count} líneas, {result.malformed_count} con coordenadas mal formadas.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+# This file makes Python treat the 'kmz_core' directory as a package.
+# It holds the parsing and route logic that does not depend on the Tk user interface.
@@ -0,0 +1,263 @@
+"""
+Background loading of KMZ files.
+
+`KMZLoadWorker` runs the unzip and streaming parse of a KMZ file in a worker thread
+and posts its results to a `queue.Queue` as `(kind, payload)` messages. The root
+KML member is streamed in batches (read in chunks through `zip_member`); the other KML members of the archive, and
+those its documents link to with NetworkLinks, are parsed after it (see
+`kmz_members`), the large ones in parallel worker processes. It never
+touches Tk: the user interface drains `messages` from the mainloop (e.g. with
+`after()`) and builds widgets and map markers on the main thread.
+
+With a `parse_cache.ParseCache`, a file that was already parsed is not parsed
+again: its pins are posted at once, as memory-mapped arrays, and the pins of
+files parsed completely are stored in the cache.
+
+With an `instrumentation.Profiler`, the load of the file and its decompression,
+XML parsing and extraction stages are recorded as spans.
+
+Messages, in order:
+    (LOAD_BATCH, (pins, progress))  Zero or more times. `pins` is a list of
+                                    `(name, (lon, lat, alt))` tuples and `progress`
+                                    a float in [0, 1] (uncompressed bytes read).
+    (LOAD_LINES, lines)             After the batches, if the root member has line
+                                    geometries: a list of `(name, (N, 3) array)` pairs
+                                    (see `kml_stream.PlacemarkStream.lines`).
+    (LOAD_FILE, KMZParseResult)     Then once per other KML member with its pins and
+                                    lines, tagged with `kmz_members.member_source`.
+    (LOAD_CACHED, (source, cached)) Instead of the other messages, when the file is in
+                                    the cache: `cached` is a `parse_cache.CachedPins`
+                                    and `source` the base name of the file.
+    Then exactly one of:
+    (LOAD_DONE, error_count)        Parsing finished.
+    (LOAD_CANCELLED, error_count)   `cancel()` was called; batches already posted stay valid.
+    (LOAD_NO_KML, None)             The archive contains no KML member.
+    (LOAD_ERROR, exception)         Any other failure (invalid zip, XML syntax error, ...).
+"""
+import os
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+import zipfile
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from .instrumentation import STAGE_LOAD, TimedReader, parse_stage_times
+from .kml_stream import PlacemarkStream, find_kml_members
+from .kmz_members import count_large_members, linked_members, member_source, parse_kmz_members
+from .zip_member import open_member
+
+# Message kinds posted by KMZLoadWorker.
+LOAD_BATCH = "batch"
+LOAD_CACHED = "cached"
+LOAD_FILE = "file"
+LOAD_LINES = "lines"
+LOAD_DONE = "done"
+LOAD_CANCELLED = "cancelled"
+LOAD_NO_KML = "no_kml"
+LOAD_ERROR = "error"
+
+DEFAULT_BATCH_SIZE = 500  # Maximum number of pins per LOAD_BATCH message
+DEFAULT_FLUSH_INTERVAL = 0.1  # Seconds after which a partial batch is posted anyway
+
+# Pins of one parsed KMZ file (or of one KML member of it).
+# source: base name of the file (or `kmz_members.member_source`), used as the pins' source.
+# names: list with the name of each pin.
+# coords: flat array('d') with lon, lat, alt for each pin (3 values per pin).
+# error_count: placemarks and line vertices skipped because of malformed coordinates.
+# error: message if the file could not be read at all (invalid zip, no KML, XML errors), else None.
+# timing: (start in perf_counter nanoseconds, {stage: nanoseconds}) of a file parsed
+#         completely (see `instrumentation.parse_stage_times`), else None.
+# members: `(member name, pin count)` pairs if the pins come from several KML members
+#          (see `kmz_members.member_sources`), else None.
+# lines: `(name, (N, 3) array)` pair per line geometry, imported as routes, or None if there are none.
+KMZParseResult = namedtuple("KMZParseResult",
+                            ["source", "names", "coords", "error_count", "error", "timing", "members", "lines"],
+                            defaults=[None, None, None])
+
+
+class KMZLoadWorker(threading.Thread):
+    """
+    Daemon thread that parses the KML members of a KMZ file and posts the pins of the
+    root member in batches, then those of each other member at once. Batches are flushed when they reach `batch_size` pins or when
+    `flush_interval` seconds have passed, so the first pins arrive quickly even on
+    very large files.
+    """
+    def __init__(self, filepath, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, cache=None,
+                 profiler=None):
+        """
+        Args:
+            filepath: Path of the KMZ file to load.
+            batch_size: Maximum number of pins per batch.
+            flush_interval: Maximum time (seconds) a parsed pin waits before being posted.
+            cache: Optional `ParseCache` the pins are read from and stored in.
+            profiler: Optional `Profiler` the load stages are recorded in.
+        """
+        super().__init__(daemon=True)
+        self.filepath = filepath
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.cache = cache
+        self.profiler = profiler
+        self.messages = queue.Queue()  # Messages for the UI thread, see module docstring
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """Asks the worker to stop; it posts LOAD_CANCELLED at the next pin it reads."""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        """True once `cancel()` has been called."""
+        return self._cancel_event.is_set()
+
+    def run(self):
+        if self.profiler is None:
+            self._load()
+            return
+        with self.profiler.span(STAGE_LOAD, file=os.path.basename(self.filepath)):
+            self._load()
+
+    def _load(self):
+        try:
+            cache_key = self.cache.key(self.filepath) if self.cache is not None else None
+            cached = self.cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                self.messages.put((LOAD_CACHED, (os.path.basename(self.filepath), cached)))
+                self.messages.put((LOAD_DONE, cached.error_count))
+                return
+            source = os.path.basename(self.filepath)
+            start = time.perf_counter_ns()
+            with zipfile.ZipFile(self.filepath, 'r') as kmz:
+                kml_members = find_kml_members(kmz)
+                if not kml_members:
+                    self.messages.put((LOAD_NO_KML, None))
+                    return
+                root = kml_members[0]
+                total_size = sum(kmz.getinfo(name).file_size for name in kml_members) or 1
+                with open_member(kmz, root) as kml_stream:
+                    unzip_ns = time.perf_counter_ns() - start  # Opening the archive and the member
+                    reader = TimedReader(kml_stream)
+                    placemarks = PlacemarkStream(reader)
+                    names, coords = [], array('d')  # Every pin, to store them in the cache
+                    pins = placemarks if cache_key is None else _collect_pins(placemarks, names, coords)
+                    finished = self._stream_batches(pins, lambda: kml_stream.tell() / total_size)
+                others = kml_members[1:] + linked_members(root, placemarks.network_links, set(kmz.namelist()))
+                cpus = os.cpu_count() or 1
+                workers = min(cpus, count_large_members(kmz, kml_members[1:])) if cpus > 1 else 0  # No gain on one core
+            if self.profiler is not None:
+                self.profiler.record_stages(start, parse_stage_times(placemarks, reader, unzip_ns), file=source)
+            error_count = placemarks.extraction_error_count
+            lines = list(placemarks.lines)  # Of every member, to store them in the cache
+            if finished and placemarks.lines:
+                self.messages.put((LOAD_LINES, placemarks.lines))
+            members = [(root, len(names))]  # Pins of each member, in the order they are cached
+            if finished and others:
+                finished, error_count = self._load_members(others, root, workers, names, coords, lines, members,
+                                                           error_count)
+            if finished:
+                if cache_key is not None:
+                    self.cache.put(cache_key, names, coords, error_count, members if len(members) > 1 else None, lines)
+                self.messages.put((LOAD_DONE, error_count))
+            else:
+                self.messages.put((LOAD_CANCELLED, error_count))
+        except Exception as e:  # Reported to the UI thread instead of killing the thread silently
+            print(traceback.format_exc())
+            self.messages.put((LOAD_ERROR, e))
+
+    def _load_members(self, others, root, workers, names, coords, lines, members, error_count):
+        """
+        Parses the KML members other than the root (and the members they link to)
+        and posts one `LOAD_FILE` message per member.
+
+        Args:
+            others: Names of the members to parse, in order.
+            root: Name of the root member, already streamed.
+            workers: Number of worker processes for the large members (0 parses all here).
+            names, coords, lines, members: Lists the pins, lines and members are
+                                           appended to for the cache (only if `self.cache` is set).
+            error_count: Placemarks skipped in the root member.
+
+        Returns:
+            (True if every member was parsed, total error count)
+        """
+        source = os.path.basename(self.filepath)
+        # "spawn" avoids forking a process that holds Tk state and other threads.
+        executor = (ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                    if workers else None)
+        try:
+            for result in parse_kmz_members(self.filepath, others, parsed=[root], executor=executor):
+                if self.cancelled:
+                    return False, error_count
+                error_count += result.error_count
+                member_tag = member_source(source, result.member, root)
+                if self.profiler is not None:
+                    self.profiler.record_stages(*result.timing, file=member_tag)
+                if self.cache is not None:
+                    names.extend(result.names)
+                    coords.extend(result.coords)
+                    lines.extend(result.lines)
+                    members.append((result.member, len(result.names)))
+                self.messages.put((LOAD_FILE, KMZParseResult(member_tag, result.names, result.coords,
+                                                             result.error_count, None, result.timing,
+                                                             lines=result.lines or None)))
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        return not self.cancelled, error_count
+
+    def _stream_batches(self, placemarks, progress):
+        """
+        Posts the pins of `placemarks` in batches.
+
+        Args:
+            placemarks: An iterable of `(name, coords)` tuples.
+            progress: Callable returning the current progress as a float in [0, 1].
+
+        Returns:
+            True if the whole stream was consumed, False if the load was cancelled.
+        """
+        batch = []
+        last_flush = time.monotonic()
+        for pin in placemarks:
+            if self.cancelled:
+                self._post_batch(batch, progress)
+                return False
+            batch.append(pin)
+            if len(batch) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                self._post_batch(batch, progress)
+                batch = []
+                last_flush = time.monotonic()
+        self._post_batch(batch, lambda: 1.0)
+        return not self.cancelled
+
+    def _post_batch(self, batch, progress):
+        if batch:
+            self.messages.put((LOAD_BATCH, (batch, min(progress(), 1.0))))
+
+
+def _collect_pins(pins, names, coords):
+    """Yields `pins` unchanged, appending their names to `names` and their coordinates to the flat `coords`."""
+    for name, pin_coords in pins:
+        names.append(name)
+        coords.extend(pin_coords)
+        yield name, pin_coords
+
+
+def drain_messages(message_queue, max_messages):
+    """
+    Pops up to `max_messages` messages from `message_queue` without blocking.
+
+    Returns:
+        A list of `(kind, payload)` messages, possibly empty.
+    """
+    drained = []
+    while len(drained) < max_messages:
+        try:
+            drained.append(message_queue.get_nowait())
+        except queue.Empty:
+            break
+    return drained
@@ -0,0 +1,46 @@
+"""
+Background execution of one long computation (a route split, an export).
+
+`TaskWorker` calls a function in a worker thread and posts its outcome to a
+`queue.Queue` as a `(kind, payload)` message, like the loaders do (see
+`background_load`). It never touches Tk: the user interface polls `messages`
+from the mainloop (e.g. with `after()` and `background_load.drain_messages`)
+and updates widgets and the map on the main thread. The function must not use
+Tk either, and should only read data the main thread does not modify meanwhile
+(e.g. copies of the pin columns).
+
+Messages, exactly one of:
+    (TASK_DONE, result)     The function returned `result`.
+    (TASK_ERROR, exception) The function raised `exception`.
+"""
+import queue
+import threading
+import traceback
+
+# Message kinds posted by TaskWorker.
+TASK_DONE = "done"
+TASK_ERROR = "error"
+
+
+class TaskWorker(threading.Thread):
+    """Daemon thread that calls `function(*args, **kwargs)` and posts its result or exception."""
+    def __init__(self, function, *args, **kwargs):
+        """
+        Args:
+            function: Callable run in the thread.
+            *args, **kwargs: Arguments it is called with.
+        """
+        super().__init__(daemon=True)
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.messages = queue.Queue()  # Messages for the UI thread, see module docstring
+
+    def run(self):
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as e:
+            print(traceback.format_exc())
+            self.messages.put((TASK_ERROR, e))
+            return
+        self.messages.put((TASK_DONE, result))
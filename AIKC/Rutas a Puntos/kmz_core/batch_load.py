@@ -0,0 +1,161 @@
+"""
+Parallel loading of many KMZ files.
+
+`parse_kmz_file` parses every KML member of one KMZ file (see `kmz_members`) into a
+compact `KMZParseResult` (a list of names plus a flat `array('d')` of lon/lat/alt
+values, the pin count of each member and the line geometries as arrays) that is
+cheap to send between processes. `KMZBatchLoadWorker` runs it for many files across a
+`ProcessPoolExecutor` and posts the results to a queue, using the message
+protocol of `background_load.KMZLoadWorker` without batches:
+
+    (LOAD_FILE, KMZParseResult)     Once per parsed file, in the order the files were given.
+    (LOAD_CACHED, (source, cached)) Instead of LOAD_FILE for the files found in the
+                                    `parse_cache.ParseCache`, if one is given; the
+                                    worker processes store the files they parse in it.
+    (LOAD_DONE, error_count)        All files were parsed (error_count is the total).
+    (LOAD_CANCELLED, error_count)   `cancel()` was called; pending files are skipped.
+    (LOAD_ERROR, exception)         The pool itself failed.
+
+Files are parsed in parallel, one per process; the members of one file are parsed
+one after the other by the process that parses the file.
+
+The worker processes time the decompression, XML parsing and extraction stages of
+each file (`KMZParseResult.timing`); with an `instrumentation.Profiler`, the
+coordinating thread records them as spans when the file's result arrives.
+"""
+import os
+import multiprocessing
+import queue
+import threading
+import traceback
+import zipfile
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+
+from .background_load import LOAD_CACHED, LOAD_DONE, LOAD_CANCELLED, LOAD_ERROR, LOAD_FILE, KMZParseResult
+from .kml_stream import find_kml_members
+from .kmz_members import parse_kmz_members
+
+CANCEL_CHECK_INTERVAL = 0.1  # Seconds between cancellation checks while waiting for a file
+
+
+def parse_kmz_file(filepath, cache=None, cache_key=None):
+    """
+    Parses the Point placemarks and line geometries of every KML member of a KMZ
+    file, and of the members they link to.
+
+    Runs in worker processes, so it never raises: failures are returned in the
+    `error` field of the result.
+
+    Args:
+        filepath: Path of the KMZ file.
+        cache: Optional `ParseCache` to store the pins in once parsed.
+        cache_key: Cache key of the file, computed before it was parsed.
+
+    Returns:
+        A `KMZParseResult`. Its `members` are set when the pins come from more than
+        one member, and its `timing` adds up the stages of every member.
+    """
+    source = os.path.basename(filepath)
+    names = []
+    coords = array('d')
+    try:
+        with zipfile.ZipFile(filepath, 'r') as kmz:
+            kml_members = find_kml_members(kmz)
+        if not kml_members:
+            return KMZParseResult(source, names, coords, 0, "No se encontró un archivo KML dentro del KMZ.")
+        error_count = 0
+        lines = []
+        members = []
+        start, stage_ns = None, {}
+        for result in parse_kmz_members(filepath, kml_members):
+            names.extend(result.names)
+            coords.extend(result.coords)
+            lines.extend(result.lines)
+            error_count += result.error_count
+            members.append((result.member, len(result.names)))
+            member_start, member_stage_ns = result.timing
+            start = member_start if start is None else start
+            for stage, duration in member_stage_ns.items():
+                stage_ns[stage] = stage_ns.get(stage, 0) + duration
+        members = members if len(members) > 1 else None
+        if cache is not None and cache_key is not None:
+            cache.put(cache_key, names, coords, error_count, members, lines)
+        return KMZParseResult(source, names, coords, error_count, None, (start, stage_ns), members, lines or None)
+    except Exception as e:
+        return KMZParseResult(source, [], array('d'), 0, str(e))
+
+
+class KMZBatchLoadWorker(threading.Thread):
+    """
+    Daemon thread that parses several KMZ files in a process pool and posts one
+    `LOAD_FILE` message per file. The thread only coordinates the pool; parsing
+    happens in the worker processes, so it scales with the number of cores.
+    """
+    def __init__(self, filepaths, max_workers=None, cache=None, profiler=None):
+        """
+        Args:
+            filepaths: Paths of the KMZ files to load.
+            max_workers: Number of worker processes (defaults to the CPU count,
+                         capped at the number of files).
+            cache: Optional `ParseCache` the pins are read from and stored in.
+            profiler: Optional `Profiler` the load stages of each file are recorded in.
+        """
+        super().__init__(daemon=True)
+        self.filepaths = list(filepaths)
+        self.cache = cache
+        self.profiler = profiler
+        self.max_workers = max_workers or min(os.cpu_count() or 1, max(len(self.filepaths), 1))
+        self.messages = queue.Queue()  # Messages for the UI thread, see module docstring
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """Asks the worker to stop; files not yet parsed are skipped."""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        """True once `cancel()` has been called."""
+        return self._cancel_event.is_set()
+
+    def run(self):
+        total_errors = 0
+        try:
+            # "spawn" avoids forking a process that holds Tk state and other threads.
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context) as executor:
+                # Cached files are looked up here; the others are parsed (and cached) by the pool
+                pending = [self._cached_or_submit(executor, path) for path in self.filepaths]
+                for item in pending:  # Results are posted in the order the files were given
+                    if not isinstance(item, Future):
+                        total_errors += item[1].error_count
+                        self.messages.put((LOAD_CACHED, item))
+                        continue
+                    while not item.done() and not self.cancelled:
+                        wait([item], timeout=CANCEL_CHECK_INTERVAL)
+                    if self.cancelled:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        self.messages.put((LOAD_CANCELLED, total_errors))
+                        return
+                    result = item.result()
+                    total_errors += result.error_count
+                    if self.profiler is not None and result.timing is not None:
+                        self.profiler.record_stages(*result.timing, file=result.source)
+                    self.messages.put((LOAD_FILE, result))
+            self.messages.put((LOAD_DONE, total_errors))
+        except Exception as e:  # Reported to the UI thread instead of killing the thread silently
+            print(traceback.format_exc())
+            self.messages.put((LOAD_ERROR, e))
+
+    def _cached_or_submit(self, executor, path):
+        """Returns (source, CachedPins) if `path` is in the cache, else the future of its parse."""
+        cache_key = None
+        if self.cache is not None:
+            try:
+                cache_key = self.cache.key(path)
+            except OSError:
+                pass  # Reported by parse_kmz_file
+            cached = self.cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                return os.path.basename(path), cached
+        return executor.submit(parse_kmz_file, path, self.cache, cache_key)
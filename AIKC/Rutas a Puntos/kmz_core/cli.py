@@ -0,0 +1,169 @@
+"""
+`kmz-routes`: creates the routes of a directory of KMZ files in one batch, with
+no user interface, so it runs on servers without a display.
+
+    python kmz_routes.py CARPETA [-o rutas.kmz] [--optimize] [--split K] [--roads red.geojson]
+
+The KMZ files are parsed in parallel (`batch_load.KMZBatchLoadWorker`, with the
+`parse_cache`), one route is made per file and KML member (or the pins are split into K routes)
+and the routes are saved with `kml_writer.save_routes`. `--optimize` orders the routes with
+`routes.order_routes`, which bounds the memory and time of a batch however large its files are.
+
+Only the standard library is imported at startup: NumPy, lxml and the rest of
+`kmz_core` are imported once the arguments are read, so `--help` and argument
+errors answer immediately.
+"""
+import argparse
+import os
+import sys
+
+DEFAULT_OUTPUT = "rutas.kml"
+OUTPUT_EXTENSIONS = (".kml", ".kmz")  # Formats `kml_writer.save_routes` writes
+SPLIT_METHOD_CHOICES = ("kmeans", "sweep")  # Values of route_split.SPLIT_KMEANS and SPLIT_SWEEP
+
+
+def build_parser():
+    """Returns the argument parser of `kmz-routes`."""
+    parser = argparse.ArgumentParser(
+        prog="kmz-routes",
+        description="Crea rutas a partir de los pines de todos los archivos KMZ de una carpeta y las guarda en un KML o KMZ.",
+    )
+    parser.add_argument("directory", help="Carpeta con los archivos KMZ.")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT,
+                        help=f"Archivo de salida, .kml o .kmz (por defecto: {DEFAULT_OUTPUT}).")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Buscar archivos KMZ también en las subcarpetas.")
+    parser.add_argument("--optimize", action="store_true",
+                        help="Reordenar las paradas de la ruta de cada archivo para acortarla.")
+    parser.add_argument("--split", type=int, metavar="K",
+                        help="Dividir todos los pines en K rutas (como máximo una por cada dos pines) en lugar de una ruta por archivo.")
+    parser.add_argument("--method", choices=SPLIT_METHOD_CHOICES, default=SPLIT_METHOD_CHOICES[0],
+                        help="Método de división con --split (por defecto: kmeans).")
+    parser.add_argument("--max-stops", type=int, help="Máximo de paradas por ruta con --split.")
+    parser.add_argument("--max-km", type=float, help="Máximo de kilómetros por ruta con --split.")
+    parser.add_argument("--roads", metavar="RED_VIAL", help="Red vial GeoJSON u .osm.pbf para que las rutas sigan las carreteras.")
+    parser.add_argument("--workers", type=int, help="Procesos usados para leer los archivos (por defecto: uno por núcleo).")
+    parser.add_argument("--no-cache", action="store_true", help="No leer ni guardar la caché de archivos ya leídos.")
+    return parser
+
+
+def find_kmz_files(directory, recursive=False):
+    """Returns the paths of the `.kmz` files in `directory` (and its subdirectories), sorted."""
+    if not recursive:
+        return sorted(entry.path for entry in os.scandir(directory) if entry.is_file() and entry.name.lower().endswith(".kmz"))
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(".kmz"))
+    return sorted(paths)
+
+
+def load_pins(paths, workers=None, cache=None, log=sys.stderr):
+    """
+    Parses KMZ files in parallel into a new `PinStore`, with each file name (and KML
+    member, see `kmz_members.member_source`) as the pins' source. Files that cannot
+    be read are reported to `log` and skipped.
+
+    Returns:
+        (PinStore, number of placemarks skipped because of malformed coordinates)
+    """
+    from .background_load import LOAD_CACHED, LOAD_DONE, LOAD_ERROR
+    from .batch_load import KMZBatchLoadWorker, LOAD_FILE
+    from .kmz_members import member_sources
+    from .pin_store import PinStore
+
+    pins = PinStore()
+    worker = KMZBatchLoadWorker(paths, max_workers=workers, cache=cache)
+    worker.start()
+    while True:
+        kind, payload = worker.messages.get()
+        if kind == LOAD_FILE:
+            if payload.error is not None:
+                print(f"No se pudo cargar {payload.source}: {payload.error}", file=log)
+            else:
+                for source, start, end in member_sources(payload.source, payload.members, len(payload.names)):
+                    pins.extend(payload.names[start:end], payload.coords[3 * start:3 * end], source)
+        elif kind == LOAD_CACHED:
+            file_source, cached = payload
+            for source, start, end in member_sources(file_source, cached.members, len(cached.coords)):
+                pins.extend_encoded(cached.names, cached.name_offsets[start:end + 1], cached.coords[start:end], source)
+        elif kind == LOAD_ERROR:
+            raise payload
+        elif kind == LOAD_DONE:
+            return pins, payload
+
+
+def build_routes(pins, args):
+    """Returns the route dictionaries (see `routes`) asked for by the parsed arguments."""
+    from .route_split import split_into_routes
+    from .routes import DEFAULT_ROUTE_COLOR, SPLIT_ROUTE_COLORS, road_route, routes_by_source
+
+    if len(pins) < 2:
+        return []
+    if args.split:
+        groups = split_into_routes(pins.lat, pins.lon, args.split, method=args.method, max_stops=args.max_stops,
+                                   max_length_m=args.max_km * 1000 if args.max_km else None)
+        named = [(f"Ruta-{number + 1}", indices) for number, indices in enumerate(groups)]
+        colors = [SPLIT_ROUTE_COLORS[number % len(SPLIT_ROUTE_COLORS)] for number in range(len(named))]
+    else:
+        named = routes_by_source(pins, args.optimize).routes
+        colors = [DEFAULT_ROUTE_COLOR] * len(named)
+
+    router = None
+    if args.roads:
+        from .road_graph import load_road_graph
+        from .road_routing import RoadRouter
+        router = RoadRouter(load_road_graph(args.roads))
+    routes = []
+    for (name, indices), color in zip(named, colors):
+        if router is not None:
+            kml_coords, _ = road_route(router, pins, indices)
+        else:
+            kml_coords = pins.kml_coords(indices)
+        routes.append({"name": name, "kml_coords": kml_coords, "color": color})
+    return routes
+
+
+def main(argv=None):
+    """
+    Runs `kmz-routes` with the command line arguments `argv` (`sys.argv[1:]` if None).
+
+    Returns:
+        The exit status: 0 when the routes were saved, 1 otherwise.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.split is not None and args.split < 1:
+        parser.error("--split debe ser un entero positivo.")
+    if os.path.splitext(args.output)[1].lower() not in OUTPUT_EXTENSIONS:
+        parser.error(f"El archivo de salida debe ser .kml o .kmz: '{args.output}'.")
+    if args.split is None and (args.max_stops is not None or args.max_km is not None):
+        parser.error("--max-stops y --max-km solo se usan con --split.")
+    if not os.path.isdir(args.directory):
+        parser.error(f"No existe la carpeta '{args.directory}'.")
+    paths = find_kmz_files(args.directory, args.recursive)
+    if not paths:
+        print(f"No se encontraron archivos KMZ en '{args.directory}'.", file=sys.stderr)
+        return 1
+
+    from .kml_writer import save_routes
+    from .parse_cache import ParseCache
+    from .routes import kml_routes
+
+    try:
+        pins, error_count = load_pins(paths, args.workers, None if args.no_cache else ParseCache())
+        print(f"Se cargaron {len(pins)} pines de {len(paths)} archivos.")
+        if error_count:
+            print(f"Se omitieron {error_count} pines debido a errores en el formato de coordenadas.")
+        routes = build_routes(pins, args)
+        if not routes:
+            print("No hay pines suficientes para crear rutas.", file=sys.stderr)
+            return 1
+        save_routes(args.output, kml_routes(routes))
+    except (ValueError, ImportError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Se guardaron {len(routes)} rutas en '{args.output}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
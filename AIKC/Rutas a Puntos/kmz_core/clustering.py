@@ -0,0 +1,134 @@
+"""
+Zoom-aware grid clustering of pins.
+
+Pins are projected once to Web Mercator "world" coordinates in [0, 1) (the tile
+coordinates of tkintermapview at zoom 0). At a zoom level `z` the world is
+`256 * 2**z` pixels wide, so pins are grouped into square cells of
+`cell_pixels` screen pixels: every cell holding two or more pins is shown as a
+single cluster with its pin count, and pins alone in their cell are shown
+individually. Each level is computed with a few vectorized NumPy passes and
+cached until pins are added.
+"""
+import math
+
+import numpy as np
+
+TILE_SIZE = 256  # Pixels per map tile, as used by tkintermapview
+MAX_LATITUDE = 85.0511287798  # Web Mercator limit
+CLUSTER_CELL_PIXELS = 64  # Size of a clustering cell on screen
+MAX_CLUSTER_ZOOM = 17  # Above this zoom level every pin is shown individually
+
+
+def project_to_world(lat, lon):
+    """
+    Projects latitudes/longitudes (degrees) to Web Mercator world coordinates.
+
+    Returns:
+        Two float64 arrays (x, y) in [0, 1); y grows to the south, like tile rows.
+    """
+    lat = np.radians(np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0
+    y = (1.0 - np.arcsinh(np.tan(lat)) / math.pi) / 2.0
+    return x, y
+
+
+def world_to_latlon(x, y):
+    """Inverse of `project_to_world`. Returns two float64 arrays (lat, lon) in degrees."""
+    lon = np.asarray(x, dtype=np.float64) * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(math.pi * (1.0 - 2.0 * np.asarray(y, dtype=np.float64)))))
+    return lat, lon
+
+
+class ClusterLevel:
+    """
+    Clusters of one zoom level.
+
+    Cells are sorted by key. `order[offsets[i]:offsets[i + 1]]` are the pin indices
+    of cell `i`, whose centroid is (`lat[i]`, `lon[i]`) and pin count `counts[i]`.
+    """
+    def __init__(self, zoom, keys, counts, lat, lon, order, offsets):
+        self.zoom = zoom
+        self.keys = keys
+        self.counts = counts
+        self.lat = lat
+        self.lon = lon
+        self.order = order
+        self.offsets = offsets
+        self._single_mask = None
+
+    def members(self, cell):
+        """Returns the pin indices of cell number `cell`."""
+        return self.order[self.offsets[cell]:self.offsets[cell + 1]]
+
+    def cluster_cells(self):
+        """Returns the numbers of the cells shown as clusters (two or more pins)."""
+        return np.flatnonzero(self.counts > 1)
+
+    def single_pins(self):
+        """Returns the indices of the pins shown individually at this level."""
+        return self.order[self.offsets[:-1][self.counts == 1]]
+
+    def single_mask(self):
+        """Returns a boolean array, indexed by pin, that is True for the pins shown individually."""
+        if self._single_mask is None:
+            self._single_mask = np.zeros(len(self.order), dtype=bool)
+            self._single_mask[self.single_pins()] = True
+        return self._single_mask
+
+
+class GridClusterIndex:
+    """
+    Incrementally built clustering index over the pins of a `PinStore`.
+
+    `extend` projects newly added pins; `level(zoom)` returns the `ClusterLevel`
+    for a zoom level (None above `max_cluster_zoom`, where no pin is clustered).
+    """
+    def __init__(self, cell_pixels=CLUSTER_CELL_PIXELS, max_cluster_zoom=MAX_CLUSTER_ZOOM):
+        self.cell_pixels = cell_pixels
+        self.max_cluster_zoom = max_cluster_zoom
+        self.clear()
+
+    def clear(self):
+        """Removes every pin and cached level."""
+        self.x = np.empty(0, dtype=np.float64)
+        self.y = np.empty(0, dtype=np.float64)
+        self._levels = {}  # zoom level -> ClusterLevel
+
+    def __len__(self):
+        return len(self.x)
+
+    def extend(self, lat, lon):
+        """
+        Adds pins (in `PinStore` index order) and invalidates the cached levels.
+
+        Args:
+            lat, lon: Arrays with the coordinates of the new pins, in degrees.
+        """
+        x, y = project_to_world(lat, lon)
+        self.x = np.concatenate((self.x, x))
+        self.y = np.concatenate((self.y, y))
+        self._levels = {}
+
+    def level(self, zoom):
+        """
+        Returns the `ClusterLevel` for integer zoom level `zoom`, computing and
+        caching it if needed, or None if pins are not clustered at that zoom.
+        """
+        if zoom > self.max_cluster_zoom:
+            return None
+        level = self._levels.get(zoom)
+        if level is None:
+            level = self._levels[zoom] = self._compute_level(zoom)
+        return level
+
+    def _compute_level(self, zoom):
+        cells_per_side = max(1, (TILE_SIZE << zoom) // self.cell_pixels)
+        cx = np.minimum((self.x * cells_per_side).astype(np.int64), cells_per_side - 1)
+        cy = np.minimum((self.y * cells_per_side).astype(np.int64), cells_per_side - 1)
+        keys, inverse, counts = np.unique(cx * cells_per_side + cy, return_inverse=True, return_counts=True)
+        order = np.argsort(inverse, kind="stable")  # Pin indices grouped by cell, in index order
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        mean_x = np.bincount(inverse, weights=self.x, minlength=len(keys)) / counts
+        mean_y = np.bincount(inverse, weights=self.y, minlength=len(keys)) / counts
+        lat, lon = world_to_latlon(mean_x, mean_y)
+        return ClusterLevel(zoom, keys, counts, lat, lon, order, offsets)
@@ -0,0 +1,253 @@
+"""
+Export of pins and routes to GeoJSON, GPX, CSV and FlatGeobuf.
+
+Each format is an `ExportFormat` with a `write_pins(file, pins, **options)`
+function, which writes a `PinStore`, and a `write_routes(file, routes,
+**options)` function, which writes route dictionaries ("name", "color",
+"kml_coords"). `EXPORT_FORMATS` maps file extensions to the formats, and
+`register_export_format` adds new ones. Routes with fewer than
+`MIN_ROUTE_VERTICES` vertices are not lines and are left out by every format.
+
+Writers stream: pins are read from the store `EXPORT_CHUNK` at a time and
+formatted with one %-formatting call per chunk, and routes one by one, so no
+full document is built in memory. `export_pins` and `export_routes` write to a
+temporary file that replaces the destination once complete.
+"""
+import csv
+import io
+import itertools
+import json
+import os
+from collections import namedtuple
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from . import flatgeobuf
+from .route_metrics import coords_array
+
+EXPORT_CHUNK = 10000  # Pins formatted and written at a time
+DEFAULT_GEOJSON_PRECISION = 7  # Decimals of GeoJSON coordinates (about a centimeter)
+ALTITUDE_DECIMALS = 2
+MIN_ROUTE_VERTICES = 2  # Routes with fewer vertices are not written: a line needs two
+
+# A file format pins and routes can be exported to
+ExportFormat = namedtuple("ExportFormat", ["label", "extension", "write_pins", "write_routes"])
+EXPORT_FORMATS = {}  # Extension (".geojson") -> ExportFormat
+
+
+def register_export_format(export_format):
+    """Adds (or replaces) the format used for files with `export_format.extension`."""
+    EXPORT_FORMATS[export_format.extension.lower()] = export_format
+
+
+def export_format_for(path):
+    """Returns the `ExportFormat` of a file name, by extension; raises ValueError if there is none."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXPORT_FORMATS:
+        supported = ", ".join(sorted(EXPORT_FORMATS))
+        raise ValueError(f"Formato de exportación no soportado: '{extension}'. Use uno de: {supported}.")
+    return EXPORT_FORMATS[extension]
+
+
+def _line_routes(routes):
+    """Yields `(route, (N, 3) coordinates)` for the routes with at least `MIN_ROUTE_VERTICES` vertices."""
+    for route in routes:
+        coords = coords_array(route["kml_coords"])
+        if len(coords) >= MIN_ROUTE_VERTICES:
+            yield route, coords
+
+
+def _pin_chunks(pins):
+    """Yields (names, lon, lat, alt, sources) for consecutive chunks of `EXPORT_CHUNK` pins."""
+    for start in range(0, len(pins), EXPORT_CHUNK):
+        stop = min(start + EXPORT_CHUNK, len(pins))
+        sources = [pins.sources[source_id] for source_id in pins.source_ids[start:stop].tolist()]
+        yield (pins.names(np.arange(start, stop)), pins.lon[start:stop].tolist(), pins.lat[start:stop].tolist(),
+               pins.alt[start:stop].tolist(), sources)
+
+
+def _text_writer(file):
+    """Wraps a binary file for writing UTF-8 text; detach it when done so `file` stays open."""
+    return io.TextIOWrapper(file, encoding="utf-8", newline="")
+
+
+# --- GeoJSON -----------------------------------------------------------------------
+
+def _geojson_position_format(precision):
+    return f"[%.{precision}f,%.{precision}f,%.{ALTITUDE_DECIMALS}f]"
+
+
+def write_geojson_pins(file, pins, precision=DEFAULT_GEOJSON_PRECISION):
+    """Writes the pins as a GeoJSON FeatureCollection of Points with "name" and "source" properties."""
+    feature_format = ('{"type":"Feature","geometry":{"type":"Point","coordinates":'
+                      + _geojson_position_format(precision) + '},"properties":{"name":%s,"source":%s}}')
+    text = _text_writer(file)
+    text.write('{"type":"FeatureCollection","features":[\n')
+    for number, (names, lon, lat, alt, sources) in enumerate(_pin_chunks(pins)):
+        chunk_format = ",\n".join([feature_format] * len(names))
+        values = itertools.chain.from_iterable(zip(lon, lat, alt, map(json.dumps, names), map(json.dumps, sources)))
+        text.write((",\n" if number else "") + chunk_format % tuple(values))
+    text.write("\n]}\n")
+    text.detach()
+
+
+def write_geojson_routes(file, routes, precision=DEFAULT_GEOJSON_PRECISION):
+    """Writes the routes as a GeoJSON FeatureCollection of LineStrings with "name" and "color" properties."""
+    position_format = _geojson_position_format(precision)
+    text = _text_writer(file)
+    text.write('{"type":"FeatureCollection","features":[\n')
+    for number, (route, coords) in enumerate(_line_routes(routes)):
+        properties = json.dumps({"name": route["name"], "color": route.get("color")})
+        text.write((",\n" if number else "") + '{"type":"Feature","geometry":{"type":"LineString","coordinates":[')
+        for start in range(0, len(coords), EXPORT_CHUNK):
+            chunk = coords[start:start + EXPORT_CHUNK]
+            text.write(("," if start else "") + ",".join([position_format] * len(chunk)) % tuple(chunk.ravel().tolist()))
+        text.write(']},"properties":' + properties + "}")
+    text.write("\n]}\n")
+    text.detach()
+
+
+# --- GPX ---------------------------------------------------------------------------
+
+GPX_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<gpx version="1.1" creator="kmz-management" xmlns="http://www.topografix.com/GPX/1/1">\n')
+
+
+def write_gpx_pins(file, pins):
+    """Writes the pins as GPX waypoints, with their source file as `src`."""
+    waypoint_format = '<wpt lat="%.8f" lon="%.8f"><ele>%.2f</ele><name>%s</name><src>%s</src></wpt>\n'
+    text = _text_writer(file)
+    text.write(GPX_HEADER)
+    for names, lon, lat, alt, sources in _pin_chunks(pins):
+        values = itertools.chain.from_iterable(zip(lat, lon, alt, map(escape, names), map(escape, sources)))
+        text.write("".join([waypoint_format] * len(names)) % tuple(values))
+    text.write("</gpx>\n")
+    text.detach()
+
+
+def write_gpx_routes(file, routes):
+    """Writes each route as a GPX track with one segment."""
+    point_format = '<trkpt lat="%.8f" lon="%.8f"><ele>%.2f</ele></trkpt>\n'
+    text = _text_writer(file)
+    text.write(GPX_HEADER)
+    for route, coords in _line_routes(routes):
+        text.write(f"<trk><name>{escape(route['name'])}</name><trkseg>\n")
+        for start in range(0, len(coords), EXPORT_CHUNK):
+            chunk = coords[start:start + EXPORT_CHUNK][:, [1, 0, 2]]  # lat, lon, ele
+            text.write("".join([point_format] * len(chunk)) % tuple(chunk.ravel().tolist()))
+        text.write("</trkseg></trk>\n")
+    text.write("</gpx>\n")
+    text.detach()
+
+
+# --- CSV ---------------------------------------------------------------------------
+
+def write_csv_pins(file, pins):
+    """Writes one CSV row per pin: name, lat, lon, alt, source."""
+    text = _text_writer(file)
+    writer = csv.writer(text)
+    writer.writerow(["name", "lat", "lon", "alt", "source"])
+    for names, lon, lat, alt, sources in _pin_chunks(pins):
+        writer.writerows(zip(names, lat, lon, alt, sources))
+    text.detach()
+
+
+def write_csv_routes(file, routes):
+    """Writes one CSV row per route vertex: route, stop (from 1), lat, lon, alt."""
+    text = _text_writer(file)
+    writer = csv.writer(text)
+    writer.writerow(["route", "stop", "lat", "lon", "alt"])
+    for route, coords in _line_routes(routes):
+        writer.writerows(zip(itertools.repeat(route["name"]), range(1, len(coords) + 1),
+                             coords[:, 1].tolist(), coords[:, 0].tolist(), coords[:, 2].tolist()))
+    text.detach()
+
+
+# --- FlatGeobuf --------------------------------------------------------------------
+
+PIN_COLUMNS = [("name", flatgeobuf.COLUMN_STRING), ("source", flatgeobuf.COLUMN_STRING), ("alt", flatgeobuf.COLUMN_DOUBLE)]
+ROUTE_COLUMNS = [("name", flatgeobuf.COLUMN_STRING), ("color", flatgeobuf.COLUMN_STRING)]
+
+
+def write_flatgeobuf_pins(file, pins):
+    """Writes the pins as FlatGeobuf Points with "name", "source" and "alt" columns and a spatial index."""
+    lon, lat = pins.lon, pins.lat
+    order = flatgeobuf.hilbert_sort(np.column_stack((lon, lat, lon, lat)))
+    encoded_sources = [source.encode("utf-8") for source in pins.sources]
+    source_sizes = np.array([len(source) for source in encoded_sources], dtype=np.int64)[pins.source_ids]
+    # Properties: two strings (column number, length, bytes) and a double (column number, value)
+    sizes = flatgeobuf.feature_size(1, 6 + pins.name_sizes() + 6 + source_sizes + 10)[order]
+
+    def features():
+        source_properties = [flatgeobuf.encode_string_property(1, source) for source in encoded_sources]
+        for start in range(0, len(order), EXPORT_CHUNK):
+            chunk = order[start:start + EXPORT_CHUNK]
+            for x, y, name, alt, source_id in zip(lon[chunk].tolist(), lat[chunk].tolist(), pins.name_bytes(chunk),
+                                                  pins.alt[chunk].tolist(), pins.source_ids[chunk].tolist()):
+                properties = b"".join((flatgeobuf.encode_string_property(0, name), source_properties[source_id],
+                                       flatgeobuf.encode_double_property(2, alt)))
+                yield flatgeobuf.encode_point_feature(x, y, properties)
+
+    boxes = np.column_stack((lon[order], lat[order], lon[order], lat[order]))
+    flatgeobuf.write_flatgeobuf(file, "pines", flatgeobuf.GEOMETRY_POINT, PIN_COLUMNS, boxes, sizes, features())
+
+
+def write_flatgeobuf_routes(file, routes):
+    """Writes the routes as FlatGeobuf LineStrings with "name" and "color" columns and a spatial index."""
+    routes = list(_line_routes(routes))
+    boxes = np.empty((len(routes), 4))
+    properties = []
+    sizes = []
+    for number, (route, coords) in enumerate(routes):
+        boxes[number] = coords[:, 0].min(), coords[:, 1].min(), coords[:, 0].max(), coords[:, 1].max()
+        properties.append(flatgeobuf.encode_properties(ROUTE_COLUMNS, (route["name"], route.get("color"))))
+        sizes.append(flatgeobuf.feature_size(len(coords), len(properties[-1])))
+    order = flatgeobuf.hilbert_sort(boxes).tolist()
+
+    def features():
+        for number in order:
+            coords = routes[number][1]
+            yield flatgeobuf.encode_feature(flatgeobuf.GEOMETRY_LINESTRING, coords[:, :2].ravel(), properties[number])
+
+    flatgeobuf.write_flatgeobuf(file, "rutas", flatgeobuf.GEOMETRY_LINESTRING, ROUTE_COLUMNS, boxes[order],
+                                [sizes[number] for number in order], features())
+
+
+register_export_format(ExportFormat("GeoJSON", ".geojson", write_geojson_pins, write_geojson_routes))
+register_export_format(ExportFormat("GPX", ".gpx", write_gpx_pins, write_gpx_routes))
+register_export_format(ExportFormat("CSV", ".csv", write_csv_pins, write_csv_routes))
+register_export_format(ExportFormat("FlatGeobuf", ".fgb", write_flatgeobuf_pins, write_flatgeobuf_routes))
+
+
+def _export(path, write, data, options):
+    partial_path = path + ".part"  # Written aside so a failed export never leaves a broken file
+    try:
+        with open(partial_path, "wb") as output:
+            write(output, data, **options)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def export_pins(path, pins, **options):
+    """
+    Exports all pins of a `PinStore` to `path`, in the format of its extension.
+
+    Raises:
+        ValueError: The extension is not a registered format.
+        OSError: The file cannot be written.
+    """
+    _export(path, export_format_for(path).write_pins, pins, options)
+
+
+def export_routes(path, routes, **options):
+    """
+    Exports route dictionaries to `path`, in the format of its extension.
+
+    Raises:
+        ValueError: The extension is not a registered format.
+        OSError: The file cannot be written.
+    """
+    _export(path, export_format_for(path).write_routes, routes, options)
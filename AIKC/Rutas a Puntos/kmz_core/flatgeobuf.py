@@ -0,0 +1,287 @@
+"""
+FlatGeobuf writer.
+
+A FlatGeobuf file is the magic bytes, a size-prefixed FlatBuffers `Header`, a
+packed Hilbert R-tree of the feature bounding boxes and the size-prefixed
+FlatBuffers `Feature`s, stored in the order of the tree leaves (see
+https://flatgeobuf.org). Readers use the tree to fetch only the features in an
+area.
+
+The `flatbuffers` package is not needed: the header goes through a small
+front-to-back table encoder, and features, which all have the same shape, are
+laid out directly with `struct` (`encode_feature`). Features are sorted along
+a Hilbert curve of their bounding box centers, the tree is built level by level
+with `np.minimum.reduceat`/`np.maximum.reduceat` and the features are then
+streamed one by one, so only their sizes have to be known in advance.
+"""
+import struct
+
+import numpy as np
+
+from .route_split import hilbert_order
+
+MAGIC = b"fgb\x03fgb\x00"  # FlatGeobuf 3.0
+INDEX_NODE_SIZE = 16  # Children per R-tree node (the format's default)
+
+# GeometryType and ColumnType values of the FlatGeobuf schema
+GEOMETRY_POINT = 1
+GEOMETRY_LINESTRING = 2
+COLUMN_DOUBLE = 10
+COLUMN_STRING = 11
+
+# R-tree node: bounding box and, for leaves, the byte offset of the feature in
+# the feature section or, for inner nodes, the position of the first child node
+NODE_ITEM = np.dtype([("min_x", "<f8"), ("min_y", "<f8"), ("max_x", "<f8"), ("max_y", "<f8"), ("offset", "<u8")])
+
+# Fixed part of an encoded feature, with a geometry that only has `xy` and
+# `type`, before the xy values and the properties:
+#   0  root offset              12  Feature table: vtable offset, geometry, properties
+#   4  Feature vtable           24  Geometry vtable (7 fields)
+#   44 Geometry table: vtable offset, xy, type    60 xy vector length, 8-aligned data at 64
+_FEATURE_HEAD = struct.Struct("<I HHHH iII HHHHHHHHH 2x iIB7x I")
+FEATURE_HEAD_SIZE = _FEATURE_HEAD.size  # 64
+_STRING_PROPERTY = struct.Struct("<HI")  # Column number and length, followed by the UTF-8 bytes
+_DOUBLE_PROPERTY = struct.Struct("<Hd")
+_POINT_TAIL = struct.Struct("<ddI")  # x, y and length of the properties of a Point feature
+
+
+def _align(buffer, alignment, extra=0):
+    """Pads `buffer` so that `len(buffer) + extra` is a multiple of `alignment`."""
+    buffer.extend(bytes(-(len(buffer) + extra) % alignment))
+
+
+def _write_table(buffer, fields):
+    """
+    Appends a FlatBuffers table and the objects it refers to, after it.
+
+    Args:
+        buffer: The bytearray the buffer is built in.
+        fields: List of (field id, kind, value). Kinds are `struct` formats for
+            scalars, "string", "table" (a nested field list), "tables" (a list
+            of field lists) and ("vector", format) for vectors of scalars.
+
+    Returns:
+        Position of the table in the buffer.
+    """
+    inline = sorted(fields, key=lambda field: -_inline_size(field[1]))
+    offsets = {}
+    size = 4  # Offset to the vtable
+    for field_id, kind, _ in inline:
+        width = _inline_size(kind)
+        size += -size % width
+        offsets[field_id] = size
+        size += width
+    slots = max(offsets) + 1 if offsets else 0
+    _align(buffer, 2)
+    vtable = len(buffer)
+    buffer.extend(struct.pack(f"<{2 + slots}H", 4 + 2 * slots, size, *(offsets.get(slot, 0) for slot in range(slots))))
+    _align(buffer, 8)
+    table = len(buffer)
+    buffer.extend(bytes(size))
+    struct.pack_into("<i", buffer, table, table - vtable)
+    for field_id, kind, value in inline:
+        position = table + offsets[field_id]
+        if isinstance(kind, str) and kind not in ("string", "table", "tables"):
+            struct.pack_into("<" + kind, buffer, position, value)
+        else:
+            struct.pack_into("<I", buffer, position, _write_object(buffer, kind, value) - position)
+    return table
+
+
+def _inline_size(kind):
+    if isinstance(kind, str) and kind not in ("string", "table", "tables"):
+        return struct.calcsize("<" + kind)
+    return 4  # Offset to the object
+
+
+def _write_object(buffer, kind, value):
+    """Appends a string, vector or table and returns its position."""
+    if kind == "table":
+        return _write_table(buffer, value)
+    if kind == "string":
+        data = value.encode("utf-8")
+        _align(buffer, 4)
+        position = len(buffer)
+        buffer.extend(struct.pack("<I", len(data)) + data + b"\0")
+        return position
+    if kind == "tables":
+        _align(buffer, 4)
+        position = len(buffer)
+        buffer.extend(struct.pack("<I", len(value)) + bytes(4 * len(value)))
+        for number, table_fields in enumerate(value):
+            slot = position + 4 + 4 * number
+            struct.pack_into("<I", buffer, slot, _write_table(buffer, table_fields) - slot)
+        return position
+    _, element_format = kind  # ("vector", format)
+    data = np.asarray(value, dtype="<" + element_format)
+    _align(buffer, max(4, data.itemsize), extra=4)  # Elements aligned to their size
+    position = len(buffer)
+    buffer.extend(struct.pack("<I", len(data)) + data.tobytes())
+    return position
+
+
+def encode_header(name, geometry_type, columns, envelope, features_count, index_node_size=INDEX_NODE_SIZE):
+    """
+    Returns the size-prefixed FlatBuffers `Header` of a WGS 84 (EPSG:4326) file.
+
+    Args:
+        name: Dataset name.
+        geometry_type: `GEOMETRY_POINT` or `GEOMETRY_LINESTRING`.
+        columns: List of (column name, column type) of the feature properties.
+        envelope: (min_x, min_y, max_x, max_y) of all features.
+        features_count: Number of features.
+        index_node_size: Children per R-tree node, or 0 for a file without index.
+    """
+    buffer = bytearray(4)  # Root offset
+    root = _write_table(buffer, [
+        (0, "string", name),
+        (1, ("vector", "f8"), envelope),
+        (2, "B", geometry_type),
+        (7, "tables", [[(0, "string", column_name), (1, "B", column_type)] for column_name, column_type in columns]),
+        (8, "Q", features_count),
+        (9, "H", index_node_size),
+        (10, "table", [(0, "string", "EPSG"), (1, "i", 4326)]),
+    ])
+    struct.pack_into("<I", buffer, 0, root)
+    return struct.pack("<I", len(buffer)) + bytes(buffer)
+
+
+def encode_string_property(column, data):
+    """Encodes a string property: column number, length and UTF-8 bytes (`data` may be str or bytes)."""
+    data = data if isinstance(data, bytes) else data.encode("utf-8")
+    return _STRING_PROPERTY.pack(column, len(data)) + data
+
+
+def encode_double_property(column, value):
+    """Encodes a double property: column number and value."""
+    return _DOUBLE_PROPERTY.pack(column, value)
+
+
+def encode_properties(columns, values):
+    """
+    Encodes the properties of a feature: the value of each column that is not
+    None, preceded by the column number (see `encode_string_property` and
+    `encode_double_property`).
+    """
+    return b"".join(
+        encode_string_property(number, value) if column_type == COLUMN_STRING else encode_double_property(number, value)
+        for number, ((_, column_type), value) in enumerate(zip(columns, values)) if value is not None
+    )
+
+
+def feature_size(vertex_count, properties_size):
+    """Size in bytes, with its size prefix, of a feature encoded by `encode_feature`."""
+    return 4 + FEATURE_HEAD_SIZE + 16 * vertex_count + 4 + properties_size
+
+
+def encode_feature(geometry_type, xy, properties):
+    """
+    Returns a size-prefixed FlatBuffers `Feature`.
+
+    Args:
+        geometry_type: `GEOMETRY_POINT` or `GEOMETRY_LINESTRING`.
+        xy: Float64 array of interleaved x, y (lon, lat) values.
+        properties: Encoded properties (`encode_properties`).
+    """
+    xy = np.ascontiguousarray(xy, dtype="<f8")
+    properties_at = FEATURE_HEAD_SIZE + 8 * len(xy)
+    head = _FEATURE_HEAD.pack(
+        12,  # Root table
+        8, 12, 4, 8,  # Feature vtable: geometry and properties fields
+        8, 44 - 16, properties_at - 20,  # Feature table
+        18, 9, 0, 4, 0, 0, 0, 0, 8,  # Geometry vtable: xy and type fields
+        44 - 24, 60 - 48, geometry_type,  # Geometry table
+        len(xy),
+    )
+    size = properties_at + 4 + len(properties)
+    return b"".join((struct.pack("<I", size), head, xy.tobytes(), struct.pack("<I", len(properties)), properties))
+
+
+_POINT_HEAD = _FEATURE_HEAD.pack(12, 8, 12, 4, 8, 8, 28, FEATURE_HEAD_SIZE + 16 - 20,
+                                 18, 9, 0, 4, 0, 0, 0, 0, 8, 20, 12, GEOMETRY_POINT, 2)
+
+
+def encode_point_feature(x, y, properties):
+    """Same as `encode_feature(GEOMETRY_POINT, (x, y), properties)`, several times faster."""
+    return b"".join((struct.pack("<I", FEATURE_HEAD_SIZE + 20 + len(properties)), _POINT_HEAD,
+                     _POINT_TAIL.pack(x, y, len(properties)), properties))
+
+
+def hilbert_sort(boxes):
+    """Returns the order of the (n, 4) bounding boxes along a Hilbert curve of their centers."""
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    return hilbert_order((boxes[:, 0] + boxes[:, 2]) / 2.0, (boxes[:, 1] + boxes[:, 3]) / 2.0)
+
+
+def level_bounds(item_count, node_size=INDEX_NODE_SIZE):
+    """
+    Returns the (start, end) node positions of each level of a packed R-tree,
+    from the leaves to the root. Nodes are stored root first.
+    """
+    counts = [item_count]
+    while True:
+        counts.append(-(-counts[-1] // node_size))
+        if counts[-1] == 1:
+            break
+    end = sum(counts)
+    bounds = []
+    for count in counts:
+        bounds.append((end - count, end))
+        end -= count
+    return bounds
+
+
+def packed_rtree(boxes, offsets, node_size=INDEX_NODE_SIZE):
+    """
+    Builds the packed R-tree of features already in Hilbert order.
+
+    Args:
+        boxes: (n, 4) array of feature bounding boxes (min_x, min_y, max_x, max_y).
+        offsets: Byte offset of each feature in the feature section.
+        node_size: Children per node.
+
+    Returns:
+        `NODE_ITEM` array of all nodes, in file order (root first).
+    """
+    levels = level_bounds(len(boxes), node_size)
+    nodes = np.zeros(levels[0][1], dtype=NODE_ITEM)
+    leaves = nodes[levels[0][0]:levels[0][1]]
+    leaves["min_x"], leaves["min_y"], leaves["max_x"], leaves["max_y"] = boxes.T
+    leaves["offset"] = offsets
+    for (start, end), (parent_start, parent_end) in zip(levels, levels[1:]):
+        children = nodes[start:end]
+        groups = np.arange(0, end - start, node_size)
+        parents = nodes[parent_start:parent_end]
+        for field, reduce in (("min_x", np.minimum), ("min_y", np.minimum), ("max_x", np.maximum), ("max_y", np.maximum)):
+            parents[field] = reduce.reduceat(children[field], groups)
+        parents["offset"] = start + groups  # Position of the first child node
+    return nodes
+
+
+def write_flatgeobuf(file, name, geometry_type, columns, boxes, sizes, features):
+    """
+    Writes a FlatGeobuf file with a spatial index.
+
+    Args:
+        file: Binary file object to write to.
+        name: Dataset name.
+        geometry_type: `GEOMETRY_POINT` or `GEOMETRY_LINESTRING`.
+        columns: List of (column name, column type) of the feature properties.
+        boxes: (n, 4) array with the bounding box of each feature, in writing order.
+        sizes: Size of each encoded feature (`feature_size`), in writing order.
+        features: Iterable of the encoded features (`encode_feature`), in the
+            same order; it is only consumed after the header and index are written.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes):
+        envelope = (boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max())
+    else:
+        envelope = ()
+    file.write(MAGIC)
+    file.write(encode_header(name, geometry_type, columns, envelope, len(boxes), INDEX_NODE_SIZE if len(boxes) else 0))
+    if len(boxes):
+        offsets = np.concatenate(([0], np.cumsum(np.asarray(sizes, dtype=np.uint64))[:-1])).astype(np.uint64)
+        file.write(packed_rtree(boxes, offsets).tobytes())
+    for feature in features:
+        file.write(feature)
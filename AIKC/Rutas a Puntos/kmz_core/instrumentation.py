@@ -0,0 +1,284 @@
+"""
+Timing and memory instrumentation of the main stages of the application.
+
+A `Profiler` records spans, the time one stage took, with `time.perf_counter_ns`
+(a span costs about a microsecond, so stages are timed always, not only when
+tracing). It keeps the last span of every stage for the status bar
+(`Profiler.summary`) and, when tracing, writes every span to a file.
+
+Tracing is switched on with environment variables read by `get_profiler`:
+
+    KMZ_TRACE=traza.jsonl         One JSON object per span and line.
+    KMZ_TRACE=traza.json          Chrome trace-event format (chrome://tracing, Perfetto).
+    KMZ_TRACE_MEMORY=1            Also record the peak memory of each span with
+                                  `tracemalloc` (slows everything down noticeably).
+
+Memory peaks are those of the whole process (tracemalloc has no per-thread
+view), so spans that overlap spans of another thread include its allocations.
+
+While a KML member is streamed, decompression, XML parsing and the extraction of
+pins interleave: `TimedReader` and `PlacemarkStream` add up the time of each, and
+`parse_stage_times` splits the parse of one file into the three stages, recorded
+as consecutive spans with those durations.
+
+Instrumentation never makes a stage fail: if the trace file cannot be opened or
+written (`OSError`), a `RuntimeWarning` is issued once and tracing is switched
+off, while the spans keep being recorded for the status bar.
+"""
+import atexit
+import json
+import os
+import threading
+import tracemalloc
+import warnings
+from collections import namedtuple
+from contextlib import contextmanager
+from time import perf_counter_ns
+
+STAGE_LOAD = "load"  # A whole KMZ file, around the three stages below
+STAGE_UNZIP = "unzip"
+STAGE_XML_PARSE = "xml_parse"
+STAGE_EXTRACTION = "extraction"
+STAGE_PIN_LIST = "pin_list"
+STAGE_MARKERS = "markers"
+STAGE_ORDERING = "ordering"
+STAGE_ROUTE_BUILD = "route_build"
+STAGE_KML_SAVE = "kml_save"
+STAGE_KML_LOAD = "kml_load"  # Reading saved routes back
+# Stages shown in the status bar, in this order, with their labels
+STAGE_LABELS = {
+    STAGE_UNZIP: "Descompresión",
+    STAGE_XML_PARSE: "XML",
+    STAGE_EXTRACTION: "Extracción",
+    STAGE_PIN_LIST: "Lista",
+    STAGE_MARKERS: "Marcadores",
+    STAGE_ORDERING: "Orden",
+    STAGE_ROUTE_BUILD: "Rutas",
+    STAGE_KML_SAVE: "Guardado",
+    STAGE_KML_LOAD: "Lectura",
+}
+
+TRACE_ENV = "KMZ_TRACE"  # Path of the trace file: ".jsonl" for JSON lines, anything else for Chrome trace events
+TRACE_MEMORY_ENV = "KMZ_TRACE_MEMORY"  # "1" to record tracemalloc peaks
+JSONL_SUFFIX = ".jsonl"
+
+# One recorded stage: its start and duration (perf_counter nanoseconds), the
+# peak memory allocated while it ran (bytes above the memory in use when it
+# started; None without tracemalloc), the name of the thread that recorded it and
+# extra details (e.g. the file name).
+Span = namedtuple("Span", ["name", "start_ns", "duration_ns", "peak_bytes", "thread", "args"])
+
+
+class TimedReader:
+    """
+    Wraps a binary file object and adds up the time spent in `read` in `read_ns`.
+    For a `ZipFile.open` member that is the decompression time. Other attributes
+    are those of the wrapped object.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.read_ns = 0
+
+    def read(self, size=-1):
+        start = perf_counter_ns()
+        data = self.stream.read(size)
+        self.read_ns += perf_counter_ns() - start
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def parse_stage_times(placemarks, reader, unzip_ns=0):
+    """
+    Splits the time a `PlacemarkStream` spent iterating into stages.
+
+    Args:
+        placemarks: The iterated `PlacemarkStream`.
+        reader: The `TimedReader` it read from.
+        unzip_ns: Time spent opening the archive, counted as decompression.
+
+    Returns:
+        {STAGE_UNZIP: ns, STAGE_XML_PARSE: ns, STAGE_EXTRACTION: ns}
+    """
+    parse_ns = placemarks.busy_ns - placemarks.extraction_ns - reader.read_ns
+    return {
+        STAGE_UNZIP: unzip_ns + reader.read_ns,
+        STAGE_XML_PARSE: max(parse_ns, 0),
+        STAGE_EXTRACTION: placemarks.extraction_ns,
+    }
+
+
+def format_duration(duration_ns):
+    """Formats a duration for the status bar: "350 ms" or "2.41 s"."""
+    if duration_ns < 1_000_000_000:
+        return f"{duration_ns / 1e6:.0f} ms"
+    return f"{duration_ns / 1e9:.2f} s"
+
+
+class Profiler:
+    """
+    Records the spans of the application's stages, from any thread.
+
+    Use `span` around a stage, or `record` for durations measured elsewhere
+    (e.g. in a worker process).
+    """
+    def __init__(self, trace_path=None, memory=False):
+        """
+        Args:
+            trace_path: File every span is written to (see the module docstring), or None.
+            memory: If True, tracemalloc is started and spans record their peak memory.
+        """
+        self.trace_path = trace_path
+        self.chrome_trace = trace_path is not None and not trace_path.lower().endswith(JSONL_SUFFIX)
+        self.memory = memory
+        self.origin_ns = perf_counter_ns()  # Trace times are relative to this
+        self.last = {}  # Stage name -> last Span
+        self.version = 0  # Incremented with every span, so readers can tell when `last` changed
+        self._lock = threading.Lock()
+        self._open_spans = []  # [traced memory at the start, highest peak seen] of spans in progress
+        self._trace_file = None
+        self._thread_ids = {}  # Thread name -> thread id in the Chrome trace
+        self._started_tracing = memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    @classmethod
+    def from_environment(cls, environ=None):
+        """Returns a profiler configured by `TRACE_ENV` and `TRACE_MEMORY_ENV`."""
+        environ = os.environ if environ is None else environ
+        return cls(environ.get(TRACE_ENV) or None, environ.get(TRACE_MEMORY_ENV) == "1")
+
+    @contextmanager
+    def span(self, name, **args):
+        """Records the time (and peak memory) of the code in the `with` block as a span of stage `name`."""
+        memory = self._enter_memory() if self.memory else None
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = perf_counter_ns() - start
+            peak = self._exit_memory(memory) if memory is not None else None
+            self.record(name, start, duration, peak, **args)
+
+    def record(self, name, start_ns, duration_ns, peak_bytes=None, **args):
+        """Records a span measured by the caller (`start_ns` from `time.perf_counter_ns`)."""
+        span = Span(name, start_ns, duration_ns, peak_bytes, threading.current_thread().name, args)
+        with self._lock:
+            self.last[name] = span
+            self.version += 1
+            if self.trace_path is not None:
+                try:
+                    self._write(span)
+                except OSError as e:
+                    self._stop_tracing(e)
+
+    def record_stages(self, start_ns, stage_ns, **args):
+        """
+        Records consecutive spans from `start_ns` with the durations of `stage_ns`
+        ({stage: ns}, e.g. from `parse_stage_times`).
+        """
+        for name, duration in stage_ns.items():
+            self.record(name, start_ns, duration, **args)
+            start_ns += duration
+
+    def summary(self):
+        """
+        Returns the status bar text: the last duration (and peak memory, if
+        recorded) of each stage of `STAGE_LABELS` that has run.
+        """
+        parts = []
+        for name, label in STAGE_LABELS.items():
+            span = self.last.get(name)
+            if span is None:
+                continue
+            text = f"{label} {format_duration(span.duration_ns)}"
+            if span.peak_bytes is not None:
+                text += f" ({span.peak_bytes / 2 ** 20:.1f} MB)"
+            parts.append(text)
+        return " · ".join(parts)
+
+    def close(self):
+        """Finishes and closes the trace file, if any, and stops tracemalloc if this profiler started it."""
+        with self._lock:
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+                self.memory = False
+            if self._trace_file is not None:
+                try:
+                    if self.chrome_trace:
+                        self._trace_file.write("\n]\n")
+                    self._trace_file.close()
+                except OSError as e:
+                    self._stop_tracing(e)
+                self._trace_file = None
+
+    def _enter_memory(self):
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak is reset for the new span, so the spans in progress keep what they saw so far
+            for open_span in self._open_spans:
+                open_span[1] = max(open_span[1], peak)
+            tracemalloc.reset_peak()
+            memory = [current, current]
+            self._open_spans.append(memory)
+            return memory
+
+    def _exit_memory(self, memory):
+        with self._lock:
+            peak = max(memory[1], tracemalloc.get_traced_memory()[1])
+            self._open_spans.remove(memory)
+            for open_span in self._open_spans:
+                open_span[1] = max(open_span[1], peak)
+            return peak - memory[0]
+
+    def _stop_tracing(self, error):
+        """Warns that the trace file failed with `error` and stops tracing; spans are still recorded."""
+        warnings.warn(f"No se pudo escribir la traza '{self.trace_path}': {error}. Se desactiva el trazado.",
+                      RuntimeWarning, stacklevel=3)
+        self.trace_path = None
+        if self._trace_file is not None:
+            try:
+                self._trace_file.close()
+            except OSError:
+                pass  # The file is abandoned either way
+            self._trace_file = None
+
+    def _write(self, span):
+        if self._trace_file is None:
+            self._trace_file = open(self.trace_path, "w", encoding="utf-8")
+            if self.chrome_trace:
+                self._trace_file.write("[\n")
+        else:
+            self._trace_file.write(",\n" if self.chrome_trace else "")
+        start_us = (span.start_ns - self.origin_ns) / 1000
+        if self.chrome_trace:
+            tid = self._thread_ids.get(span.thread)
+            if tid is None:  # Trace viewers want numeric thread ids; the name goes in a metadata event
+                tid = self._thread_ids[span.thread] = len(self._thread_ids) + 1
+                metadata = {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": span.thread}}
+                self._trace_file.write(json.dumps(metadata, ensure_ascii=False) + ",\n")
+            args = dict(span.args, peak_bytes=span.peak_bytes) if span.peak_bytes is not None else span.args
+            event = {"name": span.name, "cat": "kmz", "ph": "X", "ts": start_us, "dur": span.duration_ns / 1000,
+                     "pid": os.getpid(), "tid": tid, "args": args}
+            self._trace_file.write(json.dumps(event, ensure_ascii=False))
+        else:
+            record = {"stage": span.name, "start_ms": start_us / 1000, "duration_ms": span.duration_ns / 1e6,
+                      "peak_bytes": span.peak_bytes, "thread": span.thread, **span.args}
+            self._trace_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._trace_file.flush()  # Spans are few, and a trace should survive a crash
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """Returns the profiler of the process, created from the environment on first use."""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = Profiler.from_environment()
+            atexit.register(_profiler.close)
+        return _profiler
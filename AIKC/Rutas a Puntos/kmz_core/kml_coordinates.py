@@ -0,0 +1,145 @@
+"""
+Bulk parsing of KML coordinate lists.
+
+A LineString, LinearRing or Polygon boundary stores all its vertices in the text
+of one `<coordinates>` element: "lon,lat[,alt]" tuples separated by whitespace,
+often hundreds of thousands of them. Splitting that text and calling `float()`
+per value costs several Python operations per vertex, so `parse_coordinates`
+works on the bytes of the whole block with NumPy instead:
+
+1. the whitespace bytes delimit the tuples, and the positions of the commas give
+   the number of components of every tuple (2 or 3) and show empty ones;
+2. the commas become spaces and every value is converted by a single
+   `np.fromstring` call, then placed in an (N, 3) array (altitude 0 for
+   "lon,lat" tuples).
+
+A block with a malformed tuple (a wrong number of components, an empty one, a
+value that is not a finite number) is parsed again tuple by tuple with
+`float()`, which skips and counts the malformed tuples instead of failing the
+whole geometry. Only such blocks pay the per-vertex cost, and blocks shorter
+than `BULK_MIN_BYTES`, for which NumPy's fixed cost per call is larger.
+
+`parse_track` does the same for the `<gx:coord>` elements of a `gx:Track`,
+which hold one "lon lat alt" vertex each.
+"""
+import math
+import warnings
+
+import numpy as np
+
+BULK_MIN_BYTES = 768  # Shorter blocks are parsed tuple by tuple: NumPy's fixed cost per call would dominate
+_COMMA = ord(",")
+_SPACE = ord(" ")  # Bytes up to this one are whitespace (XML allows no other control characters)
+_NEWLINE = ord("\n")
+
+
+def _empty():
+    return np.empty((0, 3), dtype=np.float64)
+
+
+def parse_coordinates(text):
+    """
+    Parses the text of a `<coordinates>` element with any number of tuples.
+
+    Args:
+        text: "lon,lat[,alt]" tuples separated by whitespace (None or "" for none).
+
+    Returns:
+        (coords, malformed): an (N, 3) float64 array with lon, lat, alt for each
+        valid tuple, in order, and the number of malformed tuples skipped.
+    """
+    if not text:
+        return _empty(), 0
+    data = text.encode("utf-8")
+    if len(data) < BULK_MIN_BYTES:
+        return _parse_tuples(data)
+    return _parse_bytes(np.frombuffer(data, dtype=np.uint8))
+
+
+def parse_track(coord_texts):
+    """
+    Parses the `<gx:coord>` texts of a `gx:Track`, "lon lat alt" each.
+
+    Args:
+        coord_texts: Sequence with the text of each `<gx:coord>` element.
+
+    Returns:
+        (coords, malformed), as `parse_coordinates`.
+    """
+    if not coord_texts:
+        return _empty(), 0
+    if len(coord_texts) * 32 < BULK_MIN_BYTES:  # About 32 bytes per vertex
+        return _parse_tuples(b" ".join(b",".join(text.encode("utf-8").split()) for text in coord_texts if text))
+    # One vertex per line; each run of spaces inside a vertex becomes one comma,
+    # which turns the track into a coordinate list.
+    data = np.frombuffer("\n".join(text.strip() if text else "" for text in coord_texts).encode("utf-8"),
+                         dtype=np.uint8)
+    blank = (data <= _SPACE) & (data != _NEWLINE)
+    run_start = blank.copy()
+    run_start[1:] &= ~blank[:-1]
+    data = np.where(run_start, np.uint8(_COMMA), data)[~blank | run_start]
+    return _parse_bytes(data)
+
+
+def _parse_bytes(data):
+    """Parses a coordinate list given as a uint8 array of its UTF-8 bytes."""
+    separator = data <= _SPACE  # Whitespace; other control bytes are not allowed in XML
+    if separator.all():
+        return _empty(), 0
+    # Tuples are the runs of non-separator bytes: [starts[i], ends[i])
+    edges = np.flatnonzero(separator[1:] != separator[:-1]) + 1
+    if not separator[0]:
+        edges = np.concatenate(([0], edges))
+    if not separator[-1]:
+        edges = np.concatenate((edges, [len(data)]))
+    starts, ends = edges[::2], edges[1::2]
+
+    commas = np.flatnonzero(data == _COMMA)
+    components = np.searchsorted(commas, ends) - np.searchsorted(commas, starts) + 1
+    if (components.min() < 2 or components.max() > 3 or data[starts].max() == _COMMA or data[ends - 1].max() == _COMMA
+            or (len(commas) > 1 and (np.diff(commas) == 1).any())):  # Wrong count or empty components
+        return _parse_tuples(data.tobytes())
+    try:
+        with warnings.catch_warnings():
+            # NumPy < 2 warns and stops at a value that is not a number instead of raising;
+            # the count check below catches it.
+            warnings.simplefilter("ignore", DeprecationWarning)
+            values = np.fromstring(np.where(data == _COMMA, np.uint8(_SPACE), data).tobytes(), dtype=np.float64, sep=" ")
+    except ValueError:  # A value that is not a number
+        return _parse_tuples(data.tobytes())
+    if len(values) != components.sum() or not np.isfinite(values).all():
+        return _parse_tuples(data.tobytes())
+
+    coords = np.zeros((len(components), 3), dtype=np.float64)
+    if components.min() == 3:
+        coords[:] = values.reshape(-1, 3)
+    else:
+        first_value = np.cumsum(components) - components
+        rows = np.repeat(np.arange(len(components)), components)
+        coords[rows, np.arange(len(values)) - first_value[rows]] = values
+    return coords, 0
+
+
+def _parse_tuples(data):
+    """
+    Parses a coordinate list tuple by tuple with `float()`, skipping and counting
+    the malformed tuples. Used for short blocks, where it is faster than the bulk
+    conversion, and for the blocks `_parse_bytes` cannot convert in bulk.
+    """
+    rows = []
+    malformed = 0
+    for token in data.split():
+        parts = token.split(b",")
+        try:
+            if not 2 <= len(parts) <= 3 or b"_" in token:  # float() accepts "1_000", np.fromstring does not
+                raise ValueError
+            row = [float(part) for part in parts]
+            if not all(map(math.isfinite, row)):
+                raise ValueError
+        except ValueError:  # Includes empty values and bytes that are not ASCII
+            malformed += 1
+            continue
+        if len(row) == 2:
+            row.append(0.0)
+        rows.append(row)
+    return (np.array(rows, dtype=np.float64) if rows else _empty()), malformed
@@ -0,0 +1,66 @@
+"""
+Streaming KML/KMZ reader for routes, the counterpart of `kml_writer`.
+
+`load_routes` reads back the routes of a file saved by `kml_writer.save_routes`
+(or any KML or KMZ with line geometries): each LineString, Polygon outline or
+gx:Track becomes a route with the name of its Placemark and the color of its
+LineStyle, shared (`<styleUrl>` to a Style or StyleMap) or inline. Every KML
+member of a KMZ is read, in archive order (see `kml_stream.find_kml_members`),
+each one resolving its own styles. The document
+is streamed with `kml_stream.PlacemarkStream`, which parses every
+`<coordinates>` block in bulk into an array (see `kml_coordinates`), so loading
+does not go through one Python object per vertex.
+"""
+import zipfile
+from collections import namedtuple
+
+from .kml_stream import PlacemarkStream, find_kml_members
+from .routes import kml_color_to_route_color
+from .zip_member import open_member
+
+KMZ_SUFFIX = ".kmz"
+
+# Routes read from a KML or KMZ file.
+# routes: route dicts ("name", "kml_coords" as an (N, 3) lon/lat/alt array, "color"), see `routes`.
+# error_count: vertices (or Point placemarks) skipped because of malformed coordinates.
+LoadedRoutes = namedtuple("LoadedRoutes", ["routes", "error_count"])
+
+
+def _read_routes(kml_stream):
+    placemarks = PlacemarkStream(kml_stream)
+    for _ in placemarks:  # Pins are not routes
+        pass
+    routes = [
+        {"name": name, "kml_coords": coords, "color": kml_color_to_route_color(kml_color)}
+        for (name, coords), kml_color in zip(placemarks.lines, placemarks.line_colors())
+    ]
+    return LoadedRoutes(routes, placemarks.extraction_error_count)
+
+
+def load_routes(path):
+    """
+    Reads the routes of a KML file, or of every KML member of a KMZ file.
+
+    Args:
+        path: Path of a `.kml` or `.kmz` file.
+
+    Returns:
+        A `LoadedRoutes`. Lines without a LineStyle get `routes.DEFAULT_ROUTE_COLOR`.
+
+    Raises:
+        ValueError: If a KMZ file contains no KML member.
+        zipfile.BadZipFile, lxml.etree.XMLSyntaxError, OSError: If the file cannot be read.
+    """
+    if not path.lower().endswith(KMZ_SUFFIX):
+        return _read_routes(path)
+    with zipfile.ZipFile(path, "r") as kmz:
+        kml_members = find_kml_members(kmz)
+        if not kml_members:
+            raise ValueError("No se encontró un archivo KML dentro del KMZ.")
+        routes, error_count = [], 0
+        for kml_member in kml_members:
+            with open_member(kmz, kml_member) as kml_stream:
+                loaded = _read_routes(kml_stream)
+            routes.extend(loaded.routes)
+            error_count += loaded.error_count
+        return LoadedRoutes(routes, error_count)
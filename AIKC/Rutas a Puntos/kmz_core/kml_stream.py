@@ -0,0 +1,344 @@
+"""
+Streaming extraction of Point placemarks from KML documents.
+
+`PlacemarkStream` reads a KML byte stream in chunks (e.g. from a
+`zip_member.MemberReader`), feeds them to an `lxml.etree.XMLPullParser`, handles each
+Placemark as soon as its end tag is parsed and then clears it, so memory use stays
+flat no matter how large the document is. It follows the same rules as
+`KMZRouteApp._extract_placemarks_from_lxml_tree` (only Placemarks reachable through
+Document/Folder elements, first Point found, malformed coordinates counted as errors),
+so both produce the same pins and the same error count. It also collects the
+line geometries of those Placemarks (LineStrings, Polygon outer boundaries and
+gx:Tracks, see `placemark_lines`), which are imported as routes, with the
+LineStyle color of each (`PlacemarkStream.line_colors`), and the targets of the
+document's NetworkLinks, so the members of a KMZ a document links to can be
+parsed too (see `kmz_members`).
+"""
+import math
+import os
+from time import perf_counter_ns
+
+from lxml import etree
+
+from .kml_coordinates import parse_coordinates, parse_track
+from .zip_member import MEMBER_CHUNK_SIZE
+
+# Namespaces and tags used while streaming KML.
+KML_NS = "{http://www.opengis.net/kml/2.2}"  # KML namespace
+GX_NS = "{http://www.google.com/kml/ext/2.2}"  # Google extensions namespace (gx:Track)
+PLACEMARK_TAG = f"{KML_NS}Placemark"
+NETWORK_LINK_TAG = f"{KML_NS}NetworkLink"
+NETWORK_LINK_HREF_PATHS = (f"{KML_NS}Link/{KML_NS}href", f"{KML_NS}Url/{KML_NS}href")  # Url is the KML 2.0 name of Link
+LINE_STRING_TAG = f"{KML_NS}LineString"
+POLYGON_TAG = f"{KML_NS}Polygon"
+TRACK_TAG = f"{GX_NS}Track"
+LINE_TAGS = (LINE_STRING_TAG, POLYGON_TAG, TRACK_TAG)  # Geometries imported as routes
+STYLE_TAG = f"{KML_NS}Style"
+STYLE_MAP_TAG = f"{KML_NS}StyleMap"
+STYLE_URL_TAG = f"{KML_NS}styleUrl"
+LINE_COLOR_PATH = f"{KML_NS}LineStyle/{KML_NS}color"  # Color of a Style's lines, relative to the Style
+STYLE_MAP_NORMAL_KEY = "normal"  # StyleMap pair used when the feature is not highlighted
+POLYGON_OUTER_PATH = f"{KML_NS}outerBoundaryIs/{KML_NS}LinearRing/{KML_NS}coordinates"  # Holes are not routes
+CONTAINER_TAGS = (f"{KML_NS}Document", f"{KML_NS}Folder")  # Elements the extraction descends into
+DEFAULT_PIN_NAME = "Pin sin nombre"  # Name used when a Placemark has no (or an empty) name
+DEFAULT_LINE_NAME = "Ruta sin nombre"  # Name of the routes imported from Placemarks without a name
+MIN_LINE_VERTICES = 2  # Line geometries with fewer valid vertices are not imported
+PARSER_VERSION = 4  # Bump whenever a change here changes the pins or error count extracted from a file (invalidates parse_cache)
+
+
+def find_kml_member(kmz):
+    """
+    Returns the name of the first `.kml` member of an open KMZ archive.
+
+    Args:
+        kmz: An open `zipfile.ZipFile`.
+
+    Returns:
+        The member name (str), or None if the archive contains no KML file.
+    """
+    for name in kmz.namelist():
+        if name.lower().endswith('.kml'):
+            return name
+    return None
+
+
+def find_kml_members(kmz):
+    """
+    Returns the names of every `.kml` member of an open KMZ archive, in archive
+    order, so the first one is the member `find_kml_member` returns (the root document).
+
+    Args:
+        kmz: An open `zipfile.ZipFile`.
+
+    Returns:
+        A list of member names, empty if the archive contains no KML file.
+    """
+    return [name for name in kmz.namelist() if name.lower().endswith('.kml')]
+
+
+def parse_point_coordinates(coords_str):
+    """
+    Parses the text of a Point `<coordinates>` element.
+
+    Args:
+        coords_str: Text in "lon,lat[,alt]" form. Surrounding whitespace is ignored.
+
+    Returns:
+        A (lon, lat, alt) tuple of floats. Altitude defaults to 0.0 when missing.
+
+    Raises:
+        ValueError: If the text does not contain valid numeric coordinates, or
+                    one of them is not finite ("nan", "inf"), like line vertices
+                    (see `kml_coordinates`).
+    """
+    lon_str, lat_str, *alt_str = coords_str.strip().split(',')
+    lon = float(lon_str)
+    lat = float(lat_str)
+    alt = float(alt_str[0]) if alt_str else 0.0  # Altitude is optional, default to 0
+    if not (math.isfinite(lon) and math.isfinite(lat) and math.isfinite(alt)):
+        raise ValueError(f"Coordenadas no finitas: '{coords_str.strip()}'")
+    return lon, lat, alt
+
+
+def placemark_lines(placemark):
+    """
+    Extracts the line geometries of a parsed Placemark element: every LineString,
+    the outer boundary of every Polygon and every gx:Track in it, including those
+    nested in a MultiGeometry or a gx:MultiTrack. Their coordinates are parsed in
+    bulk (see `kml_coordinates`).
+
+    Args:
+        placemark: A Placemark element.
+
+    Returns:
+        (lines, malformed): a list with an (N, 3) lon/lat/alt array per geometry of
+        at least `MIN_LINE_VERTICES` valid vertices, in document order, and the
+        number of malformed coordinate tuples skipped.
+    """
+    lines = []
+    malformed = 0
+    for geometry in placemark.iter(*LINE_TAGS):
+        if geometry.tag == TRACK_TAG:
+            coords, bad = parse_track([coord.text for coord in geometry.iterfind(f"{GX_NS}coord")])
+        elif geometry.tag == POLYGON_TAG:
+            coords, bad = parse_coordinates(geometry.findtext(POLYGON_OUTER_PATH))
+        else:
+            coords, bad = parse_coordinates(geometry.findtext(f"{KML_NS}coordinates"))
+        malformed += bad
+        if len(coords) >= MIN_LINE_VERTICES:
+            lines.append(coords)
+    return lines, malformed
+
+
+class PlacemarkStream:
+    """
+    Iterates over the Point placemarks of a KML document without building the full tree.
+
+    Iterating yields `(name, (lon, lat, alt))` tuples in document order. Placemarks whose
+    coordinates cannot be parsed are skipped and counted in `extraction_error_count`,
+    which is final once iteration has finished. The line geometries of the Placemarks
+    are appended to `lines` as `(name, (N, 3) array)` pairs (see `placemark_lines`;
+    their malformed tuples count as errors too), and the `href` of every NetworkLink
+    reachable like a Placemark to `network_links`, both in document order. The shared
+    Styles and StyleMaps of the document are kept in `styles`, so `line_colors()` can
+    give the LineStyle color of each line once iteration has finished.
+
+    The time spent inside the iteration (reading, parsing and extracting, not the
+    caller's work between pins) is added up in `busy_ns`, and the part of it spent
+    extracting pins from parsed Placemarks in `extraction_ns`
+    (see `instrumentation.parse_stage_times`).
+
+    Example:
+        with open_member(kmz, kml_filename) as kml_stream:
+            placemarks = PlacemarkStream(kml_stream)
+            for name, coords in placemarks:
+                ...
+            errors = placemarks.extraction_error_count
+    """
+    def __init__(self, kml_stream):
+        """
+        Args:
+            kml_stream: A binary file-like object (e.g. the result of `ZipFile.open`)
+                        or a file path containing KML.
+        """
+        self.kml_stream = kml_stream
+        self.extraction_error_count = 0
+        self.lines = []
+        self.line_styles = []  # (inline color, styleUrl) of each line, see `_style_of`
+        self.styles = {}  # Style or StyleMap id -> (color, styleUrl)
+        self.network_links = []
+        self.busy_ns = 0
+        self.extraction_ns = 0
+
+    def __iter__(self):
+        # Same parser options as the tree-based loader: no entity resolution (security),
+        # keep CDATA content, ignore comments, and allow text nodes over 10 MB (the
+        # coordinates of long LineStrings). Line geometries are reported too, so only
+        # the Placemarks that have one are searched for them.
+        parser = etree.XMLPullParser(
+            events=("end",),
+            tag=(PLACEMARK_TAG, NETWORK_LINK_TAG, STYLE_TAG, STYLE_MAP_TAG) + LINE_TAGS,
+            resolve_entities=False,
+            strip_cdata=False,
+            remove_comments=True,
+            huge_tree=True,
+        )
+        owns_stream = isinstance(self.kml_stream, (str, os.PathLike))
+        stream = open(self.kml_stream, "rb") if owns_stream else self.kml_stream
+        try:
+            resumed = perf_counter_ns()
+            has_lines = False  # A line geometry ended since the last Placemark
+            while True:
+                data = stream.read(MEMBER_CHUNK_SIZE)
+                if data:
+                    parser.feed(data)
+                else:
+                    parser.close()  # Raises if the document is incomplete
+                for _, placemark in parser.read_events():
+                    if placemark.tag in LINE_TAGS:  # Part of the Placemark that ends next, handled with it
+                        has_lines = True
+                        continue
+                    reachable = self._is_reachable(placemark)
+                    if not reachable and placemark.tag in (STYLE_TAG, STYLE_MAP_TAG):
+                        continue  # Inline style, read with the Placemark (or StyleMap) it belongs to
+                    extraction_start = perf_counter_ns()
+                    pin = None
+                    if reachable:
+                        if placemark.tag == NETWORK_LINK_TAG:
+                            self._add_network_link(placemark)
+                        elif placemark.tag == PLACEMARK_TAG:
+                            pin = self._parse_placemark(placemark, has_lines)
+                        else:
+                            self._add_style(placemark)
+                    if placemark.tag == PLACEMARK_TAG:
+                        has_lines = False
+                    paused = perf_counter_ns()
+                    self.extraction_ns += paused - extraction_start
+                    if pin is not None:
+                        self.busy_ns += paused - resumed
+                        yield pin
+                        resumed = perf_counter_ns()
+                    # Free the processed Placemark (NetworkLink, Style) and every already handled
+                    # sibling before it, so the partially built tree never grows with the document.
+                    placemark.clear(keep_tail=True)
+                    parent = placemark.getparent()
+                    if parent is not None:
+                        while placemark.getprevious() is not None:
+                            del parent[0]
+                if not data:
+                    break
+            self.busy_ns += perf_counter_ns() - resumed
+        finally:
+            if owns_stream:
+                stream.close()
+
+    @staticmethod
+    def _is_reachable(placemark):
+        """
+        Checks that the Placemark would be visited by the recursive tree extraction,
+        i.e. every ancestor below the document root is a Document or a Folder.
+        """
+        parent = placemark.getparent()
+        while parent is not None and parent.getparent() is not None:
+            if parent.tag not in CONTAINER_TAGS:
+                return False
+            parent = parent.getparent()
+        return True
+
+    def _add_network_link(self, network_link):
+        """Appends the target of a fully parsed NetworkLink element to `network_links`, if it has one."""
+        for path in NETWORK_LINK_HREF_PATHS:
+            href = network_link.findtext(path)
+            if href and href.strip():
+                self.network_links.append(href.strip())
+                return
+
+    def _add_style(self, style):
+        """Keeps the line color of a shared Style, or the normal style of a StyleMap, in `styles`."""
+        style_id = style.get("id")
+        if not style_id:
+            return
+        if style.tag == STYLE_TAG:
+            self.styles[style_id] = (style.findtext(LINE_COLOR_PATH), None)
+            return
+        for pair in style.iterfind(f"{KML_NS}Pair"):
+            if (pair.findtext(f"{KML_NS}key") or "").strip() == STYLE_MAP_NORMAL_KEY:
+                self.styles[style_id] = self._style_of(pair)
+
+    @staticmethod
+    def _style_of(element):
+        """Returns the (inline LineStyle color, styleUrl) of a Placemark or StyleMap Pair, each None if missing."""
+        return element.findtext(f"{STYLE_TAG}/{LINE_COLOR_PATH}"), element.findtext(STYLE_URL_TAG)
+
+    def line_colors(self):
+        """
+        Returns the KML color code (e.g. "ff0000ff") of the LineStyle of each of
+        `lines`, or None for the lines without one. Styles are resolved against the
+        whole document, so call it once iteration has finished.
+        """
+        return [self._resolve_color(style) for style in self.line_styles]
+
+    def _resolve_color(self, style, depth=0):
+        color, style_url = style
+        if color and color.strip():
+            return color.strip().lower()
+        style_url = (style_url or "").strip()
+        if style_url.startswith("#") and style_url[1:] in self.styles and depth < 2:  # StyleMap -> Style at most
+            return self._resolve_color(self.styles[style_url[1:]], depth + 1)
+        return None
+
+    def _parse_placemark(self, placemark, has_lines=True):
+        """
+        Extracts the name and Point coordinates of a fully parsed Placemark element,
+        and appends its line geometries to `lines` (only searched for if `has_lines`).
+
+        Returns:
+            A `(name, (lon, lat, alt))` tuple, or None if the Placemark has no Point,
+            no coordinates, or malformed coordinates (the latter also increments
+            `extraction_error_count`).
+        """
+        name_element = placemark.find(f"{KML_NS}name")
+        name = name_element.text if name_element is not None and name_element.text else None
+
+        if has_lines:
+            lines, malformed = placemark_lines(placemark)
+            self.extraction_error_count += malformed
+            self.lines.extend((name or DEFAULT_LINE_NAME, coords) for coords in lines)
+            self.line_styles.extend([self._style_of(placemark)] * len(lines))
+        name = name or DEFAULT_PIN_NAME
+
+        # Find a Point geometry within the Placemark (can be nested, e.g. in a MultiGeometry)
+        point_element = placemark.find(f".//{KML_NS}Point")
+        if point_element is None:
+            return None
+        coordinates_element = point_element.find(f"{KML_NS}coordinates")
+        if coordinates_element is None or not coordinates_element.text:
+            return None
+
+        try:
+            coords = parse_point_coordinates(coordinates_element.text)
+        except ValueError:  # Malformed coordinate string, skip and count it
+            self.extraction_error_count += 1
+            return None
+        return name, coords
+
+
+def parse_kml_tree(kml_stream):
+    """
+    Parses a whole KML document into a tree, feeding the parser the chunks read
+    from `kml_stream`, so the document is never held as one `bytes` object next
+    to its tree. Uses the parser options of `PlacemarkStream`.
+
+    Args:
+        kml_stream: A binary file-like object, e.g. a `zip_member.MemberReader`.
+
+    Returns:
+        The root element.
+
+    Raises:
+        lxml.etree.XMLSyntaxError: If the document is not well-formed.
+    """
+    parser = etree.XMLParser(resolve_entities=False, strip_cdata=False, remove_comments=True, huge_tree=True)
+    for data in iter(lambda: kml_stream.read(MEMBER_CHUNK_SIZE), b""):
+        parser.feed(data)
+    return parser.close()
@@ -0,0 +1,106 @@
+"""
+Streaming KML/KMZ writer for routes.
+
+`write_routes_kml` writes the document incrementally with `lxml.etree.xmlfile`:
+the coordinates of each LineString are formatted and written in chunks of
+`COORDINATE_CHUNK` vertices, so memory use does not depend on the size of the
+routes and nothing is kept once written. Routes share one `<Style>` per color,
+declared at the top of the Document and referenced with `<styleUrl>`.
+
+`save_routes` writes a `.kml` file, or a `.kmz` archive whose `doc.kml` member
+is compressed as it is written. The output goes to a temporary file that only
+replaces the destination once complete.
+"""
+import itertools
+import os
+import zipfile
+
+from lxml import etree
+
+from .kml_stream import KML_NS
+
+KML_NAMESPACE = KML_NS[1:-1]  # Without the braces
+KMZ_DOCUMENT_NAME = "doc.kml"  # Name Google Earth gives to the main KML member of a KMZ
+DEFAULT_DOCUMENT_NAME = "Rutas Generadas"
+ROUTE_LINE_WIDTH = 3
+COORDINATE_CHUNK = 10000  # Vertices formatted and written at a time
+COORDINATE_FORMAT = "%.8f,%.8f,%.2f"  # lon,lat,alt: 8 decimals is about a millimeter
+KMZ_COMPRESSION_LEVEL = 1  # Fastest deflate level; higher levels take several times longer for a few percent less
+
+
+def route_style_id(kml_color):
+    """Returns the id of the shared style of the routes drawn with `kml_color`."""
+    return f"ruta-{kml_color}"
+
+
+def _write_text_element(xf, tag, text):
+    with xf.element(f"{KML_NS}{tag}"):
+        xf.write(text)
+
+
+def _write_coordinates(xf, kml_coords):
+    """Writes the text of a `<coordinates>` element, a chunk of vertices at a time."""
+    chunk_format = " ".join([COORDINATE_FORMAT] * COORDINATE_CHUNK)
+    for start in range(0, len(kml_coords), COORDINATE_CHUNK):
+        chunk = kml_coords[start:start + COORDINATE_CHUNK]
+        # One %-formatting call per chunk is much faster than formatting vertex by vertex
+        text_format = chunk_format if len(chunk) == COORDINATE_CHUNK else " ".join([COORDINATE_FORMAT] * len(chunk))
+        text = text_format % tuple(map(float, itertools.chain.from_iterable(chunk)))
+        xf.write(text if start == 0 else " " + text)
+
+
+def write_routes_kml(file, routes, document_name=DEFAULT_DOCUMENT_NAME, line_width=ROUTE_LINE_WIDTH):
+    """
+    Writes routes as a KML document.
+
+    Args:
+        file: Binary file object (or path) to write to.
+        routes: Sequence of (name, KML color code, kml_coords) tuples, where
+            `kml_coords` is a sequence of (lon, lat, alt) tuples or an (n, 3)
+            array. It is read twice: once for the styles, once for the routes.
+        document_name: Name of the KML Document.
+        line_width: Width of the route lines.
+    """
+    colors = list(dict.fromkeys(kml_color for _, kml_color, _ in routes))  # In order of first use
+    with etree.xmlfile(file, encoding="utf-8") as xf:
+        xf.write_declaration()
+        with xf.element(f"{KML_NS}kml", nsmap={None: KML_NAMESPACE}):
+            with xf.element(f"{KML_NS}Document"):
+                _write_text_element(xf, "name", document_name)
+                for kml_color in colors:
+                    with xf.element(f"{KML_NS}Style", id=route_style_id(kml_color)):
+                        with xf.element(f"{KML_NS}LineStyle"):
+                            _write_text_element(xf, "color", kml_color)
+                            _write_text_element(xf, "width", str(line_width))
+                for name, kml_color, kml_coords in routes:
+                    with xf.element(f"{KML_NS}Placemark"):
+                        _write_text_element(xf, "name", name)
+                        _write_text_element(xf, "styleUrl", "#" + route_style_id(kml_color))
+                        with xf.element(f"{KML_NS}LineString"):
+                            _write_text_element(xf, "tessellate", "1")
+                            with xf.element(f"{KML_NS}coordinates"):
+                                _write_coordinates(xf, kml_coords)
+
+
+def save_routes(path, routes, document_name=DEFAULT_DOCUMENT_NAME):
+    """
+    Saves routes (see `write_routes_kml`) to a `.kml` file or, if `path` ends
+    in `.kmz`, to a KMZ archive with the document compressed as it is written.
+
+    Raises:
+        OSError: The file cannot be written.
+    """
+    partial_path = path + ".part"  # Written aside so a failed save never leaves a broken file
+    try:
+        if path.lower().endswith(".kmz"):
+            with zipfile.ZipFile(partial_path, "w", compression=zipfile.ZIP_DEFLATED,
+                                 compresslevel=KMZ_COMPRESSION_LEVEL) as kmz:
+                with kmz.open(KMZ_DOCUMENT_NAME, "w", force_zip64=True) as member:
+                    write_routes_kml(member, routes, document_name)
+        else:
+            with open(partial_path, "wb") as kml_file:
+                write_routes_kml(kml_file, routes, document_name)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
@@ -0,0 +1,184 @@
+"""
+Loading of every KML member of a KMZ file.
+
+Exports often split their layers into several KML files inside one KMZ: the root
+document (the first `.kml` member, usually `doc.kml`) and others, frequently
+loaded by the root through `<NetworkLink>`s. `parse_kmz_members` parses the
+members in the order they are found and follows the NetworkLinks whose target is
+another member of the same archive (links to remote URLs, to files outside the
+archive or to nested KMZ files are ignored). Every member is parsed once, even
+if several documents link to it.
+
+With an executor (e.g. a `ProcessPoolExecutor`), members of at least
+`PARALLEL_MEMBER_BYTES` uncompressed bytes are parsed by `parse_kml_member` in
+its worker processes, all of them submitted up front, while the small members
+are parsed in the calling thread; results are still yielded in order.
+
+The pins keep the member they come from as their source: the pins of the root
+member have the file name as their source, as those of a KMZ with a single KML
+file, and those of every other member the file name followed by the member's
+path ("capas.kmz/postes.kml", see `member_source`), so `routes_by_source` makes
+one route per member. Results that hold the pins of several members list them as
+`(member name, pin count)` pairs, split again by `member_sources`.
+"""
+import posixpath
+import time
+import zipfile
+from array import array
+from collections import deque, namedtuple
+from urllib.parse import unquote, urlsplit
+
+from .instrumentation import TimedReader, parse_stage_times
+from .kml_stream import PlacemarkStream
+from .zip_member import open_member
+
+PARALLEL_MEMBER_BYTES = 8 * 1024 ** 2  # Uncompressed size from which a member is parsed in a worker process
+NESTED_ARCHIVE_SUFFIX = ".kmz"  # NetworkLink targets with this suffix are archives, not KML, and are skipped
+
+# Pins of one KML member of a KMZ file.
+# member: name of the member in the archive.
+# names: list with the name of each pin.
+# coords: flat array('d') with lon, lat, alt for each pin (3 values per pin).
+# lines: `(name, (N, 3) array)` pair per line geometry, imported as routes (see `kml_stream.placemark_lines`).
+# error_count: placemarks and line vertices skipped because of malformed coordinates.
+# links: members of the same archive the member's NetworkLinks point to, in document order.
+# timing: (start in perf_counter nanoseconds, {stage: nanoseconds}), see `instrumentation.parse_stage_times`.
+KMLMemberResult = namedtuple("KMLMemberResult", ["member", "names", "coords", "lines", "error_count", "links", "timing"])
+
+
+def linked_members(member, hrefs, member_names):
+    """
+    Resolves the NetworkLink targets of a member against the archive.
+
+    Args:
+        member: Name of the member the links were found in; relative targets are
+                resolved against its directory, as KML requires.
+        hrefs: The `href` of each NetworkLink (`PlacemarkStream.network_links`).
+        member_names: Set with the names of every member of the archive.
+
+    Returns:
+        The names of the linked members of the archive, in order and without repetitions.
+    """
+    linked = []
+    for href in hrefs:
+        parts = urlsplit(href)
+        if parts.scheme or parts.netloc or not parts.path:  # Remote URL (or a Windows drive), or a fragment only
+            continue
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(member), unquote(parts.path).lstrip("/")))
+        if target in member_names and target not in linked and not target.lower().endswith(NESTED_ARCHIVE_SUFFIX):
+            linked.append(target)
+    return linked
+
+
+def parse_kml_member(filepath, member):
+    """
+    Parses the Point placemarks and line geometries of one KML member of a KMZ file. Used in worker
+    processes too, so it only takes picklable arguments.
+
+    Args:
+        filepath: Path of the KMZ file.
+        member: Name of the KML member to parse.
+
+    Returns:
+        A `KMLMemberResult`.
+
+    Raises:
+        zipfile.BadZipFile, KeyError, lxml.etree.XMLSyntaxError, OSError: If the
+            archive or the member cannot be read.
+    """
+    names = []
+    coords = array('d')
+    start = time.perf_counter_ns()
+    with zipfile.ZipFile(filepath, 'r') as kmz:
+        with open_member(kmz, member) as kml_stream:
+            unzip_ns = time.perf_counter_ns() - start  # Opening the archive and the member
+            reader = TimedReader(kml_stream)
+            placemarks = PlacemarkStream(reader)
+            for name, pin_coords in placemarks:
+                names.append(name)
+                coords.extend(pin_coords)
+        links = linked_members(member, placemarks.network_links, set(kmz.namelist()))
+    timing = (start, parse_stage_times(placemarks, reader, unzip_ns))
+    return KMLMemberResult(member, names, coords, placemarks.lines, placemarks.extraction_error_count, links, timing)
+
+
+def parse_kmz_members(filepath, members, parsed=(), executor=None):
+    """
+    Parses KML members of a KMZ file and, after them, the members they link to.
+
+    Args:
+        filepath: Path of the KMZ file.
+        members: Names of the members to parse, in order.
+        parsed: Names of members the caller already parsed (e.g. the root member,
+                streamed); they are never parsed again.
+        executor: Optional `concurrent.futures.Executor` the members of at least
+                  `PARALLEL_MEMBER_BYTES` are parsed in. The caller owns it, and
+                  cancels what is left if it stops iterating early.
+
+    Yields:
+        A `KMLMemberResult` per member: those of `members` first, then the linked
+        ones, in the order they were found.
+    """
+    with zipfile.ZipFile(filepath, 'r') as kmz:
+        sizes = {info.filename: info.file_size for info in kmz.infolist()}
+    pending = deque()
+    seen = set(parsed)
+    futures = {}  # Member name -> future of its parse in the executor
+
+    def enqueue(names):
+        for name in names:
+            if name in seen:
+                continue
+            seen.add(name)
+            pending.append(name)
+            if executor is not None and sizes.get(name, 0) >= PARALLEL_MEMBER_BYTES:
+                futures[name] = executor.submit(parse_kml_member, filepath, name)
+
+    enqueue(members)
+    while pending:
+        member = pending.popleft()
+        future = futures.pop(member, None)
+        result = future.result() if future is not None else parse_kml_member(filepath, member)
+        enqueue(result.links)
+        yield result
+
+
+def member_source(source, member, root):
+    """
+    Returns the source of the pins of `member`: `source` (the KMZ file name) for the
+    root member, else the file name followed by the member's path.
+    """
+    return source if member == root else f"{source}/{member}"
+
+
+def member_sources(source, members, count):
+    """
+    Splits the pins of a KMZ file by the member they come from.
+
+    Args:
+        source: Base name of the KMZ file.
+        members: List of `(member name, pin count)` pairs in pin order, the root
+                 member first, or None if all the pins come from one member.
+        count: Total number of pins.
+
+    Returns:
+        A list of `(source, start, end)` tuples, one per member with pins: pins
+        `start` to `end - 1` have `member_source` as their source.
+    """
+    if not members:
+        return [(source, 0, count)] if count else []
+    root = members[0][0]
+    ranges = []
+    start = 0
+    for member, member_count in members:
+        if member_count:
+            ranges.append((member_source(source, member, root), start, start + member_count))
+        start += member_count
+    if start != count:
+        raise ValueError(f"Los miembros del KMZ suman {start} pines en lugar de {count}.")
+    return ranges
+
+
+def count_large_members(kmz, members):
+    """Returns how many of `members` of the open KMZ archive `kmz` are parsed in worker processes."""
+    return sum(kmz.getinfo(name).file_size >= PARALLEL_MEMBER_BYTES for name in members)
@@ -0,0 +1,227 @@
+"""
+On-disk cache of the pins parsed from KMZ files.
+
+Reopening a large KMZ means unzipping and parsing it again. `ParseCache` keeps
+the extracted pins in a compact columnar form instead, one directory per parsed
+file content:
+
+    coords.npy        float64 (N, 3) array of lon, lat, alt
+    name_offsets.npy  int64 (N + 1) array; name i is names[offsets[i]:offsets[i + 1]]
+    names.npy         uint8 array with the UTF-8 names, concatenated
+    line_coords.npy   float64 (M, 3) array with the vertices of every line geometry
+    line_offsets.npy  int64 (L + 1) array; line i is line_coords[offsets[i]:offsets[i + 1]]
+    meta.json         Pin count, extraction error count, the name of each line and,
+                      for files with several KML members, the pin count of each
+                      (see `kmz_members`)
+
+Entries are keyed by the content of the file (its size and a BLAKE2 hash), so a
+copied or re-saved file with the same bytes is still found. Hashing reads the
+whole file, which is far cheaper than parsing it but not free, so the content
+key of each path is also remembered under a key made of the path, size and
+modification time: while those do not change, the file is not read at all.
+
+The arrays are opened with `np.load(mmap_mode="r")`, so a hit costs no parsing
+and no copy besides the one into the `PinStore`. Everything lives under a
+directory named after `kml_stream.PARSER_VERSION`: when the parser changes,
+entries written by other versions are never read and are deleted at the next
+store. The total size is capped at `max_bytes`; the least recently used entries
+(by the modification time of their `meta.json`, refreshed on every hit) are
+evicted first.
+
+Entries are written to a temporary directory and renamed into place, so
+several processes (see `batch_load`) can share the cache. Cache failures are
+never fatal: unreadable entries are misses, and entries that cannot be written
+are skipped.
+"""
+import hashlib
+import json
+import os
+import shutil
+from collections import namedtuple
+
+import numpy as np
+
+from .kml_stream import PARSER_VERSION
+
+PARSE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "kmz-management", "parsed")
+DEFAULT_MAX_CACHE_BYTES = 1024 ** 3  # Total size of the cached entries before the oldest are evicted
+HASH_CHUNK_SIZE = 1024 * 1024  # Bytes read at a time while hashing a file
+REFS_DIR = "refs"  # Subdirectory with the content key of each (path, size, mtime)
+
+# Pins of a cached file, read back as (memory-mapped) arrays; see the module docstring.
+# members: `(member name, pin count)` pairs if the pins come from several KML members, else None.
+# lines: `(name, (N, 3) array)` pair per line geometry of the file (see `kml_stream.placemark_lines`).
+CachedPins = namedtuple("CachedPins", ["names", "name_offsets", "coords", "error_count", "members", "lines"],
+                        defaults=[None, ()])
+
+
+def content_key(path):
+    """Returns the cache key of the content of a file: its size and BLAKE2 hash, in hex."""
+    digest = hashlib.blake2b(digest_size=20)
+    size = 0
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return f"{size:x}-{digest.hexdigest()}"
+
+
+def _directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class ParseCache:
+    """
+    Cache of parsed pins under `cache_dir`, capped at `max_bytes`.
+
+    Plain attributes only, so it can be passed to worker processes.
+    """
+    def __init__(self, cache_dir=PARSE_CACHE_DIR, max_bytes=DEFAULT_MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version_dir = os.path.join(cache_dir, f"v{PARSER_VERSION}")
+
+    def key(self, path):
+        """
+        Returns the cache key of the file at `path`. The file is only hashed when
+        its path, size or modification time changed since it was last keyed.
+
+        Raises:
+            OSError: The file cannot be read.
+        """
+        status = os.stat(path)
+        stat_key = f"{os.path.abspath(path)}|{status.st_size}|{status.st_mtime_ns}"
+        ref_path = os.path.join(self.version_dir, REFS_DIR, hashlib.sha1(stat_key.encode("utf-8")).hexdigest())
+        try:
+            with open(ref_path, encoding="ascii") as ref:
+                return ref.read()
+        except OSError:
+            pass
+        key = content_key(path)
+        try:
+            os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+            with open(ref_path + f".{os.getpid()}.part", "w", encoding="ascii") as ref:
+                ref.write(key)
+            os.replace(ref_path + f".{os.getpid()}.part", ref_path)
+        except OSError:
+            pass  # Only means the file is hashed again next time
+        return key
+
+    def get(self, key):
+        """Returns the `CachedPins` stored under `key`, or None if there are none."""
+        entry = os.path.join(self.version_dir, key)
+        meta_path = os.path.join(entry, "meta.json")
+        try:
+            with open(meta_path, encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+            coords = np.load(os.path.join(entry, "coords.npy"), mmap_mode="r")
+            name_offsets = np.load(os.path.join(entry, "name_offsets.npy"), mmap_mode="r")
+            names = np.load(os.path.join(entry, "names.npy"), mmap_mode="r")
+            count = meta["count"]
+            if coords.shape != (count, 3) or name_offsets.shape != (count + 1,) or len(names) != name_offsets[-1]:
+                return None
+            os.utime(meta_path)  # Most recently used
+            members = meta.get("members")
+            if members is not None and sum(member_count for _, member_count in members) != count:
+                return None
+            line_coords = np.load(os.path.join(entry, "line_coords.npy"), mmap_mode="r")
+            line_offsets = np.load(os.path.join(entry, "line_offsets.npy"), mmap_mode="r")
+            line_names = meta["line_names"]
+            if line_offsets.shape != (len(line_names) + 1,) or line_coords.shape != (line_offsets[-1], 3):
+                return None
+            lines = [(name, line_coords[line_offsets[i]:line_offsets[i + 1]]) for i, name in enumerate(line_names)]
+            return CachedPins(names, name_offsets, coords, meta["error_count"], members, lines)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def put(self, key, names, coords, error_count, members=None, lines=()):
+        """
+        Stores the pins parsed from the file with cache `key`, then evicts the least
+        recently used entries beyond `max_bytes`.
+
+        Args:
+            key: Value returned by `key()` before the file was parsed.
+            names: List of pin names.
+            coords: Lon, lat, alt per pin, as an (N, 3) array-like or a flat sequence.
+            error_count: Placemarks skipped while parsing.
+            members: `(member name, pin count)` pairs if the pins come from several
+                     KML members, else None.
+            lines: `(name, (N, 3) array)` pair per line geometry of the file.
+
+        Returns:
+            True if the entry was stored.
+        """
+        encoded = [name.encode("utf-8") for name in names]
+        name_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        line_offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        np.cumsum([len(line) for _, line in lines], out=line_offsets[1:])
+        line_coords = np.concatenate([line for _, line in lines]) if lines else np.empty((0, 3))
+        if coords.nbytes + name_offsets.nbytes + name_offsets[-1] + line_coords.nbytes > self.max_bytes:
+            return False
+
+        entry = os.path.join(self.version_dir, key)
+        partial_entry = f"{entry}.{os.getpid()}.part"  # Renamed into place once complete
+        try:
+            os.makedirs(partial_entry, exist_ok=True)
+            np.save(os.path.join(partial_entry, "coords.npy"), coords)
+            np.save(os.path.join(partial_entry, "name_offsets.npy"), name_offsets)
+            np.save(os.path.join(partial_entry, "names.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            np.save(os.path.join(partial_entry, "line_coords.npy"), line_coords.astype(np.float64, copy=False))
+            np.save(os.path.join(partial_entry, "line_offsets.npy"), line_offsets)
+            with open(os.path.join(partial_entry, "meta.json"), "w", encoding="utf-8") as meta_file:
+                meta = {"count": len(coords), "error_count": error_count, "line_names": [name for name, _ in lines]}
+                if members is not None:
+                    meta["members"] = [[member, member_count] for member, member_count in members]
+                json.dump(meta, meta_file)
+            os.replace(partial_entry, entry)
+        except OSError:  # Includes another process having stored the same entry first
+            return os.path.isdir(entry)
+        finally:
+            shutil.rmtree(partial_entry, ignore_errors=True)
+        self.evict()
+        return True
+
+    def evict(self):
+        """Deletes entries of other parser versions, then the least recently used ones beyond `max_bytes`."""
+        try:
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_dir() and entry.name.startswith("v") and entry.path != self.version_dir:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            entries = []
+            for entry in os.scandir(self.version_dir):
+                if entry.is_dir() and entry.name != REFS_DIR and not entry.name.endswith(".part"):
+                    try:
+                        last_used = os.stat(os.path.join(entry.path, "meta.json")).st_mtime_ns
+                    except OSError:
+                        last_used = 0  # Incomplete entry, evicted first
+                    entries.append((last_used, _directory_size(entry.path), entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        evicted = False
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)  # May fail on Windows while the arrays are mapped
+            total -= size
+            evicted = True
+        if evicted:
+            self._prune_refs()
+
+    def _prune_refs(self):
+        """Deletes the remembered keys of entries that no longer exist."""
+        refs_dir = os.path.join(self.version_dir, REFS_DIR)
+        try:
+            for ref in os.scandir(refs_dir):
+                with open(ref.path, encoding="ascii") as ref_file:
+                    key = ref_file.read()
+                if not os.path.isdir(os.path.join(self.version_dir, key)):
+                    os.remove(ref.path)
+        except OSError:
+            pass
+
+    def clear(self):
+        """Deletes every cached entry."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
@@ -0,0 +1,408 @@
+"""
+Columnar storage for loaded pins.
+
+`PinStore` keeps every pin attribute in a NumPy column instead of one dictionary per
+pin: float64 lon/lat/alt, int32 ids into an interned table of source names, a boolean
+selection mask and an int32 selection order. Names live in a single UTF-8 blob
+indexed by an offsets array. A pin therefore costs ~40 bytes plus its name, and
+whole-dataset operations (select all, grouping by source, bounding box) are
+vectorized.
+
+Pins are addressed by their index, which is stable until `clear()` is called.
+"""
+import numpy as np
+
+from .selection_ranks import SelectionRankIndex
+
+NO_ORDER = -1  # select_order value of pins that are not selected
+DEFAULT_SOURCE = "Sin Fuente"  # Source used when none is given
+INITIAL_CAPACITY = 1024
+UNIQUE_MASK_THRESHOLD = 4096  # From this many indices, duplicates are removed with a mask instead of np.unique
+
+
+class PinStore:
+    """
+    Growable column store of pins (name, coordinates, source, selection state).
+
+    The column properties (`lon`, `lat`, `alt`, `source_ids`, `selected`,
+    `select_order`) return views of the first `len(store)` rows; they are only
+    valid until the next append, which may reallocate the columns.
+
+    Selection goes through `set_selected`, `select_all` and `deselect_all`, which
+    keep `select_order` consistent: newly selected pins get increasing order
+    numbers starting at `order_counter`, deselected pins get `NO_ORDER`, and the
+    counter restarts at 1 when nothing is selected. `rank` gives a selected pin's
+    1-based position in the selection in O(log n) (see `SelectionRankIndex`).
+    """
+    def __init__(self):
+        self.sources = []  # Interned source names, indexed by source id
+        self._source_ids_by_name = {}
+        self.order_counter = 1  # Order number given to the next selected pin
+        self._ranks = SelectionRankIndex()  # Order numbers in use, for rank queries
+        self._allocate(INITIAL_CAPACITY)
+
+    def _allocate(self, capacity):
+        self._size = 0
+        self._lon = np.empty(capacity, dtype=np.float64)
+        self._lat = np.empty(capacity, dtype=np.float64)
+        self._alt = np.empty(capacity, dtype=np.float64)
+        self._source_ids = np.empty(capacity, dtype=np.int32)
+        self._selected = np.zeros(capacity, dtype=bool)
+        self._select_order = np.full(capacity, NO_ORDER, dtype=np.int32)
+        self._name_offsets = np.zeros(capacity + 1, dtype=np.int64)  # Name i is blob[offsets[i]:offsets[i + 1]]
+        self._name_blob = bytearray()
+
+    def _ensure_capacity(self, extra):
+        needed = self._size + extra
+        capacity = len(self._lon)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, 2 * capacity)
+        grow = new_capacity - capacity
+        self._lon = np.concatenate((self._lon, np.empty(grow, dtype=np.float64)))
+        self._lat = np.concatenate((self._lat, np.empty(grow, dtype=np.float64)))
+        self._alt = np.concatenate((self._alt, np.empty(grow, dtype=np.float64)))
+        self._source_ids = np.concatenate((self._source_ids, np.empty(grow, dtype=np.int32)))
+        self._selected = np.concatenate((self._selected, np.zeros(grow, dtype=bool)))
+        self._select_order = np.concatenate((self._select_order, np.full(grow, NO_ORDER, dtype=np.int32)))
+        self._name_offsets = np.concatenate((self._name_offsets, np.zeros(grow, dtype=np.int64)))
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        """Removes all pins and sources and resets the selection order."""
+        self.sources = []
+        self._source_ids_by_name = {}
+        self.order_counter = 1
+        self._ranks.clear()
+        self._allocate(INITIAL_CAPACITY)
+
+    def copy(self):
+        """
+        Returns an independent copy of the store, e.g. for a thread that reads the
+        pins (an export) while this store keeps changing.
+        """
+        size = self._size
+        other = PinStore()
+        other.sources = list(self.sources)
+        other._source_ids_by_name = dict(self._source_ids_by_name)
+        other.order_counter = self.order_counter
+        other._size = size
+        other._lon, other._lat, other._alt = self.lon.copy(), self.lat.copy(), self.alt.copy()
+        other._source_ids = self.source_ids.copy()
+        other._selected = self.selected.copy()
+        other._select_order = self.select_order.copy()
+        other._name_offsets = self._name_offsets[:size + 1].copy()
+        other._name_blob = bytearray(self._name_blob[:self._name_offsets[size]])
+        other._ranks.add(other._select_order[other._selected])
+        return other
+
+    # --- Columns -------------------------------------------------------------------
+
+    @property
+    def lon(self):
+        return self._lon[:self._size]
+
+    @property
+    def lat(self):
+        return self._lat[:self._size]
+
+    @property
+    def alt(self):
+        return self._alt[:self._size]
+
+    @property
+    def source_ids(self):
+        return self._source_ids[:self._size]
+
+    @property
+    def selected(self):
+        """Boolean selection mask. Use the selection methods to change it."""
+        return self._selected[:self._size]
+
+    @property
+    def select_order(self):
+        """Selection order of each pin (`NO_ORDER` when not selected)."""
+        return self._select_order[:self._size]
+
+    # --- Adding pins ---------------------------------------------------------------
+
+    def intern_source(self, source):
+        """Returns the id of `source` in the source table, adding it if needed."""
+        source = source or DEFAULT_SOURCE
+        source_id = self._source_ids_by_name.get(source)
+        if source_id is None:
+            source_id = len(self.sources)
+            self.sources.append(source)
+            self._source_ids_by_name[source] = source_id
+        return source_id
+
+    def append(self, name, coords, source=None):
+        """
+        Adds one pin.
+
+        Args:
+            name: The pin's name.
+            coords: A (lon, lat, alt) tuple.
+            source: Name of the file the pin comes from.
+
+        Returns:
+            The index of the new pin.
+        """
+        return self.extend([name], [coords], source)
+
+    def extend(self, names, coords, source=None):
+        """
+        Adds several pins from the same source in one vectorized step.
+
+        Args:
+            names: Sequence of pin names.
+            coords: Array-like of shape (N, 3) with lon, lat, alt per pin
+                    (a flat sequence of 3 * N values is accepted too).
+            source: Name of the file the pins come from.
+
+        Returns:
+            The index of the first added pin.
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        count = len(coords)
+        if count != len(names):
+            raise ValueError(f"Se recibieron {len(names)} nombres para {count} coordenadas.")
+        if count == 0:
+            return self._size
+        start = self._append_columns(coords, source)
+        end = start + count
+        encoded = [name.encode("utf-8") for name in names]
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=count)
+        self._name_offsets[start + 1:end + 1] = self._name_offsets[start] + np.cumsum(lengths)
+        self._name_blob += b"".join(encoded)
+        self._size = end
+        return start
+
+    def extend_encoded(self, name_blob, name_offsets, coords, source=None):
+        """
+        Adds several pins whose names are already UTF-8 encoded in one blob, without
+        handling the names one by one (e.g. pins read back from `parse_cache`).
+
+        Args:
+            name_blob: Bytes-like object (or uint8 array) with the concatenated names.
+            name_offsets: N + 1 integers; name i is `name_blob[name_offsets[i]:name_offsets[i + 1]]`.
+            coords: Array-like of shape (N, 3) with lon, lat, alt per pin.
+            source: Name of the file the pins come from.
+
+        Returns:
+            The index of the first added pin.
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        name_offsets = np.asarray(name_offsets, dtype=np.int64)
+        count = len(coords)
+        if len(name_offsets) != count + 1:
+            raise ValueError(f"Se recibieron {len(name_offsets) - 1} nombres para {count} coordenadas.")
+        if count == 0:
+            return self._size
+        start = self._append_columns(coords, source)
+        end = start + count
+        self._name_offsets[start + 1:end + 1] = self._name_offsets[start] + name_offsets[1:] - name_offsets[0]
+        self._name_blob += memoryview(name_blob).cast("B")[name_offsets[0]:name_offsets[-1]]
+        self._size = end
+        return start
+
+    def _append_columns(self, coords, source):
+        """Writes the coordinates, source and selection columns of new pins; returns their first index."""
+        start = self._size
+        count = len(coords)
+        self._ensure_capacity(count)
+        end = start + count
+        self._lon[start:end] = coords[:, 0]
+        self._lat[start:end] = coords[:, 1]
+        self._alt[start:end] = coords[:, 2]
+        self._source_ids[start:end] = self.intern_source(source)
+        self._selected[start:end] = False
+        self._select_order[start:end] = NO_ORDER
+        return start
+
+    # --- Per-pin access ------------------------------------------------------------
+
+    def name(self, index):
+        """Returns the name of pin `index`."""
+        start, end = self._name_offsets[index], self._name_offsets[index + 1]
+        return self._name_blob[start:end].decode("utf-8")
+
+    def name_bytes(self, indices=None):
+        """Returns the UTF-8 encoded names of the pins in `indices` (all pins if None), as a list of bytes."""
+        indices = np.arange(self._size) if indices is None else np.asarray(indices, dtype=np.int64)
+        starts = self._name_offsets[indices].tolist()
+        ends = self._name_offsets[indices + 1].tolist()
+        with memoryview(self._name_blob) as blob:
+            return [blob[start:end].tobytes() for start, end in zip(starts, ends)]
+
+    def names(self, indices=None):
+        """Returns the names of the pins in `indices` (all pins if None)."""
+        return [name.decode("utf-8") for name in self.name_bytes(indices)]
+
+    def name_sizes(self):
+        """Returns the length in bytes of the UTF-8 name of every pin."""
+        return np.diff(self._name_offsets[:self._size + 1])
+
+    def coords_original(self, index):
+        """Returns the (lon, lat, alt) coordinates of pin `index`, as in the KML."""
+        return float(self._lon[index]), float(self._lat[index]), float(self._alt[index])
+
+    def coords_map(self, index):
+        """Returns the (lat, lon) coordinates of pin `index`, as used by tkintermapview."""
+        return float(self._lat[index]), float(self._lon[index])
+
+    def source(self, index):
+        """Returns the source file name of pin `index`."""
+        return self.sources[self._source_ids[index]]
+
+    def is_selected(self, index):
+        return bool(self._selected[index])
+
+    # --- Bulk access ---------------------------------------------------------------
+
+    def kml_coords(self, indices):
+        """Returns a list of (lon, lat, alt) tuples for `indices`, in that order."""
+        return list(zip(self._lon[indices].tolist(), self._lat[indices].tolist(), self._alt[indices].tolist()))
+
+    def map_coords(self, indices):
+        """Returns a list of (lat, lon) tuples for `indices`, in that order."""
+        return list(zip(self._lat[indices].tolist(), self._lon[indices].tolist()))
+
+    def bounds(self):
+        """
+        Returns the bounding box of all pins as (min_lat, min_lon, max_lat, max_lon),
+        or None if the store is empty.
+        """
+        if self._size == 0:
+            return None
+        lat, lon = self.lat, self.lon
+        return float(lat.min()), float(lon.min()), float(lat.max()), float(lon.max())
+
+    def group_indices_by_source(self):
+        """
+        Groups the pins by source.
+
+        Returns:
+            A list of (source name, indices) tuples, ordered by the first pin of each
+            source; the indices of each group keep document order.
+        """
+        if self._size == 0:
+            return []
+        source_ids = self.source_ids
+        order = np.argsort(source_ids, kind="stable")
+        _, starts = np.unique(source_ids[order], return_index=True)
+        groups = np.split(order, starts[1:])
+        groups.sort(key=lambda indices: indices[0])
+        return [(self.sources[source_ids[indices[0]]], indices) for indices in groups]
+
+    # --- Selection -----------------------------------------------------------------
+
+    def set_selected(self, indices, value):
+        """
+        Selects or deselects the pins in `indices`.
+
+        Newly selected pins get order numbers in the order given by `indices`;
+        pins that were already selected keep theirs.
+
+        Args:
+            indices: Index, sequence of indices, or boolean mask.
+            value: True to select, False to deselect.
+
+        Returns:
+            Array with the indices whose selection state actually changed.
+        """
+        indices = self._as_indices(indices)
+        if value:
+            changed = indices[~self._selected[indices]]
+            # A pin listed twice must only be numbered once
+            changed = changed[np.sort(np.unique(changed, return_index=True)[1])]
+            self._selected[changed] = True
+            self._select_order[changed] = self.order_counter + np.arange(len(changed), dtype=np.int32)
+            self._ranks.add(self._select_order[changed])
+            self.order_counter += len(changed)
+        else:
+            changed = self._unique_sorted(indices[self._selected[indices]])
+            self._ranks.remove(self._select_order[changed])
+            self._selected[changed] = False
+            self._select_order[changed] = NO_ORDER
+            if not self.selected.any():
+                self.order_counter = 1  # Next selection sequence starts at 1 again
+                self._ranks.clear()
+        return changed
+
+    def _unique_sorted(self, indices):
+        """Returns the sorted distinct values of `indices` (pin indices)."""
+        if len(indices) < UNIQUE_MASK_THRESHOLD:
+            return np.unique(indices)
+        mask = np.zeros(self._size, dtype=bool)  # O(n) but much cheaper than sorting or hashing large inputs
+        mask[indices] = True
+        return np.flatnonzero(mask)
+
+    def _as_indices(self, indices):
+        """Converts an index, index sequence or boolean mask into an int64 index array."""
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            return np.flatnonzero(indices)
+        return np.atleast_1d(indices).astype(np.int64, copy=False)
+
+    def toggle(self, index):
+        """Flips the selection state of pin `index`. Returns the new state."""
+        new_state = not self._selected[index]
+        self.set_selected(index, new_state)
+        return new_state
+
+    def select_all(self):
+        """Selects every pin; pins not yet selected are numbered in index order."""
+        return self.set_selected(np.arange(self._size), True)
+
+    def deselect_all(self):
+        """Deselects every pin and resets the order counter."""
+        return self.set_selected(np.flatnonzero(self.selected), False)
+
+    def invert_selection(self):
+        """
+        Deselects the selected pins and selects the others (numbered in index order).
+
+        Returns:
+            Array with the indices whose selection state changed (every pin).
+        """
+        was_selected = self.selected.copy()
+        self.set_selected(was_selected, False)
+        self.set_selected(~was_selected, True)
+        return np.arange(self._size)
+
+    def source_indices(self, source):
+        """Returns the indices of the pins loaded from `source`, in index order."""
+        source_id = self._source_ids_by_name.get(source)
+        if source_id is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.source_ids == source_id)
+
+    def selected_count(self):
+        return int(np.count_nonzero(self.selected))
+
+    def rank(self, index):
+        """
+        Returns the 1-based position of pin `index` in the selection order, or 0 if
+        the pin is not selected.
+        """
+        order = self._select_order[index]
+        return self._ranks.rank(int(order)) if order != NO_ORDER else 0
+
+    def ranks(self, indices):
+        """Vectorized `rank`: returns an int64 array with the rank of each of `indices`."""
+        orders = self._select_order[self._as_indices(indices)]
+        return np.where(orders != NO_ORDER, self._ranks.rank(np.maximum(orders, 0)), 0)
+
+    def selected_indices_ordered(self):
+        """Returns the indices of the selected pins sorted by selection order."""
+        indices = np.flatnonzero(self.selected)
+        return indices[np.argsort(self._select_order[indices], kind="stable")]
+
+    def nbytes(self):
+        """Approximate memory used by the store, in bytes."""
+        columns = (self._lon, self._lat, self._alt, self._source_ids, self._selected,
+                   self._select_order, self._name_offsets)
+        return sum(column.nbytes for column in columns) + len(self._name_blob)
@@ -0,0 +1,122 @@
+"""
+Selection of pins inside a map region.
+
+Regions are given in Web Mercator world coordinates (see
+`clustering.project_to_world`). Candidates come from a `PointGridIndex` query on
+the region's bounding box, then a vectorized test keeps the pins really inside.
+The returned indices are sorted so that selecting them gives a meaningful
+`select_order`:
+
+- a rectangle orders its pins along the drag direction (from the corner where the
+  drag started towards the opposite one);
+- a lasso orders its pins by the position, along the stroke, of the stroke point
+  closest to each pin, so the route follows the path the user drew (ties, such as
+  pins deep inside a filled lasso, keep index order).
+
+Selecting ~10k pins in a region takes milliseconds, not seconds.
+"""
+import numpy as np
+
+ORDER_STROKE_SAMPLES = 64  # Number of stroke points used to order the pins of a lasso
+
+
+def points_in_polygon(x, y, polygon_x, polygon_y):
+    """
+    Vectorized even-odd point-in-polygon test.
+
+    The points are sorted by y once; each edge then only tests the slice of points
+    whose y lies in the edge's y range (found with a binary search), so the work
+    is proportional to the number of edge crossings rather than points x edges.
+
+    Args:
+        x, y: Arrays with the coordinates of the points to test.
+        polygon_x, polygon_y: Vertices of the polygon (closed implicitly).
+
+    Returns:
+        Boolean array, True for the points inside the polygon.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    order = np.argsort(y)
+    sorted_x, sorted_y = x[order], y[order]
+    crossings = np.zeros(len(x), dtype=np.int64)
+
+    x1 = np.asarray(polygon_x, dtype=np.float64)
+    y1 = np.asarray(polygon_y, dtype=np.float64)
+    x2, y2 = np.roll(x1, 1), np.roll(y1, 1)
+    for ax, ay, bx, by in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist()):
+        if ay == by:
+            continue  # Horizontal edges never cross a horizontal ray
+        # Points with min(ay, by) <= y < max(ay, by), the half-open rule that counts shared vertices once
+        low, high = np.searchsorted(sorted_y, [min(ay, by), max(ay, by)], side="right")
+        band = slice(low, high)
+        edge_x = ax + (sorted_y[band] - ay) * (bx - ax) / (by - ay)
+        crossings[band] += sorted_x[band] < edge_x
+
+    inside = np.zeros(len(x), dtype=bool)
+    inside[order] = crossings % 2 == 1
+    return inside
+
+
+def stroke_positions(x, y, stroke_x, stroke_y, samples=ORDER_STROKE_SAMPLES):
+    """
+    Returns, for each point, how far along the polyline `stroke` (as a fraction of
+    its length, in [0, 1]) the point lies.
+
+    The stroke is resampled to `samples` points evenly spaced by arc length and
+    each point takes the position of the nearest sample, which keeps the cost at
+    points x samples whatever the length of the stroke.
+    """
+    stroke_x = np.asarray(stroke_x, dtype=np.float64)
+    stroke_y = np.asarray(stroke_y, dtype=np.float64)
+    travelled = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(stroke_x), np.diff(stroke_y)))))
+    if travelled[-1] == 0:
+        return np.zeros(len(x))
+    fractions = np.linspace(0.0, 1.0, samples)
+    sample_x = np.interp(fractions * travelled[-1], travelled, stroke_x)
+    sample_y = np.interp(fractions * travelled[-1], travelled, stroke_y)
+
+    distance = np.subtract.outer(np.asarray(x, dtype=np.float64), sample_x)
+    distance *= distance
+    distance_y = np.subtract.outer(np.asarray(y, dtype=np.float64), sample_y)
+    distance_y *= distance_y
+    distance += distance_y
+    return fractions[distance.argmin(axis=1)]
+
+
+def pins_in_rectangle(grid, start, end):
+    """
+    Returns the pins inside the rectangle spanned by a drag from `start` to `end`.
+
+    Args:
+        grid: `PointGridIndex` of the pins.
+        start, end: (x, y) world coordinates of the drag start and end corners.
+
+    Returns:
+        Array of pin indices ordered along the drag direction.
+    """
+    (start_x, start_y), (end_x, end_y) = start, end
+    indices = grid.query(min(start_x, end_x), min(start_y, end_y), max(start_x, end_x), max(start_y, end_y))
+    # Distance of each pin from the start corner, measured along the drag diagonal
+    along = (grid.x[indices] - start_x) * (end_x - start_x) + (grid.y[indices] - start_y) * (end_y - start_y)
+    return indices[np.argsort(along, kind="stable")]
+
+
+def pins_in_lasso(grid, stroke_x, stroke_y):
+    """
+    Returns the pins inside the polygon drawn by a lasso stroke.
+
+    Args:
+        grid: `PointGridIndex` of the pins.
+        stroke_x, stroke_y: World coordinates of the stroke points, in drawing order.
+
+    Returns:
+        Array of pin indices ordered by their position along the stroke.
+    """
+    if len(stroke_x) < 3:
+        return np.empty(0, dtype=np.int64)
+    candidates = grid.query(np.min(stroke_x), np.min(stroke_y), np.max(stroke_x), np.max(stroke_y))
+    x, y = grid.x[candidates], grid.y[candidates]
+    inside = points_in_polygon(x, y, stroke_x, stroke_y)
+    indices, x, y = candidates[inside], x[inside], y[inside]
+    return indices[np.argsort(stroke_positions(x, y, stroke_x, stroke_y), kind="stable")]
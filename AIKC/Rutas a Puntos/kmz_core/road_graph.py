@@ -0,0 +1,291 @@
+"""
+Road network graph for offline routing.
+
+`load_road_graph` reads a road network from a local file, without network
+access:
+
+- GeoJSON: LineString and MultiLineString features. An OSM-style "highway"
+  property excludes ways that are not for vehicles (footways, steps, ...) and a
+  "oneway" property ("yes"/"true"/"1" or "-1") makes them one-way.
+- OpenStreetMap `.osm.pbf` extracts, read with the optional `osmium` package
+  (`pip install osmium`); only ways with a vehicle "highway" tag are kept.
+
+Every vertex of a way becomes a node; vertices of different ways with the same
+coordinates (to 1e-7 degrees, the OSM precision) are the same node, which is
+how ways connect at intersections. The directed edges are stored as a CSR
+adjacency structure (`indptr`, `indices`, `weights` in meters) in NumPy arrays.
+
+Parsing a large extract takes a while, so the graph is saved as an uncompressed
+`.npz` in `GRAPH_CACHE_DIR`, keyed by the path, size and modification time of
+the source file; later sessions load the arrays directly.
+
+Pins are snapped to the nearest road with `RoadGraph.snap`: the road nodes near
+the pin are found in a `PointGridIndex` and the pin is projected on each edge
+touching them.
+"""
+import hashlib
+import json
+import math
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from .clustering import project_to_world, world_to_latlon
+from .route_optimize import haversine_distance
+from .spatial_index import PointGridIndex
+
+GRAPH_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "kmz-management", "road_graphs")
+GRAPH_CACHE_VERSION = 1  # Bump when the cached arrays change meaning
+COORDINATE_SCALE = 10_000_000  # Vertices closer than 1 / COORDINATE_SCALE degrees are one node
+SNAP_SEARCH_FACTOR = 2.0  # Edges touching nodes up to this many times the nearest node distance are tried
+# Ways tagged with these "highway" values are not drivable and are left out of the graph
+NON_ROUTABLE_HIGHWAYS = {
+    "footway", "path", "pedestrian", "steps", "cycleway", "bridleway", "corridor",
+    "elevator", "platform", "proposed", "construction", "abandoned", "bus_stop",
+}
+
+# Position of a pin snapped on the directed edge tail -> head: `fraction` of the
+# edge length from the tail, at (`lat`, `lon`), `distance_m` away from the pin.
+RoadSnap = namedtuple("RoadSnap", ["tail", "head", "fraction", "lat", "lon", "distance_m"])
+
+
+def _oneway_direction(value):
+    """Returns 1 for a one-way road, -1 for one-way against the drawing direction, 0 for two-way."""
+    value = str(value).strip().lower() if value is not None else ""
+    if value in ("yes", "true", "1"):
+        return 1
+    if value == "-1":
+        return -1
+    return 0
+
+
+class RoadGraph:
+    """
+    Directed road graph in CSR form: the edges leaving node `n` go to
+    `indices[indptr[n]:indptr[n + 1]]` with lengths (meters) `weights[...]`.
+    Nodes are located by `lat` and `lon` (degrees).
+    """
+    def __init__(self, lat, lon, indptr, indices, weights):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self._node_grid = None
+        self._tails = None
+
+    @classmethod
+    def from_edges(cls, lat, lon, tails, heads):
+        """Builds the graph from node coordinates and directed edges `tails[i] -> heads[i]`."""
+        tails = np.asarray(tails, dtype=np.int64)
+        heads = np.asarray(heads, dtype=np.int64)
+        keep = tails != heads
+        tails, heads = tails[keep], heads[keep]
+        # Drop duplicated edges (ways drawn twice, or two-way roads also tagged in both directions)
+        edge_keys = np.unique(tails * len(lat) + heads)
+        tails, heads = edge_keys // len(lat), edge_keys % len(lat)  # Sorted by tail
+        indptr = np.zeros(len(lat) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tails, minlength=len(lat)), out=indptr[1:])
+        weights = haversine_distance(lat[tails], lon[tails], lat[heads], lon[heads])
+        return cls(lat, lon, indptr, heads, weights)
+
+    @classmethod
+    def from_lines(cls, lines, oneway=None):
+        """
+        Builds the graph from polylines.
+
+        Args:
+            lines: Sequence of (n, 2) arrays of (lon, lat) vertices.
+            oneway: Optional sequence with the `_oneway_direction` of each line.
+        """
+        lines = [np.asarray(line, dtype=np.float64).reshape(-1, 2) for line in lines]
+        lines = [line for line in lines if len(line) >= 2]
+        if not lines:
+            raise ValueError("El archivo no contiene carreteras (líneas) utilizables.")
+        directions = np.zeros(len(lines), dtype=np.int64) if oneway is None else np.asarray(oneway, dtype=np.int64)[:len(lines)]
+        vertices = np.concatenate(lines)
+        lengths = np.array([len(line) for line in lines])
+
+        # Merge vertices with the same rounded coordinates into one node
+        scaled = np.round(vertices * COORDINATE_SCALE).astype(np.int64)
+        keys = ((scaled[:, 0] + (1 << 31)).astype(np.uint64) << np.uint64(32)) | (scaled[:, 1] + (1 << 31)).astype(np.uint64)
+        _, first, node_of_vertex = np.unique(keys, return_index=True, return_inverse=True)
+        lon, lat = vertices[first, 0], vertices[first, 1]
+
+        # Consecutive vertices of a line form an edge; the last vertex of a line has none
+        has_next = np.ones(len(vertices), dtype=bool)
+        has_next[np.cumsum(lengths) - 1] = False
+        line_direction = np.repeat(directions, lengths)[has_next]
+        starts = node_of_vertex[:-1][has_next[:-1]]
+        ends = node_of_vertex[1:][has_next[:-1]]
+        forward = line_direction >= 0
+        backward = line_direction <= 0
+        tails = np.concatenate((starts[forward], ends[backward]))
+        heads = np.concatenate((ends[forward], starts[backward]))
+        return cls.from_edges(lat, lon, tails, heads)
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    def edge_tails(self):
+        """Returns the tail node of every edge, in CSR order."""
+        if self._tails is None:
+            self._tails = np.repeat(np.arange(len(self.lat)), np.diff(self.indptr))
+        return self._tails
+
+    def edge_weight(self, tail, head):
+        """Returns the length of edge tail -> head, or None if there is no such edge."""
+        start, end = self.indptr[tail], self.indptr[tail + 1]
+        found = np.flatnonzero(self.indices[start:end] == head)
+        return float(self.weights[start + found[0]]) if len(found) else None
+
+    def save(self, file):
+        """Saves the graph arrays to an uncompressed `.npz` file (path or binary file object)."""
+        np.savez(file, version=GRAPH_CACHE_VERSION, lat=self.lat, lon=self.lon,
+                 indptr=self.indptr, indices=self.indices, weights=self.weights)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a graph saved with `save`; raises ValueError if it was saved by another version."""
+        with np.load(path) as data:
+            if int(data["version"]) != GRAPH_CACHE_VERSION:
+                raise ValueError("Versión de caché de red vial no compatible.")
+            return cls(data["lat"], data["lon"], data["indptr"], data["indices"], data["weights"])
+
+    def snap(self, lat, lon):
+        """
+        Returns the `RoadSnap` of the point of the road network closest to (lat, lon).
+
+        The candidate edges are those touching the nodes within
+        `SNAP_SEARCH_FACTOR` times the distance of the nearest node, which finds the
+        nearest edge as long as ways have vertices at least every few edge lengths
+        (always the case for OSM data). Returns None if (lat, lon) is not finite.
+        """
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            return None
+        if self._node_grid is None:
+            node_x, node_y = project_to_world(self.lat, self.lon)
+            self._node_grid = PointGridIndex(node_x, node_y)
+        grid = self._node_grid
+        (x,), (y,) = project_to_world([lat], [lon])
+        nearest = grid.nearest(x, y)
+        if nearest < 0:
+            raise ValueError("La red vial está vacía.")
+        radius = max(np.hypot(grid.x[nearest] - x, grid.y[nearest] - y) * SNAP_SEARCH_FACTOR, 1e-12)
+        nodes = grid.query(x - radius, y - radius, x + radius, y + radius)
+
+        # Edges leaving or entering the candidate nodes
+        near = np.zeros(len(self.lat), dtype=bool)
+        near[nodes] = True
+        edges = np.flatnonzero(near[self.edge_tails()] | near[self.indices])
+        tails, heads = self.edge_tails()[edges], self.indices[edges]
+        ax, ay, bx, by = grid.x[tails], grid.y[tails], grid.x[heads], grid.y[heads]
+        dx, dy = bx - ax, by - ay
+        squared = dx * dx + dy * dy
+        fraction = np.clip(((x - ax) * dx + (y - ay) * dy) / np.where(squared > 0, squared, 1.0), 0.0, 1.0)
+        px, py = ax + fraction * dx, ay + fraction * dy
+        best = int(np.hypot(px - x, py - y).argmin())
+
+        (snap_lat,), (snap_lon,) = world_to_latlon([px[best]], [py[best]])
+        distance = float(haversine_distance(lat, lon, snap_lat, snap_lon))
+        return RoadSnap(int(tails[best]), int(heads[best]), float(fraction[best]), float(snap_lat), float(snap_lon), distance)
+
+
+def read_geojson_lines(path):
+    """Returns the (lon, lat) polylines and one-way directions of the drivable roads of a GeoJSON file."""
+    with open(path, "r", encoding="utf-8") as geojson_file:
+        document = json.load(geojson_file)
+    features = document.get("features", []) if document.get("type") == "FeatureCollection" else [document]
+    lines, oneway = [], []
+    for feature in features:
+        geometry = feature.get("geometry") or {}
+        properties = feature.get("properties") or {}
+        if properties.get("highway") in NON_ROUTABLE_HIGHWAYS:
+            continue
+        if geometry.get("type") == "LineString":
+            parts = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiLineString":
+            parts = geometry["coordinates"]
+        else:
+            continue
+        direction = _oneway_direction(properties.get("oneway"))
+        for part in parts:
+            lines.append([vertex[:2] for vertex in part])
+            oneway.append(direction)
+    return lines, oneway
+
+
+def read_pbf_lines(path):
+    """Returns the (lon, lat) polylines and one-way directions of the drivable ways of an `.osm.pbf` file."""
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError("Para leer archivos .osm.pbf instale la biblioteca osmium con 'pip install osmium', o use una red vial en GeoJSON.")
+
+    class WayCollector(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.lines = []
+            self.oneway = []
+
+        def way(self, way):
+            highway = way.tags.get("highway")
+            if highway is None or highway in NON_ROUTABLE_HIGHWAYS:
+                return
+            try:
+                line = [(node.lon, node.lat) for node in way.nodes]
+            except osmium.InvalidLocationError:  # Node outside the extract
+                return
+            self.lines.append(line)
+            self.oneway.append(_oneway_direction(way.tags.get("oneway")))
+
+    collector = WayCollector()
+    collector.apply_file(path, locations=True)
+    return collector.lines, collector.oneway
+
+
+def graph_cache_path(path, cache_dir=GRAPH_CACHE_DIR):
+    """Returns the cache file of the graph of `path`, which changes whenever the file does."""
+    status = os.stat(path)
+    key = f"{os.path.abspath(path)}|{status.st_size}|{status.st_mtime_ns}|{GRAPH_CACHE_VERSION}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npz")
+
+
+def load_road_graph(path, cache_dir=GRAPH_CACHE_DIR):
+    """
+    Returns the `RoadGraph` of a GeoJSON or `.osm.pbf` road file, from the cache
+    when the file was already read.
+
+    Raises:
+        ValueError: The file has no usable roads.
+        ImportError: An `.osm.pbf` file was given but `osmium` is not installed.
+        OSError: The file cannot be read.
+    """
+    cache_path = graph_cache_path(path, cache_dir) if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            return RoadGraph.load(cache_path)
+        except (OSError, ValueError, KeyError):
+            pass  # Unreadable or outdated cache, rebuild it
+
+    if path.lower().endswith(".pbf"):
+        lines, oneway = read_pbf_lines(path)
+    else:
+        lines, oneway = read_geojson_lines(path)
+    graph = RoadGraph.from_lines(lines, oneway)
+
+    if cache_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            partial_path = cache_path + ".part"  # Written aside so an interrupted save never leaves a broken cache
+            with open(partial_path, "wb") as cache_file:
+                graph.save(cache_file)
+            os.replace(partial_path, cache_path)
+        except OSError:
+            pass  # The cache is only an optimization
+    return graph
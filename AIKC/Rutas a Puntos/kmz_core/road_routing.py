@@ -0,0 +1,189 @@
+"""
+Shortest road paths between pins, on a `road_graph.RoadGraph`.
+
+`RoadRouter.route_through` snaps each stop to the nearest road and joins
+consecutive stops with the shortest road path, found with bidirectional A*:
+a forward search from the first stop and a backward search (on the reversed
+edges) from the second meet in the middle. Both use the average potential
+`(h_to_target(v) - h_from_source(v)) / 2`, with great-circle distances as
+estimates, which keeps the two searches consistent with each other, so the
+search can stop as soon as the sum of the two smallest keys reaches the best
+path found. Compared with Dijkstra, only nodes roughly between the two stops
+are visited.
+
+Legs without a road connection (e.g. stops on separate islands of the network)
+are drawn as straight lines and counted in `RoadPath.unrouted_legs`, as are the
+legs to and from a stop without a finite position (e.g. a `nan,nan` pin), which
+is left out of the path.
+"""
+import heapq
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from .route_optimize import EARTH_RADIUS_M, haversine_distance
+
+# Road-following path through a list of stops: vertex coordinates (degrees),
+# total length in meters and number of legs that had to be drawn straight.
+RoadPath = namedtuple("RoadPath", ["lat", "lon", "length_m", "unrouted_legs"])
+
+
+class RoadRouter:
+    """Shortest paths on a `RoadGraph`, which must not be modified while the router is used."""
+    def __init__(self, graph):
+        self.graph = graph
+        # Plain lists: the search reads single items, much faster on lists than on NumPy arrays
+        self._indptr = graph.indptr.tolist()
+        self._indices = graph.indices.tolist()
+        self._weights = graph.weights.tolist()
+        # Reversed edges, in CSR form too, for the backward search
+        order = np.argsort(graph.indices, kind="stable")
+        reverse_indptr = np.zeros(len(graph) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(graph.indices, minlength=len(graph)), out=reverse_indptr[1:])
+        self._reverse_indptr = reverse_indptr.tolist()
+        self._reverse_indices = graph.edge_tails()[order].tolist()
+        self._reverse_weights = graph.weights[order].tolist()
+        lat = np.radians(graph.lat)
+        self._lat = lat.tolist()
+        self._lon = np.radians(graph.lon).tolist()
+        self._cos_lat = np.cos(lat).tolist()
+
+    def _estimate(self, node, lat, lon, cos_lat):
+        """Great-circle distance (meters) from `node` to a point given in radians."""
+        sin_dlat = math.sin((self._lat[node] - lat) / 2.0)
+        sin_dlon = math.sin((self._lon[node] - lon) / 2.0)
+        h = sin_dlat * sin_dlat + self._cos_lat[node] * cos_lat * sin_dlon * sin_dlon
+        return 2.0 * EARTH_RADIUS_M * math.asin(math.sqrt(min(h, 1.0)))
+
+    def _edge_ends(self, snap):
+        """
+        Returns ({node: meters} reachable from a snapped point, {node: meters} from
+        which the snapped point is reachable), following the edge directions.
+        """
+        weight = self.graph.edge_weight(snap.tail, snap.head)
+        reverse = self.graph.edge_weight(snap.head, snap.tail) is not None # Two-way road
+        leaving = {snap.head: (1.0 - snap.fraction) * weight}
+        arriving = {snap.tail: snap.fraction * weight}
+        if reverse:
+            leaving[snap.tail] = snap.fraction * weight
+            arriving[snap.head] = (1.0 - snap.fraction) * weight
+        return leaving, arriving
+
+    def _same_edge_length(self, start, end):
+        """Length of the path from `start` to `end` along their common edge, or inf."""
+        if {start.tail, start.head} != {end.tail, end.head}:
+            return math.inf
+        weight = self.graph.edge_weight(start.tail, start.head)
+        end_fraction = end.fraction if end.tail == start.tail else 1.0 - end.fraction
+        if end_fraction >= start.fraction:
+            return (end_fraction - start.fraction) * weight
+        if self.graph.edge_weight(start.head, start.tail) is not None:
+            return (start.fraction - end_fraction) * weight
+        return math.inf
+
+    def shortest_path(self, start, end):
+        """
+        Finds the shortest road path between two snapped points.
+
+        Args:
+            start, end: `RoadSnap` of the two stops.
+
+        Returns:
+            (length in meters, list of the graph nodes traversed), or None if `end`
+            cannot be reached from `start`. The node list is empty when both
+            points are on the same edge and the path stays on it.
+        """
+        sources, _ = self._edge_ends(start)
+        _, targets = self._edge_ends(end)
+        start_lat, start_lon = math.radians(start.lat), math.radians(start.lon)
+        end_lat, end_lon = math.radians(end.lat), math.radians(end.lon)
+        start_cos, end_cos = math.cos(start_lat), math.cos(end_lat)
+        potentials = {}
+
+        def potential(node):
+            value = potentials.get(node)
+            if value is None:
+                value = potentials[node] = (self._estimate(node, end_lat, end_lon, end_cos)
+                                            - self._estimate(node, start_lat, start_lon, start_cos)) / 2.0
+            return value
+
+        best = self._same_edge_length(start, end)
+        meeting = None
+        forward = {"distance": dict(sources), "parent": {}, "settled": set(), "sign": 1.0,
+                   "indptr": self._indptr, "indices": self._indices, "weights": self._weights}
+        backward = {"distance": dict(targets), "parent": {}, "settled": set(), "sign": -1.0,
+                    "indptr": self._reverse_indptr, "indices": self._reverse_indices, "weights": self._reverse_weights}
+        for search in (forward, backward):
+            search["heap"] = [(distance + search["sign"] * potential(node), node) for node, distance in search["distance"].items()]
+            heapq.heapify(search["heap"])
+        for node, distance in sources.items(): # Both snapped points next to the same node
+            if node in targets and distance + targets[node] < best:
+                best, meeting = distance + targets[node], node
+
+        while forward["heap"] and backward["heap"]:
+            if forward["heap"][0][0] + backward["heap"][0][0] >= best:
+                break
+            search, other = (forward, backward) if len(forward["heap"]) <= len(backward["heap"]) else (backward, forward)
+            _, node = heapq.heappop(search["heap"])
+            if node in search["settled"]:
+                continue
+            search["settled"].add(node)
+            distance = search["distance"][node]
+            indices, weights, sign = search["indices"], search["weights"], search["sign"]
+            distances, parents, other_distances, heap = search["distance"], search["parent"], other["distance"], search["heap"]
+            for edge in range(search["indptr"][node], search["indptr"][node + 1]):
+                neighbour = indices[edge]
+                new_distance = distance + weights[edge]
+                if new_distance < distances.get(neighbour, math.inf):
+                    distances[neighbour] = new_distance
+                    parents[neighbour] = node
+                    heapq.heappush(heap, (new_distance + sign * potential(neighbour), neighbour))
+                    if neighbour in other_distances and new_distance + other_distances[neighbour] < best:
+                        best, meeting = new_distance + other_distances[neighbour], neighbour
+
+        if math.isinf(best):
+            return None
+        if meeting is None: # The path along the common edge was the shortest
+            return best, []
+        nodes = [meeting]
+        while nodes[-1] in forward["parent"]:
+            nodes.append(forward["parent"][nodes[-1]])
+        nodes.reverse()
+        while nodes[-1] in backward["parent"]:
+            nodes.append(backward["parent"][nodes[-1]])
+        return best, nodes
+
+    def route_through(self, lat, lon):
+        """
+        Returns the `RoadPath` through the stops (lat, lon in degrees, in order),
+        from the first stop's snapped position to the last one's. Stops that are
+        not finite are skipped: their legs count as unrouted and the stops around
+        them are joined straight (the path is empty if no stop is finite).
+        """
+        all_snaps = [self.graph.snap(float(stop_lat), float(stop_lon)) for stop_lat, stop_lon in zip(lat, lon)]
+        unrouted = sum(start is None or end is None for start, end in zip(all_snaps, all_snaps[1:]))
+        # Whether each remaining stop follows a skipped one, so its leg is drawn straight
+        snaps, after_skipped = [], []
+        for index, snap in enumerate(all_snaps):
+            if snap is not None:
+                after_skipped.append(index > 0 and all_snaps[index - 1] is None)
+                snaps.append(snap)
+        if not snaps:
+            return RoadPath([], [], 0.0, unrouted)
+        path_lat, path_lon = [snaps[0].lat], [snaps[0].lon]
+        length = 0.0
+        for start, end, skipped in zip(snaps, snaps[1:], after_skipped[1:]):
+            result = None if skipped else self.shortest_path(start, end)
+            if result is None:
+                if not skipped:  # The legs around a skipped stop are already counted
+                    unrouted += 1
+                length += float(haversine_distance(start.lat, start.lon, end.lat, end.lon))
+            else:
+                leg_length, nodes = result
+                length += leg_length
+                path_lat.extend(self.graph.lat[nodes].tolist())
+                path_lon.extend(self.graph.lon[nodes].tolist())
+            path_lat.append(end.lat)
+            path_lon.append(end.lon)
+        return RoadPath(path_lat, path_lon, length, unrouted)
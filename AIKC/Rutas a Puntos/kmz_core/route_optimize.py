@@ -0,0 +1,234 @@
+"""
+Stop ordering for routes (open-path travelling salesman heuristics).
+
+`optimize_route` reorders the stops of a route to make it shorter:
+
+1. A haversine distance matrix of the stops is computed with NumPy broadcasting,
+   in row blocks, and stored as float32 (a 5k-stop route takes ~100 MB).
+2. A nearest-neighbour tour is built from the first stop.
+3. The tour is improved with 2-opt (reversing a stretch of the route) and Or-opt
+   (moving a run of one to three stops elsewhere, possibly reversed) until no
+   move improves it or the time budget runs out. Every candidate move of a stop
+   is evaluated at once over the whole route with vectorized NumPy operations.
+
+The route is an open path: the first stop (in document order) stays first, so
+a depot or starting point placed at the top of the KMZ keeps its place, and the
+route may end anywhere. This is handled by appending a virtual stop at distance
+zero from every other one, so the last edge of the path costs nothing.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8  # Mean Earth radius, in meters
+DEFAULT_TIME_BUDGET = 3.0  # Seconds spent improving a route after the nearest-neighbour construction
+MATRIX_BLOCK_ROWS = 256  # Rows of the distance matrix computed per NumPy pass, bounds temporary memory
+MIN_GAIN_M = 1e-3  # Moves shorter than this (meters) are not worth applying; prevents cycling on rounding
+OR_OPT_MAX_SEGMENT = 3  # Longest run of consecutive stops moved by Or-opt
+
+# Result of `optimize_route`: `order` holds the positions of the input stops in
+# the optimized route; lengths are in meters.
+RouteOptimization = namedtuple("RouteOptimization", ["order", "length_before", "length_after"])
+
+
+def haversine_matrix(lat, lon, block_rows=MATRIX_BLOCK_ROWS):
+    """
+    Returns the float32 matrix of great-circle distances (meters) between all points.
+
+    The distances are computed from the chord between the points' unit vectors,
+    `2 * R * arcsin(chord / 2)`, which equals the haversine formula but turns the
+    bulk of the work into one matrix product per block of rows.
+
+    Args:
+        lat, lon: Arrays with the coordinates of the points, in degrees.
+        block_rows: Number of rows computed per vectorized pass.
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    unit = np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+    count = len(lat)
+    matrix = np.empty((count, count), dtype=np.float32)
+    for start in range(0, count, block_rows):
+        rows = slice(start, start + block_rows)
+        chord = 2.0 - 2.0 * (unit[rows] @ unit.T)  # Squared chord length
+        np.maximum(chord, 0.0, out=chord)
+        np.sqrt(chord, out=chord)
+        chord *= 0.5
+        np.minimum(chord, 1.0, out=chord)
+        matrix[rows] = 2.0 * EARTH_RADIUS_M * np.arcsin(chord)
+    return matrix
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Returns the great-circle distances (meters) between two arrays of points, element by element."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    sin_dlat = np.sin((lat2 - lat1) / 2.0)
+    sin_dlon = np.sin((lon2 - lon1) / 2.0)
+    h = sin_dlat * sin_dlat + np.cos(lat1) * np.cos(lat2) * sin_dlon * sin_dlon
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+def leg_lengths(lat, lon):
+    """Returns the great-circle length (meters) of each leg of the path through the points in order."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    return haversine_distance(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+
+def path_length(lat, lon):
+    """Returns the length (meters) of the path through the points in the given order."""
+    return float(np.sum(leg_lengths(lat, lon)))
+
+
+def nearest_neighbour_order(matrix, start=0):
+    """
+    Returns a path through all points built by repeatedly going to the closest
+    unvisited point, beginning with point `start`.
+    """
+    count = len(matrix)
+    order = np.empty(count, dtype=np.int64)
+    visited = np.zeros(count, dtype=bool)
+    current = start
+    for position in range(count):
+        order[position] = current
+        visited[current] = True
+        if position == count - 1:
+            break
+        row = matrix[current].astype(np.float64)
+        row[visited] = np.inf
+        current = int(row.argmin())
+    return order
+
+
+def _with_virtual_end(matrix):
+    """Returns `matrix` with an extra last point at distance zero from all the others."""
+    count = len(matrix)
+    padded = np.zeros((count + 1, count + 1), dtype=matrix.dtype)
+    padded[:count, :count] = matrix
+    return padded
+
+
+def _edge_lengths(matrix, tour):
+    return matrix[tour[:-1], tour[1:]].astype(np.float64)
+
+
+def two_opt(matrix, tour, deadline):
+    """
+    Improves `tour` in place with 2-opt moves until none helps or `deadline`
+    (a `time.perf_counter()` value) passes. The first and last points of the
+    tour stay in place.
+
+    For each edge (a, b), the gain of replacing it and every later edge (c, d)
+    by (a, c) and (b, d), i.e. reversing the stretch b..c, is computed in one
+    vectorized pass and the best move is applied.
+
+    Returns:
+        True if the tour was changed.
+    """
+    last = len(tour) - 1
+    edges = _edge_lengths(matrix, tour)
+    changed = False
+    i = 0
+    while i < last - 2:
+        if time.perf_counter() > deadline:
+            break
+        a, b = tour[i], tour[i + 1]
+        c, d = tour[i + 2:last], tour[i + 3:]  # Second edge (c, d) for every later position
+        gains = edges[i] + edges[i + 2:] - matrix[a, c] - matrix[b, d]
+        best = int(gains.argmax())
+        if gains[best] > MIN_GAIN_M:
+            j = i + 2 + best  # Reverse tour[i + 1:j + 1]
+            tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1].copy()
+            edges[i:j + 1] = _edge_lengths(matrix, tour[i:j + 2])
+            changed = True
+            continue  # Try again from the same edge, which is now (a, c)
+        i += 1
+    return changed
+
+
+def or_opt(matrix, tour, deadline, max_segment=OR_OPT_MAX_SEGMENT):
+    """
+    Improves `tour` in place with Or-opt moves until none helps or `deadline`
+    passes: runs of 1 to `max_segment` consecutive points are moved, as is or
+    reversed, between two other consecutive points. The first and last points of
+    the tour stay in place.
+
+    Returns:
+        True if the tour was changed.
+    """
+    last = len(tour) - 1
+    edges = _edge_lengths(matrix, tour)
+    changed = False
+    i = 1
+    while i < last:
+        if time.perf_counter() > deadline:
+            break
+        moved = False
+        first = tour[i]
+        first_row = matrix[first][tour].astype(np.float64)  # Distance from the run's first point to every point
+        for length in range(1, max_segment + 1):
+            end = i + length - 1  # Last position of the run
+            if end >= last:
+                break
+            tail = tour[end]
+            tail_row = first_row if length == 1 else matrix[tail][tour].astype(np.float64)
+            removal_gain = edges[i - 1] + edges[end] - float(matrix[tour[i - 1], tour[end + 1]])
+            # Cost of inserting the run between tour[j] and tour[j + 1], for every edge outside the run
+            forward = first_row[:-1] + tail_row[1:]
+            backward = tail_row[:-1] + first_row[1:]
+            cost = np.minimum(forward, backward) - edges
+            cost[i - 1:end + 1] = np.inf
+            j = int(cost.argmin())
+            if removal_gain - cost[j] > MIN_GAIN_M:
+                run = tour[i:end + 1]
+                if backward[j] < forward[j]:
+                    run = run[::-1]
+                rest = np.concatenate((tour[:i], tour[end + 1:]))
+                insert_at = j + 1 if j < i else j + 1 - length
+                tour[:] = np.concatenate((rest[:insert_at], run, rest[insert_at:]))
+                edges = _edge_lengths(matrix, tour)
+                changed = moved = True
+                break
+        if not moved:
+            i += 1
+    return changed
+
+
+def optimize_route(lat, lon, time_budget=DEFAULT_TIME_BUDGET):
+    """
+    Reorders the stops of a route to shorten it, keeping the first stop first.
+
+    Args:
+        lat, lon: Arrays with the coordinates of the stops, in degrees, in their current order.
+        time_budget: Seconds allowed for the 2-opt/Or-opt improvement (the
+            nearest-neighbour construction always completes).
+
+    Returns:
+        A `RouteOptimization` with the new order (positions into `lat`/`lon`) and
+        the route length before and after, in meters. If the optimized route is
+        not shorter than the original one, the original order is returned.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    count = len(lat)
+    identity = np.arange(count)
+    length_before = path_length(lat, lon) if count > 1 else 0.0
+    if count < 4:
+        return RouteOptimization(identity, length_before, length_before)
+
+    matrix = haversine_matrix(lat, lon)
+    tour = np.append(nearest_neighbour_order(matrix), count)  # The virtual end closes the path
+    deadline = time.perf_counter() + time_budget
+    matrix = _with_virtual_end(matrix)
+    while time.perf_counter() < deadline:
+        improved = two_opt(matrix, tour, deadline)
+        improved = or_opt(matrix, tour, deadline) or improved
+        if not improved:
+            break
+
+    order = tour[:-1]
+    length_after = path_length(lat[order], lon[order])
+    if length_after >= length_before:
+        return RouteOptimization(identity, length_before, length_before)
+    return RouteOptimization(order, length_before, length_after)
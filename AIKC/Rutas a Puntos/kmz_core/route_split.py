@@ -0,0 +1,265 @@
+"""
+Splitting a set of pins into several routes.
+
+`split_into_routes` partitions the pins into K groups and orders each group as a
+route. Pins are partitioned in Web Mercator world coordinates (see
+`clustering.project_to_world`) with one of:
+
+- `SPLIT_KMEANS`: k-means whose assignment step is capacity-constrained, so the
+  groups stay balanced (at most `capacity` pins each). Each assignment is a few
+  vectorized rounds: every unassigned pin proposes to its nearest center that
+  still has room and each center accepts its closest proposers up to its free
+  capacity.
+- `SPLIT_SWEEP`: pins are sorted by their angle around the centroid and cut into
+  K runs of equal size, starting at the widest empty angle.
+
+Limits on the number of stops per route raise K as needed. Every route needs at
+least `MIN_ROUTE_STOPS` stops (a KML LineString needs two vertices), so K is
+capped at half the number of pins and the stops of smaller groups are moved to
+the group of their nearest stop. A limit on the length of a route cuts the
+ordered routes into consecutive pieces.
+
+Groups of up to `OPTIMIZE_MAX_STOPS` pins are ordered with
+`route_optimize.optimize_route`, sharing one time budget. Larger groups, whose
+distance matrix would not fit in memory, and the groups left once the budget is
+spent follow a Hilbert curve, which keeps nearby pins together at a fraction of
+the cost.
+"""
+import math
+import time
+
+import numpy as np
+
+from .clustering import project_to_world
+from .route_optimize import leg_lengths, optimize_route
+
+SPLIT_KMEANS = "kmeans"
+SPLIT_SWEEP = "sweep"
+
+DEFAULT_TIME_BUDGET = 20.0  # Seconds for ordering all the routes of a split
+BALANCE_SLACK = 0.0  # K-means groups may exceed an even share of the pins by this fraction
+KMEANS_ITERATIONS = 10  # Maximum number of k-means iterations
+KMEANS_TOLERANCE = 0.01  # K-means stops when fewer than this fraction of the points change group
+OPTIMIZE_MAX_STOPS = 5000  # Larger routes are ordered along a Hilbert curve instead of optimized
+HILBERT_ORDER = 16  # Bits per axis of the Hilbert curve grid
+MIN_ROUTE_STOPS = 2  # Fewest stops of a route: a line needs two vertices
+
+
+def kmeans_plus_plus(x, y, k, rng):
+    """Returns the indices of `k` initial centers chosen with k-means++ seeding."""
+    centers = [int(rng.integers(len(x)))]
+    distance = (x - x[centers[0]]) ** 2 + (y - y[centers[0]]) ** 2
+    for _ in range(1, k):
+        total = distance.sum()
+        if total == 0:  # Fewer distinct points than centers
+            centers.append(int(rng.integers(len(x))))
+        else:
+            centers.append(int(np.searchsorted(np.cumsum(distance), rng.random() * total)))
+        distance = np.minimum(distance, (x - x[centers[-1]]) ** 2 + (y - y[centers[-1]]) ** 2)
+    return np.array(centers)
+
+
+def capacitated_assignment(x, y, center_x, center_y, capacity):
+    """
+    Assigns each point to a center, with at most `capacity` points per center.
+
+    Unassigned points repeatedly propose to their nearest center with free
+    capacity, and each center keeps its closest proposers; every round fills at
+    least one center, so there are at most K rounds.
+
+    Returns:
+        Array with the center number of each point.
+    """
+    distance = (np.subtract.outer(x, center_x) ** 2 + np.subtract.outer(y, center_y) ** 2).astype(np.float32)
+    labels = np.full(len(x), -1, dtype=np.int64)
+    free = np.full(len(center_x), capacity, dtype=np.int64)
+    pending = np.arange(len(x))
+    while len(pending):
+        candidates = np.where(free > 0, distance[pending], np.float32(np.inf))
+        choice = candidates.argmin(axis=1)
+        choice_distance = candidates[np.arange(len(pending)), choice]
+        # Rank of each proposer among those of its center, closest first
+        order = np.lexsort((choice_distance, choice))
+        sorted_choice = choice[order]
+        group_start = np.searchsorted(sorted_choice, sorted_choice)
+        rank = np.empty(len(pending), dtype=np.int64)
+        rank[order] = np.arange(len(pending)) - group_start
+        accepted = rank < free[choice]
+        labels[pending[accepted]] = choice[accepted]
+        free -= np.bincount(choice[accepted], minlength=len(free))
+        pending = pending[~accepted]
+    return labels
+
+
+def kmeans_partition(x, y, k, capacity, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Balanced k-means: returns the group number (0 to k-1) of each point, with at
+    most `capacity` points per group (`k * capacity` must be at least the number
+    of points).
+    """
+    rng = np.random.default_rng(seed)
+    seeds = kmeans_plus_plus(x, y, k, rng)
+    center_x, center_y = x[seeds], y[seeds]
+    labels = None
+    for _ in range(iterations):
+        new_labels = capacitated_assignment(x, y, center_x, center_y, capacity)
+        converged = labels is not None and np.count_nonzero(new_labels != labels) <= KMEANS_TOLERANCE * len(x)
+        labels = new_labels
+        if converged:
+            break
+        counts = np.bincount(labels, minlength=k)
+        used = counts > 0
+        center_x[used] = np.bincount(labels, weights=x, minlength=k)[used] / counts[used]
+        center_y[used] = np.bincount(labels, weights=y, minlength=k)[used] / counts[used]
+    return labels
+
+
+def sweep_partition(x, y, k):
+    """
+    Returns the group number of each point: the points are sorted by angle
+    around their centroid, starting after the widest empty angle, and cut into
+    `k` runs of equal size.
+    """
+    angle = np.arctan2(y - y.mean(), x - x.mean())
+    order = np.argsort(angle, kind="stable")
+    gaps = np.diff(np.append(angle[order], angle[order[0]] + 2 * math.pi))
+    order = np.roll(order, -(int(gaps.argmax()) + 1))
+    labels = np.empty(len(x), dtype=np.int64)
+    for group, members in enumerate(np.array_split(order, k)):
+        labels[members] = group
+    return labels
+
+
+def merge_small_groups(x, y, labels, max_stops=None):
+    """
+    Moves every stop of a group with fewer than `MIN_ROUTE_STOPS` stops to the
+    group of its nearest stop elsewhere, preferring the groups that still have
+    room under `max_stops` (when none has, the nearest group takes it anyway).
+
+    Returns:
+        The new group number of each point; groups left empty have no points.
+    """
+    labels = labels.copy()
+    sizes = np.bincount(labels)
+    for group in np.flatnonzero((sizes > 0) & (sizes < MIN_ROUTE_STOPS)).tolist():
+        if sizes[group] >= MIN_ROUTE_STOPS:  # Another small group was merged into it
+            continue
+        for stop in np.flatnonzero(labels == group).tolist():
+            others = labels != group
+            if not others.any():
+                return labels
+            eligible = others & (sizes[labels] < max_stops) if max_stops else others
+            if not eligible.any():
+                eligible = others
+            candidates = np.flatnonzero(eligible)
+            nearest = candidates[((x[candidates] - x[stop]) ** 2 + (y[candidates] - y[stop]) ** 2).argmin()]
+            labels[stop] = labels[nearest]
+            sizes[labels[nearest]] += 1
+            sizes[group] -= 1
+    return labels
+
+
+def hilbert_order(x, y, bits=HILBERT_ORDER):
+    """Returns the indices of the points sorted along a Hilbert curve over their bounding box."""
+    side = (1 << bits) - 1
+    span = max(float(x.max() - x.min()), float(y.max() - y.min())) or 1.0
+    cx = ((x - x.min()) / span * side).astype(np.int64)
+    cy = ((y - y.min()) / span * side).astype(np.int64)
+    distance = np.zeros(len(x), dtype=np.int64)
+    s = 1 << (bits - 1)
+    while s > 0:
+        rx = (cx & s) > 0
+        ry = (cy & s) > 0
+        distance += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so the curve continues in the right direction
+        flip = ~ry & rx
+        cx = np.where(flip, side - cx, cx)
+        cy = np.where(flip, side - cy, cy)
+        swap = ~ry
+        cx, cy = np.where(swap, cy, cx), np.where(swap, cx, cy)
+        s >>= 1
+    return np.argsort(distance, kind="stable")
+
+
+def cut_by_length(lat, lon, max_length_m):
+    """
+    Cuts an ordered route into consecutive pieces no longer than `max_length_m`
+    (a piece always keeps at least two stops, even if they are farther apart).
+
+    Returns:
+        List of position arrays, one per piece.
+    """
+    count = len(lat)
+    travelled = np.concatenate(([0.0], np.cumsum(leg_lengths(lat, lon))))  # Distance from the first stop
+    pieces = []
+    start = 0
+    while start < count:
+        end = int(np.searchsorted(travelled, travelled[start] + max_length_m, side="right"))
+        end = max(end, start + 2)
+        if end >= count - 1:  # Don't leave a single stop for a last piece
+            end = count
+        pieces.append(np.arange(start, end))
+        start = end
+    return pieces
+
+
+def split_into_routes(lat, lon, k, method=SPLIT_KMEANS, max_stops=None, max_length_m=None,
+                      time_budget=DEFAULT_TIME_BUDGET):
+    """
+    Partitions stops into routes and orders each route.
+
+    Args:
+        lat, lon: Arrays with the coordinates of the stops, in degrees.
+        k: Number of routes wanted (raised if `max_stops` requires more, and at
+            most half the number of stops, so every route has two).
+        method: `SPLIT_KMEANS` or `SPLIT_SWEEP`.
+        max_stops: Optional maximum number of stops per route (exceeded by one
+            stop only when it is 2 and the number of stops is odd).
+        max_length_m: Optional maximum length of a route, in meters; longer
+            routes are cut into consecutive pieces.
+        time_budget: Seconds shared by the ordering of all the routes.
+
+    Returns:
+        List of arrays of positions into `lat`/`lon`, one per route, each in
+        route order and with at least `MIN_ROUTE_STOPS` stops (unless there is a
+        single stop). Groups are listed by their lowest position.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    count = len(lat)
+    if count == 0:
+        return []
+    k = max(1, int(k))
+    if max_stops:
+        k = max(k, math.ceil(count / max_stops))
+    k = min(k, max(1, count // MIN_ROUTE_STOPS))
+    x, y = project_to_world(lat, lon)
+
+    if method == SPLIT_SWEEP:
+        labels = sweep_partition(x, y, k)
+    else:
+        capacity = math.ceil(count / k * (1 + BALANCE_SLACK))
+        if max_stops:
+            # Every group must fit: only an odd count with `max_stops` 2 needs a third stop somewhere
+            capacity = max(min(capacity, max_stops), math.ceil(count / k))
+        labels = kmeans_partition(x, y, k, capacity)
+    labels = merge_small_groups(x, y, labels, max_stops)
+
+    order = np.argsort(labels, kind="stable")
+    groups = [group for group in np.split(order, np.cumsum(np.bincount(labels, minlength=k))[:-1]) if len(group)]
+    groups.sort(key=lambda group: group[0])
+
+    routes = []
+    deadline = time.perf_counter() + time_budget
+    for position, group in enumerate(groups):
+        remaining = deadline - time.perf_counter()
+        if len(group) <= OPTIMIZE_MAX_STOPS and remaining > 0:
+            share = remaining / (len(groups) - position)
+            group = group[optimize_route(lat[group], lon[group], time_budget=share).order]
+        else:
+            group = group[hilbert_order(x[group], y[group])]
+        if max_length_m:
+            routes.extend(group[piece] for piece in cut_by_length(lat[group], lon[group], max_length_m))
+        else:
+            routes.append(group)
+    return routes
@@ -0,0 +1,167 @@
+"""
+Route building from loaded pins, shared by the application and the `kmz-routes`
+command line tool.
+
+A route is a dictionary with the route "name", its "kml_coords" (list of (lon,
+lat, alt) tuples) and its "color": a Tk color name ("red") or "#rrggbb" string,
+as drawn by tkintermapview. `kml_routes` turns routes into the
+(name, KML color code, kml_coords) tuples written by `kml_writer.save_routes`.
+
+When the routes of the source files are optimized (`order_routes`), routes of up
+to `route_split.OPTIMIZE_MAX_STOPS` stops are reordered with `optimize_route`,
+sharing one time budget, as the routes of a split are; larger routes, and those
+left once the budget is spent, follow a Hilbert curve from their first stop.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from .clustering import project_to_world
+from .route_optimize import RouteOptimization, optimize_route, path_length
+from .route_split import OPTIMIZE_MAX_STOPS, hilbert_order
+
+DEFAULT_ROUTE_COLOR = "red"
+OPTIMIZE_TIME_BUDGET = 20.0  # Seconds shared by the optimization of all the routes of `order_routes`
+
+# KML color codes (ABGR format).
+KML_COLOR_RED = "ff0000ff"
+KML_COLOR_GREEN = "ff00ff00"
+KML_COLOR_BLUE = "ffff0000"
+KML_COLOR_CYAN = "ffffff00"
+DEFAULT_KML_COLOR = KML_COLOR_RED # Default color for KML linestrings.
+KML_COLORS = {"red": KML_COLOR_RED, "green": KML_COLOR_GREEN, "blue": KML_COLOR_BLUE, "cyan": KML_COLOR_CYAN}
+
+# Distinct colors for the routes of a split, cycled when there are more routes.
+SPLIT_ROUTE_COLORS = [
+    "#e6194b", "#3cb44b", "#4363d8", "#f58231", "#911eb4", "#42d4f4",
+    "#f032e6", "#9a6324", "#469990", "#800000", "#808000", "#000075",
+]
+
+# Routes with the pins of each source file: (name, pin indices) per route and the
+# total length of the routes, in meters, before and after optimizing their order
+# (both 0 when they were not optimized).
+SourceRoutes = namedtuple("SourceRoutes", ["routes", "length_before", "length_after"])
+
+
+def hex_color_to_kml(color):
+    """
+    Converts a "#rrggbb" color to a KML color code (opaque ABGR, e.g. "ff4bb0e6").
+    Returns `DEFAULT_KML_COLOR` for any other value.
+    """
+    if isinstance(color, str) and len(color) == 7 and color.startswith("#"):
+        red, green, blue = color[1:3], color[3:5], color[5:7]
+        return f"ff{blue}{green}{red}".lower()
+    return DEFAULT_KML_COLOR
+
+
+def route_kml_color(color):
+    """Returns the KML color code of a route color (a name of `KML_COLORS` or "#rrggbb")."""
+    return KML_COLORS.get(color) or hex_color_to_kml(color)
+
+
+def kml_color_to_route_color(kml_color):
+    """
+    Converts a KML color code (ABGR, e.g. "ff4bb0e6") back to a route color: the
+    name of `KML_COLORS` it stands for, else "#rrggbb" (the alpha is dropped).
+    Returns `DEFAULT_ROUTE_COLOR` for None or a malformed code.
+    """
+    kml_color = (kml_color or "").strip().lower()
+    for name, code in KML_COLORS.items():
+        if code == kml_color:
+            return name
+    if len(kml_color) == 8 and all(digit in "0123456789abcdef" for digit in kml_color):
+        blue, green, red = kml_color[2:4], kml_color[4:6], kml_color[6:8]
+        return f"#{red}{green}{blue}"
+    return DEFAULT_ROUTE_COLOR
+
+
+def kml_routes(routes):
+    """Returns the (name, KML color code, kml_coords) tuple of each route, for `kml_writer.save_routes`."""
+    return [(route["name"], route_kml_color(route.get("color", DEFAULT_ROUTE_COLOR)), route["kml_coords"])
+            for route in routes]
+
+
+def source_groups(pins):
+    """
+    Returns a `(name, pin indices)` pair per source file of a `PinStore`, named
+    "Ruta <source>", with its pins in load order. Sources with fewer than two pins are skipped.
+    """
+    return [(f"Ruta {source}", indices) for source, indices in pins.group_indices_by_source()
+            if len(indices) >= 2] # Need at least two pins to form a route
+
+
+def routes_by_source(pins, optimize=False, time_budget=OPTIMIZE_TIME_BUDGET):
+    """
+    Makes one route with the pins of each source file of a `PinStore` (see `source_groups`).
+
+    Args:
+        pins: The `PinStore`.
+        optimize: If True, the stops of each route are reordered to shorten it
+            (see `order_routes`); otherwise they keep the order in which they were loaded.
+        time_budget: Seconds shared by the optimization of all the routes.
+
+    Returns:
+        A `SourceRoutes`.
+    """
+    groups = source_groups(pins)
+    if not optimize:
+        return SourceRoutes(groups, 0.0, 0.0)
+    return order_routes(pins.lat, pins.lon, groups, time_budget)
+
+
+def order_routes(lat, lon, groups, time_budget=OPTIMIZE_TIME_BUDGET):
+    """
+    Reorders the stops of each route to shorten it, keeping its first stop as the start.
+
+    Routes of up to `OPTIMIZE_MAX_STOPS` stops are optimized with `optimize_route`,
+    sharing `time_budget`; the others, and those left once it is spent, follow a
+    Hilbert curve (see the module docstring). A route keeps its order when the new
+    one is not shorter. Only uses its arguments, so it can run in a worker thread
+    on copies of the pin coordinates.
+
+    Args:
+        lat, lon: Arrays with the coordinates of the pins, in degrees.
+        groups: `(name, pin indices)` pair per route, e.g. from `source_groups`.
+        time_budget: Seconds shared by the optimization of all the routes.
+
+    Returns:
+        A `SourceRoutes`.
+    """
+    routes = []
+    length_before = length_after = 0.0
+    deadline = time.perf_counter() + time_budget
+    for position, (name, indices) in enumerate(groups):
+        remaining = deadline - time.perf_counter()
+        if len(indices) <= OPTIMIZE_MAX_STOPS and remaining > 0:
+            result = optimize_route(lat[indices], lon[indices], time_budget=remaining / (len(groups) - position))
+        else:
+            result = _hilbert_route(lat[indices], lon[indices])
+        routes.append((name, indices[result.order]))
+        length_before += result.length_before
+        length_after += result.length_after
+    return SourceRoutes(routes, length_before, length_after)
+
+
+def _hilbert_route(lat, lon):
+    """Orders stops along a Hilbert curve after the first one, as a `RouteOptimization` (see `optimize_route`)."""
+    identity = np.arange(len(lat))
+    length_before = path_length(lat, lon)
+    x, y = project_to_world(lat[1:], lon[1:])
+    order = np.concatenate(([0], 1 + hilbert_order(x, y)))
+    length_after = path_length(lat[order], lon[order])
+    if length_after >= length_before:
+        return RouteOptimization(identity, length_before, length_before)
+    return RouteOptimization(order, length_before, length_after)
+
+
+def road_route(router, pins, indices):
+    """
+    Joins pins, in the order of `indices`, with the shortest road paths of a `RoadRouter`.
+
+    Returns:
+        (kml_coords, `RoadPath`): the (lon, lat, alt) vertices of the path, at
+        altitude 0, and the path with its length and unrouted legs.
+    """
+    road_path = router.route_through(pins.lat[indices], pins.lon[indices])
+    return [(lon, lat, 0.0) for lat, lon in zip(road_path.lat, road_path.lon)], road_path
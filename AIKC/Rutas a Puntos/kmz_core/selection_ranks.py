@@ -0,0 +1,99 @@
+"""
+Rank index of the selection order.
+
+Selected pins are numbered with increasing order numbers, with gaps once pins are
+deselected. The list shows each selected pin's *rank* (its 1-based position among
+the selected pins), so deselecting one pin renumbers every pin selected after it.
+`SelectionRankIndex` is a Fenwick (binary indexed) tree over order numbers: adding
+or removing an order number and computing the rank of one are O(log n), so a
+toggle never has to walk the whole selection. Bulk changes (select all, large
+ranges) rebuild the tree in O(n) with NumPy instead.
+"""
+import numpy as np
+
+INITIAL_CAPACITY = 1024
+BULK_UPDATE_THRESHOLD = 256  # Above this many changes the tree is rebuilt instead of updated
+
+
+class SelectionRankIndex:
+    """
+    Fenwick tree counting which order numbers (positive ints) are in use.
+
+    `rank(order)` returns how many order numbers <= `order` are in use, which for
+    a selected pin is its 1-based position in the selection.
+    """
+    def __init__(self):
+        self._allocate(INITIAL_CAPACITY)
+
+    def _allocate(self, capacity):
+        self._present = np.zeros(capacity + 1, dtype=bool)  # Slot 0 is unused (Fenwick trees are 1-based)
+        self._tree = np.zeros(capacity + 1, dtype=np.int64)
+
+    def clear(self):
+        """Removes every order number."""
+        self._allocate(INITIAL_CAPACITY)
+
+    def __len__(self):
+        return int(self._tree_prefix(len(self._tree) - 1))
+
+    def add(self, orders):
+        """Marks the order numbers in `orders` (array-like of positive ints) as used."""
+        self._update(np.asarray(orders, dtype=np.int64).ravel(), True)
+
+    def remove(self, orders):
+        """Marks the order numbers in `orders` as no longer used."""
+        self._update(np.asarray(orders, dtype=np.int64).ravel(), False)
+
+    def _update(self, orders, value):
+        if len(orders) == 0:
+            return
+        highest = int(orders.max())
+        if highest >= len(self._tree):
+            self._grow(highest)
+        orders = orders[self._present[orders] != value]  # Ignore numbers already in the wanted state
+        if len(orders) > BULK_UPDATE_THRESHOLD:
+            self._present[orders] = value
+            self._rebuild()
+            return
+        delta = 1 if value else -1
+        size = len(self._tree)
+        for order in np.unique(orders).tolist():
+            self._present[order] = value
+            while order < size:
+                self._tree[order] += delta
+                order += order & -order
+
+    def _grow(self, highest):
+        capacity = max(highest, 2 * (len(self._tree) - 1))
+        present = self._present
+        self._allocate(capacity)
+        self._present[:len(present)] = present
+        self._rebuild()
+
+    def _rebuild(self):
+        # tree[i] holds the count of the range (i - lowbit(i), i], i.e. a difference of prefix sums
+        prefix = np.cumsum(self._present, dtype=np.int64)
+        positions = np.arange(len(self._tree), dtype=np.int64)
+        self._tree = prefix - prefix[positions - (positions & -positions)]
+
+    def _tree_prefix(self, orders):
+        """Vectorized prefix count for an int or an array of order numbers."""
+        orders = np.minimum(np.asarray(orders, dtype=np.int64), len(self._tree) - 1)
+        total = np.zeros(orders.shape, dtype=np.int64)
+        while np.any(orders > 0):
+            total += self._tree[orders]
+            orders = orders - (orders & -orders)
+        return total
+
+    def rank(self, orders):
+        """
+        Returns the number of used order numbers <= each of `orders`.
+
+        Args:
+            orders: An order number or an array of them.
+
+        Returns:
+            An int (or int64 array of the same shape as `orders`).
+        """
+        ranks = self._tree_prefix(orders)
+        return int(ranks) if ranks.ndim == 0 else ranks
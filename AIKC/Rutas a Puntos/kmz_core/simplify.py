@@ -0,0 +1,103 @@
+"""
+Multi-resolution Douglas–Peucker simplification of polylines.
+
+`douglas_peucker_importance` runs Douglas–Peucker once, down to zero
+tolerance, and records for every vertex the tolerance at which it stops being
+kept: the distance at which it was chosen as a split point, capped by that of
+the split that created its segment so the levels stay nested. The line
+simplified with any tolerance `t` is then just the vertices whose importance is
+above `t` (`simplified_mask`), so the map can switch resolution on every zoom
+change without running Douglas–Peucker again.
+
+Splitting is vectorized by level: each pass measures the interior vertices of
+every open segment at once and splits all of them at their farthest vertex, so
+a line takes about as many passes as its recursion depth (a few dozen for GPS
+tracks) instead of one NumPy call per segment. `polylines_importance` runs the
+same passes over many polylines at once, each one an initial segment, so adding
+thousands of short routes costs a few dozen NumPy calls rather than a few dozen
+per route.
+"""
+import numpy as np
+
+
+def douglas_peucker_importance(x, y):
+    """
+    Computes the Douglas–Peucker importance of the vertices of a polyline.
+
+    Args:
+        x, y: Arrays with the vertex coordinates, in a planar projection (e.g.
+            Web Mercator world coordinates from `clustering.project_to_world`).
+
+    Returns:
+        Float64 array with the importance of each vertex, in the units of `x`
+        and `y`; the first and last vertices are infinite, so they are always kept.
+    """
+    return polylines_importance(x, y, [0, len(x)])
+
+
+def polylines_importance(x, y, offsets):
+    """
+    Computes the Douglas–Peucker importance of the vertices of several polylines
+    stored one after another.
+
+    Args:
+        x, y: Arrays with the vertex coordinates of every polyline, concatenated.
+        offsets: Polyline `i` is vertices `offsets[i]` to `offsets[i + 1] - 1`
+            (len(polylines) + 1 increasing positions, the first 0).
+
+    Returns:
+        Float64 array with the importance of each vertex, as
+        `douglas_peucker_importance` gives for its own polyline. Vertices with
+        non-finite coordinates, and those next to them, are as important as the
+        split that created their segment.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    importance = np.zeros(len(x))
+    nonempty = offsets[1:] > offsets[:-1]
+
+    # Open segments: end vertex positions and the importance of the split that created them
+    starts = offsets[:-1][nonempty]
+    ends = offsets[1:][nonempty] - 1
+    importance[starts] = importance[ends] = np.inf
+    caps = np.full(len(starts), np.inf)
+    while True:
+        interior = ends - starts - 1
+        has_interior = interior > 0
+        starts, ends, caps, interior = starts[has_interior], ends[has_interior], caps[has_interior], interior[has_interior]
+        if not len(starts):
+            return importance
+
+        # Interior vertex positions of every segment, concatenated, and their segment number
+        offsets = np.concatenate(([0], np.cumsum(interior)))
+        segment = np.repeat(np.arange(len(starts)), interior)
+        vertex = np.arange(offsets[-1]) - offsets[segment] + starts[segment] + 1
+
+        # Distance of each interior vertex to the chord of its segment
+        ax, ay = x[starts][segment], y[starts][segment]
+        dx, dy = x[ends][segment] - ax, y[ends][segment] - ay
+        squared = dx * dx + dy * dy
+        fraction = np.clip(((x[vertex] - ax) * dx + (y[vertex] - ay) * dy) / np.where(squared > 0, squared, 1.0), 0.0, 1.0)
+        distance = np.hypot(x[vertex] - ax - fraction * dx, y[vertex] - ay - fraction * dy)
+        # A vertex without a finite distance (a NaN coordinate at either end) is always split off first
+        distance[~np.isfinite(distance)] = np.inf
+
+        # Farthest interior vertex of each segment (the first one on ties)
+        farthest = np.maximum.reduceat(distance, offsets[:-1])
+        candidates = np.flatnonzero(distance == farthest[segment])
+        _, first = np.unique(segment[candidates], return_index=True)
+        split = vertex[candidates[first]]
+        split_importance = np.minimum(farthest, caps)
+        importance[split] = split_importance
+
+        starts, ends = np.concatenate((starts, split)), np.concatenate((split, ends))
+        caps = np.concatenate((split_importance, split_importance))
+
+
+def simplified_mask(importance, tolerance):
+    """
+    Returns a boolean array selecting the vertices that Douglas–Peucker keeps
+    with `tolerance`: those farther than `tolerance` from the simplified line.
+    """
+    return importance > tolerance
@@ -0,0 +1,160 @@
+"""
+Spatial indexes for viewport queries.
+
+`PointGridIndex` buckets points into a uniform grid laid over their bounding box,
+sized so that each cell holds about `pins_per_cell` points. Points are stored
+sorted by row-major cell number, so the points of one grid row inside a query
+rectangle are a single contiguous slice: a query costs one slice per grid row
+plus an exact vectorized filter of the candidates. Nearest-point lookups query
+squares of growing size around the position, up to one covering every point.
+
+`BoxIndex` keeps axis-aligned boxes (e.g. route bounding boxes) in a NumPy array
+that doubles its capacity when full, so adding boxes one at a time or in bulk
+costs amortized O(1) each, and answers overlap queries with one vectorized
+comparison, which is plenty for tens of thousands of routes.
+
+Both work in any planar coordinates; the map uses Web Mercator world coordinates
+(see `clustering.project_to_world`).
+"""
+import math
+
+import numpy as np
+
+DEFAULT_PINS_PER_CELL = 32  # Average number of points per grid cell
+MAX_GRID_SIDE = 1024  # Maximum number of cells per grid side
+INITIAL_BOX_CAPACITY = 64  # Boxes a `BoxIndex` has room for before it first grows
+
+
+class PointGridIndex:
+    """Uniform grid index over a fixed set of points."""
+    def __init__(self, x, y, pins_per_cell=DEFAULT_PINS_PER_CELL):
+        """
+        Args:
+            x, y: Arrays with the point coordinates; point `i` is returned as index `i`.
+            pins_per_cell: Average number of points per cell the grid is sized for.
+        """
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        count = len(self.x)
+        self.side = int(min(MAX_GRID_SIDE, max(1, math.ceil(math.sqrt(count / pins_per_cell)))))
+        if count == 0:
+            self.min_x = self.min_y = self.max_x = self.max_y = 0.0
+            self.cell_width = self.cell_height = 1.0
+            self.order = np.empty(0, dtype=np.int64)
+            self.offsets = np.zeros(self.side * self.side + 1, dtype=np.int64)
+            return
+        self.min_x, self.min_y = float(self.x.min()), float(self.y.min())
+        self.max_x, self.max_y = float(self.x.max()), float(self.y.max())
+        self.cell_width = (self.max_x - self.min_x) / self.side or 1.0
+        self.cell_height = (self.max_y - self.min_y) / self.side or 1.0
+        keys = self._rows(self.y) * self.side + self._columns(self.x)
+        self.order = np.argsort(keys, kind="stable")
+        # Points of cell k are order[offsets[k]:offsets[k + 1]]
+        self.offsets = np.searchsorted(keys[self.order], np.arange(self.side * self.side + 1))
+
+    def __len__(self):
+        return len(self.x)
+
+    # Non-finite coordinates cast to an arbitrary cell, which `nearest` never relies on
+    def _columns(self, x):
+        with np.errstate(invalid="ignore"):
+            return np.clip(((x - self.min_x) / self.cell_width).astype(np.int64), 0, self.side - 1)
+
+    def _rows(self, y):
+        with np.errstate(invalid="ignore"):
+            return np.clip(((y - self.min_y) / self.cell_height).astype(np.int64), 0, self.side - 1)
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """
+        Returns the sorted indices of the points inside the rectangle (edges included).
+        """
+        if len(self.x) == 0 or min_x > max_x or min_y > max_y:
+            return np.empty(0, dtype=np.int64)
+        first_column, last_column = self._columns(np.array([min_x, max_x]))
+        first_row, last_row = self._rows(np.array([min_y, max_y]))
+        slices = [
+            self.order[self.offsets[row * self.side + first_column]:self.offsets[row * self.side + last_column + 1]]
+            for row in range(first_row, last_row + 1)
+        ]
+        candidates = np.concatenate(slices)
+        x, y = self.x[candidates], self.y[candidates]
+        inside = (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+        return np.sort(candidates[inside])
+
+    def nearest(self, x, y):
+        """
+        Returns the index of the point closest to (x, y), or -1 if the index is
+        empty, the position is not finite or no point is.
+
+        Squares of doubling size around the position are queried until one holds a
+        point within its inscribed circle, which is then the closest point. Once a
+        square would cover the whole index, every point is measured instead.
+        """
+        if len(self.x) == 0 or not (math.isfinite(x) and math.isfinite(y)):
+            return -1
+        radius = max(self.cell_width, self.cell_height)
+        # Half side of a square around (x, y) that covers every point (NaN if a point is not finite)
+        covering = max(abs(x - self.min_x), abs(x - self.max_x), abs(y - self.min_y), abs(y - self.max_y))
+        while radius < covering:
+            candidates = self.query(x - radius, y - radius, x + radius, y + radius)
+            if len(candidates):
+                distance = np.hypot(self.x[candidates] - x, self.y[candidates] - y)
+                best = int(distance.argmin())
+                if distance[best] <= radius:
+                    return int(candidates[best])
+            radius *= 2
+        distance = np.hypot(self.x - x, self.y - y)
+        finite = np.isfinite(distance)
+        if not finite.any():
+            return -1
+        return int(np.flatnonzero(finite)[distance[finite].argmin()])
+
+
+class BoxIndex:
+    """Growable set of axis-aligned boxes, identified by insertion number."""
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Removes every box."""
+        self._boxes = np.empty((INITIAL_BOX_CAPACITY, 4), dtype=np.float64)  # Rows of min_x, min_y, max_x, max_y
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def boxes(self):
+        """(N, 4) view of the boxes (min_x, min_y, max_x, max_y), valid until the next add."""
+        return self._boxes[:self._size]
+
+    def add(self, min_x, min_y, max_x, max_y):
+        """Adds a box and returns its id."""
+        return self.extend([(min_x, min_y, max_x, max_y)])[0]
+
+    def extend(self, boxes):
+        """
+        Adds several boxes.
+
+        Args:
+            boxes: (N, 4) array-like with min_x, min_y, max_x, max_y per box.
+
+        Returns:
+            The range of ids given to the boxes, in order.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        needed = self._size + len(boxes)
+        if needed > len(self._boxes):
+            grown = np.empty((max(needed, 2 * len(self._boxes)), 4), dtype=np.float64)
+            grown[:self._size] = self.boxes
+            self._boxes = grown
+        self._boxes[self._size:needed] = boxes
+        first = self._size
+        self._size = needed
+        return range(first, needed)
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """Returns the ids of the boxes that overlap the rectangle (touching counts)."""
+        boxes = self.boxes
+        overlap = (boxes[:, 0] <= max_x) & (boxes[:, 2] >= min_x) & (boxes[:, 1] <= max_y) & (boxes[:, 3] >= min_y)
+        return np.flatnonzero(overlap)
@@ -0,0 +1,198 @@
+"""
+Chunked reading of KMZ archive members through `mmap`.
+
+`ZipFile.read` returns a member as one `bytes` object that the XML parser then
+copies into its own buffers, so parsing a document into a tree holds it twice.
+`open_member` returns a `MemberReader` instead, which hands the member out in
+chunks of at most `MEMBER_CHUNK_SIZE` bytes, meant for a parser's feed interface
+(`kml_stream.PlacemarkStream`, `kml_stream.parse_kml_tree`), reading the archive
+through a read-only memory map:
+
+- stored (uncompressed) members are sliced straight out of the mapped archive;
+- deflated members are inflated with `zlib.decompressobj` from views of the
+  mapped compressed bytes, producing at most one chunk at a time.
+
+lxml only parses `bytes`, so every chunk is still copied once out of the map or
+the decompressor, but nothing larger than a chunk is ever held. Where `madvise`
+exists, the mapped pages already consumed are dropped as reading advances, so
+the map does not add the size of the archive to the resident memory either. The CRC-32 of the
+member is checked at the end, as `ZipFile` does. Encrypted members, other
+compression methods and archives that are not regular files (e.g. in a `BytesIO`)
+are read with `ZipFile.open`, in chunks of the same size.
+"""
+import mmap
+import struct
+import zipfile
+import zlib
+
+MEMBER_CHUNK_SIZE = 64 * 1024  # Bytes handed to the parser at a time
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")  # Local file header of a member: signature ... name length, extra length
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+ENCRYPTED_FLAG = 0x1  # General purpose bit flag of encrypted members
+
+
+class MemberReader:
+    """
+    Binary file-like object over one member of an open `zipfile.ZipFile`.
+
+    `read(size)` returns at most `size` bytes but never more than one chunk, so
+    it may return less than asked before the end (b"" marks the end). `tell()` is
+    the number of uncompressed bytes returned so far. Use it as a context manager
+    or call `close()` to release the memory map.
+    """
+    def __init__(self, kmz, member):
+        """
+        Args:
+            kmz: An open `zipfile.ZipFile`.
+            member: Name (or `ZipInfo`) of the member to read.
+
+        Raises:
+            KeyError: If the archive has no such member.
+            zipfile.BadZipFile: If the member's local header is invalid.
+        """
+        self.info = member if isinstance(member, zipfile.ZipInfo) else kmz.getinfo(member)
+        self.position = 0
+        self._map = None
+        self._fallback = None
+        self._chunks = None
+        self._chunk = b""  # Current chunk, returned from `_offset` on
+        self._offset = 0
+        if self._can_map(kmz):
+            self._chunks = self._mapped_chunks(kmz)
+        else:
+            self._fallback = kmz.open(self.info)
+            self._chunks = iter(lambda: self._fallback.read(MEMBER_CHUNK_SIZE), b"")
+
+    def _can_map(self, kmz):
+        if self.info.flag_bits & ENCRYPTED_FLAG or self.info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            return False
+        try:
+            kmz.fp.fileno()
+        except (AttributeError, OSError, ValueError):  # Not backed by a regular file
+            return False
+        return True
+
+    def _mapped_chunks(self, kmz):
+        """Maps the archive and returns the generator of the member's chunks."""
+        self._map = mmap.mmap(kmz.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = self.info.header_offset
+        header = LOCAL_HEADER.unpack_from(self._map, offset) if offset + LOCAL_HEADER.size <= len(self._map) else None
+        if header is None or header[0] != LOCAL_HEADER_SIGNATURE:
+            self.close()
+            raise zipfile.BadZipFile(f"Encabezado inválido del archivo {self.info.filename} dentro del KMZ.")
+        start = offset + LOCAL_HEADER.size + header[-2] + header[-1]
+        end = start + self.info.compress_size
+        if end > len(self._map):
+            self.close()
+            raise zipfile.BadZipFile(f"El archivo {self.info.filename} está truncado dentro del KMZ.")
+        self._released = start - start % mmap.PAGESIZE  # Pages before this one were already released
+        if self.info.compress_type == zipfile.ZIP_STORED:
+            return self._checked(self._stored_chunks(start, end))
+        return self._checked(self._deflated_chunks(start, end))
+
+    def _release_pages(self, end):
+        """
+        Tells the kernel the whole mapped pages before `end` will not be read again.
+        The page `end` falls in is kept: releasing it would only fault it in again.
+        """
+        end -= end % mmap.PAGESIZE
+        if end > self._released and hasattr(self._map, "madvise"):  # Not available on Windows
+            self._map.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+            self._released = end
+
+    def _stored_chunks(self, start, end):
+        for chunk_start in range(start, end, MEMBER_CHUNK_SIZE):
+            chunk_end = min(chunk_start + MEMBER_CHUNK_SIZE, end)
+            chunk = self._map[chunk_start:chunk_end]
+            self._release_pages(chunk_end)
+            yield chunk
+
+    def _deflated_chunks(self, start, end):
+        inflater = zlib.decompressobj(-zlib.MAX_WBITS)  # Raw deflate stream, as stored in zip archives
+        view = memoryview(self._map)
+        try:
+            position = start
+            while position < end or inflater.unconsumed_tail:
+                if inflater.unconsumed_tail:
+                    chunk = inflater.decompress(inflater.unconsumed_tail, MEMBER_CHUNK_SIZE)
+                else:
+                    next_position = min(position + MEMBER_CHUNK_SIZE, end)
+                    with view[position:next_position] as compressed:
+                        chunk = inflater.decompress(compressed, MEMBER_CHUNK_SIZE)
+                    self._release_pages(next_position)  # What was not consumed is in unconsumed_tail
+                    position = next_position
+                if chunk:
+                    yield chunk
+                if inflater.eof:
+                    break
+            chunk = inflater.flush()
+            if chunk:
+                yield chunk
+        finally:
+            view.release()
+
+    def _checked(self, chunks):
+        """Yields `chunks`, then checks their size and CRC-32 against the archive's directory."""
+        crc = 0
+        size = 0
+        try:
+            for chunk in chunks:
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                yield chunk
+        finally:
+            chunks.close()  # Releases the view of the map when reading stops early
+        if size != self.info.file_size or crc != self.info.CRC:
+            raise zipfile.BadZipFile(f"El archivo {self.info.filename} está dañado dentro del KMZ (CRC incorrecto).")
+
+    def read(self, size=-1):
+        """Returns up to `size` bytes (at most one chunk; everything left if `size` is negative)."""
+        if size is None or size < 0:
+            data = self._chunk[self._offset:] + b"".join(self._chunks)
+            self._chunk, self._offset = b"", 0
+        else:
+            if self._offset >= len(self._chunk):
+                self._chunk, self._offset = next(self._chunks, b""), 0
+            if self._offset == 0 and size >= len(self._chunk):
+                data = self._chunk  # The whole chunk, without copying it
+            else:
+                data = self._chunk[self._offset:self._offset + size]
+            self._offset += len(data)
+        self.position += len(data)
+        return data
+
+    def tell(self):
+        """Returns the number of uncompressed bytes read so far."""
+        return self.position
+
+    def close(self):
+        """Releases the memory map (or the `ZipFile.open` stream of the fallback)."""
+        self._chunk, self._offset = b"", 0
+        if self._chunks is not None and hasattr(self._chunks, "close"):
+            self._chunks.close()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._fallback is not None:
+            self._fallback.close()
+            self._fallback = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_member(kmz, member):
+    """
+    Opens a member of an open KMZ archive for chunked reading (see the module docstring).
+
+    Args:
+        kmz: An open `zipfile.ZipFile`.
+        member: Name (or `ZipInfo`) of the member.
+
+    Returns:
+        A `MemberReader`, to be closed (or used in a `with` block).
+    """
+    return MemberReader(kmz, member)
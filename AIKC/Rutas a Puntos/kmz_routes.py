@@ -0,0 +1,18 @@
+"""
+Command line entry point of `kmz-routes`, which creates the routes of a
+directory of KMZ files without opening the map window:
+
+    python kmz_routes.py CARPETA -o rutas.kmz
+
+See `kmz_core.cli` for the options (`python kmz_routes.py --help`).
+"""
+import os
+import sys
+
+# The tool runs as a script, like the application, so its package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+import numpy as np
+
+from kmz_core.clustering import GridClusterIndex, project_to_world, TILE_SIZE
+from kmz_core.instrumentation import STAGE_MARKERS
+from kmz_core.simplify import polylines_importance, simplified_mask
+from kmz_core.spatial_index import PointGridIndex, BoxIndex
+
+CLUSTER_MARKER_COLOR = "blue" # Circle color of cluster markers
+WATCH_INTERVAL_MS = 200 # How often the map zoom and position are checked for changes
+REFRESH_DELAY_MS = 300 # Delay before the markers are rebuilt after pins were added
+VIEWPORT_MARGIN = 0.5 # Extra area materialized around the view, as a fraction of its size on each side
+PATH_TOLERANCE_PIXELS = 0.5 # Route vertices closer than this to the simplified line (on screen) are not drawn
+
+
+class MapLayer:
+    """
+    Manages the pin markers and route paths of a `tkintermapview.TkinterMapView`.
+
+    Only what intersects the current view (plus `VIEWPORT_MARGIN` on each side) is
+    materialized as tkintermapview objects: pins are looked up in a
+    `PointGridIndex` and routes in a `BoxIndex` of their bounding boxes. At each
+    integer zoom level the pins are also grouped with a `GridClusterIndex`: cells
+    with several pins are drawn as one cluster marker labelled with the pin count,
+    and the remaining pins as individual markers.
+
+    Routes are drawn simplified for the zoom level: the Douglas–Peucker importance
+    of their vertices is computed once when they are added
+    (`kmz_core.simplify`), and each zoom level draws only the vertices that are
+    more than `PATH_TOLERANCE_PIXELS` off the simplified line, so a GPS track
+    with hundreds of thousands of points is a few hundred when zoomed out. The
+    full coordinates are kept for the routes themselves.
+
+    The layer polls the map with `after()`; when the zoom level changes or the
+    view leaves the materialized area, it only creates and deletes the markers
+    and paths that differ, so panning within the margin costs nothing.
+
+    Clicking an individual marker calls `on_pin_click(index)`; clicking a cluster
+    zooms the map to the cluster's pins.
+
+    With a `Profiler`, every rebuild of the markers and paths is recorded as a
+    `STAGE_MARKERS` span.
+    """
+    def __init__(self, map_widget, pins_data, on_pin_click, pin_color, cluster_color=CLUSTER_MARKER_COLOR,
+                 profiler=None):
+        """
+        Args:
+            map_widget: The `TkinterMapView` the markers are drawn on.
+            pins_data: The application's `PinStore`.
+            on_pin_click: Called with the pin index when an individual marker is clicked.
+            pin_color: Callable returning the circle color of a pin's marker.
+            cluster_color: Circle color of cluster markers.
+            profiler: Optional `kmz_core.instrumentation.Profiler` the marker stage is recorded in.
+        """
+        self.map_widget = map_widget
+        self.pins_data = pins_data
+        self.on_pin_click = on_pin_click
+        self.pin_color = pin_color
+        self.cluster_color = cluster_color
+        self.profiler = profiler
+
+        self.clusters = GridClusterIndex()
+        self.pin_grid = None # PointGridIndex of the pins, rebuilt lazily after pins are added
+        self.pin_markers = {} # Pin index -> marker of the pins drawn individually
+        self.cluster_markers = {} # (zoom, cell key) -> marker of the clusters drawn
+
+        self.paths = [] # (map coordinates, path options) of every route, by path id
+        self.path_importance = [] # Douglas-Peucker importance (world units) of the vertices of every route
+        self.path_levels = [] # {number of vertices: simplified map coordinates} of every route
+        self.path_boxes = BoxIndex() # World bounding box of every route, by path id
+        self.path_objects = {} # Path id -> (map coordinates drawn, tkintermapview path) of the routes drawn
+
+        self.shown_zoom = None # Zoom level the markers were built for
+        self.shown_area = None # World rectangle (min_x, min_y, max_x, max_y) that was materialized
+        self._refresh_id = None
+        self._watch_id = None
+
+    def zoom_level(self):
+        """Integer zoom level of the map (tkintermapview zooms fractionally with the wheel)."""
+        return int(round(self.map_widget.zoom))
+
+    def view_rect(self, margin=0.0):
+        """
+        Returns the world rectangle (min_x, min_y, max_x, max_y) currently shown
+        by the map, enlarged by `margin` times its size on each side.
+        """
+        scale = 2 ** self.zoom_level() # tkintermapview keeps its corners in tile coordinates of the rounded zoom
+        (left, top), (right, bottom) = self.map_widget.upper_left_tile_pos, self.map_widget.lower_right_tile_pos
+        margin_x = (right - left) * margin
+        margin_y = (bottom - top) * margin
+        return ((left - margin_x) / scale, (top - margin_y) / scale,
+                (right + margin_x) / scale, (bottom + margin_y) / scale)
+
+    def pin_index(self):
+        """Returns the `PointGridIndex` of all pins (world coordinates), building it if needed."""
+        if self.pin_grid is None:
+            self.pin_grid = PointGridIndex(self.clusters.x, self.clusters.y)
+        return self.pin_grid
+
+    def materialized_pins(self, indices):
+        """
+        Returns the pins among `indices` that currently have an individual marker.
+        Costs O(min(len(indices), number of markers)).
+        """
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        if len(indices) <= len(self.pin_markers):
+            return [index for index in indices.tolist() if index in self.pin_markers]
+        wanted = np.zeros(len(self.clusters), dtype=bool)
+        wanted[indices] = True
+        return [index for index in self.pin_markers if wanted[index]]
+
+    def pin_marker(self, index):
+        """Returns the marker of pin `index`, or None if the pin is clustered or out of view."""
+        return self.pin_markers.get(index)
+
+    def start_watching(self):
+        """Starts polling the map; the layer is refreshed whenever the zoom level or view changes."""
+        if self.zoom_level() != self.shown_zoom or not self._view_is_materialized():
+            self.refresh()
+        self._watch_id = self.map_widget.after(WATCH_INTERVAL_MS, self.start_watching)
+
+    def _view_is_materialized(self):
+        if self.shown_area is None:
+            return False
+        min_x, min_y, max_x, max_y = self.view_rect()
+        shown_min_x, shown_min_y, shown_max_x, shown_max_y = self.shown_area
+        return shown_min_x <= min_x and shown_min_y <= min_y and max_x <= shown_max_x and max_y <= shown_max_y
+
+    def add_pins(self, start_index):
+        """
+        Adds the pins of `pins_data` from `start_index` on and schedules a rebuild
+        of the markers (several batches added in a row cause a single rebuild).
+        """
+        self.clusters.extend(self.pins_data.lat[start_index:], self.pins_data.lon[start_index:])
+        self.pin_grid = None
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        if self._refresh_id is None:
+            self._refresh_id = self.map_widget.after(REFRESH_DELAY_MS, self.refresh)
+
+    def add_path(self, position_list, **kwargs):
+        """
+        Adds a route, drawn with `map_widget.set_path(position_list, **kwargs)`
+        while it intersects the view, simplified for the zoom level.
+
+        Args:
+            position_list: List of (lat, lon) tuples.
+            **kwargs: Path options (color, width, ...).
+
+        Returns:
+            The id of the path in this layer.
+        """
+        return self.add_paths([(position_list, kwargs)])[0]
+
+    def add_paths(self, paths):
+        """
+        Adds several routes at once (see `add_path`): their vertices are projected
+        and simplified together, their boxes indexed together and the paths in view
+        updated once, instead of once per route.
+
+        Args:
+            paths: Iterable of `(position_list, options)` pairs, `options` being a
+                   dict of path options (color, width, ...). Every route needs at
+                   least one vertex.
+
+        Returns:
+            The ids of the paths in this layer, in order.
+        """
+        paths = list(paths)
+        if not paths:
+            return range(len(self.paths), len(self.paths))
+        # Every vertex is projected, and every route simplified, in one pass over all of them
+        offsets = np.cumsum([0] + [len(position_list) for position_list, _ in paths])
+        lat, lon = np.array([position for position_list, _ in paths for position in position_list],
+                            dtype=np.float64).reshape(-1, 2).T
+        x, y = project_to_world(lat, lon)
+        importance = polylines_importance(x, y, offsets)
+        starts = offsets[:-1]
+        boxes = np.column_stack((np.minimum.reduceat(x, starts), np.minimum.reduceat(y, starts),
+                                 np.maximum.reduceat(x, starts), np.maximum.reduceat(y, starts)))
+        for (position_list, options), start, end in zip(paths, starts.tolist(), offsets[1:].tolist()):
+            self.paths.append((position_list, options))
+            self.path_importance.append(importance[start:end])
+            self.path_levels.append({})
+        path_ids = self.path_boxes.extend(boxes)
+        if self.shown_area is not None:
+            self._show_paths(self.path_boxes.query(*self.shown_area))
+        return path_ids
+
+    def clear(self):
+        """Deletes every marker and forgets all pins."""
+        if self._refresh_id is not None:
+            self.map_widget.after_cancel(self._refresh_id)
+            self._refresh_id = None
+        for marker in self.pin_markers.values():
+            marker.delete()
+        for marker in self.cluster_markers.values():
+            marker.delete()
+        self.pin_markers = {}
+        self.cluster_markers = {}
+        self.clusters.clear()
+        self.pin_grid = None
+
+    def clear_paths(self):
+        """Deletes every route path."""
+        for _, path in self.path_objects.values():
+            path.delete()
+        self.paths = []
+        self.path_importance = []
+        self.path_levels = []
+        self.path_boxes.clear()
+        self.path_objects = {}
+
+    def refresh(self):
+        """Shows the clusters, individual pins and paths of the current zoom level and view."""
+        self._refresh_id = None
+        if self.profiler is None:
+            self._refresh()
+            return
+        with self.profiler.span(STAGE_MARKERS, zoom=self.zoom_level()):
+            self._refresh()
+
+    def _refresh(self):
+        zoom = self.zoom_level()
+        area = self.view_rect(VIEWPORT_MARGIN)
+        self.shown_zoom = zoom
+        self.shown_area = area
+
+        in_view = self.pin_index().query(*area)
+        level = self.clusters.level(zoom)
+        if level is None: # Zoomed in past the last clustered level
+            self._show_pins(in_view)
+            self._show_clusters(None, [])
+        else:
+            self._show_pins(in_view[level.single_mask()[in_view]])
+            cells = level.cluster_cells()
+            x, y = project_to_world(level.lat[cells], level.lon[cells])
+            min_x, min_y, max_x, max_y = area
+            self._show_clusters(level, cells[(x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)])
+        self._show_paths(self.path_boxes.query(*area))
+
+    def _show_pins(self, indices):
+        wanted = set(indices.tolist())
+        for index in [i for i in self.pin_markers if i not in wanted]:
+            self.pin_markers.pop(index).delete()
+        for index in wanted.difference(self.pin_markers):
+            lat, lon = self.pins_data.coords_map(index)
+            self.pin_markers[index] = self.map_widget.set_marker(
+                lat,
+                lon,
+                text=self.pins_data.name(index),
+                marker_color_circle=self.pin_color(index),
+                command=lambda m, index=index: self.on_pin_click(index)
+            )
+
+    def _show_clusters(self, level, cells):
+        wanted = {} if level is None else {(level.zoom, int(level.keys[cell])): cell for cell in cells}
+        for key in [k for k in self.cluster_markers if k not in wanted]:
+            self.cluster_markers.pop(key).delete()
+        for key, cell in wanted.items():
+            if key not in self.cluster_markers:
+                self.cluster_markers[key] = self.map_widget.set_marker(
+                    float(level.lat[cell]),
+                    float(level.lon[cell]),
+                    text=str(level.counts[cell]),
+                    marker_color_circle=self.cluster_color,
+                    command=lambda m, level=level, cell=cell: self._on_cluster_click(level, cell)
+                )
+
+    def path_positions(self, path_id, zoom):
+        """Returns the map coordinates of a route simplified for `zoom` (the full list if nothing is dropped)."""
+        position_list = self.paths[path_id][0]
+        importance = self.path_importance[path_id]
+        keep = simplified_mask(importance, PATH_TOLERANCE_PIXELS / (TILE_SIZE * 2 ** zoom))
+        count = int(np.count_nonzero(keep))
+        if count == len(position_list):
+            return position_list
+        # Levels are nested, so the number of vertices identifies the simplification
+        levels = self.path_levels[path_id]
+        if count not in levels:
+            levels[count] = [position_list[index] for index in np.flatnonzero(keep).tolist()]
+        return levels[count]
+
+    def _show_paths(self, path_ids):
+        wanted = set(path_ids.tolist())
+        for path_id in [i for i in self.path_objects if i not in wanted]:
+            self.path_objects.pop(path_id)[1].delete()
+        for path_id in wanted:
+            positions = self.path_positions(path_id, self.shown_zoom)
+            shown = self.path_objects.get(path_id)
+            if shown is not None:
+                if shown[0] is positions: # Same simplification as already drawn
+                    continue
+                shown[1].delete()
+            self.path_objects[path_id] = (positions, self.map_widget.set_path(positions, **self.paths[path_id][1]))
+
+    def _on_cluster_click(self, level, cell):
+        """Zooms the map to the pins of a cluster, so that it splits up."""
+        members = level.members(cell)
+        lat = self.pins_data.lat[members]
+        lon = self.pins_data.lon[members]
+        min_lat, max_lat, min_lon, max_lon = lat.min(), lat.max(), lon.min(), lon.max()
+        if min_lat == max_lat or min_lon == max_lon:
+            # All pins on one point or line: a bounding box cannot be fitted, zoom in step by step
+            self.map_widget.set_position(float(level.lat[cell]), float(level.lon[cell]))
+            self.map_widget.set_zoom(level.zoom + 2)
+        else:
+            self.map_widget.fit_bounding_box((float(max_lat), float(min_lon)), (float(min_lat), float(max_lon)))
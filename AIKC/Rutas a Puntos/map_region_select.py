@@ -0,0 +1,95 @@
+import numpy as np
+
+RUBBER_BAND_COLOR = "#1f6feb" # Color of the rectangle / lasso outline while dragging
+MIN_STROKE_STEP_PIXELS = 3 # Minimum mouse movement between two recorded lasso points
+
+RECTANGLE = "rectangle"
+LASSO = "lasso"
+
+
+class RegionSelector:
+    """
+    Rectangle and free-hand (lasso) region selection on a `tkintermapview.TkinterMapView`.
+
+    Shift+drag draws a rectangle and Ctrl+drag a lasso on the map canvas; plain drags
+    still pan the map. When the mouse is released the region is converted to Web
+    Mercator world coordinates and reported through:
+        on_rectangle(start, end): (x, y) world coordinates of the drag start and end.
+        on_lasso(stroke_x, stroke_y): Arrays with the world coordinates of the stroke.
+    """
+    def __init__(self, map_widget, on_rectangle, on_lasso):
+        self.map_widget = map_widget
+        self.canvas = map_widget.canvas
+        self.on_rectangle = on_rectangle
+        self.on_lasso = on_lasso
+
+        self.mode = None # RECTANGLE or LASSO while a drag is in progress
+        self.points = [] # Canvas (x, y) points of the current drag
+        self.outline = None # Canvas item showing the region being drawn
+
+        # The modifier-specific bindings take precedence over the map's own
+        # <Button-1>/<B1-Motion>/<ButtonRelease-1> handlers, so the map doesn't pan.
+        for modifier, mode in (("Shift", RECTANGLE), ("Control", LASSO)):
+            self.canvas.bind(f"<{modifier}-Button-1>", lambda event, mode=mode: self._start(event, mode))
+            self.canvas.bind(f"<{modifier}-B1-Motion>", self._drag)
+            self.canvas.bind(f"<{modifier}-ButtonRelease-1>", self._finish)
+        # The modifier may be released before the mouse button
+        self.canvas.bind("<ButtonRelease-1>", self._finish, add="+")
+
+    def _start(self, event, mode):
+        self._cancel()
+        self.mode = mode
+        self.points = [(event.x, event.y)]
+        if mode == RECTANGLE:
+            self.outline = self.canvas.create_rectangle(event.x, event.y, event.x, event.y,
+                                                        outline=RUBBER_BAND_COLOR, width=2, dash=(4, 2))
+        else:
+            self.outline = self.canvas.create_line(event.x, event.y, event.x, event.y,
+                                                   fill=RUBBER_BAND_COLOR, width=2)
+        return "break"
+
+    def _drag(self, event):
+        if self.mode is None:
+            return "break"
+        if self.mode == RECTANGLE:
+            start_x, start_y = self.points[0]
+            self.points = [(start_x, start_y), (event.x, event.y)]
+            self.canvas.coords(self.outline, start_x, start_y, event.x, event.y)
+        else:
+            last_x, last_y = self.points[-1]
+            if abs(event.x - last_x) + abs(event.y - last_y) >= MIN_STROKE_STEP_PIXELS:
+                self.points.append((event.x, event.y))
+                self.canvas.coords(self.outline, *[value for point in self.points for value in point])
+        return "break"
+
+    def _finish(self, event):
+        if self.mode is None:
+            return None # Not a selection drag: let the map handle the release
+        mode, points = self.mode, self.points
+        if mode == RECTANGLE:
+            points = [points[0], (event.x, event.y)]
+        self._cancel()
+        x, y = self.canvas_to_world(np.array([p[0] for p in points]), np.array([p[1] for p in points]))
+        if mode == RECTANGLE:
+            self.on_rectangle((x[0], y[0]), (x[1], y[1]))
+        elif len(points) >= 3:
+            self.on_lasso(x, y)
+        return "break"
+
+    def _cancel(self):
+        if self.outline is not None:
+            self.canvas.delete(self.outline)
+        self.outline = None
+        self.mode = None
+        self.points = []
+
+    def canvas_to_world(self, canvas_x, canvas_y):
+        """
+        Converts canvas pixel coordinates to Web Mercator world coordinates, the way
+        `TkinterMapView.convert_canvas_coords_to_decimal_coords` does for degrees.
+        """
+        (left, top), (right, bottom) = self.map_widget.upper_left_tile_pos, self.map_widget.lower_right_tile_pos
+        scale = 2 ** round(self.map_widget.zoom)
+        x = (left + (right - left) * canvas_x / self.canvas.winfo_width()) / scale
+        y = (top + (bottom - top) * canvas_y / self.canvas.winfo_height()) / scale
+        return x, y
@@ -0,0 +1,165 @@
+import math
+import tkinter
+from tkinter import ttk
+
+ROW_HEIGHT = 24 # Height in pixels of one row of the pin list
+WHEEL_SCROLL_ROWS = 3 # Rows scrolled per mouse wheel step
+
+
+class _PinRow:
+    """A recycled row of the list: one checkbutton plus the pin index it currently shows."""
+    def __init__(self, checkbutton):
+        self.checkbutton = checkbutton
+        self.index = None
+
+
+class VirtualPinList(ttk.Frame):
+    """
+    Scrollable list of pin checkbuttons that only creates widgets for the visible rows.
+
+    The list holds `row_count` logical rows but owns just enough `ttk.Checkbutton`
+    widgets to fill its height. When the user scrolls, the same widgets are moved to
+    show other pins: their text and checked state are read again through the
+    callbacks, so building or scrolling a list of any size costs only the visible rows.
+
+    The list does not store any pin data itself. It asks the application through:
+        row_label(index) -> str: Text of a row (e.g. "2. Pin name").
+        row_selected(index) -> bool: Whether the row's checkbutton is checked.
+        on_row_toggled(index, selected): Called after a normal click toggled a row.
+        on_row_click(event, index): `<Button-1>` handler, called before the toggle;
+            returning "break" cancels the default toggle (used for Shift-click ranges).
+    """
+    def __init__(self, master, row_label, row_selected, on_row_toggled, on_row_click, row_height=ROW_HEIGHT, **kwargs):
+        super().__init__(master, **kwargs)
+        self.row_label = row_label
+        self.row_selected = row_selected
+        self.on_row_toggled = on_row_toggled
+        self.on_row_click = on_row_click
+        self.row_height = row_height
+
+        self.row_count = 0 # Number of logical rows (pins) in the list
+        self.first_row = 0 # Index of the pin shown in the topmost row
+        self.rows = [] # Pool of recycled row widgets
+
+        self.canvas = tkinter.Canvas(self, borderwidth=0, highlightthickness=0) # Container the rows are placed in
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        # Resize the row pool when the list changes size
+        self.canvas.bind("<Configure>", self._on_configure)
+        self._bind_mousewheel(self.canvas)
+
+    def _bind_mousewheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_mousewheel) # Windows and macOS
+        widget.bind("<Button-4>", self._on_mousewheel) # Linux, wheel up
+        widget.bind("<Button-5>", self._on_mousewheel) # Linux, wheel down
+
+    @property
+    def visible_rows(self):
+        """Number of rows that fit completely in the list."""
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def _on_configure(self, event):
+        """Creates the row widgets needed to fill the new height (rows are never destroyed)."""
+        needed = math.ceil(event.height / self.row_height) + 1
+        while len(self.rows) < needed:
+            row = _PinRow(ttk.Checkbutton(self.canvas))
+            row.checkbutton.configure(command=lambda row=row: self._on_row_command(row))
+            row.checkbutton.bind("<Button-1>", lambda event, row=row: self.on_row_click(event, row.index))
+            self._bind_mousewheel(row.checkbutton)
+            self.rows.append(row)
+        self._clamp_first_row()
+        self.render()
+
+    def _on_row_command(self, row):
+        if row.index is not None:
+            self.on_row_toggled(row.index, row.checkbutton.instate(["selected"]))
+
+    def _on_mousewheel(self, event):
+        if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+            self.scroll_rows(-WHEEL_SCROLL_ROWS)
+        else:
+            self.scroll_rows(WHEEL_SCROLL_ROWS)
+
+    def set_row_count(self, row_count):
+        """
+        Sets the number of pins in the list and redraws the visible rows.
+
+        Args:
+            row_count: The new number of rows. 0 empties the list.
+        """
+        self.row_count = row_count
+        self._clamp_first_row()
+        self.render()
+
+    def _clamp_first_row(self):
+        max_first_row = max(0, self.row_count - self.visible_rows)
+        self.first_row = min(max(0, self.first_row), max_first_row)
+
+    def scroll_rows(self, delta):
+        """Scrolls the list by `delta` rows (negative scrolls up)."""
+        self.first_row += delta
+        self._clamp_first_row()
+        self.render()
+
+    def scroll_to(self, index):
+        """Scrolls just enough for row `index` to be visible."""
+        if index < self.first_row:
+            self.first_row = index
+        elif index >= self.first_row + self.visible_rows:
+            self.first_row = index - self.visible_rows + 1
+        self._clamp_first_row()
+        self.render()
+
+    def yview(self, *args):
+        """
+        Scrollbar command. Accepts the standard Tk arguments:
+        ("moveto", fraction) and ("scroll", count, "units" | "pages").
+        """
+        if not args:
+            return
+        if args[0] == "moveto":
+            self.first_row = round(float(args[1]) * self.row_count)
+        elif args[0] == "scroll":
+            step = self.visible_rows if args[2] == "pages" else 1
+            self.first_row += int(args[1]) * step
+        self._clamp_first_row()
+        self.render()
+
+    def render(self, indices=None):
+        """
+        Updates the text and checked state of the visible rows.
+
+        Args:
+            indices: Optional iterable of pin indices that changed. Rows that show
+                     none of them are left untouched; by default every visible row
+                     is refreshed.
+        """
+        # Indices are only worth checking one by one when there are fewer than rows
+        changed = None if indices is None or len(indices) > len(self.rows) else set(indices)
+        for position, row in enumerate(self.rows):
+            index = self.first_row + position
+            if index >= self.row_count:
+                if row.index is not None:
+                    row.checkbutton.place_forget()
+                    row.index = None
+                continue
+            if changed is not None and row.index == index and index not in changed:
+                continue
+            if row.index is None:
+                row.checkbutton.place(x=0, y=position * self.row_height, relwidth=1, height=self.row_height)
+            row.index = index
+            row.checkbutton.configure(text=self.row_label(index))
+            row.checkbutton.state(["!alternate", "selected" if self.row_selected(index) else "!selected"])
+
+        if self.row_count:
+            top = self.first_row / self.row_count
+            bottom = min(1.0, (self.first_row + self.visible_rows) / self.row_count)
+            self.scrollbar.set(top, bottom)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def set_background(self, color):
+        """Sets the background color shown behind the rows (used by theming)."""
+        self.canvas.configure(bg=color)
@@ -0,0 +1,70 @@
+from tkinter import ttk
+
+ROUTES_PANEL_ROWS = 5 # Rows of the routes table visible without scrolling
+
+# (column id, heading, width in pixels, anchor) of the routes table
+ROUTE_COLUMNS = [
+    ("name", "Ruta", 110, "w"),
+    ("stops", "Puntos", 50, "e"),
+    ("length", "Km", 60, "e"),
+    ("max_gap", "Tramo máx. km", 80, "e"),
+    ("climb", "Desnivel + m", 75, "e"),
+]
+
+
+class RoutesPanel(ttk.Frame):
+    """
+    Table of the created routes with their metrics (`kmz_core.route_metrics.RouteMetrics`):
+    number of points, length, longest leg and altitude gain, plus a summary line
+    with the number of routes and their total length.
+
+    Selecting a row calls `on_route_select(number)` with the route's position in
+    the list passed to `show`.
+    """
+    def __init__(self, master, on_route_select, height=ROUTES_PANEL_ROWS, **kwargs):
+        super().__init__(master, **kwargs)
+        self.on_route_select = on_route_select
+
+        table_frame = ttk.Frame(self)
+        table_frame.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=[column[0] for column in ROUTE_COLUMNS], show="headings",
+                                 height=height, selectmode="browse")
+        for column, heading, width, anchor in ROUTE_COLUMNS:
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, anchor=anchor, stretch=column == "name")
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+
+        self.summary_label = ttk.Label(self, text="Sin rutas")
+        self.summary_label.pack(anchor="w", pady=(2,0))
+
+    def show(self, routes, metrics):
+        """
+        Replaces the rows of the table.
+
+        Args:
+            routes: The route dictionaries (with a "name" key).
+            metrics: The `RouteMetrics` of each route, in the same order.
+        """
+        self.tree.delete(*self.tree.get_children())
+        for number, (route, route_metrics) in enumerate(zip(routes, metrics)):
+            self.tree.insert("", "end", iid=str(number), values=(
+                route["name"],
+                route_metrics.vertex_count,
+                f"{route_metrics.length_m / 1000:.2f}",
+                f"{route_metrics.max_gap_m / 1000:.2f}",
+                f"{route_metrics.altitude_gain_m:.0f}",
+            ))
+        if routes:
+            total_km = sum(route_metrics.length_m for route_metrics in metrics) / 1000
+            self.summary_label.configure(text=f"{len(routes)} rutas, {total_km:.1f} km en total")
+        else:
+            self.summary_label.configure(text="Sin rutas")
+
+    def _on_select(self, event):
+        selection = self.tree.selection()
+        if selection:
+            self.on_route_select(int(selection[0]))
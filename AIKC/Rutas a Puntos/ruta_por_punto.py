@@ -1,8 +1,7 @@
 import tkinter
 from tkinter import ttk, filedialog, messagebox
-import zipfile
-from io import BytesIO
 import os
+import time
 
 try:
     from lxml import etree # Para parsear XML (KML)
@@ -11,17 +10,46 @@ except ImportError:
     exit()
 
 try:
-    import simplekml # Para generar el KML de salida
+    import tkintermapview
 except ImportError:
-    messagebox.showerror("Error de Importación", "La biblioteca simplekml no está instalada. Por favor, instálala con 'pip install simplekml'")
+    messagebox.showerror("Error de Importación", "La biblioteca tkintermapview no está instalada. Por favor, instálala con 'pip install tkintermapview'")
     exit()
 
 try:
-    import tkintermapview
+    import numpy # Para el almacenamiento columnar de pines
 except ImportError:
-    messagebox.showerror("Error de Importación", "La biblioteca tkintermapview no está instalada. Por favor, instálala con 'pip install tkintermapview'")
+    messagebox.showerror("Error de Importación", "La biblioteca numpy no está instalada. Por favor, instálala con 'pip install numpy'")
     exit()
 
+# GUI-free parsing and data helpers shared with the rest of the application.
+from kmz_core.kml_stream import DEFAULT_LINE_NAME, DEFAULT_PIN_NAME, parse_point_coordinates, placemark_lines
+from kmz_core.background_load import (
+    KMZLoadWorker, drain_messages,
+    LOAD_BATCH, LOAD_CACHED, LOAD_CANCELLED, LOAD_LINES, LOAD_NO_KML, LOAD_ERROR,
+)
+from kmz_core.batch_load import KMZBatchLoadWorker, LOAD_FILE
+from kmz_core.background_task import TaskWorker, TASK_ERROR
+from kmz_core.kmz_members import member_sources
+from kmz_core.pin_store import PinStore
+from kmz_core.parse_cache import ParseCache
+from kmz_core.instrumentation import (
+    get_profiler, STAGE_PIN_LIST, STAGE_ORDERING, STAGE_ROUTE_BUILD, STAGE_KML_SAVE, STAGE_KML_LOAD,
+)
+from kmz_core.kml_reader import load_routes
+from kmz_core.kml_writer import save_routes
+from kmz_core.export import EXPORT_FORMATS, MIN_ROUTE_VERTICES, export_pins, export_routes
+from pin_list_view import VirtualPinList
+from map_layer import MapLayer
+from map_region_select import RegionSelector
+from kmz_core.region_select import pins_in_rectangle, pins_in_lasso
+from kmz_core.route_optimize import path_length
+from kmz_core.route_split import split_into_routes, SPLIT_KMEANS, SPLIT_SWEEP
+from kmz_core.routes import SPLIT_ROUTE_COLORS, SourceRoutes, kml_routes, order_routes, road_route, source_groups
+from kmz_core.route_metrics import RouteMetricsCache
+from kmz_core.road_graph import load_road_graph
+from kmz_core.road_routing import RoadRouter
+from routes_panel import RoutesPanel
+
 # Namespaces comunes en KML used for parsing KML files.
 KML_NS = "{http://www.opengis.net/kml/2.2}"  # KML namespace
 GX_NS = "{http://www.google.com/kml/ext/2.2}"  # Google Extensions namespace
@@ -51,12 +79,14 @@ DEFAULT_ROUTE_COLOR_INTERNAL = COLOR_RED # Default internal color for route line
 DEFAULT_MARKER_COLOR = COLOR_RED # Default color for map markers.
 SELECTED_MARKER_COLOR = COLOR_GREEN # Color for selected map markers.
 
-# KML color codes (ABGR format).
-KML_COLOR_RED = "ff0000ff"
-KML_COLOR_GREEN = "ff00ff00"
-KML_COLOR_BLUE = "ffff0000"
-KML_COLOR_CYAN = "ffffff00"
-DEFAULT_KML_COLOR = KML_COLOR_RED # Default color for KML linestrings.
+# Partitioning methods offered for splitting pins into routes (UI name -> method).
+SPLIT_METHODS = {"K-means": SPLIT_KMEANS, "Barrido": SPLIT_SWEEP}
+
+# Background loading settings.
+LOAD_POLL_INTERVAL_MS = 50 # How often the mainloop checks the loader queue for new pins.
+LOAD_MESSAGES_PER_POLL = 2 # Maximum pin batches turned into widgets per poll, keeps the UI responsive.
+STATUS_POLL_INTERVAL_MS = 500 # How often the status bar checks for new stage timings.
+TASK_POLL_INTERVAL_MS = 100 # How often the mainloop checks whether a background task (split, export) finished.
 
 # Theme Color Dictionaries
 DARK_THEME_COLORS = {
@@ -116,23 +146,39 @@ class KMZRouteApp(tkinter.Tk):
         method to create and arrange all user interface elements.
         """
         super().__init__()
-        self.title("Visor KMZ con LXML y SimpleKML")
+        self.title("Visor KMZ con LXML")
         self.geometry("1200x800")
 
-        self.pins_data = []  # Stores data for each placemark (name, coordinates, selection state, etc.)
+        self.pins_data = PinStore()  # Column store of every placemark (name, coordinates, source, selection state and order)
         self.routes_data = []  # Stores data for each created route (name, coordinates, color)
-        self.map_markers = []  # References to marker objects on the tkintermapview widget
-        self.map_paths = []  # References to path objects (routes) on the tkintermapview widget
+        self.route_metrics = RouteMetricsCache()  # Length, legs, bounds and altitude change of each route, computed once per route
+        self.road_router = None  # RoadRouter over the loaded road network, if any, for road-following routes
+        self.dirty_marker_indices = set()  # Pins with a marker whose selection changed since the last `update_ordering` (it needs recoloring)
         self.last_selected_index = None  # Index of the last clicked pin in the list, for shift-selection
-        self.order_counter = 1  # Counter to assign order to selected pins
         self.update_ordering_id = None  # ID for tkinter's `after` mechanism, to schedule UI updates
         self.extraction_error_count = 0 # Counter for errors encountered during placemark coordinate extraction
+        self.load_worker = None # KMZLoadWorker thread currently parsing a file, if any
+        self.load_poll_id = None # ID for tkinter's `after` mechanism, to poll the loader queue
+        self.load_start_count = 0 # Number of pins that were already loaded when the current load started
+        self.load_start_routes = 0 # Number of routes that already existed when the current load started
+        self.load_failures = [] # (file name, error message) for files a batch load could not read
+        self.load_files_total = 0 # Number of files in the current batch load
+        self.load_files_done = 0 # Number of files of the current batch load already merged
+        self.load_start_ns = 0 # perf_counter_ns() when the current load started
+        self.load_pin_list_ns = 0 # Time the current load spent adding pins to the store, list and map index
+        self.task_worker = None # TaskWorker running a route split or an export, if any
+        self.task_poll_id = None # ID for tkinter's `after` mechanism, to poll the task queue
+        self.task_handler = None # (on_done callback, error title, error text) of the running task
+        self.parse_cache = ParseCache() # Pins of the KMZ files already parsed, reloaded without parsing them again
+        self.profiler = get_profiler() # Timings of the main stages, shown in the status bar and traced with KMZ_TRACE (see kmz_core.instrumentation)
+        self.status_version = None # `self.profiler.version` shown in the status bar
         
         self.theme = "light"  # Initialize theme to light mode
         self.style = ttk.Style() # Initialize ttk.Style for theming ttk widgets
 
         self._setup_ui() # Initialize all UI components
         self._apply_theme() # Apply the initial theme
+        self._refresh_status_bar() # Start showing stage timings
         
         # Set initial map position (Asunción, Paraguay) and zoom level.
         self.map_widget.set_position(-25.2637, -57.5759) 
@@ -184,6 +230,11 @@ class KMZRouteApp(tkinter.Tk):
         self.tk.call("option", "add", "*TCombobox*Listbox.selectBackground", colors["button_select"])
         self.tk.call("option", "add", "*TCombobox*Listbox.selectForeground", colors["list_fg"])
 
+        # Routes table
+        self.style.configure("Treeview", background=colors["list_bg"], fieldbackground=colors["list_bg"], foreground=colors["list_fg"])
+        self.style.configure("Treeview.Heading", background=colors["button_bg"], foreground=colors["button_fg"])
+        self.style.map("Treeview", background=[("selected", colors["checkbutton_select"])])
+
         self.style.configure("TScrollbar", background=colors["button_bg"], troughcolor=colors["bg"], arrowcolor=colors["fg"])
         self.style.map("TScrollbar",
                        background=[('active', colors["button_select"])])
@@ -220,18 +271,10 @@ class KMZRouteApp(tkinter.Tk):
         # --- Apply to specific non-ttk and container widgets ---
         # These are direct configurations as they are not ttk widgets or need specific handling.
         
-        # Pins Canvas (standard tkinter.Canvas)
-        self.pins_canvas.configure(bg=colors["list_bg"])
-        
-        # self.pins_list_frame is a ttk.Frame, ensure it re-styles if it was already created.
-        # This is generally handled by the TFrame style, but explicit re-application can be added if needed.
-        # self.pins_list_frame.configure(style="TFrame") # Already done in _setup_ui effectively by being a ttk.Frame
+        # Pin list background (standard tkinter.Canvas inside the virtualized list)
+        self.pin_list.set_background(colors["list_bg"])
         
-        # Update dynamically created checkbuttons for pins (they should pick up TCheckbutton style)
-        # If they don't, we might need to iterate and reconfigure, but ttk.Style is preferred.
-        # for pin_data in self.pins_data:
-        #     if "checkbox_widget" in pin_data and pin_data["checkbox_widget"].winfo_exists():
-        #         pin_data["checkbox_widget"].configure(style="TCheckbutton") # Re-apply if needed
+        # The recycled checkbuttons of the pin list are ttk widgets and pick up the TCheckbutton style.
 
         # Map Widget Frame (self.map_frame is a ttk.Frame, styled by "TFrame")
         # The TkinterMapView widget itself is external and may not fully respect these themes.
@@ -249,6 +292,10 @@ class KMZRouteApp(tkinter.Tk):
         displaying pins, input fields for route naming, and the map widget itself.
         It uses `ttk` themed widgets for a modern look and feel.
         """
+        # Status bar with the duration of the last run of each stage (loading, drawing, routes, saving)
+        self.status_label = ttk.Label(self, text="", anchor="w", padding=(10, 0, 10, 5))
+        self.status_label.pack(side="bottom", fill="x")
+
         # Main application frame
         main_frame = ttk.Frame(self, padding="10")
         main_frame.pack(expand=True, fill="both")
@@ -263,29 +310,37 @@ class KMZRouteApp(tkinter.Tk):
         paned_window.add(left_panel, weight=1) # Add to paned window, allow resizing
 
         # Button to load KMZ file
-        load_button = ttk.Button(left_panel, text="Cargar Archivo KMZ", command=self.load_kmz_file)
-        load_button.pack(pady=10, padx=5, fill="x")
+        self.load_button = ttk.Button(left_panel, text="Cargar Archivo KMZ", command=self.load_kmz_file)
+        self.load_button.pack(pady=10, padx=5, fill="x")
+
+        # Button to load many KMZ files at once, parsed in parallel and added to the current pins
+        load_many_button = ttk.Button(left_panel, text="Cargar Varios KMZ", command=self.load_many_kmz_files)
+        load_many_button.pack(pady=(0,10), padx=5, fill="x")
+
+        # Progress bar and cancel button, only shown while a KMZ file loads in the background
+        self.load_progress_frame = ttk.Frame(left_panel)
+        self.load_progress_label = ttk.Label(self.load_progress_frame, text="")
+        self.load_progress_label.pack(anchor="w")
+        self.load_progress_bar = ttk.Progressbar(self.load_progress_frame, mode="determinate", maximum=100)
+        self.load_progress_bar.pack(side="left", expand=True, fill="x")
+        cancel_load_button = ttk.Button(self.load_progress_frame, text="Cancelar", command=self.cancel_kmz_load)
+        cancel_load_button.pack(side="left", padx=(5,0))
 
         ttk.Separator(left_panel, orient="horizontal").pack(fill="x", pady=5)
 
-        # Frame and scrollable canvas for displaying list of available pins
+        # Frame and virtualized scrollable list of available pins. Only the visible rows
+        # have widgets; they are recycled while scrolling, so the list size doesn't matter.
         pins_list_frame_container = ttk.LabelFrame(left_panel, text="Pines Disponibles", padding="5")
         pins_list_frame_container.pack(expand=True, fill="both", pady=5, padx=5)
 
-        self.pins_canvas = tkinter.Canvas(pins_list_frame_container, borderwidth=0)
-        self.pins_list_frame = ttk.Frame(self.pins_canvas) # Frame inside canvas to hold pin checkbuttons
-        scrollbar = ttk.Scrollbar(pins_list_frame_container, orient="vertical", command=self.pins_canvas.yview)
-        self.pins_canvas.configure(yscrollcommand=scrollbar.set)
-
-        scrollbar.pack(side="right", fill="y")
-        self.pins_canvas.pack(side="left", fill="both", expand=True)
-        # Add the pins_list_frame to the canvas
-        self.pins_canvas_window = self.pins_canvas.create_window((0, 0), window=self.pins_list_frame, anchor="nw")
-
-        # Configure scrollregion when pins_list_frame size changes
-        self.pins_list_frame.bind("<Configure>", lambda e: self.pins_canvas.configure(scrollregion=self.pins_canvas.bbox("all")))
-        # Adjust width of internal frame when canvas width changes
-        self.pins_canvas.bind('<Configure>', self._on_canvas_configure)
+        self.pin_list = VirtualPinList(
+            pins_list_frame_container,
+            row_label=self._pin_label,
+            row_selected=lambda index: self.pins_data.is_selected(index),
+            on_row_toggled=self._on_checkbutton_toggled,
+            on_row_click=self.on_checkbutton_click,
+        )
+        self.pin_list.pack(expand=True, fill="both")
 
         # Frame for route creation controls
         route_controls_frame = ttk.LabelFrame(left_panel, text="Crear Ruta", padding="5")
@@ -308,6 +363,17 @@ class KMZRouteApp(tkinter.Tk):
         # Bind color change event to automatically create route if pins are selected
         self.route_color_combo.bind("<<ComboboxSelected>>", self.on_color_change)
         
+        # Optional road network (local GeoJSON or .osm.pbf file) so routes follow the roads
+        road_frame = ttk.Frame(route_controls_frame)
+        road_frame.pack(fill="x", padx=5, pady=(0,5))
+        self.road_snap_var = tkinter.BooleanVar(value=False)
+        road_snap_check = ttk.Checkbutton(road_frame, text="Seguir carreteras", variable=self.road_snap_var)
+        road_snap_check.pack(side="left")
+        load_road_button = ttk.Button(road_frame, text="Cargar Red Vial...", command=self.load_road_network)
+        load_road_button.pack(side="right")
+        self.road_network_label = ttk.Label(route_controls_frame, text="Sin red vial cargada")
+        self.road_network_label.pack(anchor="w", padx=5, pady=(0,5))
+
         # Button to create route from currently selected pins
         create_route_button = ttk.Button(route_controls_frame, text="Crear Ruta con Pines Seleccionados", command=self.create_route_from_selection)
         create_route_button.pack(pady=5, fill="x", padx=5)
@@ -315,6 +381,10 @@ class KMZRouteApp(tkinter.Tk):
         # Button to automatically create routes based on KMZ source
         auto_routes_button = ttk.Button(route_controls_frame, text="Crear Rutas Automáticas", command=self.create_routes_from_all)
         auto_routes_button.pack(pady=5, fill="x", padx=5)
+        # Reorder the stops of automatic routes to shorten them (nearest neighbour + 2-opt/Or-opt)
+        self.optimize_routes_var = tkinter.BooleanVar(value=False)
+        optimize_routes_check = ttk.Checkbutton(route_controls_frame, text="Optimizar orden de paradas", variable=self.optimize_routes_var)
+        optimize_routes_check.pack(anchor="w", padx=5, pady=(0,5))
 
         # Frame for multiple selection buttons ("Select All", "Deselect All")
         select_buttons_frame = ttk.Frame(route_controls_frame)
@@ -324,10 +394,65 @@ class KMZRouteApp(tkinter.Tk):
         select_all_button.pack(side="left", expand=True, fill="x", padx=(0,2))
         deselect_all_button = ttk.Button(select_buttons_frame, text="Deseleccionar Todos", command=self.deselect_all_pins)
         deselect_all_button.pack(side="left", expand=True, fill="x", padx=(2,0))
+        invert_selection_button = ttk.Button(route_controls_frame, text="Invertir Selección", command=self.invert_selection)
+        invert_selection_button.pack(fill="x", padx=5, pady=(0,5))
+
+        # Select every pin of one source KMZ file
+        source_select_frame = ttk.Frame(route_controls_frame)
+        source_select_frame.pack(fill="x", pady=(0,5), padx=5)
+        self.source_combo = ttk.Combobox(source_select_frame, values=[], state="readonly") # Filled as files are loaded
+        self.source_combo.pack(side="left", expand=True, fill="x", padx=(0,2))
+        select_source_button = ttk.Button(source_select_frame, text="Seleccionar Fuente", command=self.select_source_pins)
+        select_source_button.pack(side="left", padx=(2,0))
+
+        # Hint for the region selection gestures on the map
+        region_hint = ttk.Label(route_controls_frame, text="En el mapa: Mayús+arrastrar selecciona un rectángulo, Ctrl+arrastrar una zona a mano alzada.", wraplength=300)
+        region_hint.pack(anchor="w", padx=5, pady=(0,5))
+
+        # Frame for splitting all pins into several balanced routes
+        split_frame = ttk.LabelFrame(left_panel, text="Dividir en Rutas", padding="5")
+        split_frame.pack(fill="x", pady=(0,10), padx=5)
+        split_options_frame = ttk.Frame(split_frame)
+        split_options_frame.pack(fill="x", padx=5)
+        ttk.Label(split_options_frame, text="Número de rutas:").grid(row=0, column=0, sticky="w")
+        self.split_count_spinbox = ttk.Spinbox(split_options_frame, from_=1, to=1000, width=6)
+        self.split_count_spinbox.set(2)
+        self.split_count_spinbox.grid(row=0, column=1, sticky="w")
+        ttk.Label(split_options_frame, text="Método:").grid(row=0, column=2, sticky="w", padx=(5,0))
+        self.split_method_combo = ttk.Combobox(split_options_frame, values=list(SPLIT_METHODS), state="readonly", width=8)
+        self.split_method_combo.current(0)
+        self.split_method_combo.grid(row=0, column=3, sticky="w")
+        # Optional limits per route; empty means no limit
+        ttk.Label(split_options_frame, text="Máx. paradas:").grid(row=1, column=0, sticky="w")
+        self.split_max_stops_entry = ttk.Entry(split_options_frame, width=7)
+        self.split_max_stops_entry.grid(row=1, column=1, sticky="w")
+        ttk.Label(split_options_frame, text="Máx. km:").grid(row=1, column=2, sticky="w", padx=(5,0))
+        self.split_max_km_entry = ttk.Entry(split_options_frame, width=7)
+        self.split_max_km_entry.grid(row=1, column=3, sticky="w")
+        split_button = ttk.Button(split_frame, text="Dividir Todos los Pines en Rutas", command=self.split_pins_into_routes)
+        split_button.pack(pady=5, fill="x", padx=5)
+
+        # Table of the created routes with their length and other metrics; selecting one zooms to it
+        routes_frame = ttk.LabelFrame(left_panel, text="Rutas Creadas", padding="5")
+        routes_frame.pack(fill="x", pady=(0,10), padx=5)
+        self.routes_panel = RoutesPanel(routes_frame, on_route_select=self._zoom_to_route)
+        self.routes_panel.pack(fill="x")
 
         # Button to save generated routes to a KML file
-        save_routes_button = ttk.Button(left_panel, text="Guardar Rutas Generadas (KML con SimpleKML)", command=self.save_routes_to_kml)
+        save_routes_button = ttk.Button(left_panel, text="Guardar Rutas Generadas (KML/KMZ)", command=self.save_routes_to_kml)
         save_routes_button.pack(pady=10, padx=5, fill="x")
+
+        # Button to load routes saved before back into the map
+        load_routes_button = ttk.Button(left_panel, text="Cargar Rutas Guardadas (KML/KMZ)", command=self.load_routes_from_kml)
+        load_routes_button.pack(pady=(0,10), padx=5, fill="x")
+
+        # Export of pins and routes to GeoJSON, GPX, CSV or FlatGeobuf
+        export_frame = ttk.Frame(left_panel)
+        export_frame.pack(fill="x", padx=5, pady=(0,5))
+        export_pins_button = ttk.Button(export_frame, text="Exportar Pines...", command=self.export_pins_to_file)
+        export_pins_button.pack(side="left", expand=True, fill="x", padx=(0,2))
+        export_routes_button = ttk.Button(export_frame, text="Exportar Rutas...", command=self.export_routes_to_file)
+        export_routes_button.pack(side="left", expand=True, fill="x", padx=(2,0))
         
         # Button to clear all data (pins, routes) from the map and application
         clear_map_button = ttk.Button(left_panel, text="Limpiar Mapa (Pines y Rutas)", command=self.clear_map_and_data)
@@ -346,60 +471,47 @@ class KMZRouteApp(tkinter.Tk):
         self.map_widget = tkintermapview.TkinterMapView(self.map_frame, corner_radius=0)
         self.map_widget.pack(expand=True, fill="both")
 
-    def _on_canvas_configure(self, event):
-        paned_window.add(map_frame, weight=3) # Add to paned window, allow resizing
-
-        # TkinterMapView widget
-        self.map_widget = tkintermapview.TkinterMapView(map_frame, corner_radius=0)
-        self.map_widget.pack(expand=True, fill="both")
-
-    def _on_canvas_configure(self, event):
-        """
-        Handles the configure event for the pins canvas.
-
-        Adjusts the width of the frame inside the canvas to match the canvas width,
-        ensuring the scrollbar behaves correctly and items in the list don't get
-        cut off horizontally.
+        # Pin markers (clustered by zoom level) and route paths, materialized only around the
+        # current view; updated automatically when the map is zoomed or panned
+        self.map_layer = MapLayer(self.map_widget, self.pins_data, self._on_marker_click, self._marker_color,
+                                  profiler=self.profiler)
+        self.map_layer.start_watching()
 
-        Args:
-            event: The event object containing details about the configure event,
-                   including the new width of the canvas.
-        """
-        canvas_width = event.width
-        self.pins_canvas.itemconfig(self.pins_canvas_window, width=canvas_width)
+        # Shift+drag selects the pins in a rectangle, Ctrl+drag the pins in a free-hand region
+        self.region_selector = RegionSelector(self.map_widget, self._select_pins_in_rectangle, self._select_pins_in_lasso)
 
     def _clear_pin_list_ui(self):
         """
-        Clears all checkbutton widgets from the pin list UI frame.
+        Empties the pin list UI.
         This is typically called before loading a new KMZ or clearing all data.
         """
-        for widget in self.pins_list_frame.winfo_children():
-            widget.destroy()
+        self.pin_list.set_row_count(0)
+        self.dirty_marker_indices.clear()
+        self.source_combo.configure(values=[])
+        self.source_combo.set("")
 
     def _clear_map_markers(self):
         """
-        Removes all markers from the `tkintermapview` widget and clears the
-        internal list `self.map_markers` that stores references to them.
+        Removes all pin and cluster markers from the `tkintermapview` widget
+        (see `self.map_layer`).
         """
-        for marker in self.map_markers:
-            marker.delete()
-        self.map_markers = []
+        self.map_layer.clear()
 
     def _clear_map_paths(self):
         """
-        Removes all paths (routes) from the `tkintermapview` widget and clears
-        the internal list `self.map_paths` that stores references to them.
+        Removes all paths (routes) from the `tkintermapview` widget and from
+        `self.map_layer`, which keeps them to draw the ones in view.
         """
-        for path in self.map_paths:
-            path.delete()
-        self.map_paths = []
+        self.map_layer.clear_paths()
 
     def clear_map_and_data(self):
         """
         Clears all loaded data, UI elements related to pins and routes, and map features.
 
         Resets the application to a near-initial state by:
-        - Clearing the list of pin checkbuttons in the UI.
+        - Stopping any KMZ file that is still loading in the background, and
+          discarding the result of a route split or export still running.
+        - Emptying the list of pins in the UI.
         - Removing all markers from the map.
         - Removing all paths (routes) from the map.
         - Clearing internal data storage for pins (`self.pins_data`) and routes (`self.routes_data`).
@@ -407,11 +519,14 @@ class KMZRouteApp(tkinter.Tk):
         - Resetting the map zoom to its default overview level.
         Finally, it shows an informational message to the user.
         """
+        self._abort_background_load()
+        self._abort_background_task()
         self._clear_pin_list_ui()
         self._clear_map_markers()
         self._clear_map_paths()
-        self.pins_data = []
+        self.pins_data.clear()
         self.routes_data = []
+        self.refresh_routes_panel()
         self.route_name_entry.delete(0, tkinter.END) # Clear route name input
         self.map_widget.set_zoom(5) # Reset map zoom
         messagebox.showinfo("Limpieza Completa", "Se han eliminado todos los pines y rutas del mapa y la aplicación.")
@@ -422,21 +537,30 @@ class KMZRouteApp(tkinter.Tk):
 
         Steps:
         1.  Opens a file dialog for the user to select a `.kmz` file.
-        2.  If a file is selected, it first calls `clear_map_and_data` to reset the current state.
+        2.  If a file is selected, it first calls `clear_map_and_data` to reset the current state
+            (this also stops a load that is still running).
         3.  Stores the base name of the selected file in `self.current_source`.
-        4.  Opens the KMZ (which is a zip archive) and looks for the first `.kml` file within it.
-        5.  Reads the content of the KML file.
-        6.  Parses the KML content using `lxml.etree`. An `XMLParser` is configured to
-            disable entity resolution for security, keep CDATA content, and remove XML comments.
-        7.  Resets `self.pins_data` and `self.extraction_error_count`.
-        8.  Calls `self._extract_placemarks_from_lxml_tree` to recursively find and process
-            Placemark elements from the parsed KML.
-        9.  Displays messages to the user indicating how many pins were loaded and if any
-            were skipped due to coordinate format errors.
-        10. If pins were loaded, it calls `self._populate_pin_list_ui` to update the UI
-            and `self._zoom_to_pins` to adjust the map view.
-        11. Handles potential exceptions during the process (e.g., invalid KMZ/KML,
-            file I/O errors) and shows an error message.
+        4.  Resets `self.pins_data` and `self.extraction_error_count`.
+        5.  Starts a `KMZLoadWorker` thread. If the file was parsed before, its pins come
+            from `self.parse_cache` in one message (`_add_cached_file`). Otherwise the worker
+            opens the KMZ (which is a zip archive), finds the first `.kml` file within it,
+            reads it in chunks through a memory map of the archive (`zip_member`) and
+            streams it with `PlacemarkStream` (the chunks are fed to an
+            `lxml.etree.XMLPullParser`, which reports Placemark end events; each processed
+            element is cleared, so memory stays flat regardless of file size) and stores
+            the pins in the cache. The parser disables entity
+            resolution for security, keeps CDATA content, and removes XML comments.
+            The other `.kml` members, and the members the documents link to with
+            NetworkLinks, are parsed next (the large ones in parallel processes) and
+            their pins added one member at a time (`_add_parsed_file`), with the member
+            in their source so `create_routes_from_all` makes one route per member.
+            The LineStrings, Polygon outlines and gx:Tracks of the file are imported as
+            routes (`_add_imported_lines`).
+        6.  Shows a progress bar with a Cancel button and polls the worker's queue from
+            the mainloop (`_poll_load_queue`), so the window stays responsive and pins
+            appear in the list and on the map batch by batch.
+        7.  When the worker finishes, `_finish_background_load` reports how many pins were
+            loaded and skipped, or shows an error message (invalid KMZ/KML, file I/O errors).
         """
         filepath = filedialog.askopenfilename(
             title="Seleccionar Archivo KMZ",
@@ -449,68 +573,273 @@ class KMZRouteApp(tkinter.Tk):
         # Store the name of the loaded KMZ file to identify the source of pins
         self.current_source = os.path.basename(filepath)
 
-        try:
-            # Open the KMZ (zip) file
-            with zipfile.ZipFile(filepath, 'r') as kmz:
-                kml_filename = None
-                # Find the KML file within the KMZ archive (usually doc.kml or a single .kml file)
-                for name in kmz.namelist():
-                    if name.lower().endswith('.kml'):
-                        kml_filename = name
-                        break
-                
-                if not kml_filename:
-                    messagebox.showerror("Error en KMZ", "No se encontró un archivo KML dentro del KMZ.")
-                    return
+        self.pins_data.clear() # Reset internal store of pins
+        self.extraction_error_count = 0 # Reset error counter for this file load
+        self.load_files_total = 0 # Not a batch load
+        self._start_background_load(KMZLoadWorker(filepath, cache=self.parse_cache, profiler=self.profiler))
 
-                # Read the KML file content from the KMZ archive
-                kml_bytes = kmz.read(kml_filename)
-            
-            # Parse the KML content using lxml
-            # Options: resolve_entities=False for security, strip_cdata=False to keep CDATA content, remove_comments=True to ignore KML comments
-            parser = etree.XMLParser(resolve_entities=False, strip_cdata=False, remove_comments=True)
-            xml_root = etree.fromstring(kml_bytes, parser=parser) # Get the root element of the KML
-            
-            self.pins_data = [] # Reset internal list of pins
-            self.extraction_error_count = 0 # Reset error counter for this file load
-            # Recursively extract placemarks from the parsed KML tree
-            self._extract_placemarks_from_lxml_tree(xml_root)
-
-            num_loaded = len(self.pins_data)
-            num_skipped = self.extraction_error_count
-            source_name = self.current_source
-
-            # Display feedback to the user about the loading process
-            if num_loaded > 0:
-                success_msg = f"Se cargaron {num_loaded} pines desde {source_name}."
-                if num_skipped > 0:
-                    skipped_msg = f" Se omitieron {num_skipped} pines debido a errores en el formato de coordenadas."
-                    messagebox.showinfo("KMZ Cargado Parcialmente", success_msg + skipped_msg)
-                else:
-                    messagebox.showinfo("KMZ Cargado", success_msg)
-                self._populate_pin_list_ui() # Update the UI list of pins
-                self._zoom_to_pins() # Adjust map view to show loaded pins
-            else: # No pins were successfully loaded
-                if num_skipped > 0:
-                    messagebox.showwarning("Error de Carga de Pines", f"No se cargaron pines desde {source_name}. Se omitieron {num_skipped} pines debido a errores en el formato de coordenadas.")
-                else: # No pins found and no errors, likely an empty KML or no Point placemarks
-                    messagebox.showinfo("Información", f"No se encontraron pines (Placemarks con Puntos) en el archivo KMZ '{source_name}'.")
-
-        except Exception as e: # Catch-all for other potential errors (zip issues, lxml parsing errors)
-            messagebox.showerror("Error al Cargar KMZ", f"Ocurrió un error: {e}")
-            import traceback # For debugging, print stack trace to console
-            print(traceback.format_exc()) 
+    def load_many_kmz_files(self):
+        """
+        Loads several KMZ files selected by the user and adds their pins to the ones
+        already loaded (the map is not cleared).
+
+        The files are parsed in parallel by a `KMZBatchLoadWorker`, which spreads them
+        across a process pool and returns compact pin records per file. Each file's
+        pins are merged into `self.pins_data` with the file name (and KML member) as
+        their `source`, so `create_routes_from_all` creates one route per file and member. Progress and
+        cancellation work as for `load_kmz_file`.
+        """
+        filepaths = filedialog.askopenfilenames(
+            title="Seleccionar Archivos KMZ",
+            filetypes=(("Archivos KMZ", "*.kmz"), ("Todos los archivos", "*.*"))
+        )
+        if not filepaths: # User cancelled the dialog
+            return
+
+        self._abort_background_load() # Only one load runs at a time
+        self.current_source = f"{len(filepaths)} archivos"
+        self.extraction_error_count = 0
+        self.load_files_total = len(filepaths)
+        self.load_files_done = 0
+        self._start_background_load(KMZBatchLoadWorker(filepaths, cache=self.parse_cache, profiler=self.profiler))
+
+    def _start_background_load(self, worker):
+        """
+        Starts a background loader thread and begins polling its message queue.
+
+        Args:
+            worker: A not yet started `KMZLoadWorker` or `KMZBatchLoadWorker`.
+        """
+        self.load_worker = worker
+        self.load_progress_bar["value"] = 0
+        self.load_progress_label.config(text=f"Cargando {self.current_source}...")
+        self.load_progress_frame.pack(after=self.load_button, fill="x", padx=5, pady=(0,5))
+        self.load_start_count = len(self.pins_data)
+        self.load_start_routes = len(self.routes_data)
+        self.load_failures = []
+        self.load_start_ns = time.perf_counter_ns()
+        self.load_pin_list_ns = 0
+        worker.start()
+        self.load_poll_id = self.after(LOAD_POLL_INTERVAL_MS, self._poll_load_queue)
+
+    def _poll_load_queue(self):
+        """
+        Processes messages posted by the background loader. Runs on the Tk mainloop.
+
+        Each `LOAD_BATCH` message turns its pins into pin dictionaries and adds them to
+        the list and the map (`_append_pins_to_ui`); the map is zoomed to the first batch
+        so the user sees pins right away. At most `LOAD_MESSAGES_PER_POLL` batches are
+        handled per call to keep the UI responsive. `LOAD_FILE` and `LOAD_CACHED` messages
+        add whole files (`_add_parsed_file`, `_add_cached_file`) and `LOAD_LINES` the line
+        geometries of the file as routes. Any other message ends the load via
+        `_finish_background_load`; otherwise the next poll is scheduled.
+
+        The time spent adding pins is summed in `self.load_pin_list_ns` and recorded as
+        one pin list span when the load finishes, instead of one span per batch.
+        """
+        self.load_poll_id = None
+        worker = self.load_worker
+        if worker is None: # Load was aborted
+            return
+
+        for kind, payload in drain_messages(worker.messages, LOAD_MESSAGES_PER_POLL):
+            start = time.perf_counter_ns()
+            if kind == LOAD_BATCH:
+                pins, progress = payload
+                first_new_index = self.pins_data.extend(
+                    [name for name, _ in pins], [coords for _, coords in pins], self.current_source
+                )
+                self._append_pins_to_ui(first_new_index)
+                if first_new_index == 0:
+                    self._zoom_to_pins() # Show the first pins as soon as they arrive
+                self.load_progress_bar["value"] = progress * 100
+                self.load_progress_label.config(text=f"Cargando {self.current_source}: {len(self.pins_data)} pines...")
+            elif kind == LOAD_LINES:
+                self._add_imported_lines(payload)
+            elif kind == LOAD_FILE:
+                self._add_parsed_file(payload)
+            elif kind == LOAD_CACHED:
+                self._add_cached_file(*payload)
+            else:
+                self._finish_background_load(kind, payload)
+                return
+            self.load_pin_list_ns += time.perf_counter_ns() - start
+
+        self.load_poll_id = self.after(LOAD_POLL_INTERVAL_MS, self._poll_load_queue)
+
+    def _add_parsed_file(self, result):
+        """
+        Merges the pins of one file parsed by `KMZBatchLoadWorker` (or of one more KML
+        member of the file loaded by `KMZLoadWorker`) into `self.pins_data`, in one
+        columnar append per KML member, tagging them with the file name (and member)
+        as their source, and adds them to the UI. Its line geometries become routes.
+
+        Args:
+            result: A `KMZParseResult`. Files that could not be read are recorded in
+                    `self.load_failures` and reported when the load finishes.
+        """
+        if result.error is not None:
+            self.load_failures.append((result.source, result.error))
+        else:
+            first_new_index = len(self.pins_data)
+            for source, start, end in member_sources(result.source, result.members, len(result.names)):
+                # result.coords is a flat array('d'), read by the store without copying it to Python floats
+                self.pins_data.extend(result.names[start:end], result.coords[3 * start:3 * end], source)
+            self._append_pins_to_ui(first_new_index)
+            self._add_imported_lines(result.lines or ())
+            if first_new_index == 0 and len(self.pins_data) > 0:
+                self._zoom_to_pins() # Show the first pins as soon as they arrive
+        if self.load_files_total: # One more file of a batch load
+            self.load_files_done += 1
+            self.load_progress_bar["value"] = 100 * self.load_files_done / self.load_files_total
+            self.load_progress_label.config(text=f"Cargando {self.current_source}: {self.load_files_done}/{self.load_files_total}...")
+        else:
+            self.load_progress_label.config(text=f"Cargando {self.current_source}: {len(self.pins_data)} pines...")
+
+    def _add_cached_file(self, source, cached):
+        """
+        Merges the pins of a file found in the parse cache into `self.pins_data` and
+        adds them to the UI. The names blob and arrays are memory-mapped from the
+        cache and appended in one step per KML member, without handling the pins one by one.
+        The cached line geometries become routes.
+
+        Args:
+            source: Base name of the file, used as the pins' source (with the member, see `member_sources`).
+            cached: A `CachedPins`.
+        """
+        first_new_index = len(self.pins_data)
+        for member_source, start, end in member_sources(source, cached.members, len(cached.coords)):
+            self.pins_data.extend_encoded(cached.names, cached.name_offsets[start:end + 1], cached.coords[start:end],
+                                          member_source)
+        self._append_pins_to_ui(first_new_index)
+        self._add_imported_lines(cached.lines)
+        if first_new_index == 0 and len(self.pins_data) > 0:
+            self._zoom_to_pins() # Show the first pins as soon as they arrive
+        if self.load_files_total: # One more file of a batch load
+            self.load_files_done += 1
+            self.load_progress_bar["value"] = 100 * self.load_files_done / self.load_files_total
+            self.load_progress_label.config(text=f"Cargando {self.current_source}: {self.load_files_done}/{self.load_files_total}...")
+        else:
+            self.load_progress_bar["value"] = 100
+
+    def _add_imported_lines(self, lines):
+        """
+        Adds line geometries read from a KMZ file to `self.routes_data` as routes in
+        `DEFAULT_ROUTE_COLOR_INTERNAL` and draws them on the map. The routes panel is
+        refreshed once the load finishes.
+
+        Args:
+            lines: Iterable of `(name, (N, 3) lon/lat/alt array)` pairs
+                   (see `kml_stream.placemark_lines`).
+        """
+        self._add_routes_to_map(
+            {"name": name, "kml_coords": coords, "color": DEFAULT_ROUTE_COLOR_INTERNAL} for name, coords in lines
+        )
+
+    def _add_routes_to_map(self, routes):
+        """
+        Appends routes whose `kml_coords` are (N, 3) lon/lat/alt arrays to
+        `self.routes_data` and adds their paths to `self.map_layer` in one batch
+        (`MapLayer.add_paths`). The routes are appended once their paths were added,
+        so if adding them fails none is kept.
+        """
+        routes = list(routes)
+        self.map_layer.add_paths(
+            (list(zip(route["kml_coords"][:, 1].tolist(), route["kml_coords"][:, 0].tolist())),
+             {"color": route["color"], "width": 3})
+            for route in routes
+        )
+        self.routes_data.extend(routes)
+
+    def _finish_background_load(self, kind, payload):
+        """
+        Hides the progress bar and gives the user feedback once the loader has stopped.
+
+        Args:
+            kind: The final message kind (`LOAD_DONE`, `LOAD_CANCELLED`, `LOAD_NO_KML` or `LOAD_ERROR`).
+            payload: The error count for done/cancelled loads, the exception for errors.
+        """
+        self.load_worker = None
+        self.load_progress_frame.pack_forget()
+        source_name = self.current_source
+        self.profiler.record(STAGE_PIN_LIST, self.load_start_ns, self.load_pin_list_ns,
+                             pins=len(self.pins_data) - self.load_start_count, source=source_name)
+        num_routes = len(self.routes_data) - self.load_start_routes
+        if num_routes:
+            self.refresh_routes_panel()
+        routes_note = f" Se importaron {num_routes} rutas (líneas, polígonos y tracks)." if num_routes else ""
+
+        if kind == LOAD_NO_KML:
+            messagebox.showerror("Error en KMZ", "No se encontró un archivo KML dentro del KMZ.")
+            return
+        if kind == LOAD_ERROR: # Zip issues, lxml parsing errors, ...
+            messagebox.showerror("Error al Cargar KMZ", f"Ocurrió un error: {payload}")
+            return
+
+        if self.load_failures:
+            failed_files = "\n".join(f"{name}: {error}" for name, error in self.load_failures)
+            messagebox.showwarning("Archivos No Cargados", f"No se pudieron cargar {len(self.load_failures)} archivos:\n{failed_files}")
+
+        self.extraction_error_count = payload
+        num_loaded = len(self.pins_data) - self.load_start_count
+        num_skipped = self.extraction_error_count
+
+        # Display feedback to the user about the loading process
+        if kind == LOAD_CANCELLED:
+            messagebox.showinfo("Carga Cancelada", f"Se canceló la carga de {source_name}. Se conservaron {num_loaded} pines.{routes_note}")
+        elif num_loaded > 0:
+            success_msg = f"Se cargaron {num_loaded} pines desde {source_name}.{routes_note}"
+            if num_skipped > 0:
+                skipped_msg = f" Se omitieron {num_skipped} pines o vértices de líneas debido a errores en el formato de coordenadas."
+                messagebox.showinfo("KMZ Cargado Parcialmente", success_msg + skipped_msg)
+            else:
+                messagebox.showinfo("KMZ Cargado", success_msg)
+        else: # No pins were successfully loaded
+            if num_skipped > 0:
+                messagebox.showwarning("Error de Carga de Pines", f"No se cargaron pines desde {source_name}. Se omitieron {num_skipped} pines o vértices de líneas debido a errores en el formato de coordenadas.{routes_note}")
+            else: # No pins found and no errors, likely an empty KML or no Point placemarks
+                messagebox.showinfo("Información", f"No se encontraron pines (Placemarks con Puntos) en el archivo KMZ '{source_name}'.{routes_note}")
+
+        if num_loaded > 0:
+            self._zoom_to_pins() # Adjust map view to show all loaded pins
+            self._apply_theme() # Apply theme to the checkbuttons created during the load
+
+    def cancel_kmz_load(self):
+        """
+        Cancels the KMZ file being loaded in the background.
+
+        The worker stops at the next placemark and posts `LOAD_CANCELLED`; pins that
+        were already delivered stay in the list and on the map.
+        """
+        if self.load_worker is not None:
+            self.load_worker.cancel()
+            self.load_progress_label.config(text="Cancelando...")
+
+    def _abort_background_load(self):
+        """
+        Stops a running background load immediately, discarding any pending messages.
+        Used when the loaded data is about to be cleared.
+        """
+        if self.load_worker is not None:
+            self.load_worker.cancel()
+            self.load_worker = None
+        if self.load_poll_id is not None:
+            self.after_cancel(self.load_poll_id)
+            self.load_poll_id = None
+        self.load_progress_frame.pack_forget()
 
     def _extract_placemarks_from_lxml_tree(self, xml_element):
         """
-        Recursively extracts Placemark elements with Point geometry from an lxml tree.
+        Recursively extracts Placemark elements with Point geometry from an lxml tree,
+        and imports their line geometries as routes (`_add_imported_lines`).
+
+        `load_kmz_file` uses the streaming `PlacemarkStream` instead; both follow the
+        same rules and produce the same pins, lines and error count.
 
         This method traverses the KML structure (Document, Folder, Placemark).
         When a Placemark containing a Point is found, it extracts its name and
-        coordinates. The coordinates are stored in two formats: `coords_original`
-        (lon, lat, alt) as found in the KML, and `coords_map` (lat, lon) for use
-        with `tkintermapview`. Each pin's data is stored as a dictionary in
-        `self.pins_data`. It also records the source KMZ file for each pin.
+        coordinates (lon, lat, alt, as found in the KML) and appends them to the
+        `self.pins_data` store, together with the source KMZ file of the pin.
         If coordinate parsing fails, `self.extraction_error_count` is incremented.
 
         Args:
@@ -529,8 +858,14 @@ class KMZRouteApp(tkinter.Tk):
             # If the element is a Placemark
             elif child.tag == f"{KML_NS}Placemark":
                 placemark_name_element = child.find(f"{KML_NS}name")
-                # Use "Pin sin nombre" if name tag is missing or empty
-                placemark_name = placemark_name_element.text if placemark_name_element is not None and placemark_name_element.text else "Pin sin nombre"
+                # Use "Pin sin nombre" (or "Ruta sin nombre" for lines) if name tag is missing or empty
+                placemark_name = placemark_name_element.text if placemark_name_element is not None and placemark_name_element.text else None
+
+                # LineStrings, Polygon outlines and gx:Tracks become routes; their malformed vertices are counted as errors
+                lines, malformed_vertices = placemark_lines(child)
+                self.extraction_error_count += malformed_vertices
+                self._add_imported_lines((placemark_name or DEFAULT_LINE_NAME, coords) for coords in lines)
+                placemark_name = placemark_name or DEFAULT_PIN_NAME
                 
                 # Find a Point geometry within the Placemark (can be nested)
                 point_element = child.find(f".//{KML_NS}Point") # ".//" searches current element and all descendants
@@ -544,23 +879,11 @@ class KMZRouteApp(tkinter.Tk):
                 if coordinates_element is None or not coordinates_element.text:
                     continue
 
-                coords_str = coordinates_element.text.strip()
                 try:
                     # KML coordinates are typically lon,lat,alt
-                    lon_str, lat_str, *alt_str = coords_str.split(',')
-                    lon = float(lon_str)
-                    lat = float(lat_str)
-                    alt = float(alt_str[0]) if alt_str else 0.0 # Altitude is optional, default to 0
-
-                    pin_info = {
-                        "name": placemark_name,
-                        "coords_original": (lon, lat, alt), # (lon, lat, alt) for KML
-                        "coords_map": (lat, lon), # (lat, lon) for tkintermapview
-                        "tk_var": tkinter.BooleanVar(value=False), # Selection state for UI checkbox
-                        # Store the source KMZ filename for grouping/identification
-                        "source": getattr(self, "current_source", "Sin Fuente") # Default if source not set
-                    }
-                    self.pins_data.append(pin_info)
+                    coords = parse_point_coordinates(coordinates_element.text)
+                    # Store the source KMZ filename for grouping/identification
+                    self.pins_data.append(placemark_name, coords, getattr(self, "current_source", "Sin Fuente"))
                 except ValueError: # Handle cases where coordinate string is malformed
                     # If coordinates are malformed, skip this placemark and count error
                     self.extraction_error_count += 1
@@ -568,53 +891,113 @@ class KMZRouteApp(tkinter.Tk):
 
     def _populate_pin_list_ui(self):
         """
-        Populates the scrollable list in the UI with checkbuttons for each loaded pin
-        and places corresponding markers on the map.
+        Populates the scrollable list in the UI with all loaded pins and places
+        corresponding markers on the map.
 
         This method first clears any existing pins from the UI list and map markers.
-        Then, for each pin dictionary in `self.pins_data`:
-        1.  A `ttk.Checkbutton` is created in the `self.pins_list_frame`.
-        2.  The checkbutton's selection state is tied to the pin's `tk_var`.
-        3.  A click event (`<Button-1>`) on the checkbutton is bound to `self.on_checkbutton_click`
+        Then, for the pins in `self.pins_data` (see `_append_pins_to_ui`):
+        1.  The virtualized `self.pin_list` is told how many pins there are; it only
+            creates checkbuttons for the visible rows and fills them on demand.
+        2.  Toggling a checkbutton updates the pin's selection in `self.pins_data`
+            (`_on_checkbutton_toggled`) and schedules an update of the displayed order numbers.
+        3.  A click event (`<Button-1>`) on a row is handled by `self.on_checkbutton_click`
             to handle selection logic (including Shift-click range selection).
-        4.  A trace is added to the `tk_var` to call `self.schedule_update_ordering`
-            whenever the pin's selection state changes, which updates the displayed order number.
-        5.  A marker is placed on the `self.map_widget` at the pin's coordinates.
-        6.  The marker's click command is set to `self._on_marker_click` to toggle selection.
-        7.  References to the checkbutton widget and map marker are stored in the pin's dictionary.
-        Finally, it updates the scroll region of the pins canvas.
-        """
-        self._clear_pin_list_ui() # Remove old checkbuttons
-        self._clear_map_markers() # Remove old map markers
-
-        for i, pin in enumerate(self.pins_data):
-            # Create a checkbutton for each pin in the scrollable list
-            cb = ttk.Checkbutton(self.pins_list_frame, text=pin["name"], variable=pin["tk_var"])
-            cb.pack(anchor="w", fill="x", padx=5)
-            pin["checkbox_widget"] = cb # Store reference to the widget
-            
-            # Bind left-click to handle selection, including Shift-click for range selection
-            cb.bind("<Button-1>", lambda event, index=i: self.on_checkbutton_click(event, index))
-            # When the checkbutton state changes (tk_var changes), schedule an update to the ordering display
-            pin["tk_var"].trace_add("write", lambda *args: self.schedule_update_ordering())
-
-            # Add a marker on the map for the pin
-            marker = self.map_widget.set_marker(
-                pin["coords_map"][0],  # Latitude
-                pin["coords_map"][1],  # Longitude
-                text=pin["name"],      # Text displayed with marker (can be None)
-                command=lambda m, p=pin: self._on_marker_click(p) # Command to execute when marker is clicked
-            )
-            self.map_markers.append(marker) # Keep track of map markers
-            pin["map_marker"] = marker # Store reference to the marker in the pin data
-        
-        # Update the scrollable area of the canvas after adding all checkbuttons
-        self.pins_list_frame.update_idletasks() # Ensure frame size is calculated
-        self.pins_canvas.config(scrollregion=self.pins_canvas.bbox("all"))
-        
-        # Apply theme to newly created checkbuttons
+        4.  The pins are added to `self.map_layer`, which draws the ones around the current
+            view, grouping dense areas into cluster markers for the current zoom level.
+        5.  Individual markers call `self._on_marker_click` to toggle selection.
+        """
+        with self.profiler.span(STAGE_PIN_LIST, pins=len(self.pins_data)):
+            self._clear_pin_list_ui() # Empty the list
+            self._clear_map_markers() # Remove old map markers
+            self._append_pins_to_ui(0)
+
+        # Apply theme to the list
         self._apply_theme()
 
+    def _append_pins_to_ui(self, start_index):
+        """
+        Adds the pins in `self.pins_data` starting at `start_index` to the list and
+        the map, leaving earlier pins untouched. Used by `_populate_pin_list_ui` and
+        to add pin batches while a file is still loading.
+
+        Args:
+            start_index: Index in `self.pins_data` of the first pin not yet shown.
+        """
+        # The virtualized list only needs the new row count; visible rows are refreshed
+        self.pin_list.set_row_count(len(self.pins_data))
+        # The map layer indexes the new pins and redraws the markers shortly after
+        self.map_layer.add_pins(start_index)
+        # Offer the sources loaded so far for "Seleccionar Fuente"
+        self.source_combo.configure(values=list(self.pins_data.sources))
+
+    def _on_checkbutton_toggled(self, index, selected):
+        """
+        Copies the state of a pin's checkbutton (after a normal click) into
+        `self.pins_data` and schedules an update of the ordering display.
+
+        Args:
+            index: The index of the pin in `self.pins_data`.
+            selected: The new checked state of the checkbutton.
+        """
+        self.apply_selection(index, selected)
+
+    def apply_selection(self, indices, value):
+        """
+        Bulk selection entry point: selects or deselects many pins in one operation.
+
+        The selection model (`self.pins_data`) is updated in a single vectorized call,
+        with no per-pin notification; the UI is then refreshed once through
+        `_on_selection_changed`.
+
+        Args:
+            indices: Sequence of pin indices (new selections are numbered in this
+                     order) or a boolean mask over all pins.
+            value: True to select, False to deselect.
+
+        Returns:
+            Array with the indices whose selection state actually changed.
+        """
+        changed = self.pins_data.set_selected(indices, value)
+        self._on_selection_changed(changed)
+        return changed
+
+    def _on_selection_changed(self, indices):
+        """
+        Reflects a selection change of the pins in `indices`: updates the checked
+        state of their visible list rows, marks the markers drawn for them as dirty
+        and schedules `update_ordering`, which recolors only the dirty markers.
+        Pins without a marker need nothing: they get the right color when drawn.
+
+        Args:
+            indices: Iterable of pin indices whose selection state changed.
+        """
+        self._sync_checkbuttons(indices)
+        self.dirty_marker_indices.update(self.map_layer.materialized_pins(indices))
+        self.schedule_update_ordering()
+
+    def _sync_checkbuttons(self, indices):
+        """
+        Updates the checked state of the visible list rows among `indices` to match
+        `self.pins_data`. Rows that are not visible are filled in when scrolled into view.
+
+        Args:
+            indices: Iterable of pin indices whose selection state changed.
+        """
+        self.pin_list.render(indices)
+
+    def _pin_label(self, index):
+        """
+        Returns the text of a pin's row in the list: its name, prefixed with its
+        1-based position in the selection order (e.g. "2. Pin Name") if it is selected.
+        The rank is an O(log n) lookup in `self.pins_data`, so only the rows that are
+        actually displayed are ever numbered.
+
+        Args:
+            index: The index of the pin in `self.pins_data`.
+        """
+        name = self.pins_data.name(index)
+        rank = self.pins_data.rank(index)
+        return f"{rank}. {name}" if rank else name
 
     def on_checkbutton_click(self, event, index):
         """
@@ -635,7 +1018,7 @@ class KMZRouteApp(tkinter.Tk):
         Args:
             event: The Tkinter event object, containing information about the event
                    (e.g., whether Shift key was pressed via `event.state`).
-            index: The index of the clicked pin in the `self.pins_data` list.
+            index: The index of the clicked pin in `self.pins_data`.
 
         Returns:
             "break" (str) if Shift-click range selection was handled, to stop
@@ -648,17 +1031,15 @@ class KMZRouteApp(tkinter.Tk):
             end = max(self.last_selected_index, index)
             
             # Determine the new state based on the pin being clicked.
-            # If the current pin's tk_var is False (it's about to be checked), new_state is True.
-            # If the current pin's tk_var is True (it's about to be unchecked), new_state is False.
+            # If the current pin is not selected (it's about to be checked), new_state is True.
+            # If the current pin is selected (it's about to be unchecked), new_state is False.
             # This logic ensures that clicking on an unchecked box (while holding shift) selects the range,
             # and clicking on a checked box (while holding shift) deselects the range.
-            # Note: The tk_var of pins_data[index] hasn't updated yet from this click.
-            # So, if it's currently False, it means the click intends to make it True.
-            current_pin_tk_var = self.pins_data[index]["tk_var"]
-            new_state = not current_pin_tk_var.get() # This will be the state *after* the click if not for "break"
+            # Note: The selection of the clicked pin hasn't changed yet from this click.
+            new_state = not self.pins_data.is_selected(index) # This will be the state *after* the click if not for "break"
 
-            for i in range(start, end + 1):
-                self.pins_data[i]["tk_var"].set(new_state)
+            # Update the whole range in one vectorized step, then refresh only the changed checkbuttons
+            self.apply_selection(range(start, end + 1), new_state)
             
             self.last_selected_index = index # Update the last selected index
             return "break" # Prevent default checkbutton behavior as we've handled it
@@ -666,63 +1047,88 @@ class KMZRouteApp(tkinter.Tk):
             # Normal click (no Shift), just update the last selected index
             self.last_selected_index = index
 
-    def _on_marker_click(self, pin_info):
+    def _on_marker_click(self, index):
         """
         Handles click events on map markers.
 
         When a map marker is clicked, this method toggles the selection state
-        of the associated pin (by flipping the value of `pin_info["tk_var"]`).
-        It then calls `self.update_marker_color` to visually update the marker
-        on the map to reflect its new selection state (e.g., change color).
-        The `tk_var` change will also trigger `schedule_update_ordering` due to the trace.
+        of the associated pin in `self.pins_data` and updates its checkbutton.
+        It then calls `self.update_marker_color` to recolor the marker right away,
+        and schedules an update of the order display in the list.
+
+        Args:
+            index: The index in `self.pins_data` of the pin whose marker was clicked.
+        """
+        # Toggle the selection state of the pin
+        self.pins_data.toggle(index)
+        self._on_selection_changed([index])
+        # Recolor the clicked marker immediately; it no longer needs the deferred update
+        self.update_marker_color(index)
+        self.dirty_marker_indices.discard(index)
+
+    def _select_pins_in_rectangle(self, start, end):
+        """
+        Selects the pins inside a rectangle drawn on the map (Shift+drag).
+
+        Pins not yet selected are numbered along the drag direction, from the corner
+        where the drag started. Pins are found with the spatial index of `self.map_layer`.
 
         Args:
-            pin_info: The dictionary from `self.pins_data` corresponding to the
-                      clicked marker. This dictionary contains the `tk_var` and
-                      other pin details.
+            start: (x, y) world coordinates of the corner where the drag started.
+            end: (x, y) world coordinates of the corner where it ended.
         """
-        # Toggle the selection state of the pin's BooleanVar
-        pin_info["tk_var"].set(not pin_info["tk_var"].get())
-        # Update the marker's visual appearance (color) to reflect the new state.
-        # The trace on tk_var will handle updating the order display in the list.
-        self.update_marker_color(pin_info)
+        self._select_region_pins(pins_in_rectangle(self.map_layer.pin_index(), start, end))
+
+    def _select_pins_in_lasso(self, stroke_x, stroke_y):
+        """
+        Selects the pins inside a free-hand region drawn on the map (Ctrl+drag).
+
+        Pins not yet selected are numbered in the order the stroke passes next to them.
+
+        Args:
+            stroke_x: World x coordinates of the stroke, in drawing order.
+            stroke_y: World y coordinates of the stroke.
+        """
+        self._select_region_pins(pins_in_lasso(self.map_layer.pin_index(), stroke_x, stroke_y))
+
+    def _select_region_pins(self, ordered_indices):
+        """Adds the pins in `ordered_indices` to the selection, numbering new ones in that order."""
+        self.apply_selection(ordered_indices, True)
 
     def _zoom_to_pins(self):
         """
         Adjusts the map's viewport to encompass all currently loaded pins.
 
-        -   If no map markers exist, it does nothing.
-        -   If there is exactly one marker, it centers the map on that marker's
+        -   If no pins are loaded, it does nothing.
+        -   If there is exactly one pin, it centers the map on that pin's
             position and sets a fixed zoom level (e.g., 15).
-        -   If there are multiple markers, it calculates a bounding box that
-            encloses all marker positions and then uses `self.map_widget.fit_bounding_box`
-            to adjust the map's zoom and position to show all pins.
+        -   If there are multiple pins, it takes the bounding box of all pin
+            positions (computed on the coordinate columns of `self.pins_data`)
+            and uses `self.map_widget.fit_bounding_box` to adjust the map's zoom
+            and position to show all pins.
         """
-        if not self.map_markers:
-            return # No markers to zoom to
+        if len(self.pins_data) == 0:
+            return # No pins to zoom to
         
-        if len(self.map_markers) == 1: 
-            # Single marker: center on it and set a specific zoom level
-            marker = self.map_markers[0]
-            self.map_widget.set_position(marker.position[0], marker.position[1])
+        if len(self.pins_data) == 1: 
+            # Single pin: center on it and set a specific zoom level
+            lat, lon = self.pins_data.coords_map(0)
+            self.map_widget.set_position(lat, lon)
             self.map_widget.set_zoom(15) 
             return
 
-        # Multiple markers: fit map to their bounding box
-        marker_positions = [marker.position for marker in self.map_markers if marker.position is not None]
-        if marker_positions:
-            lats = [pos[0] for pos in marker_positions]
-            lons = [pos[1] for pos in marker_positions]
-            # Determine the top-left and bottom-right coordinates of the bounding box
-            top_left = (max(lats), min(lons))       # Max latitude, Min longitude
-            bottom_right = (min(lats), max(lons))   # Min latitude, Max longitude
-            self.map_widget.fit_bounding_box(top_left, bottom_right)
+        # Multiple pins: fit map to their bounding box
+        min_lat, min_lon, max_lat, max_lon = self.pins_data.bounds()
+        # Determine the top-left and bottom-right coordinates of the bounding box
+        top_left = (max_lat, min_lon)       # Max latitude, Min longitude
+        bottom_right = (min_lat, max_lon)   # Min latitude, Max longitude
+        self.map_widget.fit_bounding_box(top_left, bottom_right)
 
     def create_route_from_selection(self):
         """
         Creates a new route from the currently selected (checked) pins.
 
-        -   It gathers all pins whose `tk_var` is True.
+        -   It gathers all selected pins from `self.pins_data`.
         -   If fewer than two pins are selected, it shows a warning and returns.
         -   The route name is taken from `self.route_name_entry`. If empty, a default
             name (e.g., "Ruta-1") is generated and also populated back into the entry field.
@@ -735,15 +1141,12 @@ class KMZRouteApp(tkinter.Tk):
         -   A new route dictionary containing the name, KML coordinates, and color
             is appended to `self.routes_data`.
         -   A path is drawn on the `self.map_widget` using the map coordinates and color.
-            This path object is stored in `self.map_paths`.
+            The path is added to `self.map_layer`, which only draws it while it is in view.
         -   A confirmation message is displayed.
         -   The route name entry field is cleared for the next route.
         """
-        # Get pins that are currently selected and sorted by their selection order
-        selected_pins_ordered = sorted(
-            [pin for pin in self.pins_data if pin["tk_var"].get() and pin.get("select_order") is not None],
-            key=lambda p: p["select_order"]
-        )
+        # Get the indices of the pins that are currently selected, sorted by their selection order
+        selected_pins_ordered = self.pins_data.selected_indices_ordered()
 
         if len(selected_pins_ordered) < 2:
             messagebox.showwarning("Selección Insuficiente", "Seleccione al menos dos pines ordenados para crear una ruta.")
@@ -766,43 +1169,81 @@ class KMZRouteApp(tkinter.Tk):
         }
         route_color_mapped = ui_to_internal_color_mapping.get(route_color_ui_name, DEFAULT_ROUTE_COLOR_INTERNAL)
         
-        # Collect coordinates for the route based on the ordered selection
-        # route_kml_coords are (lon, lat, alt) for saving to KML
-        route_kml_coords = [pin["coords_original"] for pin in selected_pins_ordered]
-        # map_coords_list are (lat, lon) for displaying on tkintermapview
-        map_coords_list = [pin["coords_map"] for pin in selected_pins_ordered]
-
-        # Store route data internally
-        self.routes_data.append({
-            "name": route_name,
-            "kml_coords": route_kml_coords,
-            "color": route_color_mapped # Store the internal color name
-        })
-
-        # Draw the route on the map
-        map_path = self.map_widget.set_path(map_coords_list, color=route_color_mapped, width=3)
-        self.map_paths.append(map_path) # Keep track of map paths
-
-        messagebox.showinfo("Ruta Creada", f"Ruta '{route_name}' creada con {len(selected_pins_ordered)} puntos y añadida al mapa.")
+        road_note = ""
+        if self.road_snap_var.get() and self.road_router is None:
+            messagebox.showwarning("Sin Red Vial", "Cargue una red vial para que la ruta siga las carreteras. Se usarán líneas rectas.")
+        with self.profiler.span(STAGE_ROUTE_BUILD, routes=1):
+            road_path = None
+            if self.road_snap_var.get() and self.road_router is not None:
+                # Follow the roads: pins are snapped to the nearest road and joined by shortest road paths
+                route_kml_coords, road_path = road_route(self.road_router, self.pins_data, selected_pins_ordered)
+                map_coords_list = list(zip(road_path.lat, road_path.lon))
+                road_note = f" Longitud por carretera: {road_path.length_m / 1000:.1f} km."
+                if road_path.unrouted_legs:
+                    road_note += f" {road_path.unrouted_legs} tramos sin conexión vial se dibujaron en línea recta."
+            if road_path is None or not road_path.lat: # No roads, or no pin with valid coordinates to snap
+                # Collect coordinates for the route based on the ordered selection
+                # route_kml_coords are (lon, lat, alt) for saving to KML
+                route_kml_coords = self.pins_data.kml_coords(selected_pins_ordered)
+                # map_coords_list are (lat, lon) for displaying on tkintermapview
+                map_coords_list = self.pins_data.map_coords(selected_pins_ordered)
+
+            # Store route data internally
+            self.routes_data.append({
+                "name": route_name,
+                "kml_coords": route_kml_coords,
+                "color": route_color_mapped # Store the internal color name
+            })
+
+            # Draw the route on the map
+            self.map_layer.add_path(map_coords_list, color=route_color_mapped, width=3)
+        self.refresh_routes_panel()
+
+        messagebox.showinfo("Ruta Creada", f"Ruta '{route_name}' creada con {len(selected_pins_ordered)} puntos y añadida al mapa.{road_note}")
         # Clear the route name field so a new route doesn't reuse the old name by default
         self.route_name_entry.delete(0, tkinter.END)
         self._apply_theme() # Re-apply theme in case message box changed focus or styling
 
+    def load_road_network(self):
+        """
+        Loads a road network from a local GeoJSON or `.osm.pbf` file chosen by the user,
+        for routes that follow the roads ("Seguir carreteras").
+
+        The graph is built by `load_road_graph`, which keeps a cache on disk, so
+        loading the same file again in a later session is fast. No network access
+        is needed.
+        """
+        filepath = filedialog.askopenfilename(
+            title="Seleccionar red vial",
+            filetypes=(("Red vial", "*.geojson *.json *.pbf"), ("Todos los archivos", "*.*"))
+        )
+        if not filepath: # User cancelled
+            return
+        self.config(cursor="watch")
+        self.update_idletasks()
+        try:
+            graph = load_road_graph(filepath)
+        except (ValueError, ImportError, OSError) as e:
+            messagebox.showerror("Error de Red Vial", f"No se pudo cargar la red vial: {e}")
+            return
+        finally:
+            self.config(cursor="")
+        self.road_router = RoadRouter(graph)
+        self.road_snap_var.set(True)
+        self.road_network_label.config(text=f"{os.path.basename(filepath)}: {len(graph)} nodos, {graph.edge_count} tramos")
+
     def save_routes_to_kml(self):
         """
-        Saves all created routes to a KML file using the `simplekml` library.
+        Saves all created routes to a KML file, or a compressed KMZ file, with the
+        streaming writer of `kmz_core.kml_writer`.
 
         -   If no routes are present in `self.routes_data`, it shows an info message and returns.
-        -   Prompts the user to select a file path and name for saving the KML file
+        -   Prompts the user to select a file path and name for saving the KML or KMZ file
             using a standard save file dialog. If the user cancels, it returns.
-        -   Creates a `simplekml.Kml` object.
-        -   Maps internal color names (e.g., "red") to KML color codes (ABGR format, e.g., "ff0000ff").
-        -   For each route in `self.routes_data`:
-            -   A new linestring is added to the KML object using the route's name and
-              `kml_coords` (which are in lon, lat, alt order).
-            -   The style of the linestring is set, including color (using the mapped KML color)
-              and width.
-        -   Attempts to save the KML object to the specified file path.
+        -   Maps internal color names (e.g., "red") and "#rrggbb" colors to KML color codes
+            (ABGR format, e.g., "ff0000ff") with `kml_routes`.
+        -   Writes every route as a linestring with the route's name and `kml_coords`
+            (which are in lon, lat, alt order), all routes of one color sharing one style.
         -   Shows a success or error message.
         """
         if not self.routes_data:
@@ -810,170 +1251,200 @@ class KMZRouteApp(tkinter.Tk):
             return
 
         filepath = filedialog.asksaveasfilename(
-            title="Guardar Rutas como KML (con SimpleKML)",
+            title="Guardar Rutas como KML o KMZ",
             defaultextension=".kml",
-            filetypes=(("Archivos KML", "*.kml"), ("Todos los archivos", "*.*"))
+            filetypes=(("Archivos KML", "*.kml"), ("Archivos KMZ", "*.kmz"), ("Todos los archivos", "*.*"))
         )
         if not filepath: # User cancelled save dialog
             return
 
-        kml_output = simplekml.Kml(name="Rutas Generadas") # Create a KML object
-        
-        # Map internal color names (used by tkintermapview) to KML color codes (ABGR format)
-        internal_to_kml_color_mapping = {
-            COLOR_RED: KML_COLOR_RED,
-            COLOR_GREEN: KML_COLOR_GREEN,
-            COLOR_BLUE: KML_COLOR_BLUE,
-            COLOR_CYAN: KML_COLOR_CYAN,
-        }
-
-        for route_info in self.routes_data:
-            route_name = route_info["name"]
-            coords = route_info["kml_coords"] # These are (lon, lat, alt)
-            linestring = kml_output.newlinestring(name=route_name, coords=coords)
-            
-            # Get the internal color name, default if not found
-            route_color_internal_name = route_info.get("color", DEFAULT_ROUTE_COLOR_INTERNAL)
-            # Get the KML color code, default if internal name not in map
-            kml_color_code = internal_to_kml_color_mapping.get(route_color_internal_name, DEFAULT_KML_COLOR)
-            
-            linestring.style.linestyle.color = kml_color_code
-            linestring.style.linestyle.width = 3 # Set line width
-        
         try:
-            kml_output.save(filepath) # Save the KML file
-            messagebox.showinfo("Guardado Exitoso", f"Rutas guardadas en '{os.path.basename(filepath)}' usando SimpleKML.")
+            with self.profiler.span(STAGE_KML_SAVE, routes=len(self.routes_data)):
+                save_routes(filepath, kml_routes(self.routes_data)) # kml_coords are (lon, lat, alt)
+            messagebox.showinfo("Guardado Exitoso", f"Rutas guardadas en '{os.path.basename(filepath)}'.")
         except Exception as e:
-            messagebox.showerror("Error al Guardar con SimpleKML", f"No se pudo guardar el archivo KML: {e}")
+            messagebox.showerror("Error al Guardar", f"No se pudo guardar el archivo: {e}")
+
+    def load_routes_from_kml(self):
+        """
+        Loads the routes of a KML or KMZ file, e.g. one written by `save_routes_to_kml`,
+        and adds them to the routes already created.
+
+        -   Prompts the user to select the file. If the user cancels, it returns.
+        -   `load_routes` (in `kmz_core.kml_reader`) streams every KML document of the
+            file and returns a route per LineString (or Polygon outline, gx:Track) with
+            its Placemark's name, its coordinates as an (N, 3) array decoded in bulk, and
+            the color of its LineStyle converted back to a map color (`kml_color_to_route_color`).
+        -   Only once the whole file was read are the routes appended to `self.routes_data`
+            and drawn on the map (`_add_routes_to_map`), so a file that fails to load adds
+            no route. The routes panel is refreshed once, whatever the outcome.
+        -   Shows how many routes were loaded, and how many vertices were skipped
+            because of malformed coordinates, or an error message.
+        """
+        filepath = filedialog.askopenfilename(
+            title="Cargar Rutas desde KML o KMZ",
+            filetypes=(("Archivos KML o KMZ", "*.kml *.kmz"), ("Todos los archivos", "*.*"))
+        )
+        if not filepath: # User cancelled the dialog
+            return
+
+        try:
+            with self.profiler.span(STAGE_KML_LOAD, file=os.path.basename(filepath)):
+                loaded = load_routes(filepath)
+                self._add_routes_to_map(loaded.routes)
+        except Exception as e: # Zip issues, lxml parsing errors, file I/O errors, ...
+            messagebox.showerror("Error al Cargar Rutas", f"No se pudo cargar el archivo: {e}")
+            return
+        finally:
+            self.refresh_routes_panel()
+
+        source_name = os.path.basename(filepath)
+        if not loaded.routes:
+            messagebox.showinfo("Sin Rutas", f"No se encontraron rutas (LineStrings) en '{source_name}'.")
+            return
+        message = f"Se cargaron {len(loaded.routes)} rutas desde '{source_name}'."
+        if loaded.error_count:
+            message += f" Se omitieron {loaded.error_count} vértices debido a errores en el formato de coordenadas."
+        messagebox.showinfo("Rutas Cargadas", message)
+
+    def _ask_export_path(self, title):
+        """Asks for the destination of an export; the format follows the chosen extension."""
+        filetypes = [(export_format.label, f"*{export_format.extension}") for export_format in EXPORT_FORMATS.values()]
+        return filedialog.asksaveasfilename(title=title, defaultextension=".geojson", filetypes=filetypes)
+
+    def export_pins_to_file(self):
+        """
+        Exports all loaded pins to a GeoJSON, GPX, CSV or FlatGeobuf file (see `kmz_core.export`).
+        The file is written in a background task; a message reports the outcome.
+        """
+        if len(self.pins_data) == 0:
+            messagebox.showinfo("Sin Pines", "No hay pines cargados para exportar.")
+            return
+        filepath = self._ask_export_path("Exportar Pines")
+        if not filepath: # User cancelled
+            return
+        # The file is written in a worker thread, from a copy of the store so that loads
+        # and selections made meanwhile do not change what is written.
+        pins = self.pins_data.copy()
+        message = f"{len(pins)} pines exportados a '{os.path.basename(filepath)}'."
+        worker = TaskWorker(export_pins, filepath, pins)
+        self._start_background_task(worker, lambda result: messagebox.showinfo("Exportación Exitosa", message),
+                                    "Error al Exportar", "No se pudieron exportar los pines")
+
+    def export_routes_to_file(self):
+        """
+        Exports all created routes to a GeoJSON, GPX, CSV or FlatGeobuf file (see `kmz_core.export`).
+        Routes with fewer than two points are left out. The file is written in a background task.
+        """
+        if not self.routes_data:
+            messagebox.showinfo("Sin Rutas", "No hay rutas creadas para exportar.")
+            return
+        filepath = self._ask_export_path("Exportar Rutas")
+        if not filepath: # User cancelled
+            return
+        routes = list(self.routes_data) # Route dictionaries are not modified once created
+        skipped = sum(len(route["kml_coords"]) < MIN_ROUTE_VERTICES for route in routes)
+        message = f"{len(routes) - skipped} rutas exportadas a '{os.path.basename(filepath)}'."
+        if skipped:
+            message += f" Se omitieron {skipped} rutas con menos de {MIN_ROUTE_VERTICES} puntos."
+        worker = TaskWorker(export_routes, filepath, routes)
+        self._start_background_task(worker, lambda result: messagebox.showinfo("Exportación Exitosa", message),
+                                    "Error al Exportar", "No se pudieron exportar las rutas")
 
     def select_all_pins(self):
         """
         Selects all pins currently loaded in `self.pins_data`.
 
-        Iterates through each pin and sets its associated `tk_var` (Tkinter BooleanVar)
-        to `True`. This action checks the corresponding checkbutton in the UI list.
-        The change in `tk_var` will also trigger the `schedule_update_ordering` method
-        due to the trace, which will then update the display order and marker colors.
+        Goes through `apply_selection`: the selection mask of the store is updated in
+        one vectorized operation (pins that were not selected yet get order numbers
+        in list order) and a single update of the display is scheduled.
         """
-        for pin in self.pins_data:
-            pin["tk_var"].set(True)
+        self.apply_selection(numpy.arange(len(self.pins_data)), True)
 
     def deselect_all_pins(self):
         """
         Deselects all pins currently loaded in `self.pins_data`.
 
-        Iterates through each pin and sets its associated `tk_var` (Tkinter BooleanVar)
-        to `False`. This action unchecks the corresponding checkbutton in the UI list.
-        The change in `tk_var` will also trigger the `schedule_update_ordering` method
-        due to the trace, which will then update (clear) the display order and
-        reset marker colors.
+        Goes through `apply_selection`: the selection mask of the store is cleared in
+        one vectorized operation, which also resets the order counter, and a single
+        update of the display is scheduled.
+        """
+        self.apply_selection(numpy.flatnonzero(self.pins_data.selected), False)
+
+    def invert_selection(self):
+        """
+        Deselects the selected pins and selects all the others, numbered in list
+        order, as one bulk operation followed by a single display update.
         """
-        for pin in self.pins_data:
-            pin["tk_var"].set(False)
+        changed = self.pins_data.invert_selection()
+        self._on_selection_changed(changed)
+
+    def select_source_pins(self):
+        """
+        Adds every pin of the source file chosen in `self.source_combo` to the
+        selection (numbered in list order) through `apply_selection`.
+        """
+        source = self.source_combo.get()
+        if not source:
+            messagebox.showwarning("Sin Fuente", "Seleccione primero una fuente (archivo KMZ) de la lista.")
+            return
+        self.apply_selection(self.pins_data.source_indices(source), True)
 
     def update_ordering(self):
         """
         Updates the displayed order of selected pins and their marker colors.
 
         This method is typically called via `schedule_update_ordering` when pin
-        selection changes. It performs the following:
-        1.  Iterates through all `self.pins_data`:
-            -   If a pin is selected (`tk_var` is True) and doesn't have a `select_order`,
-                it assigns the current `self.order_counter` and increments the counter.
-            -   If a pin is not selected, `select_order` is set to `None`.
-        2.  Resets `self.order_counter` to 1 if no pins are currently selected, ensuring
-            the next selection sequence starts from 1.
-        3.  Creates a list of selected pins and sorts them by their `select_order`.
-        4.  Updates the text of each selected pin's checkbutton in the UI to show its
-            1-based order (e.g., "1. Pin Name").
-        5.  For any pin that is not selected or has its order cleared, its checkbutton
-            text is reset to its base name (without the order prefix).
-        6.  Calls `update_marker_color` for every pin to reflect its current selection
-            status on the map.
-        """
-        selected_pins_for_ordering = [] # List to hold pins that are currently selected
-        for pin in self.pins_data:
-            if pin["tk_var"].get(): # If the pin's checkbox is checked
-                # Assign an order number if it's newly selected in this sequence
-                if "select_order" not in pin or pin["select_order"] is None:
-                    pin["select_order"] = self.order_counter
-                    self.order_counter += 1
-                selected_pins_for_ordering.append(pin)
-            else:
-                # Clear order if pin is deselected
-                pin["select_order"] = None 
-
-        # If no pins are selected at all, reset the main order counter for the next selection sequence
-        if not any(p["tk_var"].get() for p in self.pins_data):
-            self.order_counter = 1
-        
-        # Sort the selected pins by their assigned order number for correct display
-        # Pins without a select_order (should not happen if selected) are put at the end
-        selected_pins_for_ordering.sort(key=lambda p: p.get("select_order", float('inf')))
-
-        # Update the text of the checkbuttons in the UI list
-        # For selected pins, prepend the order number (1-based from the sorted list)
-        for i, pin_ordered in enumerate(selected_pins_for_ordering):
-             if pin_ordered["tk_var"].get() and pin_ordered.get("select_order") is not None:
-                base_name = pin_ordered["name"]
-                order_prefix = f"{i + 1}. " # Display order is 1-based
-                # Ensure checkbox widget exists before trying to configure it
-                if "checkbox_widget" in pin_ordered and pin_ordered["checkbox_widget"].winfo_exists():
-                    pin_ordered["checkbox_widget"].config(text=order_prefix + base_name)
-
-        # Reset text for deselected pins and update marker colors for all pins
-        for pin in self.pins_data:
-            # If pin is not selected OR somehow its order was cleared but it's still marked as selected (cleanup)
-            if not pin["tk_var"].get() or pin.get("select_order") is None: 
-                if "checkbox_widget" in pin and pin["checkbox_widget"].winfo_exists():
-                     pin["checkbox_widget"].config(text=pin["name"]) # Reset to base name without order prefix
-            self.update_marker_color(pin) # Update marker color based on selection state
-
-    def update_marker_color(self, pin):
+        selection changes. Order numbers and ranks are maintained by `self.pins_data`
+        as pins are selected; this method only reflects them in the UI:
+        1.  Refreshes the visible rows of the list, so their "N. Pin Name" labels
+            pick up any renumbering (rows scrolled into view later are labelled then).
+        2.  Recolors, in place, the markers of the pins in `self.dirty_marker_indices`
+            (the pins whose selection changed) and empties the set.
+        The cost therefore depends on the number of changed pins and visible rows,
+        not on the number of loaded pins.
+        """
+        self.update_ordering_id = None
+        dirty = self.dirty_marker_indices
+        self.dirty_marker_indices = set()
+        with self.profiler.span(STAGE_ORDERING, markers=len(dirty)):
+            self.pin_list.render() # Only the visible rows are relabelled
+            for i in dirty:
+                self.update_marker_color(i)
+
+    def update_marker_color(self, index):
         """
         Updates the color of a specific pin's map marker based on its selection state.
 
-        -   Determines the `new_color` for the marker: `SELECTED_MARKER_COLOR` if the
-            pin's `tk_var` is True (selected), otherwise `DEFAULT_MARKER_COLOR`.
-        -   If the pin already has a `map_marker` object associated with it, that
-            existing marker is deleted from the map.
-        -   A new marker is created on the `self.map_widget` at the pin's coordinates
-            (`pin["coords_map"]`), using its name as text and the `new_color`.
-        -   The click command for this new marker is re-bound to `self._on_marker_click`
-            to ensure it remains interactive.
-        -   The reference to this new marker object is stored back in `pin["map_marker"]`,
-            replacing the old one.
+        The marker is recolored in place: its circle color is changed and, if the
+        marker is currently drawn, the fill of its circle item on the map canvas is
+        updated. The marker keeps its canvas items, text and click binding. Pins
+        inside a cluster have no marker; they get the right color when they are
+        drawn individually, and pins out of view when they are scrolled into it.
 
         Args:
-            pin: The pin dictionary from `self.pins_data`. This dictionary must
-                 contain `tk_var` (BooleanVar for selection state), `coords_map`
-                 (tuple of lat, lon), `name` (str), and `map_marker` (can be None
-                 or an existing marker object).
-        """
-        new_color = SELECTED_MARKER_COLOR if pin["tk_var"].get() else DEFAULT_MARKER_COLOR
-        # Delete the old marker if it exists
-        if "map_marker" in pin and pin["map_marker"]:
-            pin["map_marker"].delete() 
-        
-        # Create a new marker with the updated color and re-bind its click command
-        new_marker = self.map_widget.set_marker(
-            pin["coords_map"][0], # Latitude
-            pin["coords_map"][1], # Longitude
-            text=pin["name"],
-            marker_color_circle=new_color, # Set the circle color for the marker
-            command=lambda m, p=pin: self._on_marker_click(p) # Re-bind click command
-        )
-        pin["map_marker"] = new_marker # Store reference to the new marker
+            index: The index of the pin in `self.pins_data`.
+        """
+        new_color = self._marker_color(index)
+        marker = self.map_layer.pin_marker(index)
+        if marker is None or marker.marker_color_circle == new_color:
+            return
+        marker.marker_color_circle = new_color # Used by the marker the next time it is drawn
+        if marker.big_circle is not None: # Drawn right now: recolor the existing canvas item
+            self.map_widget.canvas.itemconfig(marker.big_circle, fill=new_color)
+
+    def _marker_color(self, index):
+        """Returns the circle color of a pin's marker: `SELECTED_MARKER_COLOR` if selected, else `DEFAULT_MARKER_COLOR`."""
+        return SELECTED_MARKER_COLOR if self.pins_data.is_selected(index) else DEFAULT_MARKER_COLOR
 
     def schedule_update_ordering(self):
         """
         Schedules a call to `self.update_ordering` to occur after a short delay (100ms).
 
-        This method is crucial for performance and UI responsiveness. When multiple
-        pins are selected or deselected rapidly (e.g., via Shift-click, "Select All",
-        or programmatic changes to `tk_var`), each change to a `tk_var` (due to the
-        trace) would normally trigger an immediate call to `update_ordering`.
-        This can lead to many redundant UI updates.
+        This method is crucial for performance and UI responsiveness. When pins are
+        selected or deselected rapidly (e.g., clicking several checkbuttons or markers
+        in a row), each change would otherwise trigger an immediate call to
+        `update_ordering`. This can lead to many redundant UI updates.
 
         By scheduling the update:
         -   If an update is already scheduled (`self.update_ordering_id` is not None),
@@ -993,55 +1464,212 @@ class KMZRouteApp(tkinter.Tk):
         Automatically creates routes by grouping all loaded pins by their 'source'
         (the name of the KMZ file they were loaded from).
 
-        -   It iterates through `self.pins_data` and groups pins based on the
-            `"source"` key in each pin's dictionary.
-        -   For each group (source file):
-            -   If the group contains fewer than two pins, it's skipped (a route needs at least two points).
-            -   A route name is generated based on the source file name (e.g., "Ruta example.kmz").
-            -   The pins within the group are used in the order they were originally loaded
-                from the KMZ file. If a specific order within the source is needed,
-                `pins_in_group` would need to be sorted here before coordinate extraction.
-            -   KML coordinates (`coords_original`) and map coordinates (`coords_map`) are
-                collected for the pins in the group.
-            -   `DEFAULT_ROUTE_COLOR_INTERNAL` is used as the color for these automatic routes.
-            -   The new route data (name, KML coordinates, color) is appended to `self.routes_data`.
-            -   A path is drawn on the `self.map_widget` for the new route, and its reference
-                is stored in `self.map_paths`.
-            -   A counter for created routes is incremented.
-        -   Finally, a message box displays the total number of automatic routes created.
-        """
-        groups = {} # Dictionary to store pins grouped by their source KMZ file
-        for pin in self.pins_data:
-            src = pin.get("source", "Sin Fuente") # Get source, default if missing
-            groups.setdefault(src, []).append(pin) # Add pin to its source group
-        
-        routes_created_count = 0 
-        for src, pins_in_group in groups.items(): # Iterate through each source and its pins
-            if len(pins_in_group) < 2: # Need at least two pins to form a route
-                continue 
-            
-            route_name = f"Ruta {src}" # Default name for auto-generated route
-            
-            # Pins are used in the order they were originally extracted from the KML.
-            # If a specific order is needed (e.g., by name or original KML order if not preserved),
-            # pins_in_group should be sorted here before extracting coordinates.
-            route_kml_coords = [p["coords_original"] for p in pins_in_group]
-            map_coords_list = [p["coords_map"] for p in pins_in_group]
-            
-            route_color_for_auto_route = DEFAULT_ROUTE_COLOR_INTERNAL # Use default color
-            
-            # Store route data
+        -   `source_groups` (in `kmz_core.routes`) groups the pins of `self.pins_data` by
+            their source id with a single vectorized sort and makes one route per group
+            (source file) named after it (e.g., "Ruta example.kmz"), skipping groups with
+            fewer than two pins. The pins of each route keep the order in which they were
+            loaded from the KMZ file, unless "Optimizar orden de paradas" is checked: then
+            `order_routes` reorders them to shorten the route, keeping the first pin
+            as the start, and the total length before and after is reported. The
+            optimization runs in a `TaskWorker` thread on copies of the pin coordinates,
+            with one time budget for all the routes, so the window stays responsive.
+        -   `_add_source_routes` appends the routes to `self.routes_data` in
+            `DEFAULT_ROUTE_COLOR_INTERNAL`, adds their paths to `self.map_layer` in one
+            batch and displays the number of automatic routes created.
+        """
+        # (route name, pin indices) for each source KMZ file, in order of first appearance
+        groups = source_groups(self.pins_data)
+        # Copies, so loading or clearing pins while the optimization runs cannot change them
+        pins = (self.pins_data.lat.copy(), self.pins_data.lon.copy(), self.pins_data.alt.copy())
+        if not self.optimize_routes_var.get(): # Nothing slow to do
+            self._add_source_routes(self._build_source_routes(*pins, groups, False))
+            return
+        worker = TaskWorker(self._build_source_routes, *pins, groups, True)
+        self._start_background_task(worker, self._add_source_routes, "Error al Optimizar Rutas")
+
+    def _build_source_routes(self, lat, lon, alt, groups, optimize):
+        """
+        Orders the routes of `create_routes_from_all` (with `order_routes` if `optimize`)
+        and builds their coordinates. May run in a `TaskWorker` thread, so it only uses
+        its arguments and the (thread-safe) profiler.
+
+        Returns:
+            (routes, source_routes): a `(name, kml_coords, map coordinates)` tuple
+            per route, in order, and the `SourceRoutes` with the total lengths
+            before and after optimizing (both 0 when not optimized).
+        """
+        with self.profiler.span(STAGE_ROUTE_BUILD, optimize=optimize):
+            source_routes = order_routes(lat, lon, groups) if optimize else SourceRoutes(groups, 0.0, 0.0)
+            routes = [
+                (name, list(zip(lon[group].tolist(), lat[group].tolist(), alt[group].tolist())),
+                 list(zip(lat[group].tolist(), lon[group].tolist())))
+                for name, group in source_routes.routes
+            ]
+        return routes, source_routes
+
+    def _add_source_routes(self, result):
+        """Adds the routes made by `_build_source_routes` to `self.routes_data` and the map, and reports them."""
+        routes, source_routes = result
+        color = DEFAULT_ROUTE_COLOR_INTERNAL # Use default color
+        self.routes_data.extend({"name": name, "kml_coords": kml_coords, "color": color}
+                                for name, kml_coords, _ in routes)
+        self.map_layer.add_paths((map_coords, {"color": color, "width": 3}) for _, _, map_coords in routes)
+        self.refresh_routes_panel()
+
+        message = f"Se crearon {len(routes)} rutas automáticas."
+        if source_routes.length_before and routes:
+            message += f"\nLongitud total: {source_routes.length_before / 1000:.1f} km antes de optimizar, {source_routes.length_after / 1000:.1f} km después."
+        messagebox.showinfo("Rutas Automáticas", message)
+
+    def split_pins_into_routes(self):
+        """
+        Splits all loaded pins into several routes, whatever their source file.
+
+        The options of the "Dividir en Rutas" panel are passed to `split_into_routes`:
+        the number of routes, the partitioning method (balanced k-means or angular
+        sweep) and the optional limits of stops and kilometers per route, which
+        create more routes when needed. The split runs in a `TaskWorker` thread on
+        copies of the pin coordinates (`_split_in_background`), so the window stays
+        responsive; `_add_split_routes` then adds each route to `self.routes_data`
+        and draws it on the map in its own color from `SPLIT_ROUTE_COLORS`.
+        """
+        if len(self.pins_data) < 2:
+            messagebox.showinfo("Sin Pines", "Se necesitan al menos dos pines para crear rutas.")
+            return
+        try:
+            route_count = int(self.split_count_spinbox.get())
+            max_stops_text = self.split_max_stops_entry.get().strip()
+            max_stops = int(max_stops_text) if max_stops_text else None
+            max_km_text = self.split_max_km_entry.get().strip().replace(",", ".")
+            max_km = float(max_km_text) if max_km_text else None
+            if route_count < 1 or (max_stops is not None and max_stops < 2) or (max_km is not None and max_km <= 0):
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Valor Inválido", "El número de rutas debe ser un entero positivo, las paradas máximas un entero mayor que 1 y los km máximos un número positivo.")
+            return
+        method = SPLIT_METHODS.get(self.split_method_combo.get(), SPLIT_KMEANS)
+
+        # Copies, so loading or clearing pins while the split runs cannot change them
+        pins = (self.pins_data.lat.copy(), self.pins_data.lon.copy(), self.pins_data.alt.copy())
+        worker = TaskWorker(self._split_in_background, *pins, route_count, method, max_stops,
+                            max_km * 1000 if max_km else None)
+        self._start_background_task(worker, self._add_split_routes, "Error al Dividir en Rutas")
+
+    def _split_in_background(self, lat, lon, alt, route_count, method, max_stops, max_length_m):
+        """
+        Splits pins into routes with `split_into_routes`. Runs in a `TaskWorker`
+        thread, so it only uses its arguments and the (thread-safe) profiler.
+
+        Returns:
+            (routes, pin count): a `(kml_coords, map coordinates, length in meters)`
+            tuple per route, in route order, and the number of pins split.
+        """
+        with self.profiler.span(STAGE_ROUTE_BUILD, routes=route_count, method=method):
+            groups = split_into_routes(lat, lon, route_count, method=method, max_stops=max_stops,
+                                       max_length_m=max_length_m)
+            routes = [
+                (list(zip(lon[group].tolist(), lat[group].tolist(), alt[group].tolist())),
+                 list(zip(lat[group].tolist(), lon[group].tolist())),
+                 path_length(lat[group], lon[group]))
+                for group in groups
+            ]
+        return routes, len(lat)
+
+    def _add_split_routes(self, result):
+        """Adds the routes made by `_split_in_background` to `self.routes_data` and the map, and reports them."""
+        routes, pin_count = result
+        first_number = len(self.routes_data) + 1
+        paths = []
+        for number, (kml_coords, map_coords, _) in enumerate(routes):
+            color = SPLIT_ROUTE_COLORS[number % len(SPLIT_ROUTE_COLORS)]
             self.routes_data.append({
-                "name": route_name,
-                "kml_coords": route_kml_coords,
-                "color": route_color_for_auto_route 
+                "name": f"Ruta-{first_number + number}",
+                "kml_coords": kml_coords,
+                "color": color
             })
-            # Draw route on map
-            map_path = self.map_widget.set_path(map_coords_list, color=route_color_for_auto_route, width=3)
-            self.map_paths.append(map_path)
-            routes_created_count += 1
-            
-        messagebox.showinfo("Rutas Automáticas", f"Se crearon {routes_created_count} rutas automáticas.")
+            paths.append((map_coords, {"color": color, "width": 3}))
+        self.map_layer.add_paths(paths)
+        self.refresh_routes_panel()
+        total_length = sum(length for _, _, length in routes) # Meters
+
+        messagebox.showinfo("Rutas Divididas", f"Se crearon {len(routes)} rutas con {pin_count} pines ({total_length / 1000:.1f} km en total).")
+
+    def _start_background_task(self, worker, on_done, error_title, error_text="Ocurrió un error"):
+        """
+        Starts a background task and polls its queue until it finishes. Only one task
+        runs at a time; while one runs, starting another only informs the user.
+
+        Args:
+            worker: A not yet started `TaskWorker`.
+            on_done: Called on the Tk thread with the task's result.
+            error_title: Title of the error message shown if the task raises.
+            error_text: Text of that message, followed by the exception.
+        """
+        if self.task_worker is not None:
+            messagebox.showinfo("Operación en Curso", "Espere a que termine la operación en curso.")
+            return
+        self.task_worker = worker
+        self.task_handler = (on_done, error_title, error_text)
+        self.configure(cursor="watch")
+        worker.start()
+        self.task_poll_id = self.after(TASK_POLL_INTERVAL_MS, self._poll_background_task)
+
+    def _poll_background_task(self):
+        """Hands the result of the background task to its callback once it finishes. Runs on the Tk mainloop."""
+        self.task_poll_id = None
+        worker = self.task_worker
+        if worker is None: # Task was discarded
+            return
+        messages = drain_messages(worker.messages, 1)
+        if not messages:
+            self.task_poll_id = self.after(TASK_POLL_INTERVAL_MS, self._poll_background_task)
+            return
+        on_done, error_title, error_text = self.task_handler
+        self._abort_background_task()
+        kind, payload = messages[0]
+        if kind == TASK_ERROR:
+            messagebox.showerror(error_title, f"{error_text}: {payload}")
+        else:
+            on_done(payload)
+
+    def _abort_background_task(self):
+        """Stops waiting for the background task, if any; its result is discarded when it finishes."""
+        self.task_worker = None
+        self.task_handler = None
+        if self.task_poll_id is not None:
+            self.after_cancel(self.task_poll_id)
+            self.task_poll_id = None
+        self.configure(cursor="")
+
+    def _refresh_status_bar(self):
+        """
+        Shows the stage timings of `self.profiler` in the status bar when new ones
+        were recorded (by this thread or a loader), then schedules the next check.
+        """
+        if self.profiler.version != self.status_version:
+            self.status_version = self.profiler.version
+            self.status_label.configure(text=self.profiler.summary())
+        self.after(STATUS_POLL_INTERVAL_MS, self._refresh_status_bar)
+
+    def refresh_routes_panel(self):
+        """
+        Shows the routes of `self.routes_data` and their metrics in the routes panel.
+        Metrics come from `self.route_metrics`, so only new or changed routes are measured.
+        """
+        self.routes_panel.show(self.routes_data, self.route_metrics.metrics(self.routes_data))
+
+    def _zoom_to_route(self, number):
+        """Fits the map to the bounding box of route `number` of `self.routes_data`."""
+        if number >= len(self.routes_data):
+            return
+        bounds = self.route_metrics.metrics(self.routes_data)[number].bounds
+        if bounds is None:
+            return
+        min_lon, min_lat, max_lon, max_lat = bounds
+        if min_lat == max_lat or min_lon == max_lon: # A bounding box cannot be fitted to a point or a straight line
+            self.map_widget.set_position((min_lat + max_lat) / 2, (min_lon + max_lon) / 2)
+        else:
+            self.map_widget.fit_bounding_box((max_lat, min_lon), (min_lat, max_lon))
 
     def on_color_change(self, event):
         """
@@ -1059,8 +1687,7 @@ class KMZRouteApp(tkinter.Tk):
                    used in this method's logic.
         """
         # Check if any pins are currently selected
-        selected_pins = [pin for pin in self.pins_data if pin["tk_var"].get()]
-        if selected_pins: # Only proceed if there's a selection
+        if self.pins_data.selected_count() > 0: # Only proceed if there's a selection
             # Create a route using the current selection and the newly chosen color (which is already set in the combobox)
             self.create_route_from_selection()
             # Deselect all pins after the route is created for convenience
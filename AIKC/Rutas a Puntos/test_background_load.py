@@ -0,0 +1,166 @@
+import unittest
+import sys
+import os
+import queue
+import tempfile
+import zipfile
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.background_load import (
+    KMZLoadWorker, drain_messages,
+    LOAD_BATCH, LOAD_CACHED, LOAD_DONE, LOAD_CANCELLED, LOAD_FILE, LOAD_LINES, LOAD_NO_KML, LOAD_ERROR,
+)
+from kmz_core.instrumentation import Profiler, STAGE_LOAD, STAGE_UNZIP, STAGE_XML_PARSE, STAGE_EXTRACTION
+from kmz_core.kmz_members import member_sources
+from kmz_core.parse_cache import ParseCache
+from test_kmz_members import write_layered_kmz
+
+
+def write_kmz(path, num_pins, malformed=0, kml_name="doc.kml", lines=0):
+    placemarks = "".join(
+        f"<Placemark><name>P{i}</name><Point><coordinates>{i},{-i},0</coordinates></Point></Placemark>"
+        for i in range(num_pins)
+    )
+    placemarks += "<Placemark><name>X</name><Point><coordinates>a,b</coordinates></Point></Placemark>" * malformed
+    placemarks += "".join(
+        f"<Placemark><name>L{i}</name><LineString><coordinates>0,0 {i},1,5</coordinates></LineString></Placemark>"
+        for i in range(lines)
+    )
+    kml = f'<kml xmlns="http://www.opengis.net/kml/2.2"><Document>{placemarks}</Document></kml>'
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as kmz:
+        kmz.writestr(kml_name, kml)
+
+
+def collect(worker):
+    worker.start()
+    worker.join(timeout=10)
+    messages = []
+    while True:
+        try:
+            messages.append(worker.messages.get_nowait())
+        except queue.Empty:
+            return messages
+
+
+class TestKMZLoadWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "test.kmz")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_posts_batches_then_done(self):
+        write_kmz(self.path, 25, malformed=2)
+        messages = collect(KMZLoadWorker(self.path, batch_size=10, flush_interval=60))
+
+        batches = [payload for kind, payload in messages if kind == LOAD_BATCH]
+        self.assertEqual([len(pins) for pins, _ in batches], [10, 10, 5])
+        self.assertEqual(batches[0][0][0], ("P0", (0.0, -0.0, 0.0)))
+        progress = [p for _, p in batches]
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], 1.0)
+        self.assertEqual(messages[-1], (LOAD_DONE, 2))
+
+    def test_cancel_stops_early(self):
+        write_kmz(self.path, 1000)
+        worker = KMZLoadWorker(self.path, batch_size=10, flush_interval=60)
+        worker.cancel()
+        messages = collect(worker)
+
+        self.assertEqual(messages[-1], (LOAD_CANCELLED, 0))
+        delivered = sum(len(payload[0]) for kind, payload in messages if kind == LOAD_BATCH)
+        self.assertLess(delivered, 1000)
+
+    def test_second_load_comes_from_the_cache(self):
+        write_kmz(self.path, 25, malformed=2)
+        cache = ParseCache(os.path.join(self.tmpdir.name, "cache"))
+        first = collect(KMZLoadWorker(self.path, batch_size=10, flush_interval=60, cache=cache))
+        second = collect(KMZLoadWorker(self.path, cache=cache))
+
+        self.assertEqual(first[-1], (LOAD_DONE, 2))
+        self.assertEqual([kind for kind, _ in second], [LOAD_CACHED, LOAD_DONE])
+        source, cached = second[0][1]
+        self.assertEqual(source, "test.kmz")
+        self.assertEqual(len(cached.coords), 25)
+        self.assertEqual(tuple(cached.coords[3]), (3.0, -3.0, 0.0))
+        self.assertEqual(second[-1], (LOAD_DONE, 2))
+
+    def test_line_geometries_are_posted_and_cached(self):
+        write_kmz(self.path, 3, lines=2)
+        cache = ParseCache(os.path.join(self.tmpdir.name, "cache"))
+        messages = collect(KMZLoadWorker(self.path, cache=cache))
+
+        self.assertEqual([kind for kind, _ in messages], [LOAD_BATCH, LOAD_LINES, LOAD_DONE])
+        lines = messages[1][1]
+        self.assertEqual([name for name, _ in lines], ["L0", "L1"])
+        self.assertEqual(lines[1][1].tolist(), [[0, 0, 0], [1, 1, 5]])
+
+        source, cached = collect(KMZLoadWorker(self.path, cache=cache))[0][1]
+        self.assertEqual([(name, coords.tolist()) for name, coords in cached.lines],
+                         [(name, coords.tolist()) for name, coords in lines])
+
+    def test_other_kml_members_follow_the_root(self):
+        write_layered_kmz(self.path)
+        cache = ParseCache(os.path.join(self.tmpdir.name, "cache"))
+        messages = collect(KMZLoadWorker(self.path, cache=cache))
+
+        self.assertEqual([kind for kind, _ in messages], [LOAD_BATCH, LOAD_FILE, LOAD_FILE, LOAD_DONE])
+        self.assertEqual([name for name, _ in messages[0][1][0]], ["R0", "R1"])
+        files = [payload for _, payload in messages[1:3]]
+        self.assertEqual([result.source for result in files], ["test.kmz/capas/cables.kml", "test.kmz/capas/postes.xml"])
+        self.assertEqual([len(result.names) for result in files], [3, 4])
+        self.assertEqual(messages[-1], (LOAD_DONE, 1))
+
+        # The cached entry keeps the pins of each member apart
+        source, cached = collect(KMZLoadWorker(self.path, cache=cache))[0][1]
+        self.assertEqual(member_sources(source, cached.members, len(cached.coords)),
+                         [("test.kmz", 0, 2), ("test.kmz/capas/cables.kml", 2, 5), ("test.kmz/capas/postes.xml", 5, 9)])
+
+    def test_cancelled_load_is_not_cached(self):
+        write_kmz(self.path, 100)
+        cache = ParseCache(os.path.join(self.tmpdir.name, "cache"))
+        worker = KMZLoadWorker(self.path, batch_size=10, flush_interval=60, cache=cache)
+        worker.cancel()
+        collect(worker)
+        self.assertIsNone(cache.get(cache.key(self.path)))
+
+    def test_load_stages_are_recorded(self):
+        write_kmz(self.path, 25)
+        profiler = Profiler()
+        collect(KMZLoadWorker(self.path, profiler=profiler))
+
+        load = profiler.last[STAGE_LOAD]
+        self.assertEqual(load.args, {"file": "test.kmz"})
+        stages = [profiler.last[name] for name in (STAGE_UNZIP, STAGE_XML_PARSE, STAGE_EXTRACTION)]
+        self.assertEqual(stages[1].start_ns, stages[0].start_ns + stages[0].duration_ns)  # Consecutive spans
+        self.assertLessEqual(sum(span.duration_ns for span in stages), load.duration_ns)
+        self.assertGreater(stages[2].duration_ns, 0)
+
+    def test_no_kml_member(self):
+        with zipfile.ZipFile(self.path, "w") as kmz:
+            kmz.writestr("readme.txt", "sin kml")
+        self.assertEqual(collect(KMZLoadWorker(self.path)), [(LOAD_NO_KML, None)])
+
+    def test_invalid_file_reports_error(self):
+        with open(self.path, "wb") as f:
+            f.write(b"no es un zip")
+        messages = collect(KMZLoadWorker(self.path))
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0][0], LOAD_ERROR)
+        self.assertIsInstance(messages[0][1], zipfile.BadZipFile)
+
+    def test_drain_messages_limit(self):
+        q = queue.Queue()
+        for i in range(5):
+            q.put((LOAD_BATCH, i))
+        self.assertEqual(len(drain_messages(q, 3)), 3)
+        self.assertEqual(len(drain_messages(q, 3)), 2)
+        self.assertEqual(drain_messages(q, 3), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import sys
+import os
+import queue
+import tempfile
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.background_load import LOAD_CACHED, LOAD_DONE
+from kmz_core.batch_load import KMZBatchLoadWorker, parse_kmz_file, LOAD_FILE
+from kmz_core.instrumentation import Profiler, STAGE_EXTRACTION
+from kmz_core.parse_cache import ParseCache
+from test_background_load import write_kmz
+from test_kmz_members import write_layered_kmz
+
+
+def run_worker(worker):
+    worker.start()
+    worker.join(timeout=60)
+    messages = []
+    while True:
+        try:
+            messages.append(worker.messages.get_nowait())
+        except queue.Empty:
+            return messages
+
+
+class TestBatchLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_parse_kmz_file_compact_result(self):
+        path = self._path("ruta.kmz")
+        write_kmz(path, 3, malformed=1)
+        result = parse_kmz_file(path)
+
+        self.assertEqual(result.source, "ruta.kmz")
+        self.assertIsNone(result.error)
+        self.assertEqual(result.error_count, 1)
+        self.assertEqual(result.names, ["P0", "P1", "P2"])
+        self.assertEqual(list(result.coords), [0.0, 0.0, 0.0, 1.0, -1.0, 0.0, 2.0, -2.0, 0.0])
+
+    def test_parse_kmz_file_reads_every_member(self):
+        path = self._path("capas.kmz")
+        write_layered_kmz(path)
+        result = parse_kmz_file(path)
+
+        self.assertIsNone(result.error)
+        self.assertEqual(result.names, ["R0", "R1", "C0", "C1", "C2", "P0", "P1", "P2", "P3"])
+        self.assertEqual(len(result.coords), 27)
+        self.assertEqual(result.members, [("doc.kml", 2), ("capas/cables.kml", 3), ("capas/postes.xml", 4)])
+        self.assertEqual(result.error_count, 1)
+
+        write_kmz(self._path("ruta.kmz"), 2)
+        self.assertIsNone(parse_kmz_file(self._path("ruta.kmz")).members)  # A single member needs no split
+
+    def test_parse_kmz_file_reports_failures(self):
+        path = self._path("roto.kmz")
+        with open(path, "wb") as f:
+            f.write(b"no es un zip")
+        result = parse_kmz_file(path)
+
+        self.assertEqual(result.source, "roto.kmz")
+        self.assertEqual(result.names, [])
+        self.assertIsNotNone(result.error)
+
+    def test_worker_posts_one_result_per_file_in_order(self):
+        paths = []
+        for i, count in enumerate([4, 0, 2]):
+            paths.append(self._path(f"f{i}.kmz"))
+            write_kmz(paths[-1], count, malformed=i)
+
+        messages = run_worker(KMZBatchLoadWorker(paths, max_workers=2))
+
+        self.assertEqual([kind for kind, _ in messages], [LOAD_FILE, LOAD_FILE, LOAD_FILE, LOAD_DONE])
+        self.assertEqual([payload.source for _, payload in messages[:3]], ["f0.kmz", "f1.kmz", "f2.kmz"])
+        self.assertEqual([len(payload.names) for _, payload in messages[:3]], [4, 0, 2])
+        self.assertEqual(messages[-1], (LOAD_DONE, 3))
+
+    def test_stage_times_of_worker_processes_are_recorded(self):
+        paths = [self._path("a.kmz"), self._path("b.kmz")]
+        write_kmz(paths[0], 4)
+        write_kmz(paths[1], 2)
+        profiler = Profiler()
+        messages = run_worker(KMZBatchLoadWorker(paths, max_workers=1, profiler=profiler))
+
+        self.assertEqual(sorted(messages[0][1].timing[1]), ["extraction", "unzip", "xml_parse"])
+        self.assertEqual(profiler.last[STAGE_EXTRACTION].args, {"file": "b.kmz"})
+
+    def test_cached_files_are_not_parsed_again(self):
+        paths = [self._path("a.kmz"), self._path("b.kmz")]
+        write_kmz(paths[0], 4, malformed=1)
+        write_kmz(paths[1], 2)
+        cache = ParseCache(self._path("cache"))
+        cache.put(cache.key(paths[1]), ["X", "Y"], [(1, 2, 0), (3, 4, 0)], 0)
+
+        messages = run_worker(KMZBatchLoadWorker(paths, max_workers=1, cache=cache))
+        self.assertEqual([kind for kind, _ in messages], [LOAD_FILE, LOAD_CACHED, LOAD_DONE])
+        self.assertEqual(messages[1][1][0], "b.kmz")
+        self.assertEqual(messages[-1], (LOAD_DONE, 1))
+
+        # The worker process stored the parsed file
+        messages = run_worker(KMZBatchLoadWorker(paths, max_workers=1, cache=cache))
+        self.assertEqual([kind for kind, _ in messages], [LOAD_CACHED, LOAD_CACHED, LOAD_DONE])
+        self.assertEqual(len(messages[0][1][1].coords), 4)
+        self.assertEqual(messages[-1], (LOAD_DONE, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
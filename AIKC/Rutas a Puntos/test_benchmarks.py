@@ -0,0 +1,62 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmarks.run_benchmarks import STAGES, compare, make_app, parse_kml, read_kml, read_pins, run_size
+from benchmarks.synthetic_kmz import write_synthetic_kmz
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.synthetic = write_synthetic_kmz(os.path.join(cls.tmpdir.name, "sintetico.kmz"), 2500, seed=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def test_synthetic_file_counts_match_both_loaders(self):
+        names, coords, error_count, lines = read_pins(self.synthetic.path)
+        self.assertEqual(len(names), self.synthetic.pin_count)
+        self.assertEqual(len(lines), self.synthetic.line_count)
+        self.assertEqual(error_count, self.synthetic.malformed_count)
+        self.assertGreater(error_count, 0)
+        self.assertLess(self.synthetic.pin_count, self.synthetic.placemark_count)  # Some Placemarks have no Point
+        self.assertIn("Pin sin nombre", names)
+
+        app = make_app("sintetico.kmz")
+        app._extract_placemarks_from_lxml_tree(parse_kml(self.synthetic.path))
+        self.assertEqual(app.pins_data.names(), names)
+        self.assertEqual(app.extraction_error_count, error_count)
+        self.assertEqual(len(app.routes_data), len(lines))
+
+        app = make_app("sintetico.kmz")
+        app._add_imported_lines(lines)  # Added to the map in one batch
+        self.assertEqual(len(app.routes_data), self.synthetic.line_count)
+        self.assertEqual(len(app.map_layer.paths), self.synthetic.line_count)
+
+    def test_synthetic_file_is_reproducible(self):
+        again = write_synthetic_kmz(os.path.join(self.tmpdir.name, "otra.kmz"), 2500, seed=3)
+        self.assertEqual(read_kml(again.path), read_kml(self.synthetic.path))
+
+    def test_every_stage_is_measured(self):
+        results = run_size(self.synthetic.path)
+        self.assertEqual(list(results), list(STAGES))
+        for stage in STAGES:
+            self.assertGreaterEqual(results[stage]["seconds"], 0.0)
+            self.assertGreater(results[stage]["peak_bytes"], 0, stage)
+        report = json.loads(json.dumps({"results": {"2500": results}}))
+        lines = compare(report, report)
+        self.assertEqual(len(lines), len(STAGES) + 1)
+        self.assertTrue(all(line.split()[4] == "1.00" for line in lines[1:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import sys
+import os
+import io
+import subprocess
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.mock import patch
+
+from lxml import etree
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core import routes
+from kmz_core.cli import main, find_kmz_files
+from kmz_core.kml_stream import KML_NS
+from test_background_load import write_kmz
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.kmz_dir = os.path.join(self.tmpdir.name, "kmz")
+        os.makedirs(os.path.join(self.kmz_dir, "sub"))
+        write_kmz(os.path.join(self.kmz_dir, "b.kmz"), 4, malformed=1)
+        write_kmz(os.path.join(self.kmz_dir, "a.kmz"), 3)
+        write_kmz(os.path.join(self.kmz_dir, "sub", "c.kmz"), 2)
+        self.output = os.path.join(self.tmpdir.name, "rutas.kml")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _run(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        with redirect_stdout(out), redirect_stderr(err):
+            status = main([self.kmz_dir, "-o", self.output, "--workers", "1", "--no-cache", *args])
+        return status, out.getvalue(), err.getvalue()
+
+    def _saved_routes(self):
+        tree = etree.parse(self.output)
+        return [(placemark.findtext(f"{KML_NS}name"), len(placemark.findtext(f".//{KML_NS}coordinates").split()))
+                for placemark in tree.iter(f"{KML_NS}Placemark")]
+
+    def test_find_kmz_files(self):
+        names = [os.path.relpath(path, self.kmz_dir) for path in find_kmz_files(self.kmz_dir, recursive=True)]
+        self.assertEqual(names, ["a.kmz", "b.kmz", os.path.join("sub", "c.kmz")])
+        self.assertEqual(len(find_kmz_files(self.kmz_dir)), 2)
+
+    def test_one_route_per_file(self):
+        status, out, _ = self._run("--recursive")
+        self.assertEqual(status, 0)
+        self.assertIn("Se cargaron 9 pines de 3 archivos.", out)
+        self.assertIn("Se omitieron 1 pines", out)
+        self.assertEqual(self._saved_routes(), [("Ruta a.kmz", 3), ("Ruta b.kmz", 4), ("Ruta c.kmz", 2)])
+
+    def test_split_into_routes(self):
+        status, _, _ = self._run("--split", "2")
+        self.assertEqual(status, 0)
+        routes = self._saved_routes()
+        self.assertEqual([name for name, _ in routes], ["Ruta-1", "Ruta-2"])
+        self.assertEqual(sum(count for _, count in routes), 7)
+
+    def test_split_never_makes_one_stop_routes(self):
+        status, out, _ = self._run("--split", "6")  # 7 pins: at most 3 routes of two or more stops
+        self.assertEqual(status, 0)
+        routes = self._saved_routes()
+        self.assertIn(f"Se guardaron {len(routes)} rutas", out)
+        self.assertEqual(len(routes), 3)
+        self.assertTrue(all(count >= 2 for _, count in routes))
+        self.assertEqual(sum(count for _, count in routes), 7)
+
+    def test_optimize_is_capped(self):
+        # b.kmz (4 pins) is above the cap: it follows a Hilbert curve instead of getting a distance matrix
+        with patch.object(routes, "OPTIMIZE_MAX_STOPS", 3), \
+             patch.object(routes, "optimize_route", wraps=routes.optimize_route) as optimize:
+            status, _, _ = self._run("--optimize")
+        self.assertEqual(status, 0)
+        self.assertEqual([len(lat) for (lat, _), _ in optimize.call_args_list], [3])
+        self.assertEqual(self._saved_routes(), [("Ruta a.kmz", 3), ("Ruta b.kmz", 4)])
+
+    def test_errors(self):
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main([os.path.join(self.tmpdir.name, "no-existe")])
+        for option in (["--max-stops", "3"], ["--max-km", "5"],  # Only meaningful with --split
+                       ["-o", os.path.join(self.tmpdir.name, "rutas.gpx")]):  # Only KML or KMZ are written
+            with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                main([self.kmz_dir, *option])
+        status, _, err = self._run("--roads", os.path.join(self.tmpdir.name, "no-existe.geojson"))
+        self.assertEqual(status, 1)
+        self.assertIn("Error:", err)
+        self.assertFalse(os.path.exists(self.output))
+
+    def test_runs_without_tk_and_imports_lazily(self):
+        script = (
+            "import sys; sys.path.insert(0, sys.argv[1]); import kmz_core.cli;"
+            "assert 'numpy' not in sys.modules and 'lxml' not in sys.modules;"
+            "status = kmz_core.cli.main([sys.argv[2], '-o', sys.argv[3], '--workers', '1', '--no-cache']);"
+            "assert 'tkinter' not in sys.modules; sys.exit(status)"
+        )
+        result = subprocess.run([sys.executable, "-c", script, HERE, self.kmz_dir, self.output],
+                                capture_output=True, text=True, env={**os.environ, "DISPLAY": ""})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(len(self._saved_routes()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.clustering import GridClusterIndex, project_to_world, world_to_latlon
+
+
+class TestGridClusterIndex(unittest.TestCase):
+
+    def setUp(self):
+        # Two dense groups far apart plus one isolated pin
+        self.lat = np.array([-25.0, -25.0001, -25.0002, 10.0, 10.0001, 40.0])
+        self.lon = np.array([-57.0, -57.0001, -57.0002, 20.0, 20.0001, -3.0])
+        self.index = GridClusterIndex(max_cluster_zoom=17)
+        self.index.extend(self.lat[:4], self.lon[:4])
+        self.index.extend(self.lat[4:], self.lon[4:])
+
+    def test_projection_round_trip(self):
+        x, y = project_to_world(self.lat, self.lon)
+        self.assertTrue(((x >= 0) & (x < 1) & (y >= 0) & (y < 1)).all())
+        lat, lon = world_to_latlon(x, y)
+        np.testing.assert_allclose(lat, self.lat)
+        np.testing.assert_allclose(lon, self.lon)
+
+    def test_dense_groups_cluster_at_low_zoom(self):
+        level = self.index.level(5)
+        cells = level.cluster_cells()
+        self.assertEqual(sorted(level.counts[cells].tolist()), [2, 3])
+        self.assertEqual(level.single_pins().tolist(), [5])
+        members = [sorted(level.members(cell).tolist()) for cell in cells]
+        self.assertIn([0, 1, 2], members)
+        self.assertIn([3, 4], members)
+        first = cells[level.counts[cells] == 3][0]
+        self.assertAlmostEqual(level.lat[first], -25.0001, places=4)
+        self.assertAlmostEqual(level.lon[first], -57.0001, places=4)
+
+    def test_clusters_split_when_zooming_in(self):
+        index = GridClusterIndex(max_cluster_zoom=17)
+        index.extend([0.0, 0.0], [0.0, 0.01]) # ~1 km apart
+        self.assertEqual(len(index.level(8).cluster_cells()), 1)
+        self.assertEqual(index.level(14).single_pins().tolist(), [0, 1])
+        self.assertIsNone(index.level(18)) # Past the last clustered level
+
+    def test_levels_are_cached_until_pins_are_added(self):
+        level = self.index.level(5)
+        self.assertIs(self.index.level(5), level)
+        self.index.extend([40.00001], [-3.00001])
+        self.assertIsNot(self.index.level(5), level)
+        self.assertEqual(self.index.level(5).single_pins().tolist(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import csv
+import io
+import json
+import tempfile
+
+from lxml import etree
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core import export
+from kmz_core.export import export_pins, export_routes, EXPORT_FORMATS, write_geojson_pins
+from kmz_core.pin_store import PinStore
+from test_flatgeobuf import read_flatgeobuf, read_feature
+
+GPX = "{http://www.topografix.com/GPX/1/1}"
+
+ROUTES = [
+    {"name": "Ruta <1>", "color": "red", "kml_coords": [(-57.5, -25.25, 0.0), (-57.4, -25.2, 12.5)]},
+    {"name": "Ruta 2", "color": "#e6b04b", "kml_coords": [(1.0, 2.0, 0.0), (3.0, 4.0, 0.0), (5.0, 6.0, 0.0)]},
+]
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.pins = PinStore()
+        self.pins.extend(["A & B", "Ñandú", 'Con "comillas", y coma'], [(-57.5, -25.25, 10.0), (-57.4, -25.2, 0.0), (1.0, 2.0, 0.0)], "a.kmz")
+        self.pins.append("D", (3.0, 4.0, 0.0), "b.kmz")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_geojson(self):
+        export_pins(self.path("pines.geojson"), self.pins)
+        export_routes(self.path("rutas.geojson"), ROUTES)
+        with open(self.path("pines.geojson"), encoding="utf-8") as geojson_file:
+            pins = json.load(geojson_file)
+        self.assertEqual(len(pins["features"]), 4)
+        self.assertEqual(pins["features"][1]["properties"], {"name": "Ñandú", "source": "a.kmz"})
+        self.assertEqual(pins["features"][0]["geometry"], {"type": "Point", "coordinates": [-57.5, -25.25, 10.0]})
+        with open(self.path("rutas.geojson"), encoding="utf-8") as geojson_file:
+            routes = json.load(geojson_file)
+        self.assertEqual(routes["features"][1]["geometry"]["coordinates"], [[1.0, 2.0, 0.0], [3.0, 4.0, 0.0], [5.0, 6.0, 0.0]])
+        self.assertEqual(routes["features"][0]["properties"], {"name": "Ruta <1>", "color": "red"})
+
+    def test_geojson_precision_and_chunks(self):
+        output = io.BytesIO()
+        with patch.object(export, "EXPORT_CHUNK", 3):
+            write_geojson_pins(output, self.pins, precision=2)
+        pins = json.loads(output.getvalue())
+        self.assertEqual([feature["geometry"]["coordinates"][:2] for feature in pins["features"]],
+                         [[-57.5, -25.25], [-57.4, -25.2], [1.0, 2.0], [3.0, 4.0]])
+        self.assertIn(b"[-57.50,-25.25,10.00]", output.getvalue())
+
+    def test_gpx(self):
+        export_pins(self.path("pines.gpx"), self.pins)
+        export_routes(self.path("rutas.gpx"), ROUTES)
+        waypoints = etree.parse(self.path("pines.gpx")).getroot().findall(f"{GPX}wpt")
+        self.assertEqual([waypoint.findtext(f"{GPX}name") for waypoint in waypoints][:2], ["A & B", "Ñandú"])
+        self.assertEqual((float(waypoints[0].get("lat")), float(waypoints[0].get("lon"))), (-25.25, -57.5))
+        self.assertEqual(waypoints[3].findtext(f"{GPX}src"), "b.kmz")
+        tracks = etree.parse(self.path("rutas.gpx")).getroot().findall(f"{GPX}trk")
+        self.assertEqual(tracks[0].findtext(f"{GPX}name"), "Ruta <1>")
+        points = tracks[0].findall(f"{GPX}trkseg/{GPX}trkpt")
+        self.assertEqual([(float(point.get("lat")), float(point.findtext(f"{GPX}ele"))) for point in points],
+                         [(-25.25, 0.0), (-25.2, 12.5)])
+
+    def test_csv(self):
+        export_pins(self.path("pines.csv"), self.pins)
+        export_routes(self.path("rutas.csv"), ROUTES)
+        with open(self.path("pines.csv"), encoding="utf-8", newline="") as csv_file:
+            rows = list(csv.reader(csv_file))
+        self.assertEqual(rows[0], ["name", "lat", "lon", "alt", "source"])
+        self.assertEqual(rows[3], ['Con "comillas", y coma', "2.0", "1.0", "0.0", "a.kmz"])
+        with open(self.path("rutas.csv"), encoding="utf-8", newline="") as csv_file:
+            rows = list(csv.reader(csv_file))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[5], ["Ruta 2", "3", "6.0", "5.0", "0.0"])
+
+    def test_flatgeobuf(self):
+        export_pins(self.path("pines.fgb"), self.pins)
+        with open(self.path("pines.fgb"), "rb") as fgb_file:
+            data = fgb_file.read()
+        header, nodes, features_start = read_flatgeobuf(data)
+        self.assertEqual([column.string(0) for column in header.tables(7)], ["name", "source", "alt"])
+        leaves = nodes[-4:]
+        pins = {}
+        for leaf in leaves:
+            _, xy, raw = read_feature(data, features_start + int(leaf["offset"]))
+            self.assertEqual(xy.tolist(), [leaf["min_x"], leaf["min_y"]])
+            name_length = int.from_bytes(raw[2:6], "little")
+            pins[raw[6:6 + name_length].decode("utf-8")] = tuple(xy)
+        self.assertEqual(pins, {"A & B": (-57.5, -25.25), "Ñandú": (-57.4, -25.2), 'Con "comillas", y coma': (1.0, 2.0), "D": (3.0, 4.0)})
+
+        export_routes(self.path("rutas.fgb"), ROUTES)
+        with open(self.path("rutas.fgb"), "rb") as fgb_file:
+            data = fgb_file.read()
+        header, nodes, features_start = read_flatgeobuf(data)
+        self.assertEqual(header.scalar(8, "Q"), 2)
+        self.assertEqual(sorted(len(read_feature(data, features_start + int(leaf["offset"]))[1]) for leaf in nodes[-2:]), [4, 6])
+
+    def test_routes_without_a_line_are_skipped(self):
+        routes = [{"name": "Vacía", "color": "red", "kml_coords": []},
+                  {"name": "Un punto", "color": "red", "kml_coords": [(1.0, 2.0, 0.0)]}] + ROUTES
+        export_routes(self.path("rutas.geojson"), routes)
+        with open(self.path("rutas.geojson"), encoding="utf-8") as geojson_file:
+            self.assertEqual([feature["properties"]["name"] for feature in json.load(geojson_file)["features"]],
+                             ["Ruta <1>", "Ruta 2"])
+        export_routes(self.path("rutas.gpx"), routes)
+        tracks = etree.parse(self.path("rutas.gpx")).getroot().findall(f"{GPX}trk")
+        self.assertEqual([track.findtext(f"{GPX}name") for track in tracks], ["Ruta <1>", "Ruta 2"])
+        export_routes(self.path("rutas.csv"), routes)
+        with open(self.path("rutas.csv"), encoding="utf-8", newline="") as csv_file:
+            self.assertEqual({row[0] for row in list(csv.reader(csv_file))[1:]}, {"Ruta <1>", "Ruta 2"})
+        export_routes(self.path("rutas.fgb"), routes)
+        with open(self.path("rutas.fgb"), "rb") as fgb_file:
+            header, _, _ = read_flatgeobuf(fgb_file.read())
+        self.assertEqual(header.scalar(8, "Q"), 2)
+
+    def test_unknown_extension(self):
+        with self.assertRaises(ValueError):
+            export_pins(self.path("pines.txt"), self.pins)
+        self.assertEqual(os.listdir(self.directory.name), [])
+        self.assertEqual(sorted(EXPORT_FORMATS), [".csv", ".fgb", ".geojson", ".gpx"])
+
+
+if __name__ == '__main__':
+    unittest.main()
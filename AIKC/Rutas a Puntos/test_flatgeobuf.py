@@ -0,0 +1,172 @@
+import unittest
+import sys
+import os
+import io
+import struct
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core import flatgeobuf
+from kmz_core.flatgeobuf import (
+    write_flatgeobuf, encode_feature, encode_point_feature, encode_properties, feature_size,
+    level_bounds, NODE_ITEM, MAGIC, GEOMETRY_POINT, GEOMETRY_LINESTRING, COLUMN_STRING, COLUMN_DOUBLE,
+)
+
+
+class Table:
+    """Minimal FlatBuffers table reader, to check the encoded buffers independently of the writer."""
+    def __init__(self, buffer, position):
+        self.buffer = buffer
+        self.position = position
+        self.vtable = position - struct.unpack_from("<i", buffer, position)[0]
+        self.vtable_size = struct.unpack_from("<H", buffer, self.vtable)[0]
+
+    def _field(self, field_id):
+        if 4 + 2 * field_id >= self.vtable_size:
+            return None
+        offset = struct.unpack_from("<H", self.buffer, self.vtable + 4 + 2 * field_id)[0]
+        return self.position + offset if offset else None
+
+    def scalar(self, field_id, fmt, default=0):
+        position = self._field(field_id)
+        if position is not None:
+            self._check_alignment(position, struct.calcsize(fmt))
+        return default if position is None else struct.unpack_from("<" + fmt, self.buffer, position)[0]
+
+    def _target(self, field_id):
+        position = self._field(field_id)
+        return None if position is None else position + struct.unpack_from("<I", self.buffer, position)[0]
+
+    def table(self, field_id):
+        target = self._target(field_id)
+        return None if target is None else Table(self.buffer, target)
+
+    def string(self, field_id):
+        target = self._target(field_id)
+        length = struct.unpack_from("<I", self.buffer, target)[0]
+        return bytes(self.buffer[target + 4:target + 4 + length]).decode("utf-8")
+
+    def vector(self, field_id, dtype):
+        target = self._target(field_id)
+        if target is None:
+            return None
+        length = struct.unpack_from("<I", self.buffer, target)[0]
+        self._check_alignment(target + 4, np.dtype(dtype).itemsize)
+        return np.frombuffer(self.buffer, dtype=dtype, count=length, offset=target + 4)
+
+    def tables(self, field_id):
+        target = self._target(field_id)
+        length = struct.unpack_from("<I", self.buffer, target)[0]
+        slots = [target + 4 + 4 * number for number in range(length)]
+        return [Table(self.buffer, slot + struct.unpack_from("<I", self.buffer, slot)[0]) for slot in slots]
+
+    @staticmethod
+    def _check_alignment(position, size):
+        assert position % size == 0, f"Misaligned value at {position}"
+
+
+def read_flatgeobuf(data):
+    """Returns (header table, R-tree nodes, feature section offset, data) of a FlatGeobuf file."""
+    assert data[:8] == MAGIC
+    header_size = struct.unpack_from("<I", data, 8)[0]
+    header_buffer = data[12:12 + header_size]
+    header = Table(header_buffer, struct.unpack_from("<I", header_buffer, 0)[0])
+    count = header.scalar(8, "Q")
+    node_size = header.scalar(9, "H", 16)
+    node_count = level_bounds(count, node_size)[0][1] if count and node_size else 0
+    index_start = 12 + header_size
+    nodes = np.frombuffer(data, dtype=NODE_ITEM, count=node_count, offset=index_start)
+    return header, nodes, index_start + node_count * NODE_ITEM.itemsize
+
+
+def read_feature(data, offset):
+    """Returns (geometry type, xy array, raw properties) of the feature at `offset`."""
+    size = struct.unpack_from("<I", data, offset)[0]
+    buffer = data[offset + 4:offset + 4 + size]
+    feature = Table(buffer, struct.unpack_from("<I", buffer, 0)[0])
+    geometry = feature.table(0)
+    return geometry.scalar(6, "B"), geometry.vector(1, "<f8"), bytes(feature.vector(1, "u1"))
+
+
+def search(nodes, node_size, count, box):
+    """Byte offsets of the features whose boxes intersect `box`, walking the R-tree from the root."""
+    leaves_start = level_bounds(count, node_size)[0][0]
+    min_x, min_y, max_x, max_y = box
+    found, pending = [], [0]
+    while pending:
+        node = pending.pop()
+        children = range(int(nodes[node]["offset"]), min(int(nodes[node]["offset"]) + node_size, len(nodes)))
+        for child in ([node] if node >= leaves_start else children):
+            item = nodes[child]
+            if item["max_x"] < min_x or item["min_x"] > max_x or item["max_y"] < min_y or item["min_y"] > max_y:
+                continue
+            if child >= leaves_start:
+                found.append(int(item["offset"]))
+            else:
+                pending.append(child)
+    return sorted(found)
+
+
+class TestFlatGeobuf(unittest.TestCase):
+
+    def test_point_feature_fast_path(self):
+        columns = [("name", COLUMN_STRING), ("alt", COLUMN_DOUBLE)]
+        properties = encode_properties(columns, ["Pin é", 12.5])
+        encoded = encode_point_feature(-57.5, -25.25, properties)
+        self.assertEqual(encoded, encode_feature(GEOMETRY_POINT, np.array([-57.5, -25.25]), properties))
+        self.assertEqual(len(encoded), feature_size(1, len(properties)))
+        geometry_type, xy, raw = read_feature(encoded, 0)
+        self.assertEqual((geometry_type, xy.tolist()), (GEOMETRY_POINT, [-57.5, -25.25]))
+        self.assertEqual(raw, struct.pack("<HI", 0, 6) + "Pin é".encode("utf-8") + struct.pack("<Hd", 1, 12.5))
+
+    def test_file_with_index(self):
+        rng = np.random.default_rng(11)
+        count = 1000
+        starts = rng.random((count, 2)) * 10
+        lines = [np.vstack((start, start + rng.random((3, 2)))) for start in starts]
+        boxes = np.array([[line[:, 0].min(), line[:, 1].min(), line[:, 0].max(), line[:, 1].max()] for line in lines])
+        order = flatgeobuf.hilbert_sort(boxes)
+        columns = [("name", COLUMN_STRING)]
+        features = [encode_feature(GEOMETRY_LINESTRING, lines[number].ravel(), encode_properties(columns, [f"L{number}"]))
+                    for number in order]
+        output = io.BytesIO()
+        write_flatgeobuf(output, "lineas", GEOMETRY_LINESTRING, columns, boxes[order],
+                         [len(feature) for feature in features], iter(features))
+        data = output.getvalue()
+
+        header, nodes, features_start = read_flatgeobuf(data)
+        self.assertEqual(header.string(0), "lineas")
+        self.assertEqual(header.scalar(2, "B"), GEOMETRY_LINESTRING)
+        self.assertEqual(header.scalar(8, "Q"), count)
+        np.testing.assert_allclose(header.vector(1, "<f8"), [boxes[:, 0].min(), boxes[:, 1].min(),
+                                                             boxes[:, 2].max(), boxes[:, 3].max()])
+        self.assertEqual([(column.string(0), column.scalar(1, "B")) for column in header.tables(7)], [("name", COLUMN_STRING)])
+        crs = header.table(10)
+        self.assertEqual((crs.string(0), crs.scalar(1, "i")), ("EPSG", 4326))
+
+        # Every leaf points at its feature, and a search through the tree finds exactly the intersecting features
+        query = (2.0, 3.0, 4.5, 5.0)
+        expected = {f"L{number}" for number, (min_x, min_y, max_x, max_y) in enumerate(boxes)
+                    if not (max_x < 2.0 or min_x > 4.5 or max_y < 3.0 or min_y > 5.0)}
+        names = set()
+        for offset in search(nodes, 16, count, query):
+            geometry_type, xy, raw = read_feature(data, features_start + offset)
+            self.assertEqual(geometry_type, GEOMETRY_LINESTRING)
+            names.add(raw[6:].decode("utf-8"))
+        self.assertEqual(names, expected)
+        self.assertTrue(expected)
+
+    def test_empty_file(self):
+        output = io.BytesIO()
+        write_flatgeobuf(output, "vacio", GEOMETRY_POINT, [], np.empty((0, 4)), [], [])
+        header, nodes, features_start = read_flatgeobuf(output.getvalue())
+        self.assertEqual(header.scalar(8, "Q"), 0)
+        self.assertEqual(len(nodes), 0)
+        self.assertEqual(features_start, len(output.getvalue()))
+
+
+if __name__ == '__main__':
+    unittest.main()
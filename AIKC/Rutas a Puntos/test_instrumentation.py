@@ -0,0 +1,138 @@
+import unittest
+import sys
+import os
+import io
+import json
+import tempfile
+import zipfile
+import warnings
+from unittest.mock import Mock
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.instrumentation import (
+    Profiler, TimedReader, parse_stage_times, format_duration,
+    STAGE_UNZIP, STAGE_XML_PARSE, STAGE_EXTRACTION, STAGE_ORDERING, STAGE_KML_SAVE, TRACE_ENV, TRACE_MEMORY_ENV,
+)
+from kmz_core.kml_stream import PlacemarkStream
+from test_background_load import write_kmz
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_spans_and_summary(self):
+        profiler = Profiler()
+        self.assertEqual(profiler.summary(), "")
+        with profiler.span(STAGE_ORDERING, markers=3):
+            pass
+        profiler.record(STAGE_KML_SAVE, 0, 2_500_000_000)
+        profiler.record(STAGE_UNZIP, 0, 12_000_000)
+
+        self.assertEqual(profiler.version, 3)
+        self.assertEqual(profiler.last[STAGE_ORDERING].args, {"markers": 3})
+        self.assertIsNone(profiler.last[STAGE_ORDERING].peak_bytes)
+        summary = profiler.summary()
+        self.assertTrue(summary.startswith("Descompresión 12 ms · Orden "), summary)
+        self.assertTrue(summary.endswith("Guardado 2.50 s"), summary)
+        self.assertEqual(format_duration(350_400_000), "350 ms")
+
+    def test_span_is_recorded_when_the_stage_fails(self):
+        profiler = Profiler()
+        with self.assertRaises(ValueError):
+            with profiler.span(STAGE_KML_SAVE):
+                raise ValueError("falla")
+        self.assertIn(STAGE_KML_SAVE, profiler.last)
+
+    def test_memory_peaks_of_nested_spans(self):
+        profiler = Profiler(memory=True)
+        self.addCleanup(profiler.close)  # Stops tracemalloc
+        with profiler.span(STAGE_KML_SAVE):
+            with profiler.span(STAGE_ORDERING):
+                block = bytearray(4_000_000)
+                del block
+            small = bytearray(1_000_000)
+        del small
+        self.assertGreaterEqual(profiler.last[STAGE_ORDERING].peak_bytes, 4_000_000)
+        self.assertGreaterEqual(profiler.last[STAGE_KML_SAVE].peak_bytes, 4_000_000)  # The inner peak counts for the outer span
+        self.assertRegex(profiler.summary(), r"^Orden \d+ ms \(3\.8 MB\) · Guardado ")
+
+    def test_trace_files(self):
+        for name in ("traza.jsonl", "traza.json"):
+            path = os.path.join(self.tmpdir.name, name)
+            profiler = Profiler.from_environment({TRACE_ENV: path, TRACE_MEMORY_ENV: "0"})
+            with profiler.span(STAGE_ORDERING, markers=2):
+                pass
+            profiler.record_stages(profiler.origin_ns, {STAGE_UNZIP: 1000, STAGE_XML_PARSE: 3000}, file="a.kmz")
+            profiler.close()
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            if name.endswith(".jsonl"):
+                records = [json.loads(line) for line in text.splitlines()]
+                self.assertEqual([record["stage"] for record in records], [STAGE_ORDERING, STAGE_UNZIP, STAGE_XML_PARSE])
+                self.assertEqual(records[0]["markers"], 2)
+                self.assertEqual(records[2]["start_ms"], 0.001)
+                self.assertEqual(records[2]["file"], "a.kmz")
+            else:
+                events = json.loads(text)
+                self.assertEqual(events[0]["ph"], "M")  # Name of the thread
+                spans = [event for event in events if event["ph"] == "X"]
+                self.assertEqual([event["name"] for event in spans], [STAGE_ORDERING, STAGE_UNZIP, STAGE_XML_PARSE])
+                self.assertEqual((spans[2]["ts"], spans[2]["dur"]), (1.0, 3.0))
+                self.assertEqual(spans[2]["args"], {"file": "a.kmz"})
+
+    def test_trace_errors_switch_tracing_off(self):
+        # The trace file cannot be opened: the stage still runs and is recorded, with one warning
+        profiler = Profiler(os.path.join(self.tmpdir.name, "no-existe", "traza.jsonl"))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            with profiler.span(STAGE_ORDERING):
+                pass
+            profiler.record(STAGE_KML_SAVE, profiler.origin_ns, 1000)
+        self.assertEqual([warning.category for warning in caught], [RuntimeWarning])
+        self.assertIsNone(profiler.trace_path)
+        self.assertEqual(set(profiler.last), {STAGE_ORDERING, STAGE_KML_SAVE})
+
+        # Writing fails later (e.g. a full disk)
+        profiler = Profiler(os.path.join(self.tmpdir.name, "traza.json"))
+        profiler.record(STAGE_ORDERING, profiler.origin_ns, 1000)
+        profiler._trace_file.close()
+        profiler._trace_file = Mock(write=Mock(side_effect=OSError(28, "No queda espacio")))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            profiler.record(STAGE_KML_SAVE, profiler.origin_ns, 1000)
+            profiler.record(STAGE_UNZIP, profiler.origin_ns, 1000)
+            profiler.close()
+        self.assertEqual(len(caught), 1)
+        self.assertIn("No queda espacio", str(caught[0].message))
+        self.assertEqual(profiler.version, 3)
+
+    def test_parse_stage_times(self):
+        path = os.path.join(self.tmpdir.name, "a.kmz")
+        write_kmz(path, 200, malformed=1)
+        with zipfile.ZipFile(path) as kmz, kmz.open("doc.kml") as kml:
+            reader = TimedReader(kml)
+            placemarks = PlacemarkStream(reader)
+            self.assertEqual(len(list(placemarks)), 200)
+            self.assertEqual(reader.tell(), kmz.getinfo("doc.kml").file_size)
+        stages = parse_stage_times(placemarks, reader, unzip_ns=5)
+        self.assertEqual(list(stages), [STAGE_UNZIP, STAGE_XML_PARSE, STAGE_EXTRACTION])
+        self.assertEqual(stages[STAGE_UNZIP], reader.read_ns + 5)
+        self.assertEqual(sum(stages.values()), placemarks.busy_ns + 5)
+        self.assertTrue(all(duration > 0 for duration in stages.values()))
+
+    def test_timed_reader_only_times_reads(self):
+        reader = TimedReader(io.BytesIO(b"abc"))
+        self.assertEqual(reader.read(2), b"ab")
+        self.assertEqual(reader.tell(), 2)
+        self.assertGreater(reader.read_ns, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
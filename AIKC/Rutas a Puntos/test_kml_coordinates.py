@@ -0,0 +1,65 @@
+import unittest
+import sys
+import os
+from unittest import mock
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core import kml_coordinates
+from kmz_core.kml_coordinates import parse_coordinates, parse_track
+
+
+def both_paths(test):
+    """Runs `test` with short blocks parsed tuple by tuple (the default) and in bulk."""
+    def run(self):
+        test(self)
+        with mock.patch.object(kml_coordinates, "BULK_MIN_BYTES", 0):
+            test(self)
+    return run
+
+
+class TestKMLCoordinates(unittest.TestCase):
+
+    def test_bulk_parse_matches_float(self):
+        rng = np.random.default_rng(0)
+        values = rng.uniform(-180, 180, (2000, 3))
+        text = "\n\t\t" + " \n\t\t".join(",".join(repr(float(value)) for value in row) for row in values) + "\n"
+        coords, malformed = parse_coordinates(text)
+        self.assertEqual(malformed, 0)
+        np.testing.assert_array_equal(coords, values)  # Same doubles as float() gives
+
+    @both_paths
+    def test_altitude_is_optional(self):
+        coords, malformed = parse_coordinates("-57.1,-25.1,10 -57.2,-25.2\n+1e1,.5,-0")
+        np.testing.assert_array_equal(coords, [(-57.1, -25.1, 10.0), (-57.2, -25.2, 0.0), (10.0, 0.5, 0.0)])
+        self.assertEqual(malformed, 0)
+
+    @both_paths
+    def test_malformed_tuples_are_skipped_and_counted(self):
+        text = "1,2,3 a,b 1,,2 ,1,2 1,2, 7 1,2,3,4 1.2.3,4 nan,1 -1e,2 inf,2,3 Ñ,1 4,5"
+        coords, malformed = parse_coordinates(text)
+        np.testing.assert_array_equal(coords, [(1.0, 2.0, 3.0), (4.0, 5.0, 0.0)])
+        self.assertEqual(malformed, 11)
+
+    @both_paths
+    def test_empty_blocks(self):
+        for text in (None, "", " \n\t "):
+            coords, malformed = parse_coordinates(text)
+            self.assertEqual(coords.shape, (0, 3))
+            self.assertEqual(malformed, 0)
+        coords, malformed = parse_coordinates("x,y")
+        self.assertEqual((coords.shape, malformed), ((0, 3), 1))
+
+    @both_paths
+    def test_track_coordinates(self):
+        coords, malformed = parse_track(["-57.1 -25.1 10", "  -57.2\t-25.2   20 ", "-57.3 -25.3", "x y z", None])
+        np.testing.assert_array_equal(coords, [(-57.1, -25.1, 10.0), (-57.2, -25.2, 20.0), (-57.3, -25.3, 0.0)])
+        self.assertEqual(malformed, 1)  # An empty coord is skipped, like an empty <coordinates>
+        self.assertEqual(parse_track([])[0].shape, (0, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import sys
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.kml_reader import load_routes
+from kmz_core.kml_writer import save_routes
+from kmz_core.routes import kml_routes
+
+ROUTES = [
+    {"name": "Ruta 1", "kml_coords": [(-57.5, -25.25, 0.0), (-57.4, -25.2, 12.5)], "color": "red"},
+    {"name": "Ruta <2>", "kml_coords": np.array([[1.0, 2.0, 0.0], [3.0, 4.0, 0.0], [5.0, 6.0, 0.0]]),
+     "color": "#e6194b"},
+    {"name": "Ruta 3", "kml_coords": [(7.0, 8.0, 0.0), (9.0, 10.0, 0.0)], "color": "red"},
+]
+
+
+def build_kml(body):
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            f'<kml xmlns="http://www.opengis.net/kml/2.2"><Document>{body}</Document></kml>').encode()
+
+
+class TestKmlReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_saved_routes_round_trip(self):
+        for name in ("rutas.kml", "rutas.kmz"):
+            save_routes(self.path(name), kml_routes(ROUTES))
+            loaded = load_routes(self.path(name))
+            self.assertEqual(loaded.error_count, 0)
+            self.assertEqual([(route["name"], route["color"]) for route in loaded.routes],
+                             [(route["name"], route["color"]) for route in ROUTES])
+            for route, saved in zip(loaded.routes, ROUTES):
+                np.testing.assert_array_equal(route["kml_coords"], np.asarray(saved["kml_coords"]))
+
+    def test_inline_styles_and_style_maps(self):
+        with open(self.path("estilos.kml"), "wb") as kml_file:
+            kml_file.write(build_kml(
+                '<Style id="verde"><LineStyle><color>FF00FF00</color></LineStyle></Style>'
+                '<StyleMap id="mapa"><Pair><key>highlight</key><styleUrl>#otro</styleUrl></Pair>'
+                "<Pair><key>normal</key><styleUrl>#verde</styleUrl></Pair></StyleMap>"
+                '<Placemark><name>Mapa</name><styleUrl>#mapa</styleUrl>'
+                "<LineString><coordinates>1,2 3,4</coordinates></LineString></Placemark>"
+                "<Placemark><name>Propio</name><styleUrl>#verde</styleUrl>"
+                "<Style><LineStyle><color>ffe6b04b</color></LineStyle></Style>"
+                "<LineString><coordinates>1,2 3,4</coordinates></LineString></Placemark>"
+                "<Folder><Placemark><name>Sin estilo</name><styleUrl>#falta</styleUrl>"
+                "<LineString><coordinates>1,2 x 3,4</coordinates></LineString></Placemark></Folder>"
+                "<Placemark><name>Pin</name><Point><coordinates>1,2</coordinates></Point></Placemark>"
+            ))
+        loaded = load_routes(self.path("estilos.kml"))
+        self.assertEqual([(route["name"], route["color"]) for route in loaded.routes],
+                         [("Mapa", "green"), ("Propio", "#4bb0e6"), ("Sin estilo", "red")])
+        self.assertEqual(loaded.error_count, 1)
+
+    def test_every_kml_member_of_a_kmz(self):
+        with zipfile.ZipFile(self.path("capas.kmz"), "w") as kmz:
+            kmz.writestr("doc.kml", build_kml(
+                "<Placemark><name>Raíz</name><LineString><coordinates>1,2 3,4</coordinates></LineString></Placemark>"))
+            kmz.writestr("files/capa.kml", build_kml(
+                "<Style id='verde'><LineStyle><color>ff00ff00</color></LineStyle></Style>"
+                "<Placemark><name>Capa</name><styleUrl>#verde</styleUrl>"
+                "<LineString><coordinates>5,6 x 7,8</coordinates></LineString></Placemark>"))
+        loaded = load_routes(self.path("capas.kmz"))
+        self.assertEqual([(route["name"], route["color"]) for route in loaded.routes],
+                         [("Raíz", "red"), ("Capa", "green")])
+        self.assertEqual(loaded.error_count, 1)
+
+    def test_kmz_without_kml(self):
+        with zipfile.ZipFile(self.path("vacio.kmz"), "w") as kmz:
+            kmz.writestr("icono.png", b"\x89PNG")
+        with self.assertRaises(ValueError):
+            load_routes(self.path("vacio.kmz"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+import sys
+import os
+import io
+import zipfile
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.kml_stream import PlacemarkStream, find_kml_member, find_kml_members, parse_kml_tree, parse_point_coordinates
+
+
+def build_kml(body):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<kml xmlns="http://www.opengis.net/kml/2.2">'
+        f'{body}'
+        '</kml>'
+    ).encode("utf-8")
+
+
+def placemark(name, coords, geometry="Point"):
+    name_xml = f"<name>{name}</name>" if name is not None else ""
+    return f"<Placemark>{name_xml}<{geometry}><coordinates>{coords}</coordinates></{geometry}></Placemark>"
+
+
+class TestPlacemarkStream(unittest.TestCase):
+
+    def test_parse_point_coordinates(self):
+        self.assertEqual(parse_point_coordinates(" -57.1,-25.1,10 "), (-57.1, -25.1, 10.0))
+        self.assertEqual(parse_point_coordinates("-57.2,-25.2"), (-57.2, -25.2, 0.0))
+        with self.assertRaises(ValueError):
+            parse_point_coordinates("not,valid,coords")
+        for text in ("nan,-25.1", "-57.1,inf", "-57.1,-25.1,-inf"):  # float() accepts them, a position does not
+            with self.assertRaises(ValueError):
+                parse_point_coordinates(text)
+
+    def test_streams_points_in_document_order(self):
+        kml = build_kml(
+            "<Document>"
+            + placemark("Pin1", "-57.1,-25.1,10")
+            + "<Folder><!-- comentario -->" + placemark("Pin2", "-57.2,-25.2") + "</Folder>"
+            + placemark(None, "-57.3,-25.3")
+            + "</Document>"
+        )
+        placemarks = PlacemarkStream(io.BytesIO(kml))
+        pins = list(placemarks)
+
+        self.assertEqual(pins, [
+            ("Pin1", (-57.1, -25.1, 10.0)),
+            ("Pin2", (-57.2, -25.2, 0.0)),
+            ("Pin sin nombre", (-57.3, -25.3, 0.0)),
+        ])
+        self.assertEqual(placemarks.extraction_error_count, 0)
+
+    def test_malformed_and_missing_geometries(self):
+        kml = build_kml(
+            "<Document>"
+            + placemark("Malo", "not,valid,coords")
+            + placemark("No finito", "nan,nan")
+            + placemark("Linea", "-57.3,-25.3 -57.4,-25.4", geometry="LineString")
+            + "<Placemark><name>Vacio</name><Point><coordinates></coordinates></Point></Placemark>"
+            + placemark("Bueno", "-57.5,-25.5")
+            + "</Document>"
+        )
+        placemarks = PlacemarkStream(io.BytesIO(kml))
+        pins = list(placemarks)
+
+        self.assertEqual([name for name, _ in pins], ["Bueno"])
+        self.assertEqual(placemarks.extraction_error_count, 2)
+        self.assertEqual([name for name, _ in placemarks.lines], ["Linea"])
+
+    def test_collects_line_geometries(self):
+        kml = build_kml(
+            "<Document>"
+            + placemark("Tramo", "1,2,3 4,5,6 x,y 7,8", geometry="LineString")
+            + "<Folder><Placemark><name>Zona</name><Polygon>"
+            "<outerBoundaryIs><LinearRing><coordinates>0,0 1,0 1,1 0,0</coordinates></LinearRing></outerBoundaryIs>"
+            "<innerBoundaryIs><LinearRing><coordinates>0.2,0.2 0.3,0.2 0.2,0.2</coordinates></LinearRing></innerBoundaryIs>"
+            "</Polygon></Placemark></Folder>"
+            "<Placemark><MultiGeometry><Point><coordinates>9,9</coordinates></Point>"
+            "<LineString><coordinates>9,9 10,10</coordinates></LineString></MultiGeometry></Placemark>"
+            '<Placemark xmlns:gx="http://www.google.com/kml/ext/2.2"><name>Recorrido</name><gx:Track>'
+            "<when>2024-01-01T00:00:00Z</when><when>2024-01-01T00:01:00Z</when>"
+            "<gx:coord>-57.1 -25.1 10</gx:coord><gx:coord>-57.2 -25.2 12</gx:coord></gx:Track></Placemark>"
+            + placemark("Corta", "1,2", geometry="LineString")
+            + "</Document>"
+        )
+        placemarks = PlacemarkStream(io.BytesIO(kml))
+        self.assertEqual(list(placemarks), [("Pin sin nombre", (9.0, 9.0, 0.0))])
+
+        self.assertEqual([name for name, _ in placemarks.lines], ["Tramo", "Zona", "Ruta sin nombre", "Recorrido"])
+        coords = [line.tolist() for _, line in placemarks.lines]
+        self.assertEqual(coords[0], [[1, 2, 3], [4, 5, 6], [7, 8, 0]])
+        self.assertEqual(coords[1], [[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 0, 0]])  # Only the outer boundary
+        self.assertEqual(coords[3], [[-57.1, -25.1, 10], [-57.2, -25.2, 12]])
+        self.assertEqual(placemarks.extraction_error_count, 1)  # The malformed vertex; "Corta" is just skipped
+
+    def test_point_nested_in_multigeometry(self):
+        kml = build_kml(
+            "<Document><Placemark><name>Multi</name><MultiGeometry>"
+            "<Point><coordinates>1,2,3</coordinates></Point>"
+            "</MultiGeometry></Placemark></Document>"
+        )
+        self.assertEqual(list(PlacemarkStream(io.BytesIO(kml))), [("Multi", (1.0, 2.0, 3.0))])
+
+    def test_skips_placemarks_outside_documents_and_folders(self):
+        # The tree-based extraction only descends into Document and Folder elements.
+        kml = build_kml(
+            "<Document>"
+            "<NetworkLinkControl><Update><Create><Folder>"
+            + placemark("Oculto", "1,1")
+            + "</Folder></Create></Update></NetworkLinkControl>"
+            + placemark("Visible", "2,2")
+            + "</Document>"
+        )
+        self.assertEqual([name for name, _ in PlacemarkStream(io.BytesIO(kml))], ["Visible"])
+
+    def test_collects_network_link_targets(self):
+        kml = build_kml(
+            "<Document>"
+            "<NetworkLink><Link><href> capas/postes.kml </href></Link></NetworkLink>"
+            "<Folder><NetworkLink><Url><href>antiguo.kml</href></Url></NetworkLink>" + placemark("Pin", "1,2") + "</Folder>"
+            "<NetworkLink><name>Sin destino</name></NetworkLink>"
+            "<Placemark><name>Oculto</name><MultiGeometry><NetworkLink><Link><href>no.kml</href></Link></NetworkLink>"
+            "</MultiGeometry></Placemark>"
+            "</Document>"
+        )
+        placemarks = PlacemarkStream(io.BytesIO(kml))
+        self.assertEqual([name for name, _ in placemarks], ["Pin"])
+        self.assertEqual(placemarks.network_links, ["capas/postes.kml", "antiguo.kml"])
+
+    def test_parse_kml_tree_feeds_chunks(self):
+        body = "<Document><!-- comentario -->" + "".join(placemark(f"P{i}", f"{i},0") for i in range(5000)) + "</Document>"
+        root = parse_kml_tree(io.BytesIO(build_kml(body)))
+        names = root.findall(".//{http://www.opengis.net/kml/2.2}name")
+        self.assertEqual((len(names), names[-1].text), (5000, "P4999"))
+
+    def test_reads_kml_member_from_kmz_stream(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as kmz:
+            kmz.writestr("files/icon.png", b"")
+            kmz.writestr("doc.KML", build_kml("<Document>" + placemark("Pin", "1,2,3") + "</Document>"))
+        buffer.seek(0)
+
+        with zipfile.ZipFile(buffer) as kmz:
+            kml_filename = find_kml_member(kmz)
+            self.assertEqual(kml_filename, "doc.KML")
+            self.assertEqual(find_kml_members(kmz), ["doc.KML"])
+            with kmz.open(kml_filename) as kml_stream:
+                self.assertEqual(list(PlacemarkStream(kml_stream)), [("Pin", (1.0, 2.0, 3.0))])
+
+
+if __name__ == '__main__':
+    unittest.main()
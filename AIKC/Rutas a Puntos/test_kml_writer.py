@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import io
+import tempfile
+import zipfile
+
+import numpy as np
+from lxml import etree
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core import kml_writer
+from kmz_core.kml_writer import write_routes_kml, save_routes, KMZ_DOCUMENT_NAME
+
+KML = "{http://www.opengis.net/kml/2.2}"
+
+ROUTES = [
+    ("Ruta <1>", "ff0000ff", [(-57.5, -25.25, 0.0), (-57.4, -25.2, 12.5)]),
+    ("Ruta 2", "ff00ff00", np.array([[1.0, 2.0, 0.0], [3.0, 4.0, 0.0], [5.0, 6.0, 0.0]])),
+    ("Ruta 3", "ff0000ff", [(7.0, 8.0, 0.0), (9.0, 10.0, 0.0)]),
+]
+
+
+def read_routes(document):
+    """Returns the (name, style url, coordinates) of every Placemark of a parsed KML document."""
+    routes = []
+    for placemark in document.iter(f"{KML}Placemark"):
+        coordinates = [tuple(float(value) for value in vertex.split(","))
+                       for vertex in placemark.findtext(f"{KML}LineString/{KML}coordinates").split()]
+        routes.append((placemark.findtext(f"{KML}name"), placemark.findtext(f"{KML}styleUrl"), coordinates))
+    return routes
+
+
+class TestKmlWriter(unittest.TestCase):
+
+    def test_routes_share_one_style_per_color(self):
+        output = io.BytesIO()
+        write_routes_kml(output, ROUTES)
+        document = etree.fromstring(output.getvalue())
+        styles = document.findall(f"{KML}Document/{KML}Style")
+        self.assertEqual([style.get("id") for style in styles], ["ruta-ff0000ff", "ruta-ff00ff00"])
+        self.assertEqual(styles[0].findtext(f"{KML}LineStyle/{KML}color"), "ff0000ff")
+        self.assertEqual(document.findtext(f"{KML}Document/{KML}name"), "Rutas Generadas")
+
+        routes = read_routes(document)
+        self.assertEqual([route[:2] for route in routes], [
+            ("Ruta <1>", "#ruta-ff0000ff"), ("Ruta 2", "#ruta-ff00ff00"), ("Ruta 3", "#ruta-ff0000ff"),
+        ])
+        self.assertEqual(routes[0][2], [(-57.5, -25.25, 0.0), (-57.4, -25.2, 12.5)])
+        self.assertEqual(routes[1][2], [(1.0, 2.0, 0.0), (3.0, 4.0, 0.0), (5.0, 6.0, 0.0)])
+
+    def test_coordinates_written_in_chunks(self):
+        coords = [(i / 1000, -i / 500, float(i)) for i in range(10)]
+        output = io.BytesIO()
+        with patch.object(kml_writer, "COORDINATE_CHUNK", 3):
+            write_routes_kml(output, [("Larga", "ff0000ff", coords)])
+        self.assertEqual(read_routes(etree.fromstring(output.getvalue()))[0][2], coords)
+
+    def test_save_kml_and_kmz(self):
+        with tempfile.TemporaryDirectory() as directory:
+            kml_path = os.path.join(directory, "rutas.kml")
+            kmz_path = os.path.join(directory, "rutas.kmz")
+            save_routes(kml_path, ROUTES)
+            save_routes(kmz_path, ROUTES)
+            with open(kml_path, "rb") as kml_file:
+                kml_bytes = kml_file.read()
+            with zipfile.ZipFile(kmz_path) as kmz:
+                self.assertEqual(kmz.namelist(), [KMZ_DOCUMENT_NAME])
+                self.assertEqual(kmz.getinfo(KMZ_DOCUMENT_NAME).compress_type, zipfile.ZIP_DEFLATED)
+                self.assertEqual(kmz.read(KMZ_DOCUMENT_NAME), kml_bytes)
+            self.assertEqual(sorted(os.listdir(directory)), ["rutas.kml", "rutas.kmz"]) # No partial files left
+
+    def test_failed_save_keeps_the_previous_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "rutas.kml")
+            save_routes(path, ROUTES)
+            with self.assertRaises(ValueError):
+                save_routes(path, [("Mala", "ff0000ff", [("x", 0.0, 0.0)])])
+            self.assertEqual(len(read_routes(etree.parse(path).getroot())), 3)
+            self.assertEqual(os.listdir(directory), ["rutas.kml"])
+
+
+if __name__ == '__main__':
+    unittest.main()
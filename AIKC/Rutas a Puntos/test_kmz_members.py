@@ -0,0 +1,93 @@
+import unittest
+import sys
+import os
+import multiprocessing
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core import kmz_members
+from kmz_core.kmz_members import linked_members, member_sources, parse_kml_member, parse_kmz_members
+
+
+def layer_kml(prefix, num_pins, links=(), malformed=0):
+    placemarks = "".join(
+        f"<Placemark><name>{prefix}{i}</name><Point><coordinates>{i},{-i},0</coordinates></Point></Placemark>"
+        for i in range(num_pins)
+    )
+    placemarks += "<Placemark><name>X</name><Point><coordinates>a,b</coordinates></Point></Placemark>" * malformed
+    network_links = "".join(f"<NetworkLink><Link><href>{href}</href></Link></NetworkLink>" for href in links)
+    return f'<kml xmlns="http://www.opengis.net/kml/2.2"><Document>{network_links}{placemarks}</Document></kml>'
+
+
+def write_layered_kmz(path):
+    """
+    A KMZ like the exports with several layers: the root links to a member without
+    the .kml suffix and to a remote file; the other layer links back to the root.
+    """
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as kmz:
+        kmz.writestr("doc.kml", layer_kml("R", 2, links=["capas/postes.xml", "http://example.com/remoto.kml"]))
+        kmz.writestr("capas/cables.kml", layer_kml("C", 3, links=["../doc.kml", "postes.xml"], malformed=1))
+        kmz.writestr("capas/postes.xml", layer_kml("P", 4))
+        kmz.writestr("files/icono.png", b"")
+
+
+class TestKMZMembers(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "capas.kmz")
+        write_layered_kmz(self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_linked_members(self):
+        names = {"doc.kml", "capas/a.kml", "capas/b c.kml", "capas/otra.kmz"}
+        hrefs = ["a.kml", "./b%20c.kml", "../doc.kml", "a.kml", "#solo-fragmento", "https://example.com/a.kml",
+                 "otra.kmz", "no-existe.kml", "../../fuera.kml"]
+        self.assertEqual(linked_members("capas/raiz.kml", hrefs, names), ["capas/a.kml", "capas/b c.kml", "doc.kml"])
+        self.assertEqual(linked_members("doc.kml", ["capas/a.kml?x=1", "/capas/b c.kml"], names),
+                         ["capas/a.kml", "capas/b c.kml"])
+
+    def test_parse_kml_member(self):
+        result = parse_kml_member(self.path, "capas/cables.kml")
+        self.assertEqual(result.names, ["C0", "C1", "C2"])
+        self.assertEqual(list(result.coords[3:6]), [1.0, -1.0, 0.0])
+        self.assertEqual(result.error_count, 1)
+        self.assertEqual(result.links, ["doc.kml", "capas/postes.xml"])
+        self.assertEqual(sorted(result.timing[1]), ["extraction", "unzip", "xml_parse"])
+
+    def test_every_member_is_parsed_once_and_links_are_followed(self):
+        results = list(parse_kmz_members(self.path, ["doc.kml", "capas/cables.kml"]))
+        self.assertEqual([result.member for result in results], ["doc.kml", "capas/cables.kml", "capas/postes.xml"])
+        self.assertEqual([len(result.names) for result in results], [2, 3, 4])
+
+        results = list(parse_kmz_members(self.path, ["capas/cables.kml"], parsed=["doc.kml"]))
+        self.assertEqual([result.member for result in results], ["capas/cables.kml", "capas/postes.xml"])
+
+    def test_large_members_are_parsed_in_worker_processes(self):
+        expected = list(parse_kmz_members(self.path, ["doc.kml", "capas/cables.kml"]))
+        with mock.patch.object(kmz_members, "PARALLEL_MEMBER_BYTES", 0), \
+                ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as executor:
+            with mock.patch.object(executor, "submit", wraps=executor.submit) as submit:
+                results = list(parse_kmz_members(self.path, ["doc.kml", "capas/cables.kml"], executor=executor))
+        self.assertEqual(submit.call_count, 3)
+        self.assertEqual([(result.member, result.names, list(result.coords), result.error_count) for result in results],
+                         [(result.member, result.names, list(result.coords), result.error_count) for result in expected])
+
+    def test_member_sources(self):
+        self.assertEqual(member_sources("a.kmz", None, 5), [("a.kmz", 0, 5)])
+        self.assertEqual(member_sources("a.kmz", None, 0), [])
+        members = [("doc.kml", 2), ("capas/vacia.kml", 0), ("capas/postes.kml", 3)]
+        self.assertEqual(member_sources("a.kmz", members, 5), [("a.kmz", 0, 2), ("a.kmz/capas/postes.kml", 2, 5)])
+        with self.assertRaises(ValueError):
+            member_sources("a.kmz", members, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import unittest
+import sys
+import os
+
+# The application runs as a script, so its modules are imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.pin_store import PinStore
+from kmz_core.clustering import project_to_world
+from map_layer import MapLayer
+
+
+# Minimal stand-ins for tkintermapview, so the layer can be tested without a display.
+class FakeMarker:
+    def __init__(self, lat, lon, text=None, marker_color_circle=None, command=None):
+        self.position = (lat, lon)
+        self.text = text
+        self.marker_color_circle = marker_color_circle
+        self.command = command
+        self.deleted = False
+    def delete(self): self.deleted = True
+
+
+class FakePath:
+    def __init__(self, position_list, **kwargs):
+        self.position_list = position_list
+        self.options = kwargs
+        self.deleted = False
+    def delete(self): self.deleted = True
+
+
+class FakeMapWidget:
+    def __init__(self):
+        self.zoom = 5
+        self.markers = []
+        self.paths = []
+        self.scheduled = []
+        self.look_at(0.3, 0.6, 0.5)
+    def set_marker(self, lat, lon, **kwargs):
+        marker = FakeMarker(lat, lon, **kwargs)
+        self.markers.append(marker)
+        return marker
+    def look_at(self, x, y, size):
+        """Places the view around world point (x, y), `size` world units wide and high."""
+        scale = 2 ** round(self.zoom)
+        self.upper_left_tile_pos = ((x - size / 2) * scale, (y - size / 2) * scale)
+        self.lower_right_tile_pos = ((x + size / 2) * scale, (y + size / 2) * scale)
+    def set_path(self, position_list, **kwargs):
+        path = FakePath(position_list, **kwargs)
+        self.paths.append(path)
+        return path
+    def after(self, ms, func):
+        self.scheduled.append(func)
+        return f"after#{len(self.scheduled)}"
+    def after_cancel(self, after_id): pass
+    def set_position(self, lat, lon): self.position = (lat, lon)
+    def set_zoom(self, zoom): self.zoom = zoom
+    def fit_bounding_box(self, top_left, bottom_right): self.box = (top_left, bottom_right)
+
+    def live_markers(self):
+        return [marker for marker in self.markers if not marker.deleted]
+    def live_paths(self):
+        return [path for path in self.paths if not path.deleted]
+
+
+class TestMapLayer(unittest.TestCase):
+
+    def setUp(self):
+        self.pins = PinStore()
+        self.pins.extend(["A", "B", "C"], [(-57.0, -25.0, 0), (-57.0001, -25.0001, 0), (-57.0002, -25.0002, 0)], "a.kmz")
+        self.pins.append("Solo", (-3.0, 40.0, 0), "b.kmz")
+        self.map_widget = FakeMapWidget()
+        self.clicked = []
+        self.layer = MapLayer(self.map_widget, self.pins, self.clicked.append, lambda index: "red")
+        self.layer.add_pins(0)
+
+    def test_adding_pins_schedules_one_refresh(self):
+        self.layer.add_pins(len(self.pins))
+        self.assertEqual(self.map_widget.scheduled, [self.layer.refresh])
+        self.map_widget.scheduled.pop()()
+        self.assertEqual(sorted(marker.text for marker in self.map_widget.live_markers()), ["3", "Solo"])
+
+    def test_zoom_change_only_replaces_changed_markers(self):
+        self.layer.refresh()
+        solo = self.layer.pin_marker(3)
+        self.assertIsNone(self.layer.pin_marker(0)) # Clustered
+
+        self.map_widget.zoom = 18.4 # Fractional zoom from the mouse wheel
+        self.map_widget.look_at(*project_to_world(-12.0, -30.0), 1.0)
+        self.layer.start_watching()
+        self.assertIs(self.layer.pin_marker(3), solo) # Kept, not recreated
+        self.assertEqual(sorted(marker.text for marker in self.map_widget.live_markers()), ["A", "B", "C", "Solo"])
+
+        self.layer.pin_marker(1).command(None)
+        self.assertEqual(self.clicked, [1])
+
+    def test_only_pins_around_the_view_are_materialized(self):
+        self.map_widget.zoom = 18
+        x, y = project_to_world(40.0, -3.0)
+        self.map_widget.look_at(x, y, 1e-5)
+        self.layer.refresh()
+        self.assertEqual([marker.text for marker in self.map_widget.live_markers()], ["Solo"])
+
+        self.map_widget.look_at(x + 2e-6, y, 1e-5) # Small pan, still inside the margin
+        self.layer.start_watching()
+        self.assertEqual(len(self.map_widget.markers), 1)
+
+        self.map_widget.look_at(*project_to_world(-25.0001, -57.0001), 1e-5)
+        self.layer.start_watching()
+        self.assertEqual(sorted(marker.text for marker in self.map_widget.live_markers()), ["A", "B", "C"])
+
+    def test_paths_are_drawn_while_in_view(self):
+        self.layer.refresh()
+        path_id = self.layer.add_path([(-25.0, -57.0), (-24.0, -56.0)], color="red", width=3)
+        self.assertEqual(len(self.map_widget.live_paths()), 1)
+        self.assertEqual(self.map_widget.paths[0].options, {"color": "red", "width": 3})
+
+        self.map_widget.look_at(*project_to_world(40.0, -3.0), 1e-3)
+        self.layer.refresh()
+        self.assertEqual(self.map_widget.live_paths(), [])
+
+        self.map_widget.look_at(*project_to_world(-24.5, -56.5), 1e-3) # Inside the route's bounding box
+        self.layer.start_watching()
+        self.assertEqual(self.map_widget.live_paths()[0].position_list, self.layer.paths[path_id][0])
+
+        self.layer.clear_paths()
+        self.assertEqual(self.map_widget.live_paths(), [])
+
+    def test_paths_added_in_bulk(self):
+        self.map_widget.look_at(*project_to_world(-25.0, -57.0), 1e-3)
+        self.layer.refresh()
+        refreshes = []
+        show_paths = self.layer._show_paths
+        self.layer._show_paths = lambda path_ids: (refreshes.append(len(path_ids)), show_paths(path_ids))
+        path_ids = self.layer.add_paths([
+            ([(-25.0, -57.0), (-24.0, -56.0)], {"color": "red"}),
+            ([(40.0, -3.0), (40.1, -3.1)], {"color": "blue"}),  # Out of view
+            ([(-25.5, -57.5), (-24.5, -56.5)], {"color": "#3cb44b", "width": 3}),
+        ])
+        self.assertEqual(list(path_ids), [0, 1, 2])
+        self.assertEqual(refreshes, [2])  # The view is updated once, with the two routes in it
+        self.assertEqual(sorted(path.options["color"] for path in self.map_widget.live_paths()), ["#3cb44b", "red"])
+        self.assertEqual(self.layer.add_path([(-25.0, -57.0), (-24.9, -57.1)], color="cyan"), 3)
+
+    def test_path_with_a_nan_vertex(self):
+        self.assertEqual(self.layer.add_path([(1.0, 2.0), (float("nan"), 3.0), (4.0, 5.0), (6.0, 7.0)], color="red"), 0)
+        self.layer.refresh()
+
+    def test_paths_are_simplified_for_the_zoom_level(self):
+        # A straight road with a 10 m zigzag: invisible when zoomed out, drawn in full up close
+        position_list = [(-25.0 + 0.0001 * (i % 2), -57.0 + 0.001 * i) for i in range(1001)]
+        self.map_widget.zoom = 5
+        self.map_widget.look_at(*project_to_world(-25.0, -56.5), 0.01)
+        self.layer.refresh()
+        path_id = self.layer.add_path(position_list, color="blue")
+        drawn = self.map_widget.live_paths()[0]
+        self.assertEqual(drawn.position_list, [position_list[0], position_list[-1]])
+
+        self.layer.refresh() # Same zoom: the path is not redrawn
+        self.assertEqual(self.map_widget.live_paths(), [drawn])
+
+        self.map_widget.zoom = 18
+        self.map_widget.look_at(*project_to_world(-25.0, -56.5), 1e-4)
+        self.layer.start_watching()
+        self.assertTrue(drawn.deleted)
+        self.assertIs(self.map_widget.live_paths()[0].position_list, position_list)
+        self.assertEqual(self.layer.paths[path_id][0], position_list) # The full coordinates are kept
+
+    def test_materialized_pins(self):
+        self.layer.refresh() # Only pin 3 is drawn individually
+        self.assertEqual(self.layer.materialized_pins([0, 3]), [3])
+        self.assertEqual(self.layer.materialized_pins([0, 1, 2, 3]), [3])
+
+    def test_cluster_click_zooms_to_its_pins(self):
+        self.layer.refresh()
+        cluster = next(marker for marker in self.map_widget.live_markers() if marker.text == "3")
+        cluster.command(cluster)
+        (top, left), (bottom, right) = self.map_widget.box
+        self.assertEqual((top, left, bottom, right), (-25.0, -57.0002, -25.0002, -57.0))
+
+    def test_clear_deletes_every_marker(self):
+        self.layer.refresh()
+        self.layer.clear()
+        self.assertEqual(self.map_widget.live_markers(), [])
+        self.assertEqual(len(self.layer.clusters), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import sys
+import os
+import types
+
+# The application runs as a script, so its modules are imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from map_region_select import RegionSelector
+
+
+# Minimal stand-ins for the map widget and its canvas, so the selector can be tested without a display.
+class FakeCanvas:
+    def __init__(self):
+        self.bindings = {}
+        self.items = {}
+    def bind(self, sequence, func, add=None):
+        self.bindings.setdefault(sequence, []).append(func)
+    def fire(self, sequence, x, y):
+        result = None
+        for func in self.bindings.get(sequence, []):
+            result = func(types.SimpleNamespace(x=x, y=y))
+        return result
+    def create_rectangle(self, *coords, **kwargs): return self._create(coords)
+    def create_line(self, *coords, **kwargs): return self._create(coords)
+    def _create(self, coords):
+        item = len(self.items) + 1
+        self.items[item] = coords
+        return item
+    def coords(self, item, *coords): self.items[item] = coords
+    def delete(self, item): del self.items[item]
+    def winfo_width(self): return 200
+    def winfo_height(self): return 100
+
+
+class FakeMapWidget:
+    def __init__(self):
+        self.canvas = FakeCanvas()
+        self.zoom = 1
+        # The view shows the whole world: 2 x 2 tiles at zoom 1
+        self.upper_left_tile_pos = (0.0, 0.0)
+        self.lower_right_tile_pos = (2.0, 2.0)
+
+
+class TestRegionSelector(unittest.TestCase):
+
+    def setUp(self):
+        self.map_widget = FakeMapWidget()
+        self.rectangles = []
+        self.lassos = []
+        self.selector = RegionSelector(self.map_widget, lambda start, end: self.rectangles.append((start, end)),
+                                       lambda x, y: self.lassos.append((list(x), list(y))))
+        self.canvas = self.map_widget.canvas
+
+    def test_shift_drag_reports_rectangle_in_world_coordinates(self):
+        self.assertEqual(self.canvas.fire("<Shift-Button-1>", 150, 75), "break") # The map must not pan
+        self.canvas.fire("<Shift-B1-Motion>", 100, 50)
+        self.assertEqual(self.canvas.items[1], (150, 75, 100, 50)) # Rubber band follows the mouse
+        self.canvas.fire("<Shift-ButtonRelease-1>", 50, 25)
+        self.assertEqual(self.rectangles, [((0.75, 0.75), (0.25, 0.25))])
+        self.assertEqual(self.canvas.items, {}) # Rubber band removed
+
+    def test_ctrl_drag_reports_lasso_stroke(self):
+        self.canvas.fire("<Control-Button-1>", 0, 0)
+        self.canvas.fire("<Control-B1-Motion>", 1, 0) # Below MIN_STROKE_STEP_PIXELS: ignored
+        self.canvas.fire("<Control-B1-Motion>", 100, 0)
+        self.canvas.fire("<Control-B1-Motion>", 100, 50)
+        self.canvas.fire("<ButtonRelease-1>", 100, 50) # Ctrl released before the mouse button
+        self.assertEqual(self.lassos, [([0.0, 0.5, 0.5], [0.0, 0.0, 0.5])])
+
+    def test_plain_release_is_left_to_the_map(self):
+        self.assertIsNone(self.canvas.fire("<ButtonRelease-1>", 10, 10))
+        self.assertEqual((self.rectangles, self.lassos), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
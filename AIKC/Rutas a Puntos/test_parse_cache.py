@@ -0,0 +1,103 @@
+import unittest
+import sys
+import os
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core import parse_cache
+from kmz_core.parse_cache import ParseCache, content_key
+from kmz_core.pin_store import PinStore
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = ParseCache(os.path.join(self.tmpdir.name, "cache"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_key_follows_content(self):
+        first = self._write("a.kmz", b"contenido")
+        copy = self._write("b.kmz", b"contenido")
+        other = self._write("c.kmz", b"otro contenido")
+        self.assertEqual(self.cache.key(first), self.cache.key(copy))
+        self.assertNotEqual(self.cache.key(first), self.cache.key(other))
+
+    def test_key_is_not_rehashed_while_the_file_is_unchanged(self):
+        path = self._write("a.kmz", b"contenido")
+        key = self.cache.key(path)
+        with mock.patch.object(parse_cache, "content_key", side_effect=AssertionError("hashed again")):
+            self.assertEqual(self.cache.key(path), key)
+
+        with open(path, "wb") as f:
+            f.write(b"contenido nuevo")
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        self.assertEqual(self.cache.key(path), content_key(path))
+        self.assertNotEqual(self.cache.key(path), key)
+
+    def test_round_trip_is_memory_mapped(self):
+        names = ["Poste 1", "Árbol ñandú", ""]
+        coords = [(-58.4, -34.6, 25.0), (-58.5, -34.7, 0.0), (1.0, 2.0, 3.0)]
+        self.assertIsNone(self.cache.get("clave"))
+        self.assertTrue(self.cache.put("clave", names, coords, 2))
+
+        cached = self.cache.get("clave")
+        self.assertIsInstance(cached.coords, np.memmap)
+        self.assertEqual(cached.error_count, 2)
+        np.testing.assert_array_equal(cached.coords, coords)
+
+        pins = PinStore()
+        pins.extend_encoded(cached.names, cached.name_offsets, cached.coords, "a.kmz")
+        self.assertEqual(pins.names(), names)
+        self.assertEqual(pins.sources, ["a.kmz"])
+        self.assertEqual(cached.lines, [])
+
+    def test_lines_round_trip(self):
+        lines = [("Tramo", np.array([(1.0, 2.0, 0.0), (3.0, 4.0, 5.0)])), ("Zona", np.zeros((4, 3)))]
+        self.assertTrue(self.cache.put("clave", ["P"], [(1.0, 2.0, 0.0)], 0, lines=lines))
+
+        cached = self.cache.get("clave")
+        self.assertEqual([name for name, _ in cached.lines], ["Tramo", "Zona"])
+        for (_, expected), (_, coords) in zip(lines, cached.lines):
+            np.testing.assert_array_equal(coords, expected)
+
+    def test_other_parser_versions_are_ignored_and_deleted(self):
+        self.cache.put("clave", ["P"], [(1.0, 2.0, 0.0)], 0)
+        with mock.patch.object(parse_cache, "PARSER_VERSION", parse_cache.PARSER_VERSION + 1):
+            newer = ParseCache(self.cache.cache_dir)
+            self.assertIsNone(newer.get("clave"))
+            newer.put("otra", ["P"], [(1.0, 2.0, 0.0)], 0)
+        self.assertFalse(os.path.exists(self.cache.version_dir))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        coords = np.zeros((1000, 3))  # About 33 KB per entry
+        cache = ParseCache(self.cache.cache_dir, max_bytes=80_000)
+        for key in ("a", "b"):
+            cache.put(key, ["P"] * 1000, coords, 0)
+            time.sleep(0.01)
+        self.assertIsNotNone(cache.get("a"))  # "b" is now the least recently used
+        time.sleep(0.01)
+        cache.put("c", ["P"] * 1000, coords, 0)
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertFalse(cache.put("d", ["P"] * 3000, np.zeros((3000, 3)), 0))  # Larger than the whole cache
+
+
+if __name__ == '__main__':
+    unittest.main()
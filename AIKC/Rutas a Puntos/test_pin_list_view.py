@@ -0,0 +1,126 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import importlib
+import sys
+import os
+import types
+
+# The application runs as a script, so its modules are imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+# Minimal stand-ins for the Tk widgets used by the list, so it can be tested without a display.
+class FakeWidget:
+    def __init__(self, master=None, **kwargs):
+        self.options = dict(kwargs)
+        self.bindings = {}
+    def pack(self, **kwargs): pass
+    def bind(self, sequence, func): self.bindings[sequence] = func
+    def configure(self, **kwargs): self.options.update(kwargs)
+
+
+class FakeCanvas(FakeWidget):
+    height = 240
+    def winfo_height(self): return self.height
+
+
+class FakeScrollbar(FakeWidget):
+    def set(self, top, bottom): self.position = (top, bottom)
+
+
+class FakeCheckbutton(FakeWidget):
+    created = 0
+    def __init__(self, master=None, **kwargs):
+        super().__init__(master, **kwargs)
+        FakeCheckbutton.created += 1
+        self.flags = set()
+        self.placed = None
+    def state(self, specs):
+        for spec in specs:
+            if spec.startswith("!"):
+                self.flags.discard(spec[1:])
+            else:
+                self.flags.add(spec)
+    def instate(self, specs): return all(spec in self.flags for spec in specs)
+    def place(self, **kwargs): self.placed = kwargs
+    def place_forget(self): self.placed = None
+
+
+fake_ttk = types.SimpleNamespace(Frame=FakeWidget, Scrollbar=FakeScrollbar, Checkbutton=FakeCheckbutton)
+fake_tkinter = types.SimpleNamespace(Canvas=FakeCanvas, ttk=fake_ttk)
+
+
+class TestVirtualPinList(unittest.TestCase):
+
+    def setUp(self):
+        # Import the list with the fake widgets in place of tkinter
+        modules_patch = patch.dict(sys.modules, {'tkinter': fake_tkinter, 'tkinter.ttk': fake_ttk})
+        modules_patch.start()
+        self.addCleanup(modules_patch.stop)
+        sys.modules.pop('pin_list_view', None)
+        pin_list_view = importlib.import_module('pin_list_view')
+        self.selected = set()
+        self.toggled = []
+        self.clicked = []
+        self.view = pin_list_view.VirtualPinList(
+            None,
+            row_label=lambda index: f"Pin {index}",
+            row_selected=lambda index: index in self.selected,
+            on_row_toggled=lambda index, state: self.toggled.append((index, state)),
+            on_row_click=lambda event, index: self.clicked.append(index),
+            row_height=24,
+        )
+        FakeCheckbutton.created = 0
+        self.view._on_configure(types.SimpleNamespace(height=240)) # 10 visible rows
+
+    def visible(self):
+        return [row.checkbutton.options["text"] for row in self.view.rows if row.index is not None]
+
+    def test_only_visible_rows_have_widgets(self):
+        self.view.set_row_count(100000)
+        self.assertEqual(FakeCheckbutton.created, 11)
+        self.assertEqual(self.visible()[:2], ["Pin 0", "Pin 1"])
+
+    def test_scrolling_recycles_rows(self):
+        self.view.set_row_count(1000)
+        self.selected.add(500)
+        self.view.yview("moveto", "0.5")
+        self.assertEqual(self.view.first_row, 500)
+        self.assertEqual(self.visible()[0], "Pin 500")
+        self.assertTrue(self.view.rows[0].checkbutton.instate(["selected"]))
+        self.assertFalse(self.view.rows[1].checkbutton.instate(["selected"]))
+        self.assertEqual(FakeCheckbutton.created, 11)
+
+        self.view.yview("moveto", "1.0") # Clamped so the last page is full
+        self.assertEqual(self.view.first_row, 990)
+        self.view.yview("scroll", "-1", "pages")
+        self.assertEqual(self.view.first_row, 980)
+
+    def test_short_list_hides_unused_rows(self):
+        self.view.set_row_count(3)
+        self.assertEqual(self.visible(), ["Pin 0", "Pin 1", "Pin 2"])
+        self.assertIsNone(self.view.rows[3].checkbutton.placed)
+        self.view.set_row_count(0)
+        self.assertEqual(self.visible(), [])
+
+    def test_row_callbacks_use_current_index(self):
+        self.view.set_row_count(50)
+        self.view.scroll_to(30)
+        row = self.view.rows[0]
+        index = row.index
+        row.checkbutton.bindings["<Button-1>"](MagicMock())
+        row.checkbutton.state(["selected"])
+        row.checkbutton.options["command"]()
+        self.assertEqual(self.clicked, [index])
+        self.assertEqual(self.toggled, [(index, True)])
+
+    def test_render_only_changed_rows(self):
+        self.view.set_row_count(20)
+        self.selected.update({2, 15})
+        self.view.render([2, 15]) # 15 is not visible, nothing to do for it
+        self.assertTrue(self.view.rows[2].checkbutton.instate(["selected"]))
+        self.assertFalse(self.view.rows[3].checkbutton.instate(["selected"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.pin_store import PinStore, NO_ORDER
+
+
+class TestPinStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = PinStore()
+        self.store.extend(["A", "Bé", "C"], [(1, 10, 0), (2, 20, 5), (3, 30, 0)], "a.kmz")
+        self.store.append("D", (4, 40, 0), "b.kmz")
+        self.store.append("E", (5, 50, 0), "a.kmz")
+
+    def test_columns_and_accessors(self):
+        self.assertEqual(len(self.store), 5)
+        self.assertEqual(self.store.name(1), "Bé")
+        self.assertEqual(self.store.coords_original(1), (2.0, 20.0, 5.0))
+        self.assertEqual(self.store.coords_map(1), (20.0, 2.0))
+        self.assertEqual(self.store.source(3), "b.kmz")
+        self.assertEqual(self.store.sources, ["a.kmz", "b.kmz"])
+        self.assertEqual(self.store.source_ids.dtype, np.int32)
+        np.testing.assert_array_equal(self.store.lon, [1, 2, 3, 4, 5])
+        self.assertEqual(self.store.names(), ["A", "Bé", "C", "D", "E"])
+        self.assertEqual(self.store.name_bytes([2, 1]), [b"C", "Bé".encode("utf-8")])
+        self.assertEqual(self.store.names([]), [])
+        self.assertEqual(self.store.name_sizes().tolist(), [1, 3, 1, 1, 1])
+
+    def test_growth_keeps_data(self):
+        store = PinStore()
+        names = [f"P{i}" for i in range(3000)]
+        coords = np.column_stack((np.arange(3000), -np.arange(3000), np.zeros(3000)))
+        store.extend(names[:1000], coords[:1000], "x")
+        store.extend(names[1000:], coords[1000:].ravel(), "y")
+        self.assertEqual(len(store), 3000)
+        self.assertEqual(store.name(2999), "P2999")
+        self.assertEqual(store.coords_original(1500), (1500.0, -1500.0, 0.0))
+        self.assertEqual(store.source(999), "x")
+        self.assertEqual(store.source(1000), "y")
+
+    def test_extend_rejects_mismatched_lengths(self):
+        with self.assertRaises(ValueError):
+            self.store.extend(["solo"], [(1, 1, 0), (2, 2, 0)])
+        with self.assertRaises(ValueError):
+            self.store.extend_encoded(b"ab", [0, 1, 2], [(1, 1, 0)])
+
+    def test_extend_encoded_takes_a_slice_of_a_names_blob(self):
+        blob = np.frombuffer("xxFñG".encode("utf-8"), dtype=np.uint8)
+        first = self.store.extend_encoded(blob, [2, 3, 5, 6], [(6, 60, 0), (7, 70, 0), (8, 80, 1)], "c.kmz")
+        self.assertEqual(first, 5)
+        self.assertEqual(self.store.names(), ["A", "Bé", "C", "D", "E", "F", "ñ", "G"])
+        self.assertEqual(self.store.coords_original(7), (8.0, 80.0, 1.0))
+        self.assertEqual(self.store.source(6), "c.kmz")
+        self.assertFalse(self.store.selected[5:].any())
+
+    def test_selection_order(self):
+        self.store.set_selected([3, 0], True)
+        self.store.toggle(2)
+        np.testing.assert_array_equal(self.store.selected_indices_ordered(), [3, 0, 2])
+        self.assertEqual(self.store.select_order[1], NO_ORDER)
+
+        self.store.set_selected(0, False)
+        np.testing.assert_array_equal(self.store.selected_indices_ordered(), [3, 2])
+
+        self.store.select_all()  # Unselected pins are appended in index order
+        np.testing.assert_array_equal(self.store.selected_indices_ordered(), [3, 2, 0, 1, 4])
+
+        self.store.deselect_all()
+        self.assertEqual(self.store.selected_count(), 0)
+        self.assertEqual(self.store.order_counter, 1)
+
+    def test_ranks_follow_selection_order(self):
+        self.store.set_selected([3, 0, 2], True)
+        self.assertEqual([self.store.rank(i) for i in range(5)], [2, 0, 3, 1, 0])
+
+        self.store.toggle(3)  # Pins selected after it move up one place
+        np.testing.assert_array_equal(self.store.ranks(range(5)), [1, 0, 2, 0, 0])
+
+        self.store.select_all()
+        np.testing.assert_array_equal(self.store.ranks(self.store.selected_indices_ordered()), [1, 2, 3, 4, 5])
+
+    def test_invert_selection_and_source_indices(self):
+        self.store.set_selected([4, 1], True)
+        np.testing.assert_array_equal(self.store.invert_selection(), [0, 1, 2, 3, 4])
+        np.testing.assert_array_equal(self.store.selected_indices_ordered(), [0, 2, 3])
+        self.assertEqual(self.store.order_counter, 4) # Numbering restarted: nothing stayed selected
+        np.testing.assert_array_equal(self.store.source_indices("a.kmz"), [0, 1, 2, 4])
+        self.assertEqual(len(self.store.source_indices("otro.kmz")), 0)
+
+    def test_set_selected_reports_changes(self):
+        self.store.set_selected([1], True)
+        changed = self.store.set_selected([0, 1, 1, 2], True)
+        np.testing.assert_array_equal(changed, [0, 2])
+        mask = np.zeros(len(self.store), dtype=bool)
+        mask[[0, 4]] = True
+        np.testing.assert_array_equal(self.store.set_selected(mask, False), [0])
+
+    def test_group_indices_by_source(self):
+        groups = self.store.group_indices_by_source()
+        self.assertEqual([source for source, _ in groups], ["a.kmz", "b.kmz"])
+        np.testing.assert_array_equal(groups[0][1], [0, 1, 2, 4])
+        np.testing.assert_array_equal(groups[1][1], [3])
+
+    def test_bounds_and_bulk_coords(self):
+        self.assertEqual(self.store.bounds(), (10.0, 1.0, 50.0, 5.0))
+        self.assertIsNone(PinStore().bounds())
+        self.assertEqual(self.store.kml_coords([4, 0]), [(5.0, 50.0, 0.0), (1.0, 10.0, 0.0)])
+        self.assertEqual(self.store.map_coords([1]), [(20.0, 2.0)])
+
+    def test_copy_is_independent(self):
+        self.store.set_selected([3, 0], True)
+        copy = self.store.copy()
+        self.store.append("F", (6, 60, 0), "c.kmz")
+        self.store.set_selected([1], True)
+        self.store.clear()
+        self.assertEqual(copy.names(), ["A", "Bé", "C", "D", "E"])
+        self.assertEqual(copy.source(3), "b.kmz")
+        np.testing.assert_array_equal(copy.selected_indices_ordered(), [3, 0])
+        self.assertEqual(copy.rank(0), 2)
+        copy.append("G", (7, 70, 0), "b.kmz")  # The copy still grows on its own
+        self.assertEqual((len(copy), copy.name(5), copy.source(5)), (6, "G", "b.kmz"))
+
+    def test_clear(self):
+        self.store.select_all()
+        self.store.clear()
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.sources, [])
+        self.assertEqual(self.store.order_counter, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
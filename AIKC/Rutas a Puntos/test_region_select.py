@@ -0,0 +1,57 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.spatial_index import PointGridIndex
+from kmz_core.region_select import points_in_polygon, stroke_positions, pins_in_rectangle, pins_in_lasso
+
+
+class TestRegionSelect(unittest.TestCase):
+
+    def test_points_in_polygon(self):
+        # Concave "L" shape
+        polygon_x = [0, 2, 2, 1, 1, 0]
+        polygon_y = [0, 0, 1, 1, 2, 2]
+        x = [0.5, 1.5, 1.5, 0.5, 3.0]
+        y = [0.5, 0.5, 1.5, 1.5, 0.5]
+        np.testing.assert_array_equal(points_in_polygon(x, y, polygon_x, polygon_y), [True, True, False, True, False])
+
+    def test_points_in_polygon_matches_ray_casting(self):
+        rng = np.random.default_rng(3)
+        angles = np.sort(rng.random(40)) * 2 * np.pi
+        radii = 0.5 + rng.random(40)
+        polygon_x, polygon_y = radii * np.cos(angles), radii * np.sin(angles)
+        x, y = rng.random(2000) * 3 - 1.5, rng.random(2000) * 3 - 1.5
+        expected = np.zeros(len(x), dtype=bool)
+        for i in range(len(polygon_x)):
+            x1, y1, x2, y2 = polygon_x[i], polygon_y[i], polygon_x[i - 1], polygon_y[i - 1]
+            crosses = (y1 > y) != (y2 > y)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                expected ^= crosses & (x < x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+        np.testing.assert_array_equal(points_in_polygon(x, y, polygon_x, polygon_y), expected)
+
+    def test_stroke_positions(self):
+        positions = stroke_positions([0.1, 0.9, 0.5], [0.0, 0.1, -0.1], [0, 1], [0, 0], samples=11)
+        np.testing.assert_allclose(positions, [0.1, 0.9, 0.5])
+
+    def test_rectangle_orders_along_drag(self):
+        grid = PointGridIndex([0.1, 0.5, 0.9, 0.5], [0.1, 0.5, 0.9, 2.0])
+        self.assertEqual(pins_in_rectangle(grid, (1, 1), (0, 0)).tolist(), [2, 1, 0])
+        self.assertEqual(pins_in_rectangle(grid, (0, 0), (1, 1)).tolist(), [0, 1, 2])
+
+    def test_lasso_orders_along_stroke(self):
+        # Pins along a band, lasso drawn from right to left around them
+        grid = PointGridIndex([0.2, 0.4, 0.6, 0.8, 0.5], [0.5, 0.5, 0.5, 0.5, 5.0])
+        stroke_x = [0.9, 0.1, 0.1, 0.9]
+        stroke_y = [0.45, 0.45, 0.55, 0.55]
+        self.assertEqual(pins_in_lasso(grid, stroke_x, stroke_y).tolist(), [3, 2, 1, 0])
+        self.assertEqual(len(pins_in_lasso(grid, [0, 1], [0, 1])), 0) # Not a region
+
+
+if __name__ == '__main__':
+    unittest.main()
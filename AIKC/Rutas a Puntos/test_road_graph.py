@@ -0,0 +1,82 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.road_graph import RoadGraph, load_road_graph, graph_cache_path, read_geojson_lines
+
+
+def grid_lines(size, step=0.001):
+    """Horizontal and vertical roads of a size x size grid, as (lon, lat) polylines."""
+    ticks = np.arange(size) * step
+    rows = [np.column_stack((ticks, np.full(size, lat))) for lat in ticks]
+    columns = [np.column_stack((np.full(size, lon), ticks)) for lon in ticks]
+    return rows + columns
+
+
+class TestRoadGraph(unittest.TestCase):
+
+    def test_from_lines_merges_shared_vertices(self):
+        graph = RoadGraph.from_lines(grid_lines(3))
+        self.assertEqual(len(graph), 9)  # Crossing roads share their intersection nodes
+        self.assertEqual(graph.edge_count, 24)  # 12 two-way road segments
+        self.assertAlmostEqual(graph.edge_weight(0, 1), 111.2, delta=0.5)
+
+    def test_oneway_lines(self):
+        graph = RoadGraph.from_lines([[(0.0, 0.0), (0.001, 0.0)], [(0.0, 0.001), (0.001, 0.001)]], oneway=[1, -1])
+        self.assertEqual(graph.edge_count, 2)
+        start = np.flatnonzero((graph.lon == 0.0) & (graph.lat == 0.0))[0]
+        end = np.flatnonzero((graph.lon == 0.001) & (graph.lat == 0.0))[0]
+        self.assertIsNotNone(graph.edge_weight(start, end))
+        self.assertIsNone(graph.edge_weight(end, start))
+        top_start = np.flatnonzero((graph.lon == 0.0) & (graph.lat == 0.001))[0]
+        top_end = np.flatnonzero((graph.lon == 0.001) & (graph.lat == 0.001))[0]
+        self.assertIsNotNone(graph.edge_weight(top_end, top_start))  # "-1": against the drawing direction
+        self.assertIsNone(graph.edge_weight(top_start, top_end))
+
+    def test_from_lines_without_roads(self):
+        with self.assertRaises(ValueError):
+            RoadGraph.from_lines([[(0.0, 0.0)]])
+
+    def test_snap_projects_on_nearest_edge(self):
+        graph = RoadGraph.from_lines(grid_lines(4))
+        snap = graph.snap(0.0012, 0.00052)  # Just above the road at lat 0.001, between two nodes
+        self.assertAlmostEqual(snap.lat, 0.001, places=6)
+        self.assertAlmostEqual(snap.lon, 0.00052, places=6)
+        self.assertAlmostEqual(snap.fraction if graph.lon[snap.tail] < graph.lon[snap.head] else 1 - snap.fraction, 0.52, places=3)
+        self.assertAlmostEqual(snap.distance_m, 22.2, delta=0.5)
+
+    def test_geojson_reading_and_cache(self):
+        features = [
+            {"type": "Feature", "properties": {"highway": "residential"},
+             "geometry": {"type": "LineString", "coordinates": [[0.0, 0.0], [0.001, 0.0], [0.002, 0.0]]}},
+            {"type": "Feature", "properties": {"highway": "footway"},
+             "geometry": {"type": "LineString", "coordinates": [[0.0, 0.0], [0.0, 0.001]]}},
+            {"type": "Feature", "properties": {"oneway": "yes"},
+             "geometry": {"type": "MultiLineString", "coordinates": [[[0.002, 0.0], [0.002, 0.001]]]}},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "roads.geojson")
+            with open(path, "w", encoding="utf-8") as geojson_file:
+                json.dump({"type": "FeatureCollection", "features": features}, geojson_file)
+            lines, oneway = read_geojson_lines(path)
+            self.assertEqual(len(lines), 2)  # The footway is not drivable
+            self.assertEqual(oneway, [0, 1])
+
+            cache_dir = os.path.join(directory, "cache")
+            graph = load_road_graph(path, cache_dir=cache_dir)
+            self.assertTrue(os.path.exists(graph_cache_path(path, cache_dir)))
+            cached = load_road_graph(path, cache_dir=cache_dir)
+            for name in ("lat", "lon", "indptr", "indices", "weights"):
+                np.testing.assert_array_equal(getattr(cached, name), getattr(graph, name))
+            self.assertEqual(graph.edge_count, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import sys
+import os
+import heapq
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.road_graph import RoadGraph
+from kmz_core.road_routing import RoadRouter
+
+
+def dijkstra(graph, sources, targets):
+    """Reference shortest distance from the {node: offset} sources to the {node: offset} targets."""
+    distance = dict(sources)
+    heap = [(value, node) for node, value in sources.items()]
+    heapq.heapify(heap)
+    best = float("inf")
+    while heap:
+        value, node = heapq.heappop(heap)
+        if value > distance[node] or value >= best:
+            continue
+        if node in targets:
+            best = min(best, value + targets[node])
+        for edge in range(graph.indptr[node], graph.indptr[node + 1]):
+            neighbour, new_value = int(graph.indices[edge]), value + graph.weights[edge]
+            if new_value < distance.get(neighbour, float("inf")):
+                distance[neighbour] = new_value
+                heapq.heappush(heap, (new_value, neighbour))
+    return best
+
+
+def random_grid_graph(size, rng, step=0.001):
+    """Grid of roads with jittered vertices and some one-way streets."""
+    lines, oneway = [], []
+    ticks = np.arange(size) * step
+    jitter = rng.normal(scale=step * 0.1, size=(size, size, 2))
+    for i in range(size):
+        lines.append(np.column_stack((ticks + jitter[i, :, 0], ticks[i] + jitter[i, :, 1])))
+        lines.append(np.column_stack((ticks[i] + jitter[:, i, 0], ticks + jitter[:, i, 1])))
+        oneway.extend(rng.choice([0, 0, 1, -1], size=2).tolist())
+    return RoadGraph.from_lines(lines, oneway)
+
+
+class TestRoadRouting(unittest.TestCase):
+
+    def test_shortest_path_matches_dijkstra(self):
+        rng = np.random.default_rng(3)
+        graph = random_grid_graph(20, rng)
+        router = RoadRouter(graph)
+        for _ in range(30):
+            start = graph.snap(*(rng.random(2) * 0.019))
+            end = graph.snap(*(rng.random(2) * 0.019))
+            sources, _ = router._edge_ends(start)
+            _, targets = router._edge_ends(end)
+            expected = min(dijkstra(graph, sources, targets), router._same_edge_length(start, end))
+            result = router.shortest_path(start, end)
+            if np.isinf(expected):
+                self.assertIsNone(result)
+                continue
+            length, nodes = result
+            self.assertAlmostEqual(length, expected, places=6)
+            # The returned nodes form a path along existing edges
+            for tail, head in zip(nodes, nodes[1:]):
+                self.assertIsNotNone(graph.edge_weight(tail, head))
+
+    def test_points_on_the_same_edge(self):
+        graph = RoadGraph.from_lines([[(0.0, 0.0), (0.01, 0.0)]])
+        router = RoadRouter(graph)
+        length, nodes = router.shortest_path(graph.snap(0.0, 0.002), graph.snap(0.0, 0.007))
+        self.assertEqual(nodes, [])
+        self.assertAlmostEqual(length, 556.0, delta=1.0)
+
+    def test_route_through_counts_unrouted_legs(self):
+        # Two roads that don't touch: the leg between them is drawn straight
+        graph = RoadGraph.from_lines([[(0.0, 0.0), (0.001, 0.0), (0.002, 0.0)], [(0.0, 0.01), (0.002, 0.01)]])
+        router = RoadRouter(graph)
+        path = router.route_through([0.0, 0.0, 0.01], [0.0, 0.002, 0.001])
+        self.assertEqual(path.unrouted_legs, 1)
+        self.assertEqual(path.lat[0], 0.0)
+        self.assertAlmostEqual(path.lat[-1], 0.01)
+        self.assertEqual(len(path.lat), 4)  # Start, the middle node, the second stop and the third stop
+        self.assertGreater(path.length_m, 222.0 + 1100.0)
+
+    def test_stops_without_a_finite_position_are_unrouted(self):
+        graph = RoadGraph.from_lines([[(0.0, 0.0), (0.001, 0.0), (0.002, 0.0)]])
+        router = RoadRouter(graph)
+        path = router.route_through([0.0, float("nan"), 0.0, 0.0], [0.0, float("nan"), 0.002, 0.001])
+        self.assertEqual(path.unrouted_legs, 2)  # To and from the NaN stop
+        self.assertEqual(len(path.lat), 4)  # The first stop, the third joined straight, the middle node and the fourth
+        self.assertTrue(np.isfinite(path.lat).all() and np.isfinite(path.length_m))
+        self.assertAlmostEqual(path.length_m, 222.4 + 111.2, delta=1.0)
+        self.assertEqual(router.route_through([float("nan")] * 2, [0.0, 1.0]), ([], [], 0.0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from kmz_core.route_metrics import RouteMetricsCache, compute_route_metrics, coords_array
+
+DEGREE_M = 111195.08 # One degree of a great circle, in meters
+
+
+class TestRouteMetrics(unittest.TestCase):
+
+    def test_single_route(self):
+        coords = [(0.0, 0.0, 100.0), (1.0, 0.0, 150.0), (1.0, 2.0, 120.0), (1.0, 2.5, 130.0)]
+        metrics, = compute_route_metrics([coords])
+        self.assertEqual(metrics.vertex_count, 4)
+        self.assertAlmostEqual(metrics.length_m, 3.5 * DEGREE_M, delta=5)
+        np.testing.assert_allclose(metrics.segment_lengths, [DEGREE_M, 2 * DEGREE_M, 0.5 * DEGREE_M], atol=5)
+        self.assertAlmostEqual(metrics.max_gap_m, 2 * DEGREE_M, delta=5)
+        self.assertEqual(metrics.bounds, (0.0, 0.0, 1.0, 2.5))
+        self.assertAlmostEqual(metrics.altitude_gain_m, 60.0)
+        self.assertAlmostEqual(metrics.altitude_loss_m, 30.0)
+
+    def test_routes_do_not_leak_into_each_other(self):
+        first = [(0.0, 0.0, 0.0), (0.0, 1.0, 10.0)]
+        second = [(50.0, 50.0, 500.0), (50.0, 50.5, 0.0)]
+        empty, single = [], [(3.0, 4.0, 5.0)]
+        metrics = compute_route_metrics([first, empty, single, second])
+        self.assertEqual([m.vertex_count for m in metrics], [2, 0, 1, 2])
+        self.assertAlmostEqual(metrics[0].length_m, DEGREE_M, delta=5)
+        self.assertAlmostEqual(metrics[0].altitude_gain_m, 10.0)
+        self.assertIsNone(metrics[1].bounds)
+        self.assertEqual(metrics[1].length_m, 0.0)
+        self.assertEqual(metrics[2].length_m, 0.0)
+        self.assertEqual(len(metrics[2].segment_lengths), 0)
+        self.assertEqual(metrics[2].bounds, (3.0, 4.0, 3.0, 4.0))
+        self.assertAlmostEqual(metrics[3].length_m, 0.5 * DEGREE_M, delta=5)
+        self.assertAlmostEqual(metrics[3].altitude_loss_m, 500.0)
+        self.assertEqual(metrics[3].altitude_gain_m, 0.0)
+        self.assertEqual(compute_route_metrics([]), [])
+
+    def test_coords_array(self):
+        np.testing.assert_array_equal(coords_array([(1, 2, 3), (4, 5, 6)]), [[1, 2, 3], [4, 5, 6]])
+        self.assertEqual(coords_array([]).shape, (0, 3))
+
+    def test_cache_recomputes_only_changed_routes(self):
+        routes = [{"kml_coords": [(0.0, 0.0, 0.0), (0.0, 1.0, 0.0)]}, {"kml_coords": [(1.0, 0.0, 0.0), (2.0, 0.0, 0.0)]}]
+        cache = RouteMetricsCache()
+        first = cache.metrics(routes)
+        again = cache.metrics(routes)
+        self.assertIs(again[0], first[0])
+        self.assertIs(again[1], first[1])
+
+        routes[1]["kml_coords"] = routes[1]["kml_coords"] + [(3.0, 0.0, 0.0)] # Replacing the coordinates invalidates
+        edited = cache.metrics(routes)
+        self.assertIs(edited[0], first[0])
+        self.assertEqual(edited[1].vertex_count, 3)
+
+        routes[0]["kml_coords"].append((0.0, 2.0, 0.0)) # In-place edits need invalidate()
+        self.assertEqual(cache.metrics(routes)[0].vertex_count, 2)
+        cache.invalidate(routes[0])
+        self.assertEqual(cache.metrics(routes)[0].vertex_count, 3)
+
+        self.assertEqual(cache.metrics(routes[1:])[0].vertex_count, 3)
+        self.assertEqual(len(cache._entries), 1) # Entries of removed routes are dropped
+
+
+if __name__ == '__main__':
+    unittest.main()
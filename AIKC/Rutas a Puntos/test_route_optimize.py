@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from kmz_core.route_optimize import haversine_matrix, nearest_neighbour_order, optimize_route, path_length
+
+
+class TestRouteOptimize(unittest.TestCase):
+
+    def test_haversine_distances(self):
+        matrix = haversine_matrix([0.0, 0.0, 1.0], [0.0, 1.0, 0.0], block_rows=2)
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertAlmostEqual(float(matrix[0, 1]), 111195.08, delta=1.0) # One degree along the equator
+        self.assertAlmostEqual(float(matrix[0, 2]), 111195.08, delta=1.0) # One degree of latitude
+        np.testing.assert_allclose(matrix, matrix.T)
+        self.assertAlmostEqual(path_length([0.0, 0.0, 1.0], [0.0, 1.0, 0.0]), float(matrix[0, 1] + matrix[1, 2]), delta=1.0)
+
+    def test_nearest_neighbour_order(self):
+        lon = np.array([0.0, 0.3, 0.1, 0.2])
+        order = nearest_neighbour_order(haversine_matrix(np.zeros(4), lon))
+        np.testing.assert_array_equal(order, [0, 2, 3, 1])
+
+    def test_zig_zag_line_is_straightened(self):
+        rng = np.random.default_rng(3)
+        lon = np.concatenate(([0.0], rng.permutation(np.linspace(0.001, 0.1, 99))))
+        lat = np.zeros(100)
+        result = optimize_route(lat, lon)
+        np.testing.assert_array_equal(lon[result.order], np.sort(lon))
+        self.assertAlmostEqual(result.length_after, path_length([0.0, 0.0], [0.0, 0.1]), delta=1.0)
+        self.assertGreater(result.length_before, 10 * result.length_after)
+
+    def test_random_stops(self):
+        rng = np.random.default_rng(5)
+        lat = -25.3 + rng.random(500) * 0.2
+        lon = -57.6 + rng.random(500) * 0.2
+        result = optimize_route(lat, lon)
+        self.assertEqual(result.order[0], 0) # The first stop stays the start
+        np.testing.assert_array_equal(np.sort(result.order), np.arange(500))
+        self.assertAlmostEqual(result.length_after, path_length(lat[result.order], lon[result.order]))
+        self.assertLess(result.length_after, result.length_before / 5)
+
+    def test_time_budget_keeps_nearest_neighbour_tour(self):
+        rng = np.random.default_rng(7)
+        lat, lon = rng.random(300), rng.random(300)
+        result = optimize_route(lat, lon, time_budget=0.0)
+        np.testing.assert_array_equal(np.sort(result.order), np.arange(300))
+        self.assertLessEqual(result.length_after, result.length_before)
+
+    def test_short_or_already_optimal_routes_keep_their_order(self):
+        for count in (0, 1, 3):
+            result = optimize_route(np.zeros(count), np.arange(count) * 0.01)
+            np.testing.assert_array_equal(result.order, np.arange(count))
+            self.assertEqual(result.length_before, result.length_after)
+        result = optimize_route(np.zeros(6), np.arange(6) * 0.01)
+        np.testing.assert_array_equal(result.order, np.arange(6))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from kmz_core.clustering import project_to_world
+from kmz_core.route_optimize import path_length
+from kmz_core.route_split import (
+    capacitated_assignment, cut_by_length, hilbert_order, kmeans_partition, merge_small_groups, split_into_routes,
+    sweep_partition, MIN_ROUTE_STOPS, SPLIT_SWEEP,
+)
+
+
+def town_stops(rng, centers, per_town, spread=0.01):
+    """Stops scattered around each (lat, lon) center."""
+    lat = np.concatenate([c_lat + rng.normal(size=per_town) * spread for c_lat, _ in centers])
+    lon = np.concatenate([c_lon + rng.normal(size=per_town) * spread for _, c_lon in centers])
+    return lat, lon
+
+
+class TestRouteSplit(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(11)
+        self.centers = [(-25.3, -57.6), (-25.3, -56.6), (-24.3, -57.1)]
+
+    def test_capacitated_assignment_respects_capacity(self):
+        x = np.array([0.0, 0.1, 0.2, 0.3, 10.0])
+        y = np.zeros(5)
+        labels = capacitated_assignment(x, y, np.array([0.0, 10.0]), np.array([0.0, 0.0]), capacity=3)
+        np.testing.assert_array_equal(labels, [0, 0, 0, 1, 1]) # The farthest of the four near pins overflows
+
+    def test_kmeans_finds_separate_towns(self):
+        lat, lon = town_stops(self.rng, self.centers, 200)
+        x, y = project_to_world(lat, lon)
+        labels = kmeans_partition(x, y, 3, capacity=200)
+        for town in range(3):
+            self.assertEqual(len(np.unique(labels[town * 200:(town + 1) * 200])), 1)
+        np.testing.assert_array_equal(np.bincount(labels), [200, 200, 200])
+
+    def test_sweep_partition_is_even(self):
+        lat, lon = town_stops(self.rng, self.centers, 100, spread=0.3)
+        x, y = project_to_world(lat, lon)
+        counts = np.bincount(sweep_partition(x, y, 4))
+        self.assertEqual(counts.max() - counts.min(), 0)
+
+    def test_hilbert_order_visits_neighbours_in_a_row(self):
+        grid_x, grid_y = np.meshgrid(np.arange(16.0), np.arange(16.0))
+        x, y = grid_x.ravel(), grid_y.ravel()
+        order = hilbert_order(x, y)
+        np.testing.assert_array_equal(np.sort(order), np.arange(256))
+        steps = np.abs(np.diff(x[order])) + np.abs(np.diff(y[order]))
+        self.assertTrue(np.all(steps == 1)) # Consecutive points are always grid neighbours
+
+    def test_cut_by_length(self):
+        lon = np.arange(10) * 0.01 # About 1.1 km between stops
+        pieces = cut_by_length(np.zeros(10), lon, 3000)
+        self.assertEqual([len(piece) for piece in pieces], [3, 3, 4]) # The lone last stop joins the last piece
+        np.testing.assert_array_equal(np.concatenate(pieces), np.arange(10))
+
+    def test_split_into_routes(self):
+        lat, lon = town_stops(self.rng, self.centers, 300)
+        routes = split_into_routes(lat, lon, 3)
+        self.assertEqual(len(routes), 3)
+        np.testing.assert_array_equal(np.sort(np.concatenate(routes)), np.arange(900))
+        self.assertEqual(sorted(len(route) for route in routes), [300, 300, 300])
+        for route in routes: # Each route stays in one town and is ordered
+            self.assertLess(path_length(lat[route], lon[route]), path_length(lat[np.sort(route)], lon[np.sort(route)]) / 4)
+
+    def test_split_limits(self):
+        lat, lon = town_stops(self.rng, self.centers, 100)
+        routes = split_into_routes(lat, lon, 1, max_stops=40)
+        self.assertGreaterEqual(len(routes), 8)
+        self.assertTrue(all(len(route) <= 40 for route in routes))
+
+        routes = split_into_routes(lat, lon, 3, method=SPLIT_SWEEP, max_length_m=5000)
+        np.testing.assert_array_equal(np.sort(np.concatenate(routes)), np.arange(300))
+        for route in routes:
+            self.assertTrue(len(route) == 2 or path_length(lat[route], lon[route]) <= 5000)
+
+    def test_k_close_to_the_number_of_stops(self):
+        for count, k in ((12, 10), (7, 6), (5, 5), (3, 3), (2, 2)):
+            lat, lon = town_stops(self.rng, self.centers[:2], count)
+            lat, lon = lat[:count], lon[:count]
+            for method in ("kmeans", SPLIT_SWEEP):
+                for max_stops in (None, 2, 3):
+                    routes = split_into_routes(lat, lon, k, method=method, max_stops=max_stops)
+                    np.testing.assert_array_equal(np.sort(np.concatenate(routes)), np.arange(count))
+                    self.assertLessEqual(len(routes), count // 2)
+                    self.assertTrue(all(len(route) >= MIN_ROUTE_STOPS for route in routes), (count, k, method, max_stops))
+        self.assertEqual([len(route) for route in split_into_routes([1.0], [2.0], 3)], [1])
+
+    def test_small_groups_join_their_nearest_group(self):
+        x = np.array([0.0, 0.1, 5.0, 5.1, 5.2, 0.3, 9.0])
+        labels = merge_small_groups(x, np.zeros(7), np.array([0, 0, 1, 1, 1, 2, 3]))
+        np.testing.assert_array_equal(labels, [0, 0, 1, 1, 1, 0, 1])
+        x = np.array([0.0, 0.1, 5.0, 5.1, 5.2, 5.3, 0.3, 9.0])
+        labels = merge_small_groups(x, np.zeros(8), np.array([0, 0, 1, 1, 1, 1, 2, 3]), max_stops=4)
+        np.testing.assert_array_equal(labels, [0, 0, 1, 1, 1, 1, 0, 0])  # Group 1 is full
+
+    def test_time_budget_falls_back_to_hilbert_order(self):
+        lat, lon = town_stops(self.rng, self.centers, 50)
+        routes = split_into_routes(lat, lon, 3, time_budget=0.0)
+        np.testing.assert_array_equal(np.sort(np.concatenate(routes)), np.arange(150))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.pin_store import PinStore
+from kmz_core.road_graph import RoadGraph
+from kmz_core.road_routing import RoadRouter
+from kmz_core.routes import (
+    DEFAULT_KML_COLOR, DEFAULT_ROUTE_COLOR, hex_color_to_kml, kml_color_to_route_color, kml_routes, road_route,
+    order_routes, routes_by_source, source_groups,
+)
+from kmz_core import routes
+
+
+class TestRoutes(unittest.TestCase):
+
+    def setUp(self):
+        self.pins = PinStore()
+        self.pins.extend(["A0", "A1", "A2", "A3"], [(0.0, 0.0, 0), (0.2, 0.0, 0), (0.1, 0.0, 0), (0.3, 0.0, 0)], "a.kmz")
+        self.pins.append("B0", (5.0, 5.0, 0), "b.kmz")
+
+    def test_kml_colors(self):
+        self.assertEqual(hex_color_to_kml("#e6b04b"), "ff4bb0e6")
+        self.assertEqual(hex_color_to_kml("rojo"), DEFAULT_KML_COLOR)
+        routes = [{"name": "R1", "kml_coords": [(1, 1, 0)], "color": "cyan"},
+                  {"name": "R2", "kml_coords": [(2, 2, 0)], "color": "#3cb44b"},
+                  {"name": "R3", "kml_coords": [(3, 3, 0)]}]
+        self.assertEqual(kml_routes(routes), [("R1", "ffffff00", [(1, 1, 0)]),
+                                              ("R2", "ff4bb43c", [(2, 2, 0)]),
+                                              ("R3", "ff0000ff", [(3, 3, 0)])])
+
+    def test_kml_colors_back_to_route_colors(self):
+        self.assertEqual(kml_color_to_route_color("ffffff00"), "cyan")
+        self.assertEqual(kml_color_to_route_color(" FF4BB43C "), "#3cb44b")
+        self.assertEqual(kml_color_to_route_color("804bb43c"), "#3cb44b")  # The alpha is dropped
+        for kml_color in (None, "", "rojo", "ff4bb43"):
+            self.assertEqual(kml_color_to_route_color(kml_color), DEFAULT_ROUTE_COLOR)
+
+    def test_routes_by_source(self):
+        source_routes = routes_by_source(self.pins)
+        self.assertEqual([(name, indices.tolist()) for name, indices in source_routes.routes], [("Ruta a.kmz", [0, 1, 2, 3])])
+        self.assertEqual((source_routes.length_before, source_routes.length_after), (0.0, 0.0))
+
+        optimized = routes_by_source(self.pins, optimize=True)
+        self.assertEqual(optimized.routes[0][1].tolist(), [0, 2, 1, 3])
+        self.assertLess(optimized.length_after, optimized.length_before)
+
+    def test_large_routes_and_spent_budget_follow_a_hilbert_curve(self):
+        lon = np.array([0.0, 0.3, 0.1, 0.2, 0.05])
+        lat = np.zeros(5)
+        groups = [("Ruta a", np.arange(5))]
+        with patch.object(routes, "OPTIMIZE_MAX_STOPS", 4), patch.object(routes, "optimize_route") as optimize:
+            result = order_routes(lat, lon, groups)
+            optimize.assert_not_called()
+        self.assertEqual(result.routes[0][1].tolist(), [0, 4, 2, 3, 1])  # The first stop stays first
+        self.assertLess(result.length_after, result.length_before)
+
+        with patch.object(routes, "optimize_route") as optimize:  # No time left: not optimized either
+            result = order_routes(lat, lon, groups + [("Ruta b", np.array([0, 1]))], time_budget=0.0)
+            optimize.assert_not_called()
+        self.assertEqual([indices.tolist() for _, indices in result.routes], [[0, 4, 2, 3, 1], [0, 1]])
+        self.assertEqual([name for name, _ in source_groups(self.pins)], ["Ruta a.kmz"])
+
+    def test_road_route(self):
+        graph = RoadGraph.from_lines([[(0.0, 0.0), (0.1, 0.0), (0.2, 0.0)]], [0])
+        kml_coords, road_path = road_route(RoadRouter(graph), self.pins, [0, 1])
+        self.assertEqual(len(kml_coords), 3)
+        for (lon, lat, alt), expected_lon in zip(kml_coords, [0.0, 0.1, 0.2]):
+            self.assertAlmostEqual(lon, expected_lon, places=9)
+            self.assertEqual((lat, alt), (0.0, 0.0))
+        self.assertEqual(road_path.unrouted_legs, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch
+import importlib
+import sys
+import os
+import types
+
+# The application runs as a script, so its modules are imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from kmz_core.route_metrics import compute_route_metrics
+
+
+# Minimal stand-ins for the Tk widgets used by the panel, so it can be tested without a display.
+class FakeWidget:
+    def __init__(self, master=None, **kwargs):
+        self.options = dict(kwargs)
+        self.bindings = {}
+    def pack(self, **kwargs): pass
+    def bind(self, sequence, func): self.bindings[sequence] = func
+    def configure(self, **kwargs): self.options.update(kwargs)
+    def yview(self, *args): pass
+    def set(self, *args): pass
+
+
+class FakeTreeview(FakeWidget):
+    def __init__(self, master=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.rows = {}
+        self.selected = ()
+    def heading(self, column, **kwargs): pass
+    def column(self, column, **kwargs): pass
+    def get_children(self): return tuple(self.rows)
+    def delete(self, *items):
+        for item in items:
+            del self.rows[item]
+    def insert(self, parent, index, iid, values):
+        self.rows[iid] = values
+    def selection(self): return self.selected
+
+
+fake_ttk = types.SimpleNamespace(Frame=FakeWidget, Scrollbar=FakeWidget, Label=FakeWidget, Treeview=FakeTreeview)
+fake_tkinter = types.SimpleNamespace(ttk=fake_ttk)
+
+
+class TestRoutesPanel(unittest.TestCase):
+
+    def setUp(self):
+        modules_patch = patch.dict(sys.modules, {'tkinter': fake_tkinter, 'tkinter.ttk': fake_ttk})
+        modules_patch.start()
+        self.addCleanup(modules_patch.stop)
+        sys.modules.pop('routes_panel', None)
+        routes_panel = importlib.import_module('routes_panel')
+        self.selected = []
+        self.panel = routes_panel.RoutesPanel(None, on_route_select=self.selected.append)
+
+    def test_show_routes_and_summary(self):
+        routes = [
+            {"name": "Ruta-1", "kml_coords": [(0.0, 0.0, 0.0), (0.0, 0.01, 25.0), (0.0, 0.02, 5.0)]},
+            {"name": "Ruta-2", "kml_coords": [(1.0, 0.0, 0.0), (1.0, 0.1, 0.0)]},
+        ]
+        self.panel.show(routes, compute_route_metrics([route["kml_coords"] for route in routes]))
+        self.assertEqual(self.panel.tree.rows["0"], ("Ruta-1", 3, "2.22", "1.11", "25"))
+        self.assertEqual(self.panel.tree.rows["1"], ("Ruta-2", 2, "11.12", "11.12", "0"))
+        self.assertEqual(self.panel.summary_label.options["text"], "2 rutas, 13.3 km en total")
+
+        self.panel.show([], [])
+        self.assertEqual(self.panel.tree.rows, {})
+        self.assertEqual(self.panel.summary_label.options["text"], "Sin rutas")
+
+    def test_selecting_a_row_reports_the_route_number(self):
+        self.panel.tree.selected = ("1",)
+        self.panel.tree.bindings["<<TreeviewSelect>>"](None)
+        self.assertEqual(self.selected, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,16 @@ from unittest.mock import patch, MagicMock, mock_open, call
 import sys
 import os
 
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from kmz_core.pin_store import PinStore
+from kmz_core.route_metrics import RouteMetricsCache
+from kmz_core.road_graph import RoadGraph
+from kmz_core.road_routing import RoadRouter
+from kmz_core.instrumentation import Profiler
+# Helper modules the application imports, loaded with the real lxml before it is mocked
+import kmz_core.background_load, kmz_core.batch_load, kmz_core.kml_reader, kmz_core.parse_cache
+
 # Mock modules before importing the application
 MOCK_MODULES = {
     'tkinter': MagicMock(),
@@ -10,11 +20,30 @@ MOCK_MODULES = {
     'tkinter.filedialog': MagicMock(),
     'tkinter.messagebox': MagicMock(),
     'tkintermapview': MagicMock(),
-    'simplekml': MagicMock(),
     'lxml': MagicMock(),
     'lxml.etree': MagicMock(),
 }
 
+
+class FakeTk:
+    """Stand-in for `tkinter.Tk`, so that the application class stays a real class; window methods are mocks."""
+    def __init__(self):
+        for method in ("title", "geometry", "configure", "after", "after_cancel"):
+            setattr(self, method, MagicMock())
+
+
+class FakeComment:
+    """Stand-in for `lxml.etree._Comment`, which the application checks with isinstance."""
+
+
+MOCK_MODULES['tkinter'].Tk = FakeTk
+MOCK_MODULES['lxml.etree']._Comment = FakeComment
+# `from tkinter import messagebox` reads the attribute of the mocked package: make it the mocked submodule
+for _name, _module in MOCK_MODULES.items():
+    if "." in _name:
+        _package, _attribute = _name.rsplit(".", 1)
+        setattr(MOCK_MODULES[_package], _attribute, _module)
+
 # Helper to create mock lxml elements
 def create_mock_element(tag, text=None, children=None, attrib=None):
     el = MagicMock()
@@ -73,12 +102,21 @@ def create_mock_element(tag, text=None, children=None, attrib=None):
 KML_NS_TEST = "{http://www.opengis.net/kml/2.2}"
 
 
-@patch.dict(sys.modules, MOCK_MODULES)
 class TestKMZRouteApp(unittest.TestCase):
 
     def setUp(self):
-        # Import the application class AFTER mocks are in place
-        from AIKC.Rutas.a.Puntos.ruta_por_punto import KMZRouteApp, KML_NS, LIGHT_THEME_COLORS, DARK_THEME_COLORS
+        # The mocks stay in place for setUp and the test, and the application is imported
+        # again under them, so it never reaches a real window or dialog even if another
+        # test module imported it first.
+        modules = patch.dict(sys.modules, MOCK_MODULES)
+        modules.start()
+        self.addCleanup(modules.stop)
+        for module in MOCK_MODULES.values():
+            module.reset_mock()
+        sys.modules.pop("ruta_por_punto", None)
+        import ruta_por_punto
+        self.module = ruta_por_punto
+        from ruta_por_punto import KMZRouteApp, KML_NS, LIGHT_THEME_COLORS, DARK_THEME_COLORS
 
         # Mock methods that would normally interact with Tkinter's mainloop or UI setup
         with patch.object(KMZRouteApp, '__init__', lambda s: None): # Bypass original __init__
@@ -92,12 +130,12 @@ class TestKMZRouteApp(unittest.TestCase):
         self.app.after = MagicMock()
         
         # Data structures
-        self.app.pins_data = []
+        self.app.pins_data = PinStore()
         self.app.routes_data = []
-        self.app.map_markers = []
-        self.app.map_paths = []
+        self.app.route_metrics = RouteMetricsCache()
+        self.app.dirty_marker_indices = set()
+        self.app.map_layer = MagicMock()
         self.app.last_selected_index = None
-        self.app.order_counter = 1
         self.app.update_ordering_id = None
         self.app.extraction_error_count = 0
         self.app.current_source = "test_source.kmz"
@@ -106,8 +144,18 @@ class TestKMZRouteApp(unittest.TestCase):
         self.app.map_widget = MOCK_MODULES['tkintermapview'].TkinterMapView.return_value
         self.app.route_name_entry = MagicMock()
         self.app.route_color_combo = MagicMock()
-        self.app.pins_canvas = MagicMock()
-        self.app.pins_list_frame = MagicMock() 
+        self.app.pin_list = MagicMock()
+        self.app.routes_panel = MagicMock()
+        self.app.source_combo = MagicMock()
+        self.app.optimize_routes_var = MagicMock()
+        self.app.optimize_routes_var.get.return_value = False
+        self.app.road_snap_var = MagicMock()
+        self.app.road_snap_var.get.return_value = False
+        self.app.road_router = None
+        self.app.profiler = Profiler()
+        self.app.task_worker = None
+        self.app.task_poll_id = None
+        self.app.task_handler = None
         
         # Theme related
         self.app.theme = "light"
@@ -121,27 +169,25 @@ class TestKMZRouteApp(unittest.TestCase):
         # Mock _apply_theme as it's called often and can be complex
         self.app._apply_theme = MagicMock()
         
-        # Mock tkinter.BooleanVar for pin selection
-        self.MockBooleanVar = MOCK_MODULES['tkinter'].BooleanVar
-
 
     def test_initial_state(self):
         # For this test, we re-initialize an app instance but let its __init__ run partially
         # to check default initializations before _setup_ui and _apply_theme are called.
         
         # Temporarily unpatch __init__ to test its internal state setup
-        with patch.object(sys.modules['AIKC.Rutas.a.Puntos.ruta_por_punto'].KMZRouteApp, '_setup_ui', MagicMock()), \
-             patch.object(sys.modules['AIKC.Rutas.a.Puntos.ruta_por_punto'].KMZRouteApp, '_apply_theme', MagicMock()):
+        with patch.object(self.module.KMZRouteApp, '_setup_ui', lambda app: setattr(app, "map_widget", MagicMock())), \
+             patch.object(self.module.KMZRouteApp, '_apply_theme', MagicMock()), \
+             patch.object(self.module.KMZRouteApp, '_refresh_status_bar', MagicMock()):
             
             # Import here to get the class with unpatched __init__ for this specific test scope
-            from AIKC.Rutas.a.Puntos.ruta_por_punto import KMZRouteApp
+            from ruta_por_punto import KMZRouteApp
             app_for_init_test = KMZRouteApp() # This will call the actual __init__ now
 
         self.assertEqual(len(app_for_init_test.pins_data), 0)
         self.assertEqual(len(app_for_init_test.routes_data), 0)
         self.assertEqual(app_for_init_test.theme, "light")
         self.assertIsNotNone(app_for_init_test.style)
-        self.assertEqual(app_for_init_test.order_counter, 1)
+        self.assertEqual(app_for_init_test.pins_data.order_counter, 1)
         self.assertEqual(app_for_init_test.extraction_error_count, 0)
 
 
@@ -162,15 +208,15 @@ class TestKMZRouteApp(unittest.TestCase):
         self.app._extract_placemarks_from_lxml_tree(mock_kml_root)
 
         self.assertEqual(len(self.app.pins_data), 2)
-        self.assertEqual(self.app.pins_data[0]["name"], "Pin1")
-        self.assertEqual(self.app.pins_data[0]["coords_original"], (-57.1, -25.1, 10.0))
-        self.assertEqual(self.app.pins_data[0]["coords_map"], (-25.1, -57.1))
-        self.assertEqual(self.app.pins_data[0]["source"], "test.kmz")
+        self.assertEqual(self.app.pins_data.name(0), "Pin1")
+        self.assertEqual(self.app.pins_data.coords_original(0), (-57.1, -25.1, 10.0))
+        self.assertEqual(self.app.pins_data.coords_map(0), (-25.1, -57.1))
+        self.assertEqual(self.app.pins_data.source(0), "test.kmz")
         
-        self.assertEqual(self.app.pins_data[1]["name"], "Pin2")
-        self.assertEqual(self.app.pins_data[1]["coords_original"], (-57.2, -25.2, 0.0)) # Altitude defaults to 0.0
-        self.assertEqual(self.app.pins_data[1]["coords_map"], (-25.2, -57.2))
-        self.assertEqual(self.app.pins_data[1]["source"], "test.kmz")
+        self.assertEqual(self.app.pins_data.name(1), "Pin2")
+        self.assertEqual(self.app.pins_data.coords_original(1), (-57.2, -25.2, 0.0)) # Altitude defaults to 0.0
+        self.assertEqual(self.app.pins_data.coords_map(1), (-25.2, -57.2))
+        self.assertEqual(self.app.pins_data.source(1), "test.kmz")
         
         self.assertEqual(self.app.extraction_error_count, 0)
 
@@ -222,17 +268,13 @@ class TestKMZRouteApp(unittest.TestCase):
         self.app._extract_placemarks_from_lxml_tree(mock_kml_root)
 
         self.assertEqual(len(self.app.pins_data), 2)
-        self.assertTrue(any(p["name"] == "Pin1Nested" for p in self.app.pins_data))
-        self.assertTrue(any(p["name"] == "Pin2Root" for p in self.app.pins_data))
+        names = [self.app.pins_data.name(i) for i in range(len(self.app.pins_data))]
+        self.assertIn("Pin1Nested", names)
+        self.assertIn("Pin2Root", names)
 
     def test_create_route_from_selection_sufficient_pins(self):
-        # Mock pins_data
-        pin1_var = self.MockBooleanVar.return_value; pin1_var.get.return_value = True
-        pin2_var = self.MockBooleanVar.return_value; pin2_var.get.return_value = True
-        self.app.pins_data = [
-            {"name": "PinA", "coords_original": (1,1,0), "coords_map": (1,1), "tk_var": pin1_var, "select_order": 1, "source": "s1"},
-            {"name": "PinB", "coords_original": (2,2,0), "coords_map": (2,2), "tk_var": pin2_var, "select_order": 2, "source": "s1"},
-        ]
+        self.app.pins_data.extend(["PinA", "PinB"], [(1,1,0), (2,2,0)], "s1")
+        self.app.pins_data.set_selected([0, 1], True)
         self.app.route_name_entry.get.return_value = "Test Route"
         self.app.route_color_combo.get.return_value = "rojo" # User-facing name
         
@@ -242,16 +284,29 @@ class TestKMZRouteApp(unittest.TestCase):
         route = self.app.routes_data[0]
         self.assertEqual(route["name"], "Test Route")
         self.assertEqual(route["color"], "red") # Internal color name
-        self.assertEqual(len(route["kml_coords"]), 2)
-        self.app.map_widget.set_path.assert_called_once()
+        self.assertEqual(route["kml_coords"], [(1.0, 1.0, 0.0), (2.0, 2.0, 0.0)])
+        self.app.map_layer.add_path.assert_called_once()
         MOCK_MODULES['tkinter.messagebox'].showinfo.assert_called_once()
         self.app._apply_theme.assert_called() # Check if theme is reapplied
 
+    def test_create_route_from_selection_following_roads(self):
+        self.app.pins_data.extend(["PinA", "PinB"], [(0.0,0.0,0), (0.002,0.0,0)], "s1")
+        self.app.pins_data.set_selected([0, 1], True)
+        self.app.route_name_entry.get.return_value = "Road Route"
+        self.app.route_color_combo.get.return_value = "rojo"
+        self.app.road_snap_var.get.return_value = True
+        self.app.road_router = RoadRouter(RoadGraph.from_lines([[(0.0, 0.0), (0.001, 0.0), (0.002, 0.0)]]))
+
+        self.app.create_route_from_selection()
+
+        route = self.app.routes_data[0]
+        self.assertEqual(len(route["kml_coords"]), 3) # Both pins plus the road node between them
+        self.assertAlmostEqual(route["kml_coords"][1][0], 0.001)
+        self.app.map_layer.add_path.assert_called_once()
+
     def test_create_route_from_selection_insufficient_pins(self):
-        pin1_var = self.MockBooleanVar.return_value; pin1_var.get.return_value = True
-        self.app.pins_data = [
-            {"name": "PinA", "coords_original": (1,1,0), "coords_map": (1,1), "tk_var": pin1_var, "select_order": 1, "source": "s1"},
-        ]
+        self.app.pins_data.append("PinA", (1,1,0), "s1")
+        self.app.pins_data.set_selected([0], True)
         self.app.create_route_from_selection()
         
         self.assertEqual(len(self.app.routes_data), 0)
@@ -270,48 +325,73 @@ class TestKMZRouteApp(unittest.TestCase):
 
     def test_save_routes_to_kml_with_routes(self):
         self.app.routes_data = [
-            {"name": "Route1", "kml_coords": [(1,1,0), (2,2,0)], "color": "red"}
+            {"name": "Route1", "kml_coords": [(1,1,0), (2,2,0)], "color": "red"},
+            {"name": "Route2", "kml_coords": [(3,3,0), (4,4,0)], "color": "#e6b04b"},
         ]
         MOCK_MODULES['tkinter.filedialog'].asksaveasfilename.return_value = "dummy_path.kml"
-        
-        mock_kml_instance = MOCK_MODULES['simplekml'].Kml.return_value
-        
-        self.app.save_routes_to_kml()
-        
-        MOCK_MODULES['simplekml'].Kml.assert_called_once_with(name="Rutas Generadas")
-        mock_kml_instance.newlinestring.assert_called_once_with(name="Route1", coords=[(1,1,0), (2,2,0)])
-        mock_kml_instance.save.assert_called_once_with("dummy_path.kml")
-        MOCK_MODULES['tkinter.messagebox'].showinfo.assert_called_with("Guardado Exitoso", "Rutas guardadas en 'dummy_path.kml' usando SimpleKML.")
+
+        with patch.object(self.module, 'save_routes') as mock_save_routes:
+            self.app.save_routes_to_kml()
+
+        mock_save_routes.assert_called_once_with("dummy_path.kml", [
+            ("Route1", "ff0000ff", [(1,1,0), (2,2,0)]),
+            ("Route2", "ff4bb0e6", [(3,3,0), (4,4,0)]),
+        ])
+        MOCK_MODULES['tkinter.messagebox'].showinfo.assert_called_with("Guardado Exitoso", "Rutas guardadas en 'dummy_path.kml'.")
+
+    def test_load_routes_from_kml_keeps_no_route_when_it_fails(self):
+        import numpy as np
+        from kmz_core.kml_reader import LoadedRoutes
+        routes = [{"name": "R1", "kml_coords": np.array([[1.0, 1.0, 0.0], [2.0, 2.0, 0.0]]), "color": "red"}]
+        MOCK_MODULES['tkinter.filedialog'].askopenfilename.return_value = "rutas.kmz"
+        self.app.map_layer.add_paths.side_effect = ValueError("coordenadas")
+
+        with patch.object(self.module, 'load_routes',
+                          return_value=LoadedRoutes(routes, 0)):
+            self.app.load_routes_from_kml()
+            MOCK_MODULES['tkinter.messagebox'].showerror.assert_called_with("Error al Cargar Rutas", "No se pudo cargar el archivo: coordenadas")
+            self.assertEqual(self.app.routes_data, [])
+            self.app.routes_panel.show.assert_called_once() # Refreshed even when the load fails
+
+            self.app.map_layer.add_paths.side_effect = None
+            self.app.load_routes_from_kml()
+        self.assertEqual([route["name"] for route in self.app.routes_data], ["R1"])
+        MOCK_MODULES['tkinter.messagebox'].showinfo.assert_called_with("Rutas Cargadas", "Se cargaron 1 rutas desde 'rutas.kmz'.")
 
     def test_select_all_deselect_all_pins(self):
-        mock_vars = [MagicMock(spec=MOCK_MODULES['tkinter'].BooleanVar) for _ in range(3)]
-        self.app.pins_data = [
-            {"tk_var": mock_vars[0]},
-            {"tk_var": mock_vars[1]},
-            {"tk_var": mock_vars[2]},
-        ]
-        
+        self.app.pins_data.extend(["A", "B", "C"], [(1,1,0), (2,2,0), (3,3,0)], "s1")
+        self.app.map_layer.materialized_pins.side_effect = lambda indices: list(indices) # Every pin has a marker
+
         self.app.select_all_pins()
-        for var_mock in mock_vars:
-            var_mock.set.assert_called_with(True)
+        self.assertTrue(self.app.pins_data.selected.all())
+        self.assertEqual(list(self.app.pin_list.render.call_args[0][0]), [0, 1, 2])
+        self.assertEqual(self.app.dirty_marker_indices, {0, 1, 2}) # Only changed markers get recolored
+        self.app.after.assert_called() # A single ordering update is scheduled
         
+        self.app.dirty_marker_indices.clear()
+        self.app.pins_data.set_selected(1, False)
         self.app.deselect_all_pins()
-        for var_mock in mock_vars:
-            var_mock.set.assert_called_with(False)
+        self.assertFalse(self.app.pins_data.selected.any())
+        self.assertEqual(self.app.dirty_marker_indices, {0, 2})
+
+    def test_invert_and_select_by_source(self):
+        self.app.pins_data.extend(["A", "B"], [(1,1,0), (2,2,0)], "s1")
+        self.app.pins_data.append("C", (3,3,0), "s2")
+        self.app.map_layer.materialized_pins.side_effect = lambda indices: list(indices)
+
+        self.app.source_combo.get.return_value = "s1"
+        self.app.select_source_pins()
+        self.assertEqual(self.app.pins_data.selected_indices_ordered().tolist(), [0, 1])
+
+        self.app.invert_selection()
+        self.assertEqual(self.app.pins_data.selected_indices_ordered().tolist(), [2])
+        self.assertEqual(self.app.dirty_marker_indices, {0, 1, 2})
+        self.app.after.assert_called() # Display updates are coalesced into the scheduled `update_ordering`
 
     def test_create_routes_from_all(self):
-        pin1_var = self.MockBooleanVar.return_value
-        pin2_var = self.MockBooleanVar.return_value
-        pin3_var = self.MockBooleanVar.return_value
-        pin4_var = self.MockBooleanVar.return_value
-        
-        self.app.pins_data = [
-            {"name": "P1S1", "coords_original": (1,1,0), "coords_map": (1,1), "tk_var": pin1_var, "source": "sourceA.kmz"},
-            {"name": "P2S1", "coords_original": (2,1,0), "coords_map": (1,2), "tk_var": pin2_var, "source": "sourceA.kmz"},
-            {"name": "P1S2", "coords_original": (3,3,0), "coords_map": (3,3), "tk_var": pin3_var, "source": "sourceB.kmz"},
-            {"name": "P2S2", "coords_original": (4,3,0), "coords_map": (3,4), "tk_var": pin4_var, "source": "sourceB.kmz"},
-            {"name": "P1S3_single", "coords_original": (5,5,0), "coords_map": (5,5), "tk_var": MagicMock(), "source": "sourceC_single.kmz"},
-        ]
+        self.app.pins_data.extend(["P1S1", "P2S1"], [(1,1,0), (2,1,0)], "sourceA.kmz")
+        self.app.pins_data.extend(["P1S2", "P2S2"], [(3,3,0), (4,3,0)], "sourceB.kmz")
+        self.app.pins_data.append("P1S3_single", (5,5,0), "sourceC_single.kmz")
         
         self.app.create_routes_from_all()
         
@@ -322,8 +402,58 @@ class TestKMZRouteApp(unittest.TestCase):
         self.assertIn("Ruta sourceB.kmz", route_names)
         self.assertNotIn("Ruta sourceC_single.kmz", route_names)
         
-        self.assertEqual(self.app.map_widget.set_path.call_count, 2)
+        self.assertIsNone(self.app.task_worker) # Nothing to optimize: no worker thread
+        (paths,), _ = self.app.map_layer.add_paths.call_args # Both routes are added to the map at once
+        self.assertEqual(len(list(paths)), 2)
         MOCK_MODULES['tkinter.messagebox'].showinfo.assert_called_with("Rutas Automáticas", "Se crearon 2 rutas automáticas.")
+        routes, metrics = self.app.routes_panel.show.call_args[0]
+        self.assertEqual([m.vertex_count for m in metrics], [2, 2])
+
+    def test_create_routes_from_all_optimized(self):
+        # Stops along a line, in zig-zag document order; the first one is at the west end
+        lons = [0.0, 0.4, 0.1, 0.3, 0.2]
+        self.app.pins_data.extend([f"P{i}" for i in range(5)], [(lon, 0.0, 0) for lon in lons], "sourceA.kmz")
+        self.app.optimize_routes_var.get.return_value = True
+
+        self.app.create_routes_from_all()
+        self.assertEqual(self.app.routes_data, []) # The optimization runs in a worker thread
+        self.app.task_worker.join()
+        self.app._poll_background_task()
+
+        route_lons = [coords[0] for coords in self.app.routes_data[0]["kml_coords"]]
+        self.assertEqual(route_lons, [0.0, 0.1, 0.2, 0.3, 0.4])
+        title, message = MOCK_MODULES['tkinter.messagebox'].showinfo.call_args[0]
+        self.assertIn("Longitud total: 111.2 km antes de optimizar, 44.5 km después.", message)
+
+    def test_split_pins_into_routes(self):
+        self.app.pins_data.extend([f"A{i}" for i in range(6)], [(0.01 * i, 0.0, 0) for i in range(6)], "sourceA.kmz")
+        self.app.pins_data.extend([f"B{i}" for i in range(6)], [(0.01 * i, 1.0, 0) for i in range(6)], "sourceB.kmz")
+        self.app.split_count_spinbox = MagicMock()
+        self.app.split_count_spinbox.get.return_value = "2"
+        self.app.split_method_combo = MagicMock()
+        self.app.split_method_combo.get.return_value = "K-means"
+        self.app.split_max_stops_entry = MagicMock()
+        self.app.split_max_stops_entry.get.return_value = ""
+        self.app.split_max_km_entry = MagicMock()
+        self.app.split_max_km_entry.get.return_value = ""
+
+        self.app.split_pins_into_routes()
+        self.assertEqual(self.app.routes_data, []) # The split runs in a worker thread
+        self.app.task_worker.join()
+        self.app._poll_background_task()
+
+        self.assertIsNone(self.app.task_worker)
+        self.assertEqual([r["name"] for r in self.app.routes_data], ["Ruta-1", "Ruta-2"])
+        self.assertEqual([r["color"] for r in self.app.routes_data], ["#e6194b", "#3cb44b"])
+        for route in self.app.routes_data:
+            self.assertEqual(len({coords[1] for coords in route["kml_coords"]}), 1) # One row of pins per route
+        (paths,), _ = self.app.map_layer.add_paths.call_args # Both routes are added to the map at once
+        self.assertEqual(len(paths), 2)
+
+        self.app.split_max_stops_entry.get.return_value = "uno"
+        self.app.split_pins_into_routes()
+        MOCK_MODULES['tkinter.messagebox'].showerror.assert_called()
+        self.assertEqual(len(self.app.routes_data), 2)
 
 
 if __name__ == '__main__':
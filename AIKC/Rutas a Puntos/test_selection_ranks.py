@@ -0,0 +1,39 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.selection_ranks import SelectionRankIndex, INITIAL_CAPACITY, BULK_UPDATE_THRESHOLD
+
+
+class TestSelectionRankIndex(unittest.TestCase):
+
+    def test_rank_counts_used_orders(self):
+        index = SelectionRankIndex()
+        index.add([2, 5, 9])
+        self.assertEqual([index.rank(order) for order in (1, 2, 5, 9, 100)], [0, 1, 2, 3, 3])
+        index.remove([5])
+        np.testing.assert_array_equal(index.rank(np.array([2, 9])), [1, 2])
+        self.assertEqual(len(index), 2)
+
+    def test_bulk_updates_and_growth_match_single_updates(self):
+        rng = np.random.default_rng(1)
+        index = SelectionRankIndex()
+        used = np.zeros(4 * INITIAL_CAPACITY, dtype=bool)
+        for size in (1, BULK_UPDATE_THRESHOLD * 4, 3, BULK_UPDATE_THRESHOLD * 2):
+            orders = rng.integers(1, len(used), size=size)
+            index.add(orders)
+            used[orders] = True
+            removed = orders[::3]
+            index.remove(removed)
+            used[removed] = False
+            queries = np.arange(len(used))
+            np.testing.assert_array_equal(index.rank(queries), np.cumsum(used))
+
+
+if __name__ == '__main__':
+    unittest.main()
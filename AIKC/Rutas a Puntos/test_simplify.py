@@ -0,0 +1,76 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.simplify import douglas_peucker_importance, polylines_importance, simplified_mask
+
+
+def douglas_peucker(x, y, tolerance):
+    """Reference recursive Douglas-Peucker, returning the mask of kept vertices."""
+    keep = np.zeros(len(x), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(x) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        inner = np.arange(start + 1, end)
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        squared = dx * dx + dy * dy
+        fraction = np.clip(((x[inner] - x[start]) * dx + (y[inner] - y[start]) * dy) / (squared or 1.0), 0.0, 1.0)
+        distance = np.hypot(x[inner] - x[start] - fraction * dx, y[inner] - y[start] - fraction * dy)
+        farthest = start + 1 + int(distance.argmax())
+        if distance.max() > tolerance:
+            keep[farthest] = True
+            stack += [(start, farthest), (farthest, end)]
+    return keep
+
+
+class TestSimplify(unittest.TestCase):
+
+    def test_matches_douglas_peucker_at_every_tolerance(self):
+        rng = np.random.default_rng(5)
+        for count in (2, 3, 50, 2000):
+            x = np.cumsum(rng.normal(size=count))
+            y = np.cumsum(rng.normal(size=count))
+            importance = douglas_peucker_importance(x, y)
+            for tolerance in (0.0, 0.5, 3.0, 20.0, 1e6):
+                np.testing.assert_array_equal(simplified_mask(importance, tolerance), douglas_peucker(x, y, tolerance))
+
+    def test_closed_line_and_endpoints(self):
+        angle = np.linspace(0.0, 2 * np.pi, 101) # First and last vertices coincide
+        x, y = np.cos(angle), np.sin(angle)
+        importance = douglas_peucker_importance(x, y)
+        self.assertTrue(np.isinf(importance[[0, -1]]).all())
+        for tolerance in (0.01, 0.3, 1.5):
+            np.testing.assert_array_equal(simplified_mask(importance, tolerance), douglas_peucker(x, y, tolerance))
+        self.assertEqual(len(douglas_peucker_importance([], [])), 0)
+
+    def test_several_polylines_at_once(self):
+        rng = np.random.default_rng(6)
+        counts = [1, 0, 2, 3, 40, 500]
+        lines = [(np.cumsum(rng.normal(size=count)), np.cumsum(rng.normal(size=count))) for count in counts]
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        importance = polylines_importance(np.concatenate([x for x, _ in lines]), np.concatenate([y for _, y in lines]),
+                                          offsets)
+        for (x, y), start, end in zip(lines, offsets[:-1], offsets[1:]):
+            np.testing.assert_array_equal(importance[start:end], douglas_peucker_importance(x, y))
+
+    def test_non_finite_vertices_are_kept(self):
+        x = np.array([0.0, 1.0, np.nan, 3.0, 4.0, 5.0, 6.0])
+        y = np.array([0.0, 0.1, 0.0, 0.0, 2.0, 0.0, 0.0])
+        importance = polylines_importance(np.concatenate((x, [0.0, 1.0, 2.0])), np.concatenate((y, [0.0, 1.0, 0.0])),
+                                          [0, 7, 10])
+        self.assertEqual(importance[2], np.inf)
+        self.assertFalse(np.isnan(importance).any())
+        np.testing.assert_array_equal(importance[7:], douglas_peucker_importance([0.0, 1.0, 2.0], [0.0, 1.0, 0.0]))
+        self.assertTrue(simplified_mask(importance[:7], 1.0)[[0, 2, 6]].all())
+
+
+if __name__ == '__main__':
+    unittest.main()
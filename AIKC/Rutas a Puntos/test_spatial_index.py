@@ -0,0 +1,69 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core.spatial_index import PointGridIndex, BoxIndex
+
+
+class TestSpatialIndex(unittest.TestCase):
+
+    def test_point_query_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        x = rng.random(5000)
+        y = rng.random(5000) * 0.5
+        index = PointGridIndex(x, y, pins_per_cell=8)
+        for _ in range(50):
+            min_x, max_x = np.sort(rng.random(2) * 1.2 - 0.1)
+            min_y, max_y = np.sort(rng.random(2) * 0.6 - 0.05)
+            expected = np.flatnonzero((x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y))
+            np.testing.assert_array_equal(index.query(min_x, min_y, max_x, max_y), expected)
+
+    def test_degenerate_point_sets(self):
+        self.assertEqual(len(PointGridIndex([], []).query(0, 0, 1, 1)), 0)
+        same = PointGridIndex([0.5, 0.5], [0.2, 0.2]) # Zero-sized bounding box
+        self.assertEqual(same.query(0.4, 0.1, 0.6, 0.3).tolist(), [0, 1])
+        self.assertEqual(same.query(0.6, 0.1, 0.7, 0.3).tolist(), [])
+
+    def test_nearest_matches_brute_force(self):
+        rng = np.random.default_rng(9)
+        x, y = rng.random(3000), rng.random(3000)
+        index = PointGridIndex(x, y, pins_per_cell=4)
+        for qx, qy in rng.random((50, 2)) * 1.4 - 0.2: # Some positions outside the points' bounding box
+            self.assertEqual(index.nearest(qx, qy), int(np.hypot(x - qx, y - qy).argmin()))
+        self.assertEqual(PointGridIndex([], []).nearest(0.5, 0.5), -1)
+
+    def test_nearest_of_non_finite_or_far_positions(self):
+        index = PointGridIndex([0.0, 1.0, np.nan], [0.0, 1.0, np.nan])
+        for qx, qy in ((np.nan, 0.5), (0.5, np.inf), (-np.inf, -np.inf)):
+            self.assertEqual(index.nearest(qx, qy), -1)
+        self.assertEqual(index.nearest(1e6, 1e6), 1)
+        self.assertEqual(PointGridIndex([np.nan], [np.nan]).nearest(0.5, 0.5), -1)
+
+    def test_box_overlap(self):
+        boxes = BoxIndex()
+        boxes.add(0, 0, 1, 1)
+        boxes.add(2, 2, 3, 3)
+        self.assertEqual(boxes.query(0.5, 0.5, 2.0, 2.0).tolist(), [0, 1]) # Touching counts
+        self.assertEqual(boxes.query(1.5, 0, 1.8, 5).tolist(), [])
+        boxes.clear()
+        self.assertEqual(len(boxes), 0)
+
+    def test_boxes_grow_past_their_capacity(self):
+        boxes = BoxIndex()
+        self.assertEqual(boxes.add(0, 0, 1, 1), 0)
+        ids = boxes.extend([(i, 0, i + 0.5, 1) for i in range(1, 200)])
+        self.assertEqual(list(ids), list(range(1, 200)))
+        self.assertEqual(boxes.add(500, 0, 501, 1), 200)
+        self.assertEqual(len(boxes), 201)
+        self.assertEqual(boxes.boxes[150].tolist(), [150, 0, 150.5, 1])
+        self.assertEqual(boxes.query(149.4, 0, 151.2, 1).tolist(), [149, 150, 151])
+        self.assertEqual(list(boxes.extend([])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import sys
+import os
+import io
+import random
+import tempfile
+import zipfile
+from unittest import mock
+
+# The application runs as a script, so its helper package is imported from this directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kmz_core import zip_member
+from kmz_core.zip_member import open_member
+
+
+def read_all(reader, size):
+    chunks = []
+    for data in iter(lambda: reader.read(size), b""):
+        assert len(data) <= size
+        chunks.append(data)
+    return b"".join(chunks)
+
+
+class TestZipMember(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "capas.kmz")
+        rng = random.Random(1)
+        # Text that compresses, with some noise so the deflate stream spans many chunks
+        self.data = "".join(f"<Placemark><name>P{i} {rng.random()}</name></Placemark>\n" for i in range(20000)).encode()
+        with zipfile.ZipFile(self.path, "w") as kmz:
+            kmz.writestr("archivos/icono.png", b"\x89PNG" * 100)
+            kmz.writestr("almacenado.kml", self.data, compress_type=zipfile.ZIP_STORED)
+            kmz.writestr("comprimido.kml", self.data, compress_type=zipfile.ZIP_DEFLATED)
+            kmz.writestr("bzip2.kml", self.data, compress_type=zipfile.ZIP_BZIP2)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_members_read_back_in_chunks(self):
+        with mock.patch.object(zip_member, "MEMBER_CHUNK_SIZE", 4096), zipfile.ZipFile(self.path) as kmz:
+            for member in ("almacenado.kml", "comprimido.kml", "bzip2.kml"):
+                with open_member(kmz, member) as reader:
+                    self.assertEqual(read_all(reader, 1000), self.data, member)
+                    self.assertEqual(reader.tell(), len(self.data))
+                    self.assertEqual(reader.read(1000), b"")
+                    self.assertEqual(reader._fallback is None, member != "bzip2.kml")  # Only bzip2 is not mapped
+
+    def test_read_everything_and_short_reads(self):
+        with zipfile.ZipFile(self.path) as kmz, open_member(kmz, "comprimido.kml") as reader:
+            first = reader.read(10)
+            self.assertEqual(first, self.data[:10])
+            self.assertEqual(reader.read(), self.data[10:])
+            self.assertEqual(reader.tell(), len(self.data))
+
+    def test_archive_in_memory_falls_back_to_zipfile(self):
+        with open(self.path, "rb") as file:
+            buffer = io.BytesIO(file.read())
+        with zipfile.ZipFile(buffer) as kmz, open_member(kmz, "almacenado.kml") as reader:
+            self.assertIsNotNone(reader._fallback)
+            self.assertEqual(read_all(reader, 1 << 20), self.data)
+
+    def test_corrupted_member_is_detected(self):
+        with zipfile.ZipFile(self.path) as kmz:
+            info = kmz.getinfo("almacenado.kml")
+        with open(self.path, "r+b") as file:
+            file.seek(info.header_offset + 30 + len(info.filename) + len(info.extra) + 100)
+            file.write(b"#")
+        with zipfile.ZipFile(self.path) as kmz, open_member(kmz, "almacenado.kml") as reader:
+            with self.assertRaises(zipfile.BadZipFile):
+                read_all(reader, 1 << 20)
+
+    def test_closing_early_releases_the_map(self):
+        with zipfile.ZipFile(self.path) as kmz:
+            reader = open_member(kmz, "comprimido.kml")
+            reader.read(100)
+            reader.close()
+            self.assertIsNone(reader._map)
+            with self.assertRaises(KeyError):
+                open_member(kmz, "no-existe.kml")
+
+
+if __name__ == '__main__':
+    unittest.main()